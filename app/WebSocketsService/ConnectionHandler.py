@@ -1,14 +1,17 @@
 import json
 import logging
 from fastapi import WebSocket
+from app.core.message_bus import MessageBus
 from app.services.https.UserManagement import UserManagement
 
 
 class ConnectionHandler:
     """
     连接管理器，管理所有WebSocket连接
+    多 worker 部署时 sessions 只包含本进程的连接，发送与广播经 MessageBus 转发到其他 worker
     """
     sessions = {}  # 类级别，存储所有已认证的客户端 {user_id: websocket}
+    bus_channel = "connections"  # 在消息路由总线上的频道名（与 sessions 一一对应）
 
     def __init__(self, websocket: WebSocket):
         self.websocket = websocket
@@ -36,6 +39,8 @@ class ConnectionHandler:
 
             # 认证成功，注册会话
             self.sessions[self.user_id] = self.websocket
+            if MessageBus.active is not None:
+                await MessageBus.active.claim(self.bus_channel, self.user_id)
             await self.websocket.send_text(json.dumps({"status": "authenticated", "user_id": self.user_id}))
             
             # 调用连接钩子
@@ -56,18 +61,28 @@ class ConnectionHandler:
             # 清理会话
             if self.user_id and self.user_id in self.sessions:
                 del self.sessions[self.user_id]
+                await self._release_route(self.user_id)
             await self.on_disconnect()
 
     @classmethod
     async def broadcast(cls, message: str, exclude_id: str = None):
         """
-        广播消息给所有连接的客户端
+        广播消息给所有连接的客户端（多 worker 部署时包括其他 worker 上的连接）
+        """
+        await cls.broadcast_local(message, exclude_id)
+        if MessageBus.active is not None:
+            await MessageBus.active.broadcast(cls.bus_channel, message, exclude_id)
+
+    @classmethod
+    async def broadcast_local(cls, message: str, exclude_id: str = None):
+        """
+        广播消息给本进程的客户端
         """
         if not cls.sessions:
             return
 
         disconnected = []
-        for user_id, websocket in cls.sessions.items():
+        for user_id, websocket in list(cls.sessions.items()):
             if exclude_id and user_id == exclude_id:
                 continue
             try:
@@ -77,12 +92,24 @@ class ConnectionHandler:
         
         # 清理断开的连接
         for user_id in disconnected:
-            cls.sessions.pop(user_id, None)
+            if cls.sessions.pop(user_id, None) is not None:
+                await cls._release_route(user_id)
 
     @classmethod
     async def send_to_user(cls, user_id: str, message: str) -> bool:
         """
-        发送消息给指定用户
+        发送消息给指定用户；本进程没有该用户的连接时转发给持有连接的 worker，返回是否送达
+        """
+        if await cls.deliver_local(user_id, message):
+            return True
+        if MessageBus.active is None:
+            return False
+        return await MessageBus.active.send(cls.bus_channel, user_id, message)
+
+    @classmethod
+    async def deliver_local(cls, user_id: str, message: str) -> bool:
+        """
+        发送消息给本进程的指定用户
         """
         if user_id not in cls.sessions:
             return False
@@ -91,9 +118,16 @@ class ConnectionHandler:
             await cls.sessions[user_id].send_text(message)
             return True
         except Exception:
-            cls.sessions.pop(user_id, None)
+            if cls.sessions.pop(user_id, None) is not None:
+                await cls._release_route(user_id)
             return False
 
+    @classmethod
+    async def _release_route(cls, user_id: str):
+        """通知其他 worker 该用户在本进程的连接已断开"""
+        if MessageBus.active is not None:
+            await MessageBus.active.release(cls.bus_channel, user_id)
+
     async def _authenticate(self, auth_data: dict) -> bool:
         """
         认证逻辑，检查用户是否在UserManagement缓存中存在
@@ -123,7 +157,7 @@ class ConnectionHandler:
             # 中文注释：不再转换为整数，直接按字符串ID查找
             user_id_for_lookup = str(user_id_input)
             print(f"🔍 [DEBUG] Looking up user with ID: {user_id_for_lookup} (type: {type(user_id_for_lookup)})")
-            user_instance = user_manager.get_user_instance(user_id_for_lookup)
+            user_instance = await user_manager.get_user_instance(user_id_for_lookup)
             print(f"🔍 [DEBUG] get_user_instance returned: {user_instance}")
             
             if user_instance is None:
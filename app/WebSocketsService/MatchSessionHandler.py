@@ -11,6 +11,7 @@ class MatchSessionHandler(ConnectionHandler):
     匹配会话处理器，使用N8nWebhookManager和MatchManager实现匹配功能
     """
     sessions = {}  # 类级别的字典，作为"会话管理器"，用于存储所有已认证的客户端
+    bus_channel = "match"
 
     def __init__(self, websocket: WebSocket):
         """
@@ -117,42 +118,6 @@ class MatchSessionHandler(ConnectionHandler):
         await super().on_disconnect()
         logging.info(f"User {self.user_id} disconnected from match system")
 
-    @classmethod
-    async def broadcast(cls, message: str, exclude_id: str = None):
-        """
-        广播消息给所有连接的客户端（可被子类复写）
-        """
-        if not cls.sessions:
-            return
-
-        disconnected = []
-        for user_id, websocket in cls.sessions.items():
-            if exclude_id and user_id == exclude_id:
-                continue
-            try:
-                await websocket.send_text(message)
-            except Exception:
-                disconnected.append(user_id)
-        
-        # 清理断开的连接
-        for user_id in disconnected:
-            cls.sessions.pop(user_id, None)
-
-    @classmethod
-    async def send_to_user(cls, user_id: str, message: str) -> bool:
-        """
-        向指定用户ID发送私聊消息（可被子类复写）
-        """
-        if user_id not in cls.sessions:
-            return False
-        
-        try:
-            await cls.sessions[user_id].send_text(message)
-            return True
-        except Exception:
-            cls.sessions.pop(user_id, None)
-            return False
-
     async def _authenticate(self, auth_data: dict) -> bool:
         """
         认证逻辑，检查用户是否在UserManagement的user_list中
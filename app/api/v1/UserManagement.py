@@ -32,7 +32,7 @@ async def create_new_user(request: CreateNewUserRequest):
 async def edit_user_age(request: EditUserAgeRequest):
     user_manager = UserManagement()
     try:
-        success = user_manager.edit_user_age(request.user_id, request.age)
+        success = await user_manager.edit_user_age(request.user_id, request.age)
         return EditUserAgeResponse(success=success)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
@@ -42,7 +42,7 @@ async def edit_user_age(request: EditUserAgeRequest):
 async def edit_target_gender(request: EditTargetGenderRequest):
     user_manager = UserManagement()
     try:
-        success = user_manager.edit_target_gender(request.user_id, request.target_gender)
+        success = await user_manager.edit_target_gender(request.user_id, request.target_gender)
         return EditTargetGenderResponse(success=success)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
@@ -52,7 +52,7 @@ async def edit_target_gender(request: EditTargetGenderRequest):
 async def edit_summary(request: EditSummaryRequest):
     user_manager = UserManagement()
     try:
-        success = user_manager.edit_summary(request.user_id, request.summary)
+        success = await user_manager.edit_summary(request.user_id, request.summary)
         return EditSummaryResponse(success=success)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
@@ -72,7 +72,7 @@ async def save_to_database(request: SaveUserInfoToDatabaseRequest):
 async def get_user_info_with_user_id(request: GetUserInfoWithUserIdRequest):
     user_manager = UserManagement()
     try:
-        user_info = user_manager.get_user_info_with_user_id(request.user_id)
+        user_info = await user_manager.get_user_info_with_user_id(request.user_id)
         return GetUserInfoWithUserIdResponse(**user_info)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
@@ -28,6 +28,100 @@ class Settings:
     # MONGODB_PASSWORD: str = os.getenv("MONGODB_PASSWORD", "Awr20020311")
     # MONGODB_AUTH_SOURCE: str = os.getenv("MONGODB_AUTH_SOURCE", "admin")
 
+    # 连接池配置：最大/最小连接数、空闲连接回收时间与等待可用连接的超时（毫秒，0 表示不限制）
+    MONGODB_MAX_POOL_SIZE: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+    MONGODB_MIN_POOL_SIZE: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+    MONGODB_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "0"))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "0"))
+    # 网络压缩算法，逗号分隔（如 "zstd,snappy,zlib"，需安装对应依赖）；为空则不压缩
+    MONGODB_COMPRESSORS: str = os.getenv("MONGODB_COMPRESSORS", "")
+
+    # 批量写入配置：bulk_upsert 每批发送的文档数量
+    DB_BULK_BATCH_SIZE: int = int(os.getenv("DB_BULK_BATCH_SIZE", "1000"))
+    # 流式读取配置：Database.iter 每批返回的文档数量（同时作为游标批大小）
+    DB_ITER_BATCH_SIZE: int = int(os.getenv("DB_ITER_BATCH_SIZE", "1000"))
+    # 慢操作日志：单次数据库调用超过该耗时（秒）时记录查询形状；保留最近多少条慢操作
+    DB_SLOW_OP_THRESHOLD: float = float(os.getenv("DB_SLOW_OP_THRESHOLD", "0.5"))
+    DB_SLOW_OP_HISTORY: int = int(os.getenv("DB_SLOW_OP_HISTORY", "100"))
+    # find_one 读穿透缓存（默认关闭，按部署开启）：仅缓存按 _id 查询的结果；TTL 按集合配置（"集合:秒"，逗号分隔），未配置的集合不缓存
+    DB_CACHE_ENABLED: bool = os.getenv("DB_CACHE_ENABLED", "false").lower() == "true"
+    DB_CACHE_TTLS: str = os.getenv("DB_CACHE_TTLS", "users:30")
+    DB_CACHE_MAX_ENTRIES: int = int(os.getenv("DB_CACHE_MAX_ENTRIES", "10000"))
+    # 存储后端：mongo 为 MongoDB；memory 为进程内存储引擎（仅用于基准测试，数据不落盘）
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "mongo").lower()
+    # 内存后端每次操作注入的固定延迟与随机抖动（秒），用于模拟网络往返
+    DB_MEMORY_LATENCY: float = float(os.getenv("DB_MEMORY_LATENCY", "0"))
+    DB_MEMORY_JITTER: float = float(os.getenv("DB_MEMORY_JITTER", "0"))
+    # 数据库故障注入（压测/故障演练用）：JSON 规则列表，如
+    # [{"collection": "users", "operation": "bulk_write", "tail_rate": 0.01, "tail_latency": 0.5, "error_rate": 0.05}]
+    # 为空则不注入；DB_FAULT_SEED 固定随机序列便于复现
+    DB_FAULT_INJECTION: str = os.getenv("DB_FAULT_INJECTION", "")
+    DB_FAULT_SEED: int = int(os.getenv("DB_FAULT_SEED", "0"))
+    # 启动时对登记的热点查询执行 explain()，退化为全集合扫描时输出警告
+    QUERY_PLAN_CHECK_ENABLED: bool = os.getenv("QUERY_PLAN_CHECK_ENABLED", "true").lower() == "true"
+
+    # ID分配配置：每次从 counters 集合租用的ID段大小，以及当前段剩余多少个ID时在后台预取下一段
+    ID_BLOCK_SIZE: int = int(os.getenv("ID_BLOCK_SIZE", "1000"))
+    ID_REFILL_REMAINING: int = int(os.getenv("ID_REFILL_REMAINING", "500"))
+
+    # 数据库审计配置：游标批大小 / $in 批量删除大小，以及每扫描多少个文档输出一次进度
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", "1000"))
+    AUDIT_PROGRESS_EVERY: int = int(os.getenv("AUDIT_PROGRESS_EVERY", "100000"))
+
+    # 刷新调度配置：同时进行的刷新数量上限，以及各管理器的刷新间隔（秒）
+    FLUSH_MAX_CONCURRENCY: int = int(os.getenv("FLUSH_MAX_CONCURRENCY", "3"))
+    FLUSH_INTERVAL_USERS: float = float(os.getenv("FLUSH_INTERVAL_USERS", "10"))
+    FLUSH_INTERVAL_MATCHES: float = float(os.getenv("FLUSH_INTERVAL_MATCHES", "10"))
+    FLUSH_INTERVAL_CHATROOMS: float = float(os.getenv("FLUSH_INTERVAL_CHATROOMS", "10"))
+    FLUSH_INTERVAL_AI: float = float(os.getenv("FLUSH_INTERVAL_AI", "10"))
+    FLUSH_INTERVAL_PERSONALITY: float = float(os.getenv("FLUSH_INTERVAL_PERSONALITY", "30"))
+    FLUSH_INTERVAL_FORUM: float = float(os.getenv("FLUSH_INTERVAL_FORUM", "10"))
+    # 自适应刷新：上面的间隔作为脏对象的最长等待时间；脏对象数达到阈值时提前刷新
+    FLUSH_DIRTY_THRESHOLD: int = int(os.getenv("FLUSH_DIRTY_THRESHOLD", "500"))
+    FLUSH_POLL_INTERVAL: float = float(os.getenv("FLUSH_POLL_INTERVAL", "1"))
+    # 单次刷新超过该耗时（秒）或失败时退避，退避倍数上限
+    FLUSH_SLOW_THRESHOLD: float = float(os.getenv("FLUSH_SLOW_THRESHOLD", "2"))
+    FLUSH_BACKOFF_MAX: float = float(os.getenv("FLUSH_BACKOFF_MAX", "8"))
+    FLUSH_DECISION_HISTORY: int = int(os.getenv("FLUSH_DECISION_HISTORY", "20"))
+    # 引用完整性由 ReferenceIndex 在变更时维护，全量检查只作为夜间任务（默认每天一次）
+    INTEGRITY_CHECK_INTERVAL: float = float(os.getenv("INTEGRITY_CHECK_INTERVAL", "86400"))
+    # 增量检查只验证变更日志中的主键，成本随写入量增长，可以频繁执行
+    INTEGRITY_INCREMENTAL_INTERVAL: float = float(os.getenv("INTEGRITY_INCREMENTAL_INTERVAL", "60"))
+
+    # 本地预写日志配置：日志目录与批量 fsync 间隔（秒）
+    JOURNAL_ENABLED: bool = os.getenv("JOURNAL_ENABLED", "true").lower() == "true"
+    JOURNAL_DIR: str = os.getenv("JOURNAL_DIR", str(PROJECT_DIR / "data" / "journal"))
+    JOURNAL_FSYNC_INTERVAL: float = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "0.1"))
+
+    # 内存快照配置：快照文件路径、写快照间隔（秒），以及追平时向前多取的时间余量（秒）
+    SNAPSHOT_ENABLED: bool = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+    SNAPSHOT_PATH: str = os.getenv("SNAPSHOT_PATH", str(PROJECT_DIR / "data" / "snapshot.bin"))
+    SNAPSHOT_INTERVAL: float = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+    SNAPSHOT_CATCHUP_MARGIN: float = float(os.getenv("SNAPSHOT_CATCHUP_MARGIN", "5"))
+
+    # 停机刷新配置：最终写回的总时限（秒），以及未能按时写回的脏数据的溢写目录（下次启动时重放）
+    SHUTDOWN_FLUSH_DEADLINE: float = float(os.getenv("SHUTDOWN_FLUSH_DEADLINE", "15"))
+    RECOVERY_DIR: str = os.getenv("RECOVERY_DIR", str(PROJECT_DIR / "data" / "recovery"))
+
+    # 多 worker 部署：uvicorn worker 进程数（大于 1 时启用跨进程变更订阅与启动协调，仅支持同一台机器）
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    # 进程协调的文件锁目录（启动互斥锁、领导者锁）
+    WORKER_STATE_DIR: str = os.getenv("WORKER_STATE_DIR", str(PROJECT_DIR / "data" / "workers"))
+    # 变更订阅：事件文件目录、轮询其他进程事件的间隔（秒）、事件文件保留时间（秒）与单个分段文件的大小上限（字节）
+    CHANGE_FEED_DIR: str = os.getenv("CHANGE_FEED_DIR", str(PROJECT_DIR / "data" / "change_feed"))
+    CHANGE_FEED_POLL_INTERVAL: float = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "0.05"))
+    CHANGE_FEED_RETENTION: float = float(os.getenv("CHANGE_FEED_RETENTION", "120"))
+    CHANGE_FEED_SEGMENT_BYTES: int = int(os.getenv("CHANGE_FEED_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+    # WebSocket 跨进程路由：各 worker 的 Unix 套接字目录（路径总长不能超过 108 字节）与等待送达确认的时限（秒）
+    MESSAGE_BUS_DIR: str = os.getenv("MESSAGE_BUS_DIR", str(PROJECT_DIR / "data" / "message_bus"))
+    MESSAGE_BUS_ACK_TIMEOUT: float = float(os.getenv("MESSAGE_BUS_ACK_TIMEOUT", "1.0"))
+
+    # 用户缓存模式：full 启动时加载全部用户；lazy 只在内存保留最近活跃的用户，未命中时按需从数据库读取
+    USER_CACHE_MODE: str = os.getenv("USER_CACHE_MODE", "full")
+    # lazy 模式：常驻用户数上限，以及多久未访问的用户在刷新后被淘汰（秒）；有未写回修改的用户不会被淘汰
+    USER_CACHE_CAPACITY: int = int(os.getenv("USER_CACHE_CAPACITY", "10000"))
+    USER_CACHE_IDLE_SECONDS: float = float(os.getenv("USER_CACHE_IDLE_SECONDS", "1800"))
+
     # JWT配置 (为了保持结构完整性，即使当前未使用)
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key")
     ALGORITHM: str = "HS256"
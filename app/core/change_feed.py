@@ -0,0 +1,489 @@
+"""
+跨进程变更订阅（多 worker 部署时保持各进程的内存缓存一致）
+- 经 Database 门面写入成功后发布实体级事件：
+  u：bulk_upsert / 插入写入的完整文档，其他进程直接应用
+  i：局部更新（$set/$push/$pull 等）只发布主键，其他进程从数据库重新读取后应用
+  x：删除，其他进程从内存移除
+- 管理器在单例创建时登记集合的 apply(key, document) / remove(key)；应用时不标脏、不记日志，也不会再次发布
+- 本进程对同一实体还有未写回的修改（仍登记在 ChangeTracker 中）时，远端的 u/i 文档与本地文档按共同祖先
+  （本地第一次修改前的文档）三方合并后应用，实体保持为脏，随后的刷新写回合并结果：
+  列表字段按元素合并两边各自的增删，其他字段只有一边修改时取修改后的值，两边都修改时保留本地的值
+  没有共同祖先时（新建对象、写回失败后重新标脏）列表取并集；无法取得本地文档时跳过事件并记录警告
+- 同一实体只应用时间戳不早于上次应用的事件，乱序到达的旧事件被丢弃
+- apply 返回 False 表示依赖尚未就绪（如聊天室的用户还未到达），事件在保留时间内随之后的轮询重试
+- 远端写入同时失效本进程的 find_one 缓存
+- 传输层 FileFeedTransport：同机多 worker 共享一个目录，每个进程追加写自己的分段文件并轮询读取其他进程的文件
+"""
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from bson import json_util
+
+from app.config import settings
+from app.core.change_tracker import ChangeTracker
+from app.core.metrics import Metrics
+from app.core.query_cache import QueryCache, written_ids
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("ChangeFeed")
+
+Metrics.describe("change_feed_events_total", "Change feed events by collection and direction (published/received)")
+Metrics.describe("change_feed_lag_seconds", "Delay between a write in another worker and this worker receiving it")
+
+FEED_SUFFIX = ".feed"
+_MISSING = object()
+
+
+def _contains(values: list):
+    """返回支持 in 判断的容器（元素可哈希时用集合）"""
+    try:
+        return set(values)
+    except TypeError:
+        return values
+
+
+def merge_lists(base: Optional[list], local: list, remote: list) -> list:
+    """
+    合并列表字段：保留本地顺序，去掉远端相对祖先删除的元素，追加远端相对祖先新增且本地没有的元素
+    没有祖先时取并集
+    """
+    if base is None:
+        local_items = _contains(local)
+        return local + [item for item in remote if item not in local_items]
+    base_items, remote_items = _contains(base), _contains(remote)
+    removed = _contains([item for item in base if item not in remote_items])
+    merged = [item for item in local if item not in removed]
+    merged_items = _contains(merged)
+    return merged + [item for item in remote if item not in base_items and item not in merged_items]
+
+
+def merge_documents(base: Optional[dict], local: dict, remote: dict) -> Tuple[dict, List[str]]:
+    """
+    三方合并远端文档与本地文档（base 为本地第一次修改前的文档，可为 None）
+    返回 (合并后的文档, 两边都修改、保留了本地值的字段)
+    """
+    merged = dict(local)
+    conflicts = []
+    for field, remote_value in remote.items():
+        local_value = local.get(field, _MISSING)
+        if remote_value == local_value:
+            continue
+        if local_value is _MISSING:
+            merged[field] = remote_value
+            continue
+        base_value = base.get(field, _MISSING) if base is not None else _MISSING
+        if isinstance(remote_value, list) and isinstance(local_value, list):
+            merged[field] = merge_lists(base_value if isinstance(base_value, list) else None, local_value, remote_value)
+        elif base is not None and local_value == base_value:
+            merged[field] = remote_value
+        elif base is None or remote_value != base_value:
+            conflicts.append(field)
+    return merged, conflicts
+
+
+class FileFeedTransport:
+    """
+    基于共享目录的变更传输（同一台机器上的多个 worker）
+    - 每个进程写自己的分段文件 <worker_id>.<序号>.feed；一批事件一次 write 追加，读方只消费以换行结尾的完整行
+    - 创建时记录已有文件的末尾位置：订阅之前的事件对应的写入已在数据库中，由各管理器的加载覆盖
+    - 分段超过大小上限时滚动；最后修改时间超过保留时间的分段由任意进程删除，读方按 inode 识别删除后重建的文件
+    """
+
+    def __init__(self, directory: str, worker_id: str, segment_bytes: Optional[int] = None, retention: Optional[float] = None):
+        self.directory = Path(directory)
+        self.worker_id = worker_id
+        self.segment_bytes = segment_bytes or settings.CHANGE_FEED_SEGMENT_BYTES
+        self.retention = retention if retention is not None else settings.CHANGE_FEED_RETENTION
+        self._segment = 0
+        self._offsets: Dict[str, Tuple[int, int]] = {}  # 文件名 -> (inode, 已读偏移)
+        self._last_cleanup = time.time()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in self._feed_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            self._offsets[path.name] = (stat.st_ino, stat.st_size)
+
+    def _feed_files(self) -> List[Path]:
+        """其他进程的分段文件"""
+        return [
+            path for path in self.directory.glob(f"*{FEED_SUFFIX}")
+            if path.name.rsplit(".", 2)[0] != self.worker_id
+        ]
+
+    def _segment_path(self) -> Path:
+        return self.directory / f"{self.worker_id}.{self._segment:06d}{FEED_SUFFIX}"
+
+    def publish(self, lines: List[str]) -> None:
+        """追加一批事件行到自己的当前分段"""
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        path = self._segment_path()
+        try:
+            if path.stat().st_size >= self.segment_bytes:
+                self._segment += 1
+                path = self._segment_path()
+        except FileNotFoundError:
+            pass
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                # 空闲过久的分段可能恰好在打开后被清理，此时写入一个新文件
+                if os.fstat(fd).st_nlink > 0:
+                    return
+            finally:
+                os.close(fd)
+
+    def poll(self) -> List[str]:
+        """读取其他进程自上次轮询以来追加的完整事件行"""
+        lines: List[str] = []
+        seen = set()
+        for path in self._feed_files():
+            try:
+                with open(path, "rb") as feed_file:
+                    stat = os.fstat(feed_file.fileno())
+                    inode, offset = self._offsets.get(path.name, (stat.st_ino, 0))
+                    if inode != stat.st_ino or stat.st_size < offset:
+                        offset = 0
+                    if stat.st_size > offset:
+                        feed_file.seek(offset)
+                        data = feed_file.read(stat.st_size - offset)
+                        end = data.rfind(b"\n") + 1
+                        lines.extend(line for line in data[:end].decode("utf-8").split("\n") if line)
+                        offset += end
+            except FileNotFoundError:
+                continue
+            self._offsets[path.name] = (stat.st_ino, offset)
+            seen.add(path.name)
+        for name in [name for name in self._offsets if name not in seen]:
+            del self._offsets[name]
+        self._cleanup()
+        return lines
+
+    def _cleanup(self) -> None:
+        """删除超过保留时间未被修改的分段（每 1/4 保留时间检查一次）"""
+        now = time.time()
+        if now - self._last_cleanup < self.retention / 4:
+            return
+        self._last_cleanup = now
+        for path in self.directory.glob(f"*{FEED_SUFFIX}"):
+            try:
+                if now - path.stat().st_mtime > self.retention:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+
+
+class ChangeFeed:
+    """
+    全局变更订阅
+    属性：
+        _appliers: dict{collection, (key_field, apply, remove)}
+        _outbox: list[str]                                # 待发布的事件行，后台任务批量写入传输层
+        _applied_at: dict{(collection, key), 时间戳}      # 每个实体最后应用的事件时间，用于丢弃乱序的旧事件
+        _deferred: dict{(collection, key), (时间戳, 文档)}  # 依赖尚未就绪、等待重试的文档
+        _dumps: dict{collection, dump(key)}               # 字典型管理器生成本进程当前文档（合并时使用）
+    """
+    _appliers: Dict[str, Tuple[str, Callable[[Hashable, dict], Any], Callable[[Hashable], Any]]] = {}
+    _dumps: Dict[str, Callable[[Hashable], Optional[dict]]] = {}
+    _outbox: List[str] = []
+    _applied_at: Dict[Tuple[str, Hashable], float] = {}
+    _deferred: Dict[Tuple[str, Hashable], Tuple[float, dict]] = {}
+    _transport: Optional[FileFeedTransport] = None
+    _task: Optional[asyncio.Task] = None
+    _last_prune = 0.0
+    _stats: Dict[str, Any] = {}
+
+    @classmethod
+    def register(
+        cls,
+        collection: str,
+        apply: Callable[[Hashable, dict], Any],
+        remove: Callable[[Hashable], Any],
+        key_field: str = "_id",
+        dump: Optional[Callable[[Hashable], Optional[dict]]] = None,
+    ) -> None:
+        """
+        登记集合的应用回调：apply(key, document) 新增或原地更新实体，remove(key) 从内存移除
+        字典型管理器（登记脏对象时 obj 为 None）需提供 dump(key) 返回本进程的当前文档，否则本地脏实体无法合并远端写入
+        """
+        cls._appliers[collection] = (key_field, apply, remove)
+        if dump is not None:
+            cls._dumps[collection] = dump
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls._transport is not None
+
+    @classmethod
+    def _relevant(cls, collection: str) -> bool:
+        """其他进程是否关心该集合的写入（有内存缓存或 find_one 缓存）"""
+        return collection in cls._appliers or QueryCache.caches(collection)
+
+    @classmethod
+    def _publish(cls, collection: str, op: str, key_field: str, keys=None, documents=None) -> None:
+        event = {"o": cls._transport.worker_id, "t": time.time(), "c": collection, "op": op, "f": key_field}
+        if documents is not None:
+            event["d"] = documents
+        else:
+            event["k"] = keys
+        # 立即序列化：发布的是写入时的文档，之后的内存修改不影响事件内容
+        cls._outbox.append(json_util.dumps(event))
+        Metrics.increment("change_feed_events_total", collection=collection, direction="published")
+
+    @classmethod
+    def publish_upserts(cls, collection: str, documents: List[dict], key_field: Optional[str] = None) -> None:
+        """发布已写入数据库的完整文档（key_field 默认取集合登记的主键字段）"""
+        if cls._transport is None or not documents or not cls._relevant(collection):
+            return
+        key_field = key_field or cls._appliers.get(collection, ("_id",))[0]
+        cls._publish(collection, "u", key_field, documents=list(documents))
+
+    @classmethod
+    def publish_keys(cls, collection: str, op: str, query: Optional[dict] = None, ids: Optional[Iterable[Hashable]] = None) -> None:
+        """
+        发布按主键的局部更新（op="i"）或删除（op="x"）
+        无法从过滤条件确定主键时，其他进程只失效 find_one 缓存，内存中的实体不会更新
+        """
+        if cls._transport is None or not cls._relevant(collection):
+            return
+        key_field = cls._appliers.get(collection, ("_id",))[0]
+        if ids is None:
+            ids = written_ids(query, key_field)
+        if ids is None:
+            if collection in cls._appliers:
+                logger.warning(f"无法从过滤条件确定 {collection} 的主键，其他进程的内存不会同步这次写入: {query}")
+        else:
+            ids = list(ids)
+            if not ids:
+                return
+        cls._publish(collection, op, key_field, keys=ids)
+
+    # ==================== 生命周期 ====================
+    @classmethod
+    def subscribe(cls, transport: FileFeedTransport) -> None:
+        """
+        开始订阅（在各管理器从数据库加载之前调用）：此后本进程的写入会被发布，
+        加载期间其他进程的事件在 start() 之后应用
+        """
+        cls._transport = transport
+        cls._outbox = []
+        cls._applied_at.clear()
+        cls._deferred.clear()
+        cls._stats = {
+            "published": 0, "received": 0, "applied": 0, "removed": 0,
+            "merged": 0, "skipped_dirty": 0, "stale": 0, "dropped": 0, "last_lag": None, "max_lag": 0.0,
+        }
+        ChangeTracker.capture_bases = True
+        logger.info(f"变更订阅已启用: {transport.directory} (worker {transport.worker_id})")
+
+    @classmethod
+    def start(cls) -> None:
+        """启动后台任务：每个轮询间隔发布本进程的事件并应用其他进程的事件"""
+        if cls._transport is not None and cls._task is None:
+            cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    async def stop(cls) -> None:
+        """停止后台任务并发出剩余事件（停机刷新之后调用）"""
+        if cls._task is not None:
+            cls._task.cancel()
+            await asyncio.gather(cls._task, return_exceptions=True)
+            cls._task = None
+        if cls._transport is not None:
+            try:
+                await cls._flush_outbox()
+            except Exception as e:
+                logger.error(f"发布剩余变更事件失败: {e}")
+        cls._transport = None
+        ChangeTracker.capture_bases = False
+
+    @classmethod
+    async def _run(cls):
+        while True:
+            await asyncio.sleep(settings.CHANGE_FEED_POLL_INTERVAL)
+            try:
+                await cls.pump()
+            except Exception as e:
+                logger.error(f"变更订阅处理失败: {e}")
+
+    @classmethod
+    async def _flush_outbox(cls) -> None:
+        outbox, cls._outbox = cls._outbox, []
+        if not outbox:
+            return
+        try:
+            await asyncio.to_thread(cls._transport.publish, outbox)
+        except Exception:
+            cls._outbox = outbox + cls._outbox
+            raise
+        cls._stats["published"] += len(outbox)
+
+    @classmethod
+    async def pump(cls) -> int:
+        """发布待发送的事件并应用其他进程的新事件，返回应用的实体数（后台任务每个轮询间隔调用一次）"""
+        if cls._transport is None:
+            return 0
+        await cls._flush_outbox()
+        events = []
+        for line in await asyncio.to_thread(cls._transport.poll):
+            try:
+                events.append(json_util.loads(line))
+            except Exception:
+                logger.warning(f"跳过无法解析的变更事件: {line[:200]}")
+        events.sort(key=lambda event: event["t"])
+        applied = 0
+        for event in events:
+            applied += await cls._apply_event(event)
+        applied += cls._retry_deferred()
+        cls._prune()
+        return applied
+
+    # ==================== 应用远端事件 ====================
+    @classmethod
+    async def _apply_event(cls, event: dict) -> int:
+        from app.core.database import Database
+
+        if event["o"] == cls._transport.worker_id:
+            return 0
+        collection, op, key_field, at = event["c"], event["op"], event["f"], event["t"]
+        lag = max(0.0, time.time() - at)
+        cls._stats["received"] += 1
+        cls._stats["last_lag"] = round(lag, 4)
+        cls._stats["max_lag"] = max(cls._stats["max_lag"], round(lag, 4))
+        Metrics.increment("change_feed_events_total", collection=collection, direction="received")
+        Metrics.observe("change_feed_lag_seconds", lag, collection=collection)
+
+        documents = [document for document in event.get("d", ()) if key_field in document]
+        keys = [document[key_field] for document in documents] if op == "u" else event.get("k")
+        if keys is None:
+            QueryCache.invalidate(collection)
+            return 0
+        QueryCache.invalidate(collection, ids=keys if key_field == "_id" else None)
+        entry = cls._appliers.get(collection)
+        if entry is None or not keys:
+            return 0
+        _, apply, remove = entry
+
+        if op == "x":
+            removed = 0
+            for key in keys:
+                if not cls._newer(collection, key, at):
+                    continue
+                # 删除优先于本进程未写回的修改，避免刷新时把已删除的实体重新写入
+                ChangeTracker.discard(collection, key)
+                cls._deferred.pop((collection, key), None)
+                try:
+                    remove(key)
+                except Exception as e:
+                    logger.error(f"移除 {collection}/{key} 失败: {e}")
+                    continue
+                cls._applied_at[(collection, key)] = at
+                removed += 1
+            cls._stats["removed"] += removed
+            return removed
+
+        if op == "i":
+            # 局部更新：读取数据库中的当前文档（此时已不早于事件时间）；已被删除的主键由删除事件处理
+            documents = await Database.find(collection, {key_field: {"$in": keys}})
+        return sum(cls._apply_one(collection, document[key_field], document, at, apply) for document in documents)
+
+    @classmethod
+    def _newer(cls, collection: str, key: Hashable, at: float) -> bool:
+        if at < cls._applied_at.get((collection, key), 0.0):
+            cls._stats["stale"] += 1
+            return False
+        return True
+
+    @classmethod
+    def _apply_one(cls, collection: str, key: Hashable, document: dict, at: float, apply) -> int:
+        if not cls._newer(collection, key, at):
+            return 0
+        remote = document
+        merged = ChangeTracker.is_dirty(collection, key)
+        if merged:
+            document = cls._merge_local(collection, key, remote)
+            if document is None:
+                cls._stats["skipped_dirty"] += 1
+                logger.warning(f"{collection}/{key} 有未写回的本地修改且无法取得本地文档，跳过远端变更（本进程随后的刷新会覆盖它）")
+                return 0
+        try:
+            result = apply(key, document)
+        except Exception as e:
+            logger.error(f"应用 {collection}/{key} 的远端变更失败: {e}")
+            return 0
+        if result is False:
+            cls._deferred[(collection, key)] = (at, remote)
+            return 0
+        cls._deferred.pop((collection, key), None)
+        cls._applied_at[(collection, key)] = at
+        cls._stats["applied"] += 1
+        if merged:
+            ChangeTracker.rebase(collection, key, remote)
+            cls._stats["merged"] += 1
+        return 1
+
+    @classmethod
+    def _merge_local(cls, collection: str, key: Hashable, remote: dict) -> Optional[dict]:
+        """把远端文档合并进本地脏实体的当前文档，无法取得本地文档时返回 None"""
+        obj = ChangeTracker._dirty.get(collection, {}).get(key)
+        try:
+            if obj is not None:
+                local = obj.to_document()
+            else:
+                dump = cls._dumps.get(collection)
+                local = dump(key) if dump is not None else None
+        except Exception as e:
+            logger.error(f"生成 {collection}/{key} 的本地文档失败: {e}")
+            return None
+        if local is None:
+            return None
+        merged, conflicts = merge_documents(ChangeTracker.base_of(collection, key), local, remote)
+        if conflicts:
+            logger.warning(f"{collection}/{key} 的字段 {conflicts} 在本进程与其他进程都有修改，保留本进程的值")
+        return merged
+
+    @classmethod
+    def _retry_deferred(cls) -> int:
+        applied = 0
+        now = time.time()
+        for (collection, key), (at, document) in list(cls._deferred.items()):
+            if now - at > cls._transport.retention:
+                del cls._deferred[(collection, key)]
+                cls._stats["dropped"] += 1
+                logger.warning(f"放弃应用 {collection}/{key} 的远端变更：依赖在 {cls._transport.retention} 秒内未就绪")
+                continue
+            entry = cls._appliers.get(collection)
+            if entry is not None:
+                applied += cls._apply_one(collection, key, document, at, entry[1])
+        return applied
+
+    @classmethod
+    def _prune(cls) -> None:
+        """清理超过保留时间的应用记录（更早的事件已不会再到达）"""
+        now = time.time()
+        retention = cls._transport.retention
+        if now - cls._last_prune < retention / 4:
+            return
+        cls._last_prune = now
+        for entity, at in list(cls._applied_at.items()):
+            if now - at > retention:
+                del cls._applied_at[entity]
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        if cls._transport is None:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "worker_id": cls._transport.worker_id,
+            "directory": str(cls._transport.directory),
+            "outbox": len(cls._outbox),
+            "deferred": len(cls._deferred),
+            "collections": sorted(cls._appliers),
+            **cls._stats,
+        }
@@ -0,0 +1,76 @@
+"""
+完备性变更日志（进程内）
+- 记录自上次完备性检查以来被触及的主键：删除的用户、创建/删除的匹配、创建的聊天室、写入的消息
+- 增量检查只验证这些主键及其相邻对象，检查成本随写入量而不是数据库规模增长
+- 全量检查（定时任务）开始时清空日志，因为它会覆盖全部数据
+"""
+from typing import Any, Dict, Hashable, Set, Tuple
+
+
+class ChangeLog:
+    """
+    全局变更日志，按实体类型分组
+    属性：
+        deleted_users: set(user_id)
+        matches: dict{match_id, (user_id_1, user_id_2)}  # 删除后仍能找到双方用户
+        chatrooms: set(chatroom_id)
+        messages: dict{message_id, chatroom_id}
+    """
+    deleted_users: Set[str] = set()
+    matches: Dict[Hashable, Tuple[str, str]] = {}
+    chatrooms: Set[Hashable] = set()
+    messages: Dict[Hashable, Hashable] = {}
+
+    @classmethod
+    def user_deleted(cls, user_id: str) -> None:
+        cls.deleted_users.add(str(user_id))
+
+    @classmethod
+    def match_touched(cls, match_id: Hashable, user_id_1: str, user_id_2: str) -> None:
+        cls.matches[match_id] = (str(user_id_1), str(user_id_2))
+
+    @classmethod
+    def chatroom_created(cls, chatroom_id: Hashable) -> None:
+        cls.chatrooms.add(chatroom_id)
+
+    @classmethod
+    def message_inserted(cls, message_id: Hashable, chatroom_id: Hashable) -> None:
+        cls.messages[message_id] = chatroom_id
+
+    @classmethod
+    def drain(cls) -> Dict[str, Any]:
+        """取出并清空当前日志"""
+        changes = {
+            "deleted_users": cls.deleted_users,
+            "matches": cls.matches,
+            "chatrooms": cls.chatrooms,
+            "messages": cls.messages,
+        }
+        cls.deleted_users = set()
+        cls.matches = {}
+        cls.chatrooms = set()
+        cls.messages = {}
+        return changes
+
+    @classmethod
+    def restore(cls, changes: Dict[str, Any]) -> None:
+        """检查失败时把取出的记录放回，留给下一次检查"""
+        cls.deleted_users.update(changes["deleted_users"])
+        for match_id, user_ids in changes["matches"].items():
+            cls.matches.setdefault(match_id, user_ids)
+        cls.chatrooms.update(changes["chatrooms"])
+        for message_id, chatroom_id in changes["messages"].items():
+            cls.messages.setdefault(message_id, chatroom_id)
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls.deleted_users) + len(cls.matches) + len(cls.chatrooms) + len(cls.messages)
+
+    @classmethod
+    def get_status(cls) -> Dict[str, int]:
+        return {
+            "deleted_users": len(cls.deleted_users),
+            "matches": len(cls.matches),
+            "chatrooms": len(cls.chatrooms),
+            "messages": len(cls.messages),
+        }
@@ -0,0 +1,517 @@
+"""
+变更追踪层（写回缓存的脏标记）
+- 领域对象在持久化字段变更时自动把自己登记为"脏"
+- 各管理器的 save_to_database 只刷新脏集合，而不是整表重写
+- 每次刷新记录写入数量与耗时，便于监控
+- 多 worker 模式下记录脏对象本轮第一次修改前的文档，变更订阅据此把远端写入与本地修改三方合并
+- 领域对象使用 __slots__；整数ID集合存为 array('q')，用户ID字符串驻留（sys.intern）以共享同一对象
+"""
+import sys
+import time
+import weakref
+from array import array
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+class ChangeTracker:
+    """
+    全局脏对象登记表，按集合名分组
+    属性：
+        _dirty: dict{collection, dict{key, obj}}  # obj 为领域对象；字典型管理器登记时为 None
+        _dirty_since: dict{collection, float}     # 该集合最早一次变脏的时间戳
+        _last_flush: dict{manager_name, dict}     # 每个管理器最近一次刷新的统计
+        _bases: dict{collection, dict{key, document}}  # 脏对象本轮第一次修改前的文档（仅 capture_bases 开启时记录）
+        journal: 启用本地日志后指向 Journal，每次登记脏对象都会记入日志
+        capture_bases: 多 worker 模式下开启，远端写入与本地未写回的修改按共同祖先三方合并
+    """
+    _dirty: Dict[str, Dict[Hashable, Any]] = {}
+    _dirty_since: Dict[str, float] = {}
+    _last_flush: Dict[str, Dict[str, Any]] = {}
+    _bases: Dict[str, Dict[Hashable, dict]] = {}
+    journal = None
+    capture_bases = False
+
+    @classmethod
+    def mark_dirty(cls, collection: str, key: Hashable, obj: Any = None) -> None:
+        """登记一个脏对象"""
+        bucket = cls._dirty.get(collection)
+        if bucket is None:
+            bucket = cls._dirty[collection] = {}
+        if not bucket:
+            cls._dirty_since[collection] = time.time()
+        bucket[key] = obj
+        if cls.journal is not None:
+            cls.journal.note(collection, key, obj)
+
+    @classmethod
+    def before_change(cls, obj: Any) -> None:
+        """
+        领域对象修改前调用：对象还不是脏对象时记录其当前文档作为共同祖先
+        已是脏对象（本轮已记录，或是尚未写入数据库的新对象）时不再记录
+        """
+        key = getattr(obj, obj._tracked_key, None)
+        if key is None:
+            return
+        collection = obj._tracked_collection
+        bases = cls._bases.get(collection)
+        if bases is None:
+            bases = cls._bases[collection] = {}
+        if key in bases or key in cls._dirty.get(collection, ()):
+            return
+        try:
+            bases[key] = obj.to_document()
+        except AttributeError:
+            # 构造中的对象字段尚未齐全
+            return
+
+    @classmethod
+    def base_of(cls, collection: str, key: Hashable) -> Optional[dict]:
+        """返回脏对象的共同祖先文档，没有记录时返回 None"""
+        return cls._bases.get(collection, {}).get(key)
+
+    @classmethod
+    def rebase(cls, collection: str, key: Hashable, document: dict) -> None:
+        """远端写入合并进本地对象后，以远端文档作为新的共同祖先"""
+        cls._bases.setdefault(collection, {})[key] = document
+
+    @classmethod
+    def discard(cls, collection: str, key: Hashable, obj: Any = None) -> None:
+        """撤销登记；传入 obj 时只在登记的正是该对象时撤销"""
+        bucket = cls._dirty.get(collection)
+        if not bucket or key not in bucket:
+            return
+        if obj is not None and bucket[key] is not obj:
+            return
+        del bucket[key]
+        cls._bases.get(collection, {}).pop(key, None)
+        if not bucket:
+            cls._dirty_since.pop(collection, None)
+
+    @classmethod
+    async def pop_dirty(cls, collection: str) -> Dict[Hashable, Any]:
+        """取出并清空某个集合的脏对象（刷新开始时调用）；启用日志时等待封存完成"""
+        bucket = cls._dirty.pop(collection, None) or {}
+        cls._dirty_since.pop(collection, None)
+        cls._bases.pop(collection, None)
+        if cls.journal is not None:
+            # 封存该集合的日志，刷新成功后才删除
+            await cls.journal.seal(collection)
+        return bucket
+
+    @classmethod
+    def peek_dirty(cls) -> Dict[str, Dict[Hashable, Any]]:
+        """返回全部脏对象的副本，不改变登记状态（停机溢写时使用）"""
+        return {collection: dict(bucket) for collection, bucket in cls._dirty.items() if bucket}
+
+    @classmethod
+    def is_dirty(cls, collection: str, key: Hashable) -> bool:
+        return key in cls._dirty.get(collection, {})
+
+    @classmethod
+    def dirty_count(cls, collection: Optional[str] = None) -> int:
+        if collection is not None:
+            return len(cls._dirty.get(collection, {}))
+        return sum(len(bucket) for bucket in cls._dirty.values())
+
+    @classmethod
+    def dirty_since(cls, collection: str) -> Optional[float]:
+        """返回该集合最早变脏的时间戳，没有脏对象时返回 None"""
+        return cls._dirty_since.get(collection)
+
+    @classmethod
+    def clear(cls, collection: Optional[str] = None) -> None:
+        if collection is None:
+            cls._dirty.clear()
+            cls._dirty_since.clear()
+            cls._bases.clear()
+        else:
+            cls._dirty.pop(collection, None)
+            cls._dirty_since.pop(collection, None)
+            cls._bases.pop(collection, None)
+
+    @classmethod
+    def record_flush(cls, manager_name: str, written: int, failed: int, elapsed: float, collections=()) -> Dict[str, Any]:
+        """
+        记录一次刷新的结果，返回统计字典
+        collections 为本次刷新覆盖的集合；全部写入成功时释放这些集合已封存的日志
+        """
+        report = {
+            "written": written,
+            "failed": failed,
+            "elapsed": round(elapsed, 4),
+            "finished_at": time.time(),
+        }
+        cls._last_flush[manager_name] = report
+        if failed == 0 and cls.journal is not None:
+            for collection in collections:
+                cls.journal.release(collection)
+        return report
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        """获取脏集合与最近刷新统计（供状态报告使用）"""
+        return {
+            "dirty": {name: len(bucket) for name, bucket in cls._dirty.items()},
+            "last_flush": dict(cls._last_flush),
+        }
+
+
+class TrackedList(list):
+    """
+    会通知所属对象变脏的列表
+    - 覆盖所有原地修改方法
+    - intern=True 时新加入的字符串元素会被驻留（用户ID列表）
+    - 序列化时还原为普通 list
+    """
+    __slots__ = ("_owner", "_intern")
+
+    def __init__(self, iterable=(), owner=None, intern=False):
+        super().__init__(iterable)
+        self._owner = weakref.ref(owner) if owner is not None else None
+        self._intern = intern
+
+    def _before(self):
+        if ChangeTracker.capture_bases:
+            owner = self._owner() if self._owner is not None else None
+            if owner is not None:
+                ChangeTracker.before_change(owner)
+
+    def _touch(self):
+        owner = self._owner() if self._owner is not None else None
+        if owner is not None:
+            owner.mark_dirty()
+
+    def _interned(self, item):
+        return sys.intern(item) if self._intern and type(item) is str else item
+
+    def append(self, item):
+        self._before()
+        super().append(self._interned(item))
+        self._touch()
+
+    def extend(self, iterable):
+        self._before()
+        super().extend(self._interned(item) for item in iterable)
+        self._touch()
+
+    def insert(self, index, item):
+        self._before()
+        super().insert(index, self._interned(item))
+        self._touch()
+
+    def remove(self, item):
+        self._before()
+        super().remove(item)
+        self._touch()
+
+    def pop(self, *args):
+        self._before()
+        item = super().pop(*args)
+        self._touch()
+        return item
+
+    def clear(self):
+        self._before()
+        super().clear()
+        self._touch()
+
+    def sort(self, *args, **kwargs):
+        self._before()
+        super().sort(*args, **kwargs)
+        self._touch()
+
+    def reverse(self):
+        self._before()
+        super().reverse()
+        self._touch()
+
+    def __setitem__(self, index, value):
+        self._before()
+        super().__setitem__(index, value)
+        self._touch()
+
+    def __delitem__(self, index):
+        self._before()
+        super().__delitem__(index)
+        self._touch()
+
+    def __iadd__(self, other):
+        self._before()
+        result = super().__iadd__(other)
+        self._touch()
+        return result
+
+    def __imul__(self, n):
+        self._before()
+        result = super().__imul__(n)
+        self._touch()
+        return result
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+class TrackedIdArray(array):
+    """
+    会通知所属对象变脏的整数ID集合（array('q')，每个ID占 8 字节，不再逐个装箱）
+    - 提供与 TrackedList 相同的原地修改方法，保持插入顺序
+    - 与 list 比较相等，序列化时还原为普通 list
+    """
+    __slots__ = ("_owner",)
+
+    def __new__(cls, iterable=(), owner=None):
+        return super().__new__(cls, "q", iterable)
+
+    def __init__(self, iterable=(), owner=None):
+        self._owner = weakref.ref(owner) if owner is not None else None
+
+    @staticmethod
+    def accepts(values) -> bool:
+        """values 中全部为 int64 范围内的整数时才能存为数组（历史数据中的其他类型仍用 TrackedList）"""
+        return all(type(value) is int and _INT64_MIN <= value <= _INT64_MAX for value in values)
+
+    def _before(self):
+        if ChangeTracker.capture_bases:
+            owner = self._owner() if self._owner is not None else None
+            if owner is not None:
+                ChangeTracker.before_change(owner)
+
+    def _touch(self):
+        owner = self._owner() if self._owner is not None else None
+        if owner is not None:
+            owner.mark_dirty()
+
+    def append(self, item):
+        self._before()
+        super().append(item)
+        self._touch()
+
+    def extend(self, iterable):
+        self._before()
+        super().extend(iterable)
+        self._touch()
+
+    def insert(self, index, item):
+        self._before()
+        super().insert(index, item)
+        self._touch()
+
+    def remove(self, item):
+        self._before()
+        super().remove(item)
+        self._touch()
+
+    def pop(self, *args):
+        self._before()
+        item = super().pop(*args)
+        self._touch()
+        return item
+
+    def clear(self):
+        self._before()
+        super().__delitem__(slice(None))
+        self._touch()
+
+    def reverse(self):
+        self._before()
+        super().reverse()
+        self._touch()
+
+    def __setitem__(self, index, value):
+        self._before()
+        super().__setitem__(index, value)
+        self._touch()
+
+    def __delitem__(self, index):
+        self._before()
+        super().__delitem__(index)
+        self._touch()
+
+    def __iadd__(self, other):
+        self._before()
+        result = super().__iadd__(array("q", other))
+        self._touch()
+        return result
+
+    def __imul__(self, n):
+        self._before()
+        result = super().__imul__(n)
+        self._touch()
+        return result
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+class TrackedDict(dict):
+    """会通知所属对象变脏的字典（仅追踪顶层修改）"""
+    __slots__ = ("_owner",)
+
+    def __init__(self, mapping=(), owner=None):
+        super().__init__(mapping)
+        self._owner = weakref.ref(owner) if owner is not None else None
+
+    def _before(self):
+        if ChangeTracker.capture_bases:
+            owner = self._owner() if self._owner is not None else None
+            if owner is not None:
+                ChangeTracker.before_change(owner)
+
+    def _touch(self):
+        owner = self._owner() if self._owner is not None else None
+        if owner is not None:
+            owner.mark_dirty()
+
+    def __setitem__(self, key, value):
+        self._before()
+        super().__setitem__(key, value)
+        self._touch()
+
+    def __delitem__(self, key):
+        self._before()
+        super().__delitem__(key)
+        self._touch()
+
+    def pop(self, *args):
+        self._before()
+        value = super().pop(*args)
+        self._touch()
+        return value
+
+    def popitem(self):
+        self._before()
+        item = super().popitem()
+        self._touch()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._before()
+            self._touch()
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._before()
+        super().update(*args, **kwargs)
+        self._touch()
+
+    def clear(self):
+        self._before()
+        super().clear()
+        self._touch()
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class ChangeTrackingMixin:
+    """
+    领域对象的变更追踪混入类
+    子类需声明：
+        _tracked_collection: 对应的 MongoDB 集合名
+        _tracked_key: 作为主键的属性名
+        _tracked_fields: 需要持久化的属性名集合（对其赋值即视为变更）
+        __slots__: 全部实例属性（含不持久化的运行期引用），不再为每个实例分配 __dict__
+    可选声明：
+        _id_array_fields: 整数ID列表字段，存为 TrackedIdArray
+        _interned_fields: 用户ID字段（字符串或字符串列表），赋值时驻留，同一ID在各对象间共享一个字符串
+    """
+    # TrackedList 等以弱引用指向所属对象
+    __slots__ = ("__weakref__",)
+
+    _tracked_collection: str = ""
+    _tracked_key: str = ""
+    _tracked_fields: frozenset = frozenset()
+    _id_array_fields: frozenset = frozenset()
+    _interned_fields: frozenset = frozenset()
+
+    def __setattr__(self, name, value):
+        if name not in self._tracked_fields:
+            object.__setattr__(self, name, value)
+            return
+        if ChangeTracker.capture_bases:
+            ChangeTracker.before_change(self)
+
+        if name == self._tracked_key:
+            # 主键被重新赋值（如从数据库恢复ID）时，撤销旧主键的登记
+            old_key = getattr(self, name, None)
+            if old_key is not None and old_key != value:
+                ChangeTracker.discard(self._tracked_collection, old_key, self)
+
+        object.__setattr__(self, name, self._track(name, value))
+        self.mark_dirty()
+
+    def _track(self, name, value):
+        """
+        持久化字段的存储形式：可变容器包装为可追踪版本（原地修改也能标脏），
+        整数ID列表存为数组，用户ID字符串驻留
+        """
+        intern = name in self._interned_fields
+        if intern and type(value) is str:
+            return sys.intern(value)
+        if isinstance(value, (list, array)):
+            if name in self._id_array_fields and TrackedIdArray.accepts(value):
+                return TrackedIdArray(value, self)
+            if intern:
+                value = [sys.intern(item) if type(item) is str else item for item in value]
+            return TrackedList(value, self, intern)
+        if isinstance(value, dict):
+            return TrackedDict(value, self)
+        return value
+
+    @classmethod
+    def _from_fields(cls, fields: Dict[str, Any]):
+        """
+        绕过 __init__ 按字段直接重建对象（从数据库加载时使用）
+        不消耗ID计数器、不登记脏对象；可变容器同样包装为可追踪版本
+        """
+        obj = cls.__new__(cls)
+        for name, value in fields.items():
+            if name in cls._tracked_fields:
+                value = obj._track(name, value)
+            object.__setattr__(obj, name, value)
+        return obj
+
+    def refresh_from(self, source: "ChangeTrackingMixin") -> None:
+        """
+        用另一个实例（通常由 from_document 重建）的持久化字段原地覆盖自己（应用其他进程的写入时使用）
+        对象身份不变，其他结构持有的引用仍然有效；不登记脏对象
+        """
+        for name in self._tracked_fields:
+            value = getattr(source, name, _MISSING)
+            if value is _MISSING:
+                continue
+            object.__setattr__(self, name, self._track(name, value))
+
+    def mark_dirty(self) -> None:
+        """把自己登记为脏对象（主键尚未赋值时忽略）"""
+        key = getattr(self, self._tracked_key, None)
+        if key is not None:
+            ChangeTracker.mark_dirty(self._tracked_collection, key, self)
+
+    def mark_clean(self) -> None:
+        """撤销自己的脏登记（已写回数据库或刚从数据库加载）"""
+        key = getattr(self, self._tracked_key, None)
+        if key is not None:
+            ChangeTracker.discard(self._tracked_collection, key, self)
+
+    @property
+    def is_dirty(self) -> bool:
+        key = getattr(self, self._tracked_key, None)
+        return key is not None and ChangeTracker._dirty.get(self._tracked_collection, {}).get(key) is self
@@ -0,0 +1,136 @@
+"""
+文档编解码层（按集合声明）
+- 每个集合声明哪些字段是 ObjectId；读路径只转换这些字段，不再对每个文档做 Python 层的递归遍历
+- 不含 ObjectId 的集合（主键为 openid / 自增整数）走空操作快速路径，文档原样返回
+- 可选声明领域模型，直接把文档解码为 User / Match / Post / Comment 等对象（绕过 __init__，不消耗ID计数器、不标脏）
+- 未声明的集合回退到递归转换，保持与原先 convert_objectid_to_str 相同的行为
+"""
+import importlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("codec")
+
+
+def convert_objectid_to_str(data):
+    """将字典中的所有ObjectID转换为字符串"""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, ObjectId):
+                data[key] = str(value)
+            elif isinstance(value, dict):
+                convert_objectid_to_str(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        convert_objectid_to_str(item)
+    return data
+
+
+class Codec:
+    """
+    单个集合的编解码器
+    属性：
+        collection: 集合名
+        object_id_fields: 声明为 ObjectId 的顶层字段，解码时转为字符串；为空即走快速路径
+        model: 领域模型的导入路径（"模块.类名"），首次使用时才导入，避免循环依赖
+    """
+
+    def __init__(self, collection: str, object_id_fields: Iterable[str] = (), model: Optional[str] = None):
+        self.collection = collection
+        self.object_id_fields = tuple(object_id_fields)
+        self.model = model
+        self._model_class = None
+
+    @property
+    def passthrough(self) -> bool:
+        return not self.object_id_fields
+
+    def decode(self, document: Optional[dict]) -> Optional[dict]:
+        """解码单个文档（原地修改并返回）"""
+        if document is None or self.passthrough:
+            return document
+        for field in self.object_id_fields:
+            value = document.get(field)
+            if type(value) is ObjectId:
+                document[field] = str(value)
+        return document
+
+    def decode_many(self, documents: List[dict]) -> List[dict]:
+        if self.passthrough:
+            return documents
+        return [self.decode(document) for document in documents]
+
+    def model_class(self):
+        if self._model_class is None:
+            if self.model is None:
+                raise TypeError(f"No model declared for collection {self.collection}")
+            module_name, class_name = self.model.rsplit(".", 1)
+            self._model_class = getattr(importlib.import_module(module_name), class_name)
+        return self._model_class
+
+    def to_object(self, document: dict) -> Any:
+        """把已解码的文档直接重建为领域对象"""
+        return self.model_class().from_document(document)
+
+    def to_objects(self, documents: List[dict]) -> List[Any]:
+        """批量重建领域对象；单个文档损坏时记录错误并跳过，不影响同批其余文档"""
+        model_class = self.model_class()
+        objects = []
+        for document in documents:
+            try:
+                objects.append(model_class.from_document(document))
+            except Exception as e:
+                logger.error(f"Error decoding {self.collection} document {document.get('_id', 'unknown')}: {e}")
+        return objects
+
+
+class _RecursiveCodec(Codec):
+    """未声明集合的回退编解码器：递归转换全部 ObjectId"""
+
+    @property
+    def passthrough(self) -> bool:
+        return False
+
+    def decode(self, document: Optional[dict]) -> Optional[dict]:
+        return convert_objectid_to_str(document) if document else document
+
+
+class CodecRegistry:
+    """
+    全局编解码器登记表
+    属性：
+        _codecs: dict{collection, Codec}
+    """
+    _codecs: Dict[str, Codec] = {}
+
+    @classmethod
+    def register(cls, codec: Codec) -> Codec:
+        cls._codecs[codec.collection] = codec
+        return codec
+
+    @classmethod
+    def get(cls, collection: str) -> Codec:
+        codec = cls._codecs.get(collection)
+        if codec is None:
+            codec = cls._codecs[collection] = _RecursiveCodec(collection)
+        return codec
+
+
+# 主键由本服务生成（openid / 自增整数），文档中不含 ObjectId
+CodecRegistry.register(Codec("users", model="app.objects.User.User"))
+CodecRegistry.register(Codec("matches", model="app.objects.Match.Match"))
+CodecRegistry.register(Codec("posts", model="app.objects.Post.Post"))
+CodecRegistry.register(Codec("chatrooms"))
+CodecRegistry.register(Codec("messages"))
+CodecRegistry.register(Codec("comments", model="app.objects.Comment.Comment"))
+# 以业务字段为键写入的集合：AI_chatroom 等文档不带 _id，由 MongoDB 生成 ObjectId；
+# AI_message 新文档使用整数 _id，早先按业务字段 upsert 写入的文档仍可能是 ObjectId
+CodecRegistry.register(Codec("AI_chatroom", object_id_fields=("_id",)))
+CodecRegistry.register(Codec("AI_message", object_id_fields=("_id",)))
+CodecRegistry.register(Codec("personality_test_records", object_id_fields=("_id",)))
+CodecRegistry.register(Codec("personality_questions", object_id_fields=("_id",)))
+CodecRegistry.register(Codec("personality_cards", object_id_fields=("_id",)))
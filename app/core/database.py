@@ -1,30 +1,348 @@
+import asyncio
+import functools
+import json
+import random
 import sys
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import AutoReconnect, BulkWriteError, NetworkTimeout
 
 ROOT_PATH = Path(__file__).resolve().parents[2]
 sys.path.append(str(ROOT_PATH))
 from app.config import settings
+from app.core.change_feed import ChangeFeed
+from app.core.codec import CodecRegistry, convert_objectid_to_str  # noqa: F401  兼容旧的导入路径
+from app.core.journal import Journal
+from app.core.memory_backend import MemoryDatabase
+from app.core.metrics import Metrics
+from app.core.query_cache import QueryCache
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("database")
 
+# 每次经 Database 写入时附加的时间戳字段，快照热启动据此只追平快照之后变更的文档
+MODIFIED_AT_FIELD = "_modified_at"
 
-def convert_objectid_to_str(data):
-    """将字典中的所有ObjectID转换为字符串"""
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, ObjectId):
-                data[key] = str(value)
-            elif isinstance(value, dict):
-                convert_objectid_to_str(value)
-            elif isinstance(value, list):
-                for item in value:
-                    if isinstance(item, dict):
-                        convert_objectid_to_str(item)
-    return data
+
+def with_modified_at(update: dict) -> dict:
+    """返回附加了写入时间戳的更新语句（不修改调用方传入的字典）"""
+    set_fields = dict(update.get("$set", {}))
+    set_fields[MODIFIED_AT_FIELD] = datetime.now(timezone.utc)
+    return {**update, "$set": set_fields}
+
+
+def query_shape(value):
+    """把查询中的取值替换为 "?"，只保留字段名与操作符（慢操作日志不记录用户数据）"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0])] if value else []
+    return "?"
+
+
+Metrics.describe("db_operation_seconds", "Latency of Database facade calls by collection and operation")
+Metrics.describe("db_operation_errors_total", "Failed Database facade calls by collection and operation")
+
+
+def record_operation(operation: str, collection_name: str, duration: float, failed: bool = False, sample=None) -> None:
+    """记录一次数据库操作的耗时与失败；超过阈值时写慢操作日志（附查询形状）"""
+    Metrics.observe("db_operation_seconds", duration, collection=collection_name, operation=operation)
+    if failed:
+        Metrics.increment("db_operation_errors_total", collection=collection_name, operation=operation)
+    if duration >= settings.DB_SLOW_OP_THRESHOLD:
+        if isinstance(sample, list):
+            shape = f"{len(sample)} documents"
+        else:
+            shape = query_shape(sample) if sample is not None else None
+        Metrics.record_slow(collection=collection_name, operation=operation, duration=round(duration, 4), shape=shape)
+        logger.warning(f"Slow {operation} on {collection_name}: {duration * 1000:.1f}ms shape={shape}")
+
+
+Metrics.describe("db_pool_checkouts_total", "Connections checked out of the MongoDB pool")
+Metrics.describe("db_pool_checkout_failures_total", "Failed pool checkouts by reason (timeout = pool exhausted)")
+Metrics.describe("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection")
+Metrics.describe("db_pool_connections_in_use", "Connections currently checked out of the pool")
+Metrics.describe("db_pool_connections_open", "Connections currently open in the pool")
+
+
+def _address(address) -> str:
+    host, port = address
+    return f"{host}:{port}"
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    连接池事件监听器：把检出次数、等待时间、失败原因与占用/打开的连接数写入 Metrics
+    pymongo 在持有连接池锁时同步回调，这里只做计数，不做任何 I/O
+    """
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        address = _address(event.address)
+        Metrics.set_gauge("db_pool_connections_in_use", 0, address=address)
+        Metrics.set_gauge("db_pool_connections_open", 0, address=address)
+
+    def connection_created(self, event):
+        Metrics.adjust_gauge("db_pool_connections_open", 1, address=_address(event.address))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        Metrics.adjust_gauge("db_pool_connections_open", -1, address=_address(event.address))
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        Metrics.increment("db_pool_checkout_failures_total", address=_address(event.address), reason=event.reason)
+        Metrics.observe("db_pool_checkout_wait_seconds", event.duration or 0.0, address=_address(event.address))
+
+    def connection_checked_out(self, event):
+        address = _address(event.address)
+        Metrics.increment("db_pool_checkouts_total", address=address)
+        Metrics.observe("db_pool_checkout_wait_seconds", event.duration or 0.0, address=address)
+        Metrics.adjust_gauge("db_pool_connections_in_use", 1, address=address)
+
+    def connection_checked_in(self, event):
+        Metrics.adjust_gauge("db_pool_connections_in_use", -1, address=_address(event.address))
+
+
+def client_options() -> dict:
+    """由 settings 生成 Motor 客户端参数（连接池、压缩与事件监听）"""
+    options = {
+        "username": settings.MONGODB_USERNAME,
+        "password": settings.MONGODB_PASSWORD,
+        "authSource": settings.MONGODB_AUTH_SOURCE,
+        "serverSelectionTimeoutMS": 5000,
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "event_listeners": [PoolMetricsListener()],
+    }
+    # 0 表示不限制，交给驱动默认值
+    if settings.MONGODB_MAX_IDLE_TIME_MS > 0:
+        options["maxIdleTimeMS"] = settings.MONGODB_MAX_IDLE_TIME_MS
+    if settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options["waitQueueTimeoutMS"] = settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS
+    compressors = [name.strip() for name in settings.MONGODB_COMPRESSORS.split(",") if name.strip()]
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+Metrics.describe("db_injected_faults_total", "Faults injected into Database calls by collection, operation and kind")
+
+# 可注入故障的集合方法（驱动层方法名；bulk_upsert 对应 bulk_write，find 在游标取数时注入）
+FAULT_OPERATIONS = frozenset({
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "find_one_and_update", "delete_one", "delete_many", "count_documents", "bulk_write", "create_indexes",
+})
+
+
+class FaultRule:
+    """
+    一条故障注入规则
+    属性：
+        collection / operation: 匹配的集合与驱动操作名，"*" 匹配任意
+        latency: 每次调用附加的固定延迟（秒）
+        jitter: 叠加的 [0, jitter) 均匀随机延迟
+        tail_rate / tail_latency: 以 tail_rate 的概率再附加 tail_latency（模拟 p99 抖高）
+        error_rate: 延迟之后抛出 AutoReconnect 的概率
+        timeout_rate / timeout: 以 timeout_rate 的概率等待 timeout 秒后抛出 NetworkTimeout
+    """
+
+    def __init__(
+        self,
+        collection: str = "*",
+        operation: str = "*",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_latency: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout: float = 5.0,
+    ):
+        if operation != "*" and operation not in FAULT_OPERATIONS:
+            raise ValueError(f"Unknown operation for fault rule: {operation}")
+        self.collection = collection
+        self.operation = operation
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+
+    def matches(self, collection_name: str, operation: str) -> bool:
+        return self.collection in ("*", collection_name) and self.operation in ("*", operation)
+
+    @property
+    def specificity(self) -> int:
+        return (self.collection != "*") * 2 + (self.operation != "*")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class FaultInjector:
+    """
+    全局故障注入登记表（仅用于压测与故障演练）
+    - 规则来自 settings.DB_FAULT_INJECTION（JSON 列表），也可在运行期 configure / add_rule
+    - 同一次调用只应用最具体的一条规则（集合+操作 > 集合 > 操作 > 通配）
+    - 注入发生在集合层（get_collection 返回的代理上），门面自身的错误处理、重试与指标照常生效
+    """
+    _rules: List[FaultRule] = [FaultRule(**spec) for spec in json.loads(settings.DB_FAULT_INJECTION or "[]")]
+    _random = random.Random(settings.DB_FAULT_SEED)
+
+    @classmethod
+    def configure(cls, rules: Iterable[Any], seed: Optional[int] = None) -> None:
+        """替换全部规则（元素可为 FaultRule 或其参数字典）"""
+        cls._rules = [rule if isinstance(rule, FaultRule) else FaultRule(**rule) for rule in rules]
+        if seed is not None:
+            cls._random.seed(seed)
+        if cls._rules:
+            logger.warning(f"Database fault injection enabled: {[rule.to_dict() for rule in cls._rules]}")
+
+    @classmethod
+    def add_rule(cls, **kwargs) -> FaultRule:
+        rule = FaultRule(**kwargs)
+        cls._rules.append(rule)
+        logger.warning(f"Database fault injection rule added: {rule.to_dict()}")
+        return rule
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._rules = []
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return bool(cls._rules)
+
+    @classmethod
+    def rule_for(cls, collection_name: str, operation: str) -> Optional[FaultRule]:
+        candidates = [rule for rule in cls._rules if rule.matches(collection_name, operation)]
+        return max(candidates, key=lambda rule: rule.specificity) if candidates else None
+
+    @classmethod
+    async def inject(cls, collection_name: str, operation: str) -> None:
+        rule = cls.rule_for(collection_name, operation)
+        if rule is None:
+            return
+        if rule.timeout_rate and cls._random.random() < rule.timeout_rate:
+            Metrics.increment("db_injected_faults_total", collection=collection_name, operation=operation, fault="timeout")
+            await asyncio.sleep(rule.timeout)
+            raise NetworkTimeout(f"Injected timeout on {collection_name}.{operation}")
+        delay = rule.latency
+        if rule.jitter:
+            delay += cls._random.random() * rule.jitter
+        if rule.tail_rate and cls._random.random() < rule.tail_rate:
+            delay += rule.tail_latency
+            Metrics.increment("db_injected_faults_total", collection=collection_name, operation=operation, fault="tail_latency")
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rule.error_rate and cls._random.random() < rule.error_rate:
+            Metrics.increment("db_injected_faults_total", collection=collection_name, operation=operation, fault="error")
+            raise AutoReconnect(f"Injected error on {collection_name}.{operation}")
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        return {"enabled": cls.enabled(), "rules": [rule.to_dict() for rule in cls._rules]}
+
+
+class _FaultyCursor:
+    """游标代理：第一次取数（to_list 或异步迭代）前注入故障"""
+
+    def __init__(self, cursor, collection_name: str):
+        self._cursor = cursor
+        self._collection_name = collection_name
+        self._injected = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, *args, **kwargs):
+        self._cursor = self._cursor.limit(*args, **kwargs)
+        return self
+
+    def batch_size(self, *args, **kwargs):
+        self._cursor = self._cursor.batch_size(*args, **kwargs)
+        return self
+
+    async def _inject_once(self):
+        if not self._injected:
+            self._injected = True
+            await FaultInjector.inject(self._collection_name, "find")
+
+    async def to_list(self, *args, **kwargs):
+        await self._inject_once()
+        return await self._cursor.to_list(*args, **kwargs)
+
+    def __aiter__(self):
+        self._iterator = self._cursor.__aiter__()
+        return self
+
+    async def __anext__(self):
+        await self._inject_once()
+        return await self._iterator.__anext__()
+
+
+class _FaultyCollection:
+    """集合代理：对 FAULT_OPERATIONS 中的异步方法先注入故障再调用真实集合"""
+
+    def __init__(self, collection, collection_name: str):
+        self._collection = collection
+        self._collection_name = collection_name
+
+    def find(self, *args, **kwargs):
+        return _FaultyCursor(self._collection.find(*args, **kwargs), self._collection_name)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name not in FAULT_OPERATIONS:
+            return attribute
+
+        async def call(*args, **kwargs):
+            await FaultInjector.inject(self._collection_name, name)
+            return await attribute(*args, **kwargs)
+        return call
+
+
+def instrumented(operation: str):
+    """装饰 Database 的异步方法：按集合与操作记录耗时、失败次数，以第一个参数（查询或文档）作为慢操作样本"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(cls, collection_name: str, *args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return await func(cls, collection_name, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                sample = args[0] if args else kwargs.get("query", kwargs.get("documents", kwargs.get("document")))
+                record_operation(operation, collection_name, time.perf_counter() - started, failed, sample)
+        return wrapper
+    return decorator
 
 
 class Database:
@@ -33,33 +351,33 @@ class Database:
 
     @classmethod
     async def connect(cls):
-        """连接到 MongoDB"""
+        """连接到 MongoDB（settings.DB_BACKEND 为 memory 时改用进程内存储引擎）"""
+        if FaultInjector.enabled():
+            logger.warning(f"Database fault injection is active: {FaultInjector.get_status()['rules']}")
+        if settings.DB_BACKEND == "memory":
+            cls.use_backend(MemoryDatabase(settings.DB_MEMORY_LATENCY, settings.DB_MEMORY_JITTER))
+            return
         try:
-            # 使用同步客户端测试连接
-            test_client = MongoClient(
-                settings.MONGODB_URL,
-                username=settings.MONGODB_USERNAME,
-                password=settings.MONGODB_PASSWORD,
-                authSource=settings.MONGODB_AUTH_SOURCE,
-                serverSelectionTimeoutMS=5000,
-            )
-            test_client.server_info()  # 测试连接
-            test_client.close()
-
-            # 创建异步客户端
-            cls.client = AsyncIOMotorClient(
-                settings.MONGODB_URL,
-                username=settings.MONGODB_USERNAME,
-                password=settings.MONGODB_PASSWORD,
-                authSource=settings.MONGODB_AUTH_SOURCE,
-                serverSelectionTimeoutMS=5000,
-            )
+            cls.client = AsyncIOMotorClient(settings.MONGODB_URL, **client_options())
+            # 异步 ping 确认可连接（不再额外创建同步客户端探测）
+            await cls.client.admin.command("ping")
             cls.db = cls.client[settings.MONGODB_DB_NAME]
             logger.info("Connected to MongoDB successfully")
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
+            if cls.client:
+                cls.client.close()
+                cls.client = None
             raise
 
+    @classmethod
+    def use_backend(cls, db) -> None:
+        """替换存储后端（任何实现 Motor 集合接口、可按名称取集合的对象），供基准测试与单元测试使用"""
+        cls.client = None
+        cls.db = db
+        QueryCache.clear()
+        logger.info(f"Using {type(db).__name__} storage backend")
+
     @classmethod
     async def close(cls):
         """关闭 MongoDB 连接"""
@@ -74,14 +392,21 @@ class Database:
 
     @classmethod
     def get_collection(cls, collection_name: str):
-        """获取集合实例"""
-        return cls.get_db()[collection_name]
+        """获取集合实例（启用故障注入时返回注入代理）"""
+        collection = cls.get_db()[collection_name]
+        if FaultInjector.enabled():
+            return _FaultyCollection(collection, collection_name)
+        return collection
 
     @classmethod
+    @instrumented("insert_one")
     async def insert_one(cls, collection_name: str, document: dict):
         """插入单个文档"""
         try:
+            document = {**document, MODIFIED_AT_FIELD: datetime.now(timezone.utc)}
             result = await cls.get_collection(collection_name).insert_one(document)
+            QueryCache.invalidate(collection_name, ids=[result.inserted_id])
+            ChangeFeed.publish_upserts(collection_name, [document])
             logger.info(f"Inserted document with id: {result.inserted_id}")
             return str(result.inserted_id)
         except Exception as e:
@@ -89,10 +414,15 @@ class Database:
             raise
 
     @classmethod
+    @instrumented("insert_many")
     async def insert_many(cls, collection_name: str, documents: list):
         """插入多个文档"""
         try:
+            modified_at = datetime.now(timezone.utc)
+            documents = [{**document, MODIFIED_AT_FIELD: modified_at} for document in documents]
             result = await cls.get_collection(collection_name).insert_many(documents)
+            QueryCache.invalidate(collection_name, ids=result.inserted_ids)
+            ChangeFeed.publish_upserts(collection_name, documents)
             logger.info(f"Inserted {len(result.inserted_ids)} documents")
             return [str(id) for id in result.inserted_ids]
         except Exception as e:
@@ -101,15 +431,29 @@ class Database:
 
     @classmethod
     async def find_one(cls, collection_name: str, query: dict):
-        """查找单个文档"""
+        """查找单个文档（按 _id 查询且集合配置了 TTL 时经读穿透缓存）"""
+        if not QueryCache.cacheable(collection_name, query):
+            return await cls._find_one(collection_name, query)
+        hit, document = QueryCache.get(collection_name, query)
+        if hit:
+            return document
+        version = QueryCache.version(collection_name)
+        document = await cls._find_one(collection_name, query)
+        QueryCache.put(collection_name, query, document, version)
+        return document
+
+    @classmethod
+    @instrumented("find_one")
+    async def _find_one(cls, collection_name: str, query: dict):
         try:
             result = await cls.get_collection(collection_name).find_one(query)
-            return convert_objectid_to_str(result) if result else None
+            return CodecRegistry.get(collection_name).decode(result) if result else None
         except Exception as e:
             logger.error(f"Error finding document: {e}")
             raise
 
     @classmethod
+    @instrumented("find")
     async def find(
         cls,
         collection_name: str,
@@ -126,16 +470,88 @@ class Database:
             if limit > 0:
                 cursor = cursor.limit(limit)
             results = await cursor.to_list(length=None)
-            return [convert_objectid_to_str(result) for result in results]
+            return CodecRegistry.get(collection_name).decode_many(results)
         except Exception as e:
             logger.error(f"Error finding documents: {e}")
             raise
 
     @classmethod
-    async def update_one(cls, collection_name: str, query: dict, update: dict):
+    async def iter(
+        cls,
+        collection_name: str,
+        query: Optional[dict] = None,
+        projection: Optional[dict] = None,
+        batch_size: Optional[int] = None,
+        sort: Optional[list] = None,
+        as_objects: bool = False,
+    ) -> AsyncIterator[List[Any]]:
+        """
+        按批流式读取文档（异步迭代器，每次产出一个列表）
+        与 find 不同，不会把整个结果集读入内存，适合启动加载与全表扫描
+        as_objects=True 时按集合编解码器直接产出领域对象
+        """
+        codec = CodecRegistry.get(collection_name)
+        batch_size = batch_size or settings.DB_ITER_BATCH_SIZE
+        cursor = cls.get_collection(collection_name).find(query or {}, projection or None)
+        if sort:
+            cursor = cursor.sort(sort)
+        cursor = cursor.batch_size(batch_size)
+        batch = []
+        # 只统计等待游标的时间，不含调用方处理每个批次的时间
+        started = time.perf_counter()
+        try:
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    record_operation("iter", collection_name, time.perf_counter() - started, sample=query or {})
+                    batch = codec.decode_many(batch)
+                    yield codec.to_objects(batch) if as_objects else batch
+                    batch = []
+                    started = time.perf_counter()
+        except Exception:
+            record_operation("iter", collection_name, time.perf_counter() - started, True, query or {})
+            raise
+        if batch:
+            record_operation("iter", collection_name, time.perf_counter() - started, sample=query or {})
+            batch = codec.decode_many(batch)
+            yield codec.to_objects(batch) if as_objects else batch
+
+    @classmethod
+    async def iter_documents(
+        cls,
+        collection_name: str,
+        documents: Optional[list] = None,
+        as_objects: bool = False,
+        **kwargs,
+    ) -> AsyncIterator[List[Any]]:
+        """
+        加载器使用：已传入文档（如快照热启动）时作为一个批次产出，否则按 iter 从数据库流式读取
+        """
+        if documents is not None:
+            if documents:
+                yield CodecRegistry.get(collection_name).to_objects(documents) if as_objects else documents
+            return
+        async for batch in cls.iter(collection_name, as_objects=as_objects, **kwargs):
+            yield batch
+
+    @classmethod
+    @instrumented("count_documents")
+    async def count_documents(cls, collection_name: str, query: Optional[dict] = None) -> int:
+        """统计匹配的文档数量"""
+        try:
+            return await cls.get_collection(collection_name).count_documents(query or {})
+        except Exception as e:
+            logger.error(f"Error counting documents: {e}")
+            raise
+
+    @classmethod
+    @instrumented("update_one")
+    async def update_one(cls, collection_name: str, query: dict, update: dict, upsert: bool = False):
         """更新单个文档"""
         try:
-            result = await cls.get_collection(collection_name).update_one(query, update)
+            result = await cls.get_collection(collection_name).update_one(query, with_modified_at(update), upsert=upsert)
+            QueryCache.invalidate(collection_name, query)
+            ChangeFeed.publish_keys(collection_name, "i", query)
             # logger.info(f"Modified {result.modified_count} document")
             return result.modified_count
         except Exception as e:
@@ -143,12 +559,15 @@ class Database:
             raise
 
     @classmethod
+    @instrumented("update_many")
     async def update_many(cls, collection_name: str, query: dict, update: dict):
         """更新多个文档"""
         try:
             result = await cls.get_collection(collection_name).update_many(
-                query, update
+                query, with_modified_at(update)
             )
+            QueryCache.invalidate(collection_name, query)
+            ChangeFeed.publish_keys(collection_name, "i", query)
             # logger.info(f"Modified {result.modified_count} documents")
             return result.modified_count
         except Exception as e:
@@ -156,10 +575,97 @@ class Database:
             raise
 
     @classmethod
+    @instrumented("find_one_and_update")
+    async def find_one_and_update(cls, collection_name: str, query: dict, update: dict, upsert: bool = False):
+        """原子地更新单个文档并返回更新后的文档"""
+        try:
+            result = await cls.get_collection(collection_name).find_one_and_update(
+                query, with_modified_at(update), upsert=upsert, return_document=ReturnDocument.AFTER
+            )
+            QueryCache.invalidate(collection_name, query)
+            ChangeFeed.publish_keys(collection_name, "i", query)
+            return CodecRegistry.get(collection_name).decode(result) if result else None
+        except Exception as e:
+            logger.error(f"Error finding and updating document: {e}")
+            raise
+
+    @classmethod
+    @instrumented("bulk_upsert")
+    async def bulk_upsert(
+        cls,
+        collection_name: str,
+        documents: list,
+        key: str = "_id",
+        batch_size: int = None,
+        replace: bool = False,
+    ) -> dict:
+        """
+        批量 upsert 文档（无序 bulk_write，每批一次往返）
+        - 默认使用 UpdateOne + $set，保留文档中本服务不管理的字段（与原先逐条 $set 的语义一致）
+        - key 不是 "_id" 而文档带有 _id 时，新建文档以 $setOnInsert 写入该 _id（与原先 insert_one 一致），不让 MongoDB 生成 ObjectId
+        - replace=True 且 key 为 "_id" 时使用 ReplaceOne 整文档替换
+        返回统计字典，failed_keys 为写入失败的文档主键列表，调用方可据此重试
+        """
+        result_summary = {"matched": 0, "modified": 0, "upserted": 0, "failed_keys": []}
+        if not documents:
+            return result_summary
+
+        batch_size = batch_size or settings.DB_BULK_BATCH_SIZE
+        collection = cls.get_collection(collection_name)
+        modified_at = datetime.now(timezone.utc)
+
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            operations = []
+            for document in batch:
+                if replace and key == "_id":
+                    replacement = {**document, MODIFIED_AT_FIELD: modified_at}
+                    operations.append(ReplaceOne({"_id": document["_id"]}, replacement, upsert=True))
+                else:
+                    payload = {k: v for k, v in document.items() if k != "_id"}
+                    payload[MODIFIED_AT_FIELD] = modified_at
+                    update = {"$set": payload}
+                    if key != "_id" and "_id" in document:
+                        update["$setOnInsert"] = {"_id": document["_id"]}
+                    operations.append(UpdateOne({key: document[key]}, update, upsert=True))
+
+            try:
+                result = await collection.bulk_write(operations, ordered=False)
+                QueryCache.invalidate(collection_name, ids=[document[key] for document in batch] if key == "_id" else None)
+                ChangeFeed.publish_upserts(collection_name, batch, key)
+                result_summary["matched"] += result.matched_count
+                result_summary["modified"] += result.modified_count
+                result_summary["upserted"] += result.upserted_count
+            except BulkWriteError as e:
+                # 无序写入：失败的只是个别文档，其余已生效
+                QueryCache.invalidate(collection_name, ids=[document[key] for document in batch] if key == "_id" else None)
+                details = e.details or {}
+                result_summary["matched"] += details.get("nMatched", 0)
+                result_summary["modified"] += details.get("nModified", 0)
+                result_summary["upserted"] += details.get("nUpserted", 0)
+                failed_indexes = {write_error["index"] for write_error in details.get("writeErrors", [])}
+                for index in sorted(failed_indexes):
+                    result_summary["failed_keys"].append(batch[index][key])
+                ChangeFeed.publish_upserts(
+                    collection_name, [document for index, document in enumerate(batch) if index not in failed_indexes], key
+                )
+                logger.error(f"Bulk upsert into {collection_name} partially failed: {len(details.get('writeErrors', []))} errors")
+            except Exception as e:
+                result_summary["failed_keys"].extend(document[key] for document in batch)
+                logger.error(f"Error bulk upserting documents into {collection_name}: {e}")
+
+        return result_summary
+
+    @classmethod
+    @instrumented("delete_one")
     async def delete_one(cls, collection_name: str, query: dict):
         """删除单个文档"""
         try:
             result = await cls.get_collection(collection_name).delete_one(query)
+            QueryCache.invalidate(collection_name, query)
+            ChangeFeed.publish_keys(collection_name, "x", query)
+            # 记录删除标记，避免日志重放时恢复已删除的文档
+            Journal.record_delete(collection_name, query)
             logger.info(f"Deleted {result.deleted_count} document")
             return result.deleted_count
         except Exception as e:
@@ -167,10 +673,14 @@ class Database:
             raise
 
     @classmethod
+    @instrumented("delete_many")
     async def delete_many(cls, collection_name: str, query: dict):
         """删除多个文档"""
         try:
             result = await cls.get_collection(collection_name).delete_many(query)
+            QueryCache.invalidate(collection_name, query)
+            ChangeFeed.publish_keys(collection_name, "x", query)
+            Journal.record_delete(collection_name, query)
             logger.info(f"Deleted {result.deleted_count} documents")
             return result.deleted_count
         except Exception as e:
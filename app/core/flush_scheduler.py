@@ -0,0 +1,234 @@
+"""
+刷新调度器（各管理器独立节奏的并发写回）
+- 每个管理器注册自己的刷新函数与刷新间隔，各自独立循环，互不阻塞
+- 全局信号量限制同时进行的刷新数量，避免瞬间占满数据库连接
+- 同一管理器的刷新通过各自的锁串行，绝不与上一次刷新重叠
+- 记录每个管理器最近一次刷新的时间戳与耗时，供监控使用
+- 声明了集合的任务按写入压力自适应刷新：脏对象数超过阈值或最早的脏对象超过最长等待时间（取先到者）
+  即刷新；数据库变慢或刷新失败时退避（放大阈值与等待时间），恢复后逐步回落
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.config import settings
+from app.core.change_tracker import ChangeTracker
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("FlushScheduler")
+
+
+class FlushJob:
+    """
+    单个管理器的刷新任务
+    属性：
+        name: 管理器名称
+        flush_func: 无参异步函数，返回 True 表示刷新成功
+        interval: 刷新间隔（秒）；声明了集合的任务中为脏对象的最长等待时间
+        collections: 该任务负责写回的集合（自适应刷新据此统计脏对象；停机刷新据此判断哪些溢写文件可以删除）
+        dirty_threshold: 脏对象数达到该值时立即刷新
+        backoff: 当前退避倍数（1 表示未退避）
+        decisions: 最近的刷新决策记录，供调参使用
+        lock: 保证同一管理器的刷新不重叠
+    """
+
+    def __init__(self, name: str, flush_func: Callable[[], Awaitable[Any]], interval: float, collections: Tuple[str, ...] = ()):
+        self.name = name
+        self.flush_func = flush_func
+        self.interval = interval
+        self.collections = tuple(collections)
+        self.dirty_threshold = settings.FLUSH_DIRTY_THRESHOLD
+        self.backoff = 1.0
+        self.decisions = deque(maxlen=settings.FLUSH_DECISION_HISTORY)
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at: Optional[float] = None
+        self.last_finished_at: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_success: Optional[bool] = None
+
+    def dirty_state(self) -> Tuple[int, Optional[float]]:
+        """返回 (脏对象总数, 最早脏对象已等待的秒数)"""
+        dirty = sum(ChangeTracker.dirty_count(collection) for collection in self.collections)
+        since = [ChangeTracker.dirty_since(collection) for collection in self.collections]
+        since = [value for value in since if value is not None]
+        return dirty, (time.time() - min(since) if since else None)
+
+    def decide(self) -> Optional[str]:
+        """
+        自适应刷新决策：返回触发原因（"threshold" / "max_age"），不需要刷新时返回 None
+        退避时阈值与最长等待时间同比放大，让慢数据库收到更少、更大的批次
+        """
+        dirty, age = self.dirty_state()
+        if dirty == 0:
+            return None
+        if dirty >= self.dirty_threshold * self.backoff:
+            reason = "threshold"
+        elif age is not None and age >= self.interval * self.backoff:
+            reason = "max_age"
+        else:
+            return None
+        self.decisions.append({
+            "at": time.time(),
+            "reason": reason,
+            "dirty": dirty,
+            "age": round(age, 3) if age is not None else None,
+            "backoff": self.backoff,
+        })
+        return reason
+
+    def update_backoff(self, success: bool, duration: float) -> None:
+        """刷新变慢或失败时退避加倍，正常时减半直至恢复"""
+        if not success or duration > settings.FLUSH_SLOW_THRESHOLD:
+            self.backoff = min(self.backoff * 2, settings.FLUSH_BACKOFF_MAX)
+        else:
+            self.backoff = max(self.backoff / 2, 1.0)
+
+    def get_status(self) -> Dict[str, Any]:
+        dirty, age = self.dirty_state()
+        return {
+            "interval": self.interval,
+            "adaptive": bool(self.collections),
+            "dirty": dirty,
+            "oldest_dirty_age": round(age, 3) if age is not None else None,
+            "dirty_threshold": self.dirty_threshold,
+            "backoff": self.backoff,
+            "recent_decisions": list(self.decisions),
+            "running": self.lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started_at": self.last_started_at,
+            "last_finished_at": self.last_finished_at,
+            "last_duration": self.last_duration,
+            "last_success": self.last_success,
+        }
+
+
+class FlushScheduler:
+    """
+    刷新调度器单例
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.jobs = {}  # dict{name, FlushJob}
+            cls._instance.max_concurrency = settings.FLUSH_MAX_CONCURRENCY
+            cls._instance._semaphore = None
+            logger.info("FlushScheduler singleton instance created")
+        return cls._instance
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 信号量需绑定到运行中的事件循环，因此延迟创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def register(self, name: str, flush_func: Callable[[], Awaitable[Any]], interval: float, collections: Tuple[str, ...] = ()) -> FlushJob:
+        """注册一个管理器的刷新函数；重复注册同名任务时替换刷新函数、间隔与集合"""
+        job = self.jobs.get(name)
+        if job is None:
+            job = self.jobs[name] = FlushJob(name, flush_func, interval, collections)
+        else:
+            job.flush_func = flush_func
+            job.interval = interval
+            job.collections = tuple(collections)
+        return job
+
+    async def flush(self, name: str) -> bool:
+        """
+        立即执行一次指定管理器的刷新
+        - 若该管理器上一次刷新仍在进行，则等待其结束后再执行
+        - 受全局并发上限约束
+        """
+        job = self.jobs[name]
+        async with job.lock:
+            async with self._get_semaphore():
+                job.last_started_at = time.time()
+                started = time.perf_counter()
+                try:
+                    success = await job.flush_func()
+                    success = success is not False
+                except Exception as e:
+                    logger.error(f"{name} 刷新失败: {e}")
+                    success = False
+                job.last_duration = round(time.perf_counter() - started, 4)
+                job.last_finished_at = time.time()
+                job.last_success = success
+                job.runs += 1
+                job.update_backoff(success, job.last_duration)
+                if not success:
+                    job.failures += 1
+
+        if success:
+            logger.info(f"✅ {name} 刷新完成，耗时 {job.last_duration:.3f}秒")
+        else:
+            logger.warning(f"⚠️ {name} 刷新部分失败，耗时 {job.last_duration:.3f}秒")
+        return success
+
+    async def flush_all(self, exclude=(), timeout: Optional[float] = None) -> Dict[str, Optional[bool]]:
+        """
+        并发刷新所有已注册的管理器（exclude 中的除外），返回 {name: 是否成功}
+        指定 timeout 时，超时仍未完成的刷新被取消，结果记为 None
+        """
+        names = [name for name in self.jobs if name not in exclude]
+        if not names:
+            return {}
+        tasks = {name: asyncio.create_task(self.flush(name)) for name in names}
+        _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return {name: (None if task in pending else task.result()) for name, task in tasks.items()}
+
+    async def _run_job(self, job: FlushJob):
+        """
+        单个管理器的刷新循环
+        - 声明了集合的任务：每个轮询周期检查写入压力，由 FlushJob.decide 决定是否刷新
+        - 其他任务（完备性检查、快照等）：按固定间隔执行
+        """
+        while True:
+            try:
+                if job.collections:
+                    await asyncio.sleep(settings.FLUSH_POLL_INTERVAL)
+                    if job.decide() is None:
+                        continue
+                else:
+                    await asyncio.sleep(job.interval)
+                # shield：停止调度时不打断进行中的刷新，避免已取出的脏对象丢失
+                await asyncio.shield(self.flush(job.name))
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"{job.name} 刷新循环发生错误: {e}")
+
+    def start(self):
+        """为每个已注册的管理器启动独立的刷新循环"""
+        for job in self.jobs.values():
+            if job.task is None or job.task.done():
+                job.task = asyncio.create_task(self._run_job(job))
+        logger.info(f"刷新调度器已启动: {len(self.jobs)} 个任务，并发上限 {self.max_concurrency}")
+
+    async def stop(self):
+        """停止所有刷新循环，并等待正在进行的刷新完成"""
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self.jobs.values():
+            job.task = None
+            async with job.lock:
+                pass
+        logger.info("刷新调度器已停止")
+
+    def get_status(self) -> Dict[str, Any]:
+        """获取每个管理器最近一次刷新的时间戳与耗时"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "jobs": {name: job.get_status() for name, job in self.jobs.items()},
+        }
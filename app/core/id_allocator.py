@@ -0,0 +1,183 @@
+"""
+租约式ID分配（多进程安全）
+- counters 集合中每个序列一条文档 {_id: 序列名, value: 已分配出去的最大ID}
+- 每个进程用 find_one_and_update($inc) 原子地租下一整段ID（默认 1000 个），段内分配只是本地自增
+- 当前段剩余数量低于阈值时在后台预取下一段，热路径上不等待数据库
+- 首次使用时以集合中现有的最大整数ID（默认 _id，可指定业务ID字段）作为序列下限（$max），兼容以前按 sort _id desc 起算的数据
+- 当前段用尽而预取尚未完成时，创建对象前 await ensure() 同步租下一段，不让请求失败
+- 无法访问 counters 时退回进程内计数器（与原先的时间戳起点一致），只适用于单进程，按错误级别记录
+"""
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.config import settings
+from app.core.database import Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("IdAllocator")
+
+COUNTERS_COLLECTION = "counters"
+
+
+class IdSequence:
+    """
+    单个序列在本进程中的租约状态
+    属性：
+        name: 序列名（与集合名一致）
+        next_id: 下一个要分配的ID
+        end: 当前段的上界（不含）
+        reserve: 已预取但尚未启用的下一段 (start, end)
+        leased: False 表示未使用 counters 集合（进程内计数器）
+        refill_task: 进行中的后台预取任务
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.next_id = 1
+        self.end: Optional[int] = None
+        self.reserve: Optional[Tuple[int, int]] = None
+        self.leased = False
+        self.refill_task: Optional[asyncio.Task] = None
+        self.blocks_leased = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.end is None:
+            return None
+        return self.end - self.next_id
+
+
+class IdAllocator:
+    """
+    全局ID分配器，按序列名分组
+    属性：
+        _sequences: dict{name, IdSequence}
+    """
+    _sequences: Dict[str, IdSequence] = {}
+
+    @classmethod
+    def _sequence(cls, name: str) -> IdSequence:
+        sequence = cls._sequences.get(name)
+        if sequence is None:
+            sequence = cls._sequences[name] = IdSequence(name)
+        return sequence
+
+    @classmethod
+    async def _lease(cls, name: str) -> Tuple[int, int]:
+        """原子地租下一段ID，返回 [start, end)"""
+        block_size = settings.ID_BLOCK_SIZE
+        counter = await Database.find_one_and_update(
+            COUNTERS_COLLECTION, {"_id": name}, {"$inc": {"value": block_size}}, upsert=True
+        )
+        end = int(counter["value"]) + 1
+        cls._sequence(name).blocks_leased += 1
+        return end - block_size, end
+
+    @classmethod
+    async def initialize(cls, name: str, fallback_start: Optional[int] = None, id_field: str = "_id") -> None:
+        """
+        初始化序列：把 counters 下限抬到集合现有最大的整数 id_field，再租下第一段
+        id_field 取值不是数字的文档（如 MongoDB 生成的 ObjectId _id）不参与计算
+        失败时退回进程内计数器，从 fallback_start（默认毫秒时间戳）起算
+        """
+        sequence = cls._sequence(name)
+        try:
+            latest = await Database.find(name, {id_field: {"$type": "number"}}, sort=[(id_field, -1)], limit=1)
+            floor = int(latest[0][id_field]) if latest else 0
+            await Database.update_one(COUNTERS_COLLECTION, {"_id": name}, {"$max": {"value": floor}}, upsert=True)
+            sequence.next_id, sequence.end = await cls._lease(name)
+            sequence.reserve = None
+            sequence.leased = True
+            logger.info(f"ID sequence {name} leased block [{sequence.next_id}, {sequence.end})")
+        except Exception as e:
+            logger.error(f"Failed to lease ID block for {name}: {e}")
+            start = fallback_start if fallback_start is not None else int(time.time() * 1000)
+            cls.seed_local(name, start)
+            logger.error(f"Using process-local ID counter for {name} starting after {start}; IDs are not unique across processes")
+
+    @classmethod
+    def seed_local(cls, name: str, last_id: int) -> None:
+        """切换为进程内计数器，下一个ID为 last_id + 1"""
+        sequence = cls._sequence(name)
+        sequence.next_id = int(last_id) + 1
+        sequence.end = None
+        sequence.reserve = None
+        sequence.leased = False
+
+    @classmethod
+    async def ensure(cls, name: str, count: int = 1) -> None:
+        """
+        保证接下来 count 次 next_id 不会用尽已租到的ID（创建对象前调用，与 next_id 之间不得有 await）
+        当前段与预取段都不够时等待进行中的预取，仍不够则同步租下一段
+        """
+        sequence = cls._sequence(name)
+        if not sequence.leased or cls._available(sequence) >= count:
+            return
+        if sequence.refill_task is not None and not sequence.refill_task.done():
+            await asyncio.shield(sequence.refill_task)
+        if sequence.reserve is None and cls._available(sequence) < count:
+            block = await cls._lease(name)
+            if sequence.reserve is None:
+                sequence.reserve = block
+            logger.warning(f"ID sequence {name} ran out before prefetch finished; leased block {sequence.reserve} on the request path")
+
+    @staticmethod
+    def _available(sequence: IdSequence) -> int:
+        available = sequence.remaining
+        if sequence.reserve is not None:
+            available += sequence.reserve[1] - sequence.reserve[0]
+        return available
+
+    @classmethod
+    def next_id(cls, name: str) -> int:
+        """
+        分配一个ID（同步，本地自增）
+        未初始化的序列按进程内计数器从 1 开始（仅用于测试等单进程场景）
+        """
+        sequence = cls._sequence(name)
+        if sequence.leased:
+            if sequence.next_id >= sequence.end:
+                if sequence.reserve is None:
+                    raise RuntimeError(f"ID block for {name} exhausted; await IdAllocator.ensure() before allocating")
+                sequence.next_id, sequence.end = sequence.reserve
+                sequence.reserve = None
+            if sequence.reserve is None and sequence.remaining <= settings.ID_REFILL_REMAINING:
+                cls._schedule_refill(sequence)
+        value = sequence.next_id
+        sequence.next_id += 1
+        return value
+
+    @classmethod
+    def _schedule_refill(cls, sequence: IdSequence) -> None:
+        if sequence.refill_task is not None and not sequence.refill_task.done():
+            return
+        try:
+            sequence.refill_task = asyncio.get_running_loop().create_task(cls._refill(sequence))
+        except RuntimeError:
+            # 没有运行中的事件循环（同步上下文）：留到下一次分配时再尝试
+            pass
+
+    @classmethod
+    async def _refill(cls, sequence: IdSequence) -> None:
+        try:
+            block = await cls._lease(sequence.name)
+            # ensure() 可能已在请求路径上租到下一段
+            if sequence.reserve is None:
+                sequence.reserve = block
+            logger.info(f"ID sequence {sequence.name} prefetched block {sequence.reserve}")
+        except Exception as e:
+            logger.error(f"Failed to prefetch ID block for {sequence.name}: {e}")
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "mode": "leased" if sequence.leased else "local",
+                "next_id": sequence.next_id,
+                "remaining": sequence.remaining,
+                "reserve": list(sequence.reserve) if sequence.reserve else None,
+                "blocks_leased": sequence.blocks_leased,
+            }
+            for name, sequence in cls._sequences.items()
+        }
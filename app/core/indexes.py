@@ -0,0 +1,159 @@
+"""
+索引声明与热点查询计划检查
+- 各集合需要的索引集中声明在本模块，启动时由 lifespan 调用 ensure_indexes 幂等创建
+- 热点查询同样在此登记；check_hot_queries 对每条查询执行 explain()，
+  一旦获胜计划退化为全集合扫描（COLLSCAN）即输出警告
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.core.database import MODIFIED_AT_FIELD, Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("indexes")
+
+
+class HotQuery:
+    """一条需要保持走索引的热点查询（查询值只用于生成计划，取样例值即可）"""
+
+    def __init__(
+        self,
+        name: str,
+        collection: str,
+        query: Dict[str, Any],
+        sort: Optional[List[tuple]] = None,
+        limit: int = 0,
+        projection: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.sort = sort
+        self.limit = limit
+        self.projection = projection
+
+
+def plan_stages(explain: Dict[str, Any]) -> List[str]:
+    """展开 explain() 结果中获胜计划的全部阶段名（兼容经典引擎与 SBE 的输出格式）"""
+    winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    winning_plan = winning_plan.get("queryPlan", winning_plan)
+    stages = []
+    pending = [winning_plan]
+    while pending:
+        node = pending.pop()
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", ()))
+    return stages
+
+
+class IndexRegistry:
+    """
+    全局索引与热点查询登记表
+    属性：
+        _indexes: dict{collection, list(IndexModel)}
+        _hot_queries: dict{name, HotQuery}
+    """
+    _indexes: Dict[str, List[IndexModel]] = {}
+    _hot_queries: Dict[str, HotQuery] = {}
+
+    @classmethod
+    def declare(cls, collection: str, keys: List[tuple], **options) -> None:
+        """声明一个索引；keys 形如 [("field", ASCENDING)]"""
+        cls._indexes.setdefault(collection, []).append(IndexModel(keys, **options))
+
+    @classmethod
+    def hot_query(cls, name: str, collection: str, query: Dict[str, Any], **kwargs) -> None:
+        """登记一条热点查询"""
+        cls._hot_queries[name] = HotQuery(name, collection, query, **kwargs)
+
+    @classmethod
+    def indexes(cls) -> Dict[str, List[IndexModel]]:
+        return cls._indexes
+
+    @classmethod
+    def hot_queries(cls) -> List[HotQuery]:
+        return list(cls._hot_queries.values())
+
+    @classmethod
+    async def ensure_indexes(cls) -> Dict[str, List[str]]:
+        """
+        为全部声明的索引执行 create_indexes（索引已存在时为空操作）
+        单个集合失败只记录错误，不影响其余集合；返回 {collection: [索引名]}
+        """
+        created = {}
+        for collection, models in cls._indexes.items():
+            try:
+                created[collection] = await Database.get_collection(collection).create_indexes(models)
+            except Exception as e:
+                logger.error(f"Error creating indexes on {collection}: {e}")
+        logger.info(f"Ensured indexes on {len(created)}/{len(cls._indexes)} collections")
+        return created
+
+    @classmethod
+    async def explain(cls, hot_query: HotQuery) -> Dict[str, Any]:
+        cursor = Database.get_collection(hot_query.collection).find(hot_query.query, hot_query.projection)
+        if hot_query.sort:
+            cursor = cursor.sort(hot_query.sort)
+        if hot_query.limit:
+            cursor = cursor.limit(hot_query.limit)
+        return await cursor.explain()
+
+    @classmethod
+    async def check_hot_queries(cls) -> Dict[str, List[str]]:
+        """
+        逐条 explain 热点查询，返回 {name: 获胜计划阶段列表}
+        计划中出现 COLLSCAN 时输出警告
+        """
+        plans = {}
+        for hot_query in cls._hot_queries.values():
+            try:
+                stages = plan_stages(await cls.explain(hot_query))
+            except Exception as e:
+                logger.error(f"Error explaining hot query {hot_query.name}: {e}")
+                continue
+            plans[hot_query.name] = stages
+            if "COLLSCAN" in stages:
+                logger.warning(
+                    f"Hot query {hot_query.name} on {hot_query.collection} falls back to a collection scan: {stages}"
+                )
+        return plans
+
+
+# ==================== 索引声明 ====================
+# 批量写回以业务键 upsert，每次写回都按这些键定位文档
+IndexRegistry.declare("AI_chatroom", [("user_id", ASCENDING)])
+IndexRegistry.declare("AI_message", [("ai_message_id", ASCENDING)])
+IndexRegistry.declare("personality_test_records", [("session_id", ASCENDING)])
+IndexRegistry.declare("personality_test_records", [("user_id", ASCENDING)])
+# 聊天记录按聊天室、发送时间读取
+IndexRegistry.declare("messages", [("chatroom_id", ASCENDING), ("message_send_time_in_utc", ASCENDING)])
+# 帖子列表：已发布帖子按时间倒序
+IndexRegistry.declare("posts", [("post_status", ASCENDING), ("created_at", DESCENDING)])
+IndexRegistry.declare("comments", [("post_id", ASCENDING)])
+# 快照热启动按写入时间戳追平快照之后变更的文档
+for _collection in ("users", "matches", "chatrooms", "posts", "comments",
+                    "AI_chatroom", "AI_message", "personality_test_records"):
+    IndexRegistry.declare(_collection, [(MODIFIED_AT_FIELD, ASCENDING)])
+
+# ==================== 热点查询 ====================
+IndexRegistry.hot_query("ai_chatroom_by_user", "AI_chatroom", {"user_id": "openid"})
+IndexRegistry.hot_query("ai_message_by_id", "AI_message", {"ai_message_id": 1})
+IndexRegistry.hot_query("personality_record_by_session", "personality_test_records", {"session_id": "session"})
+IndexRegistry.hot_query("personality_records_by_user", "personality_test_records", {"user_id": "openid"})
+# 聊天记录按消息ID逐条读取（ChatroomManager.get_chatroom_history）
+IndexRegistry.hot_query("message_by_id", "messages", {"_id": 1})
+IndexRegistry.hot_query(
+    "chatroom_history", "messages", {"chatroom_id": 1}, sort=[("message_send_time_in_utc", ASCENDING)]
+)
+IndexRegistry.hot_query(
+    "latest_posts", "posts", {"post_status": "published"}, sort=[("created_at", DESCENDING)], limit=20
+)
+IndexRegistry.hot_query("comments_by_post", "comments", {"post_id": 1})
+IndexRegistry.hot_query(
+    "snapshot_catchup_users", "users", {MODIFIED_AT_FIELD: {"$gte": datetime(2000, 1, 1, tzinfo=timezone.utc)}}
+)
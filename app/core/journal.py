@@ -0,0 +1,316 @@
+"""
+本地预写日志（两次自动保存之间的内存修改持久化）
+- 领域对象/管理器每次登记脏对象时，把 (集合, 主键) 记入待写队列
+- 后台任务按固定间隔把队列中对象的最新文档追加到本地日志并统一 fsync（批量落盘）
+- 每个集合一个活动日志文件；管理器刷新取出脏对象时封存活动文件，刷新成功后删除封存文件
+- 数据库中直接删除的文档记录删除标记，重放时按顺序执行，避免已删除对象被恢复
+- 启动时（各管理器从数据库加载之前）把残留日志重放到 MongoDB，成功后截断
+- 停机刷新前把全部脏对象溢写到恢复目录（同样的格式），未能按时写回的集合在下次启动时重放
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from bson import json_util
+
+from app.config import settings
+from app.core.change_tracker import ChangeTracker
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("Journal")
+
+ACTIVE_SUFFIX = ".active.jsonl"
+SEALED_SUFFIX = ".sealed.jsonl"
+
+
+class Journal:
+    """
+    全局本地日志，按集合分文件
+    属性：
+        _collections: dict{collection, (key_field, dump)}  # 已登记的集合；dump(key, obj) 返回要写入的文档
+        _pending: OrderedDict{(collection, key) 或删除标记, obj}  # 尚未落盘的记录，保持登记顺序
+        _sealed: dict{collection, list[Path]}                 # 已封存、等待刷新成功后删除的文件
+    """
+    _collections: Dict[str, tuple] = {}
+    _pending: "OrderedDict[Any, Any]" = OrderedDict()
+    _sealed: Dict[str, List[Path]] = {}
+    _directory: Optional[Path] = None
+    _enabled: bool = False
+    _writer_task: Optional[asyncio.Task] = None
+    _file_lock = threading.Lock()
+    _io_lock: Optional[asyncio.Lock] = None  # 串行化落盘与封存（在 open 时创建，绑定当前事件循环）
+    _tombstone_seq = 0
+
+    @classmethod
+    def register(cls, collection: str, key_field: str = "_id", dump: Optional[Callable[[Hashable, Any], Optional[dict]]] = None) -> None:
+        """
+        登记一个需要写入日志的集合
+        - 领域对象集合无需 dump，默认调用对象的 to_document()
+        - 字典型管理器（登记脏对象时 obj 为 None）需提供 dump(key, obj)
+        """
+        cls._collections[collection] = (key_field, dump)
+
+    # ==================== 运行期记录 ====================
+    @classmethod
+    def note(cls, collection: str, key: Hashable, obj: Any = None) -> None:
+        """登记一次修改（由 ChangeTracker.mark_dirty 调用），实际文档在落盘时才序列化"""
+        if collection not in cls._collections:
+            return
+        entry = (collection, key)
+        cls._pending[entry] = obj
+        cls._pending.move_to_end(entry)
+
+    @classmethod
+    def record_delete(cls, collection: str, query: dict) -> None:
+        """记录一次直接在数据库执行的删除，重放时按相同顺序删除"""
+        if not cls._enabled or collection not in cls._collections:
+            return
+        cls._tombstone_seq += 1
+        cls._pending[("__delete__", collection, cls._tombstone_seq)] = query
+
+    @classmethod
+    def _drain_pending(cls, collection: Optional[str] = None) -> Dict[str, List[str]]:
+        """把待写队列序列化为每个集合的日志行（必须在事件循环线程调用）"""
+        lines: Dict[str, List[str]] = {}
+        for entry in list(cls._pending):
+            if entry[0] == "__delete__":
+                target = entry[1]
+                if collection is not None and target != collection:
+                    continue
+                query = cls._pending.pop(entry)
+                lines.setdefault(target, []).append(json_util.dumps({"c": target, "q": query}))
+                continue
+
+            target, key = entry
+            if collection is not None and target != collection:
+                continue
+            line = cls._document_line(target, key, cls._pending.pop(entry))
+            if line is not None:
+                lines.setdefault(target, []).append(line)
+        return lines
+
+    @classmethod
+    def _document_line(cls, collection: str, key: Hashable, obj: Any) -> Optional[str]:
+        """序列化一个对象的最新文档为日志行；对象已不存在时返回 None"""
+        key_field, dump = cls._collections[collection]
+        try:
+            document = dump(key, obj) if dump is not None else (obj.to_document() if obj is not None else None)
+        except Exception as e:
+            logger.error(f"序列化日志记录失败 {collection}/{key}: {e}")
+            return None
+        if document is None:
+            return None
+        return json_util.dumps({"c": collection, "f": key_field, "d": document})
+
+    @classmethod
+    def _append(cls, lines: Dict[str, List[str]], directory: Optional[Path] = None) -> None:
+        """追加日志行并 fsync（可在线程池中执行）"""
+        directory = directory or cls._directory
+        with cls._file_lock:
+            for collection, collection_lines in lines.items():
+                path = directory / f"{collection}{ACTIVE_SUFFIX}"
+                with open(path, "a", encoding="utf-8") as journal_file:
+                    journal_file.write("\n".join(collection_lines) + "\n")
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+
+    @classmethod
+    async def seal(cls, collection: str) -> None:
+        """
+        封存某集合的活动日志（由 ChangeTracker.pop_dirty 调用）
+        先把该集合尚未落盘的记录写入，确保本次刷新期间崩溃也不会丢失
+        - 待写记录在事件循环上立即取出（与取出脏对象之间没有 await，之后登记的修改留给下一个活动文件）
+        - 追加、fsync 与改名在线程池中执行；与批量落盘共用 _io_lock，保证日志行按取出顺序写入
+        """
+        if not cls._enabled or collection not in cls._collections:
+            return
+        lines = cls._drain_pending(collection)
+        sealed_path = cls._directory / f"{collection}.{time.time_ns()}{SEALED_SUFFIX}"
+        async with cls._io_lock:
+            if await asyncio.to_thread(cls._seal_files, collection, lines, sealed_path):
+                cls._sealed.setdefault(collection, []).append(sealed_path)
+
+    @classmethod
+    def _seal_files(cls, collection: str, lines: Dict[str, List[str]], sealed_path: Path) -> bool:
+        """写入剩余记录并把活动文件改名为封存文件（在线程池中执行），活动文件不存在时返回 False"""
+        cls._append(lines)
+        with cls._file_lock:
+            active_path = cls._directory / f"{collection}{ACTIVE_SUFFIX}"
+            if not active_path.exists():
+                return False
+            os.replace(active_path, sealed_path)
+            return True
+
+    @classmethod
+    def release(cls, collection: str) -> None:
+        """刷新成功后删除该集合已封存的日志文件"""
+        with cls._file_lock:
+            for sealed_path in cls._sealed.pop(collection, []):
+                try:
+                    sealed_path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    async def _writer_loop(cls):
+        """批量落盘循环：每个间隔把待写队列统一写入并 fsync 一次"""
+        while True:
+            try:
+                await asyncio.sleep(settings.JOURNAL_FSYNC_INTERVAL)
+                if cls._pending:
+                    async with cls._io_lock:
+                        lines = cls._drain_pending()
+                        await asyncio.to_thread(cls._append, lines)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"日志落盘失败: {e}")
+
+    # ==================== 停机溢写 ====================
+    @classmethod
+    def spill(cls, directory: Optional[str] = None) -> Dict[str, int]:
+        """
+        把当前全部脏对象的最新文档写入恢复目录（停机刷新开始前调用，不改变脏标记）
+        返回 {collection: 溢写的文档数}
+        """
+        recovery_dir = Path(directory or settings.RECOVERY_DIR)
+        lines: Dict[str, List[str]] = {}
+        for collection, bucket in ChangeTracker.peek_dirty().items():
+            if collection not in cls._collections:
+                continue
+            for key, obj in bucket.items():
+                line = cls._document_line(collection, key, obj)
+                if line is not None:
+                    lines.setdefault(collection, []).append(line)
+        if lines:
+            recovery_dir.mkdir(parents=True, exist_ok=True)
+            cls._append(lines, recovery_dir)
+        return {collection: len(collection_lines) for collection, collection_lines in lines.items()}
+
+    @classmethod
+    def discard_spill(cls, collections: Iterable[str], directory: Optional[str] = None) -> None:
+        """删除已成功写回数据库的集合的溢写文件"""
+        recovery_dir = Path(directory or settings.RECOVERY_DIR)
+        with cls._file_lock:
+            for collection in collections:
+                try:
+                    (recovery_dir / f"{collection}{ACTIVE_SUFFIX}").unlink()
+                except FileNotFoundError:
+                    pass
+
+    # ==================== 生命周期 ====================
+    @classmethod
+    def _journal_files(cls, directory: Path) -> Dict[str, List[Path]]:
+        """按集合分组列出日志文件：封存文件按时间顺序在前，活动文件在最后"""
+        files: Dict[str, List[Path]] = {}
+        for path in sorted(directory.glob(f"*{SEALED_SUFFIX}"), key=lambda p: int(p.name.split(".")[-3])):
+            files.setdefault(path.name.split(".")[0], []).append(path)
+        for path in directory.glob(f"*{ACTIVE_SUFFIX}"):
+            files.setdefault(path.name[:-len(ACTIVE_SUFFIX)], []).append(path)
+        return files
+
+    @classmethod
+    async def recover(cls, directory: Optional[str] = None) -> int:
+        """
+        重放上次运行残留的日志到 MongoDB（在各管理器从数据库加载之前调用）
+        全部写入成功后删除日志文件，返回重放的记录数
+        """
+        from app.core.database import Database
+
+        journal_dir = Path(directory or settings.JOURNAL_DIR)
+        if not journal_dir.exists():
+            return 0
+
+        replayed = 0
+        for collection, paths in cls._journal_files(journal_dir).items():
+            # 连续的 upsert 合并为一次批量写；遇到删除标记时先写出之前的 upsert，保证顺序
+            pending_docs: "OrderedDict[Any, dict]" = OrderedDict()
+            key_field = "_id"
+
+            async def write_pending():
+                if pending_docs:
+                    result = await Database.bulk_upsert(collection, list(pending_docs.values()), key=key_field)
+                    if result["failed_keys"]:
+                        raise RuntimeError(f"重放 {collection} 失败的主键: {result['failed_keys']}")
+                    pending_docs.clear()
+
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as journal_file:
+                    for line in journal_file:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            record = json_util.loads(line)
+                        except Exception:
+                            # 崩溃时最后一行可能只写了一半
+                            logger.warning(f"跳过损坏的日志记录: {path.name}")
+                            continue
+                        if "q" in record:
+                            await write_pending()
+                            await Database.delete_many(collection, record["q"])
+                        else:
+                            if record["f"] != key_field:
+                                await write_pending()
+                                key_field = record["f"]
+                            pending_docs[record["d"][key_field]] = record["d"]
+                        replayed += 1
+            await write_pending()
+
+            for path in paths:
+                path.unlink()
+
+        if replayed:
+            logger.info(f"日志重放完成: {replayed} 条记录已写回数据库")
+        return replayed
+
+    @classmethod
+    def open(cls, directory: Optional[str] = None) -> None:
+        """启用日志：挂接到变更追踪层并启动批量落盘任务（在各管理器加载完成后调用）"""
+        cls._directory = Path(directory or settings.JOURNAL_DIR)
+        cls._directory.mkdir(parents=True, exist_ok=True)
+        cls._pending.clear()
+        cls._sealed.clear()
+        cls._io_lock = asyncio.Lock()
+        cls._enabled = True
+        ChangeTracker.journal = cls
+        cls._writer_task = asyncio.create_task(cls._writer_loop())
+        logger.info(f"本地日志已启用: {cls._directory}")
+
+    @classmethod
+    async def close(cls, truncate: bool = False) -> None:
+        """
+        停止日志：写出剩余记录
+        truncate=True 时（所有脏数据已成功写回数据库）删除全部日志文件
+        """
+        if not cls._enabled:
+            return
+        if cls._writer_task and not cls._writer_task.done():
+            cls._writer_task.cancel()
+            await asyncio.gather(cls._writer_task, return_exceptions=True)
+        cls._writer_task = None
+
+        async with cls._io_lock:
+            await asyncio.to_thread(cls._append, cls._drain_pending())
+        ChangeTracker.journal = None
+        cls._enabled = False
+
+        if truncate:
+            with cls._file_lock:
+                for paths in cls._journal_files(cls._directory).values():
+                    for path in paths:
+                        path.unlink()
+                cls._sealed.clear()
+        logger.info("本地日志已关闭")
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        return {
+            "enabled": cls._enabled,
+            "pending": len(cls._pending),
+            "sealed": {collection: len(paths) for collection, paths in cls._sealed.items()},
+        }
@@ -0,0 +1,478 @@
+"""
+进程内存储引擎（Database 的可插拔后端）
+- 实现本服务经 Database 门面用到的 Motor 集合接口：find（sort/limit/projection）、find_one、insert_one/many、
+  update_one/many（$set/$unset/$inc/$max/$push/$pull/$addToSet/$each/$rename，支持 upsert）、
+  find_one_and_update、delete_one/many、count_documents、bulk_write、create_indexes
+- 读写都做深拷贝，调用方拿到的文档与存储互不影响（与经过 BSON 往返的行为一致）
+- 每次操作可注入固定延迟与随机抖动，便于在没有 MongoDB 的情况下基准测试管理器的热路径
+- 只用于基准测试与单元测试；settings.DB_BACKEND=memory 时由 Database.connect 启用
+"""
+import asyncio
+import copy
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_MISSING = object()
+
+
+# ==================== 查询匹配 ====================
+def _get_path(document: Any, path: str) -> Any:
+    """按点号路径取值；路径中的数字段作为数组下标"""
+    value = document
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else _MISSING
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    """跨类型可比较的排序键（缺失/None < 数字 < 字符串 < 其它）"""
+    if value is _MISSING or value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, str(value))
+    try:
+        return (5, value.timestamp())
+    except AttributeError:
+        return (6, repr(value))
+
+
+def _compare(value: Any, operand: Any, operator: str) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    left, right = _sort_key(value), _sort_key(operand)
+    if left[0] != right[0]:
+        return False
+    if operator == "$gt":
+        return left > right
+    if operator == "$gte":
+        return left >= right
+    if operator == "$lt":
+        return left < right
+    return left <= right
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    """字段等值：数组字段只要包含期望值即匹配（与 MongoDB 语义一致）"""
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        return _equals(value, condition)
+    for operator, operand in condition.items():
+        if operator == "$in":
+            if not any(_equals(value, item) for item in operand):
+                return False
+        elif operator == "$nin":
+            if any(_equals(value, item) for item in operand):
+                return False
+        elif operator == "$ne":
+            if _equals(value, operand):
+                return False
+        elif operator == "$exists":
+            if (value is not _MISSING) != bool(operand):
+                return False
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            candidates = value if isinstance(value, list) else [value]
+            if not any(_compare(item, operand, operator) for item in candidates):
+                return False
+        elif operator == "$size":
+            if not isinstance(value, list) or len(value) != operand:
+                return False
+        elif operator == "$type" and operand == "number":
+            if type(value) not in (int, float):
+                return False
+        else:
+            raise NotImplementedError(f"Unsupported query operator {operator}")
+    return True
+
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(document, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, sub) for sub in condition):
+                return False
+        elif not _match_condition(_get_path(document, key), condition):
+            return False
+    return True
+
+
+# ==================== 更新 ====================
+def _set_path(document: dict, path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def _unset_path(document: dict, path: str) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(parts[-1], None)
+
+
+def _each(value: Any) -> List[Any]:
+    if isinstance(value, dict) and "$each" in value:
+        return list(value["$each"])
+    return [value]
+
+
+def apply_update(document: dict, update: dict, inserting: bool = False) -> None:
+    """
+    按更新操作符原地修改文档；不含操作符时视为整文档替换（保留 _id）
+    inserting: upsert 新建文档时为 True，此时才应用 $setOnInsert
+    """
+    if not any(key.startswith("$") for key in update):
+        _id = document.get("_id")
+        document.clear()
+        document.update(copy.deepcopy(update))
+        if _id is not None:
+            document["_id"] = _id
+        return
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            current = _get_path(document, path)
+            if operator == "$set":
+                _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                if inserting:
+                    _set_path(document, path, copy.deepcopy(value))
+            elif operator == "$unset":
+                _unset_path(document, path)
+            elif operator == "$inc":
+                _set_path(document, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$max":
+                if current is _MISSING or _sort_key(value) > _sort_key(current):
+                    _set_path(document, path, value)
+            elif operator == "$min":
+                if current is _MISSING or _sort_key(value) < _sort_key(current):
+                    _set_path(document, path, value)
+            elif operator == "$push":
+                items = [] if current is _MISSING else current
+                _set_path(document, path, items + copy.deepcopy(_each(value)))
+            elif operator == "$addToSet":
+                items = [] if current is _MISSING else list(current)
+                for item in _each(value):
+                    if item not in items:
+                        items.append(copy.deepcopy(item))
+                _set_path(document, path, items)
+            elif operator == "$pull":
+                if isinstance(current, list):
+                    if isinstance(value, dict) and any(key.startswith("$") for key in value):
+                        kept = [item for item in current if not _match_condition(item, value)]
+                    else:
+                        kept = [item for item in current if item != value]
+                    _set_path(document, path, kept)
+            elif operator == "$rename":
+                if current is not _MISSING:
+                    _unset_path(document, path)
+                    _set_path(document, value, current)
+            else:
+                raise NotImplementedError(f"Unsupported update operator {operator}")
+
+
+def _upsert_seed(query: dict) -> dict:
+    """upsert 时由查询中的等值条件生成新文档的初始字段"""
+    document = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            continue
+        _set_path(document, key, copy.deepcopy(condition))
+    return document
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(document)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        result = {}
+        for key in fields:
+            value = _get_path(document, key)
+            if value is not _MISSING:
+                _set_path(result, key, copy.deepcopy(value))
+    else:
+        result = copy.deepcopy(document)
+        for key in fields:
+            _unset_path(result, key)
+    if include_id and "_id" in document:
+        result["_id"] = document["_id"]
+    elif not include_id:
+        result.pop("_id", None)
+    return result
+
+
+# ==================== 结果对象 ====================
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched_count=0, modified_count=0, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count=0):
+        self.deleted_count = deleted_count
+
+
+class BulkWriteResult:
+    def __init__(self, details: dict):
+        self.inserted_count = details["nInserted"]
+        self.matched_count = details["nMatched"]
+        self.modified_count = details["nModified"]
+        self.deleted_count = details["nRemoved"]
+        self.upserted_count = details["nUpserted"]
+
+
+# ==================== 游标与集合 ====================
+class MemoryCursor:
+    """惰性游标：迭代或 to_list 时才执行查询（并注入一次延迟）"""
+
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection: Optional[dict]):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._limit = 0
+        self._results: Optional[List[dict]] = None
+
+    def sort(self, key_or_list, direction: Optional[int] = None) -> "MemoryCursor":
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or 1)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    async def _execute(self) -> List[dict]:
+        if self._results is None:
+            await self.collection.database.delay()
+            documents = [document for document in self.collection.documents.values() if matches(document, self.query)]
+            # 多键排序：从最次要的键开始做稳定排序
+            for field, direction in reversed(self._sort):
+                documents.sort(key=lambda document: _sort_key(_get_path(document, field)), reverse=direction < 0)
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [project(document, self.projection) for document in documents]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = await self._execute()
+        return list(results if length is None else results[:length])
+
+    def __aiter__(self):
+        self._position = 0
+        return self
+
+    async def __anext__(self) -> dict:
+        results = await self._execute()
+        if self._position >= len(results):
+            raise StopAsyncIteration
+        self._position += 1
+        return results[self._position - 1]
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.documents: Dict[Any, dict] = {}
+        self.indexes: List[str] = []
+
+    def _find_matching(self, query: Optional[dict], limit: int = 0) -> List[dict]:
+        # _id 等值查询直接按主键取
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            document = self.documents.get(query["_id"])
+            return [document] if document is not None else []
+        found = []
+        for document in self.documents.values():
+            if matches(document, query):
+                found.append(document)
+                if limit and len(found) >= limit:
+                    break
+        return found
+
+    def _insert(self, document: dict) -> Any:
+        document = copy.deepcopy(document)
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: {document['_id']}")
+        self.documents[document["_id"]] = document
+        return document["_id"]
+
+    def _update(self, query: dict, update: dict, upsert: bool, multi: bool) -> UpdateResult:
+        targets = self._find_matching(query, limit=0 if multi else 1)
+        modified = 0
+        for document in targets:
+            before = copy.deepcopy(document)
+            apply_update(document, update)
+            if document != before:
+                modified += 1
+        if not targets and upsert:
+            document = _upsert_seed(query)
+            apply_update(document, update, inserting=True)
+            return UpdateResult(0, 0, self._insert(document))
+        return UpdateResult(len(targets), modified)
+
+    def _delete(self, query: dict, multi: bool) -> int:
+        targets = self._find_matching(query, limit=0 if multi else 1)
+        for document in targets:
+            del self.documents[document["_id"]]
+        return len(targets)
+
+    # ---------- Motor 兼容接口 ----------
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, query, projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        await self.database.delay()
+        found = self._find_matching(query, limit=1)
+        return project(found[0], projection) if found else None
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        await self.database.delay()
+        return InsertOneResult(self._insert(document))
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> InsertManyResult:
+        await self.database.delay()
+        return InsertManyResult([self._insert(document) for document in documents])
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await self.database.delay()
+        return self._update(query, update, upsert, multi=False)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False) -> UpdateResult:
+        await self.database.delay()
+        return self._update(query, update, upsert, multi=True)
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document: bool = False,
+                                  projection: Optional[dict] = None) -> Optional[dict]:
+        await self.database.delay()
+        found = self._find_matching(query, limit=1)
+        before = project(found[0], projection) if found else None
+        result = self._update(query, update, upsert, multi=False)
+        if not return_document:
+            return before
+        _id = found[0]["_id"] if found else result.upserted_id
+        document = self.documents.get(_id)
+        return project(document, projection) if document is not None else None
+
+    async def delete_one(self, query: dict) -> DeleteResult:
+        await self.database.delay()
+        return DeleteResult(self._delete(query, multi=False))
+
+    async def delete_many(self, query: dict) -> DeleteResult:
+        await self.database.delay()
+        return DeleteResult(self._delete(query, multi=True))
+
+    async def count_documents(self, query: Optional[dict] = None) -> int:
+        await self.database.delay()
+        return len(self._find_matching(query))
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        """逐条执行 pymongo 写操作；与 MongoDB 一样，无序写入时个别失败不影响其余操作"""
+        await self.database.delay()
+        details = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0, "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    details["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    result = self._update(request._filter, request._doc, request._upsert, multi=isinstance(request, UpdateMany))
+                    details["nMatched"] += result.matched_count
+                    details["nModified"] += result.modified_count
+                    details["nUpserted"] += 1 if result.upserted_id is not None else 0
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    details["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                else:
+                    raise NotImplementedError(f"Unsupported bulk operation {type(request).__name__}")
+            except DuplicateKeyError as e:
+                details["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details)
+
+    async def create_indexes(self, models: List[Any]) -> List[str]:
+        await self.database.delay()
+        names = [model.document["name"] for model in models]
+        self.indexes.extend(name for name in names if name not in self.indexes)
+        return names
+
+
+class MemoryDatabase:
+    """
+    内存数据库：按名称惰性创建集合，可像 Motor 数据库一样用 db[name] 取集合
+    属性：
+        latency: 每次操作注入的固定延迟（秒）
+        jitter: 在固定延迟之上叠加的 [0, jitter) 随机延迟（秒）
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections[name] = MemoryCollection(self, name)
+        return collection
+
+    async def delay(self) -> None:
+        latency = self.latency + (random.random() * self.jitter if self.jitter else 0.0)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        else:
+            # 即使零延迟也让出一次事件循环，保持与真实驱动相同的调度特性
+            await asyncio.sleep(0)
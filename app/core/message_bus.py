@@ -0,0 +1,348 @@
+"""
+WebSocket 跨进程消息路由（多 worker 部署时，接收方可能连接在另一个 worker 上）
+- 每个 worker 的 ConnectionHandler.sessions 只包含本进程的连接；本地找不到接收方时经总线转发
+- 路由表：用户连接/断开时向其他 worker 广播上线/下线，各 worker 记录 {频道: {user_id: worker_id}}；
+  worker 启动时向已有 worker 打招呼，对方回送其全部在线用户；停止时广播告别，其他 worker 删除指向它的路由
+- 定向发送：路由已知时只发给持有连接的 worker，否则发给全部 worker；接收方投递到本地连接后回送确认，
+  任一确认成功即视为送达，全部失败或超时视为未送达（调用方据此返回 delivered）
+- 广播：本地广播之外再转发给其他 worker 各自广播，不等待确认
+- 传输层：MemoryBusTransport（同一进程内的多个总线，测试用）与 UnixSocketBusTransport（同机多 worker，
+  每个进程在共享目录下绑定一个 Unix 数据报套接字）
+"""
+import asyncio
+import itertools
+import json
+import socket
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.core.metrics import Metrics
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("MessageBus")
+
+Metrics.describe("message_bus_frames_total", "WebSocket frames forwarded between workers by channel and result")
+Metrics.describe("message_bus_ack_seconds", "Round trip from forwarding a frame to receiving its delivery acknowledgement")
+
+SOCKET_SUFFIX = ".sock"
+# 单个数据报的接收缓冲（发送方超出内核上限时发送失败，按未送达处理）
+MAX_DATAGRAM = 1024 * 1024
+
+Receiver = Callable[[bytes], None]
+
+
+class MemoryBusTransport:
+    """
+    进程内传输：network 为共享的 {worker_id: 传输} 字典，同一个字典中的总线互为对端
+    投递通过事件循环异步进行，与真实传输一样不会在发送调用中同步执行对端逻辑
+    """
+
+    def __init__(self, worker_id: str, network: Dict[str, "MemoryBusTransport"]):
+        self.worker_id = worker_id
+        self.network = network
+        self._receive: Optional[Receiver] = None
+
+    async def open(self, receive: Receiver) -> None:
+        self._receive = receive
+        self.network[self.worker_id] = self
+
+    def peers(self) -> List[str]:
+        return [worker_id for worker_id in self.network if worker_id != self.worker_id]
+
+    async def send(self, peer: str, data: bytes) -> bool:
+        target = self.network.get(peer)
+        if target is None or target._receive is None:
+            return False
+        asyncio.get_running_loop().call_soon(target._receive, data)
+        return True
+
+    async def close(self) -> None:
+        if self.network.get(self.worker_id) is self:
+            del self.network[self.worker_id]
+        self._receive = None
+
+
+class UnixSocketBusTransport:
+    """
+    同机传输：每个 worker 绑定 <directory>/<worker_id>.sock（数据报），对端即目录下的其他套接字文件
+    - 已退出进程遗留的套接字文件在发送被拒绝时删除
+    - 对端接收队列已满时在确认时限内重试
+    """
+
+    def __init__(self, directory: str, worker_id: str, retry_for: Optional[float] = None):
+        self.directory = Path(directory)
+        self.worker_id = worker_id
+        self.path = self.directory / f"{worker_id}{SOCKET_SUFFIX}"
+        self.retry_for = retry_for if retry_for is not None else settings.MESSAGE_BUS_ACK_TIMEOUT
+        self._sock: Optional[socket.socket] = None
+
+    async def open(self, receive: Receiver) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(str(self.path))
+        sock.setblocking(False)
+        self._sock = sock
+
+        def on_readable():
+            while True:
+                try:
+                    data = sock.recv(MAX_DATAGRAM)
+                except (BlockingIOError, InterruptedError):
+                    return
+                receive(data)
+
+        asyncio.get_running_loop().add_reader(sock.fileno(), on_readable)
+
+    def peers(self) -> List[str]:
+        return [
+            path.name[:-len(SOCKET_SUFFIX)] for path in self.directory.glob(f"*{SOCKET_SUFFIX}")
+            if path != self.path
+        ]
+
+    async def send(self, peer: str, data: bytes) -> bool:
+        if self._sock is None:
+            return False
+        address = self.directory / f"{peer}{SOCKET_SUFFIX}"
+        deadline = time.monotonic() + self.retry_for
+        while True:
+            try:
+                self._sock.sendto(data, str(address))
+                return True
+            except (BlockingIOError, InterruptedError):
+                if time.monotonic() >= deadline:
+                    logger.warning(f"worker {peer} 的接收队列持续已满，放弃本次发送")
+                    return False
+                await asyncio.sleep(0.005)
+            except ConnectionRefusedError:
+                # 绑定该套接字的进程已退出
+                address.unlink(missing_ok=True)
+                return False
+            except FileNotFoundError:
+                return False
+            except OSError as e:
+                logger.warning(f"向 worker {peer} 发送失败（{len(data)} 字节）: {e}")
+                return False
+
+    async def close(self) -> None:
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        self.path.unlink(missing_ok=True)
+
+
+class MessageBus:
+    """
+    跨进程消息路由总线（每个 worker 一个实例，active 指向本进程正在使用的实例）
+    属性：
+        _channels: dict{频道, (deliver, broadcast)}  # deliver(user_id, text) -> bool 投递到本地连接；broadcast(text, exclude_id) 本地广播
+        _local: dict{频道, set(user_id)}              # 本进程持有连接的用户
+        _routes: dict{频道, dict{user_id, worker_id}}  # 其他 worker 持有连接的用户
+        _pending: dict{帧ID, (Future, 待确认数)}        # 等待送达确认的定向发送
+    """
+    active: Optional["MessageBus"] = None
+
+    def __init__(self, transport, ack_timeout: Optional[float] = None):
+        self.transport = transport
+        self.worker_id = transport.worker_id
+        self.ack_timeout = ack_timeout if ack_timeout is not None else settings.MESSAGE_BUS_ACK_TIMEOUT
+        self._channels: Dict[str, Tuple[Callable[[str, str], Awaitable[bool]], Callable[[str, Optional[str]], Awaitable[Any]]]] = {}
+        self._local: Dict[str, Set[str]] = {}
+        self._routes: Dict[str, Dict[str, str]] = {}
+        self._pending: Dict[str, Tuple[asyncio.Future, int]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._frame_ids = itertools.count(1)
+        self._stats = {
+            "forwarded": 0, "delivered": 0, "undelivered": 0, "timeouts": 0,
+            "received": 0, "broadcasts": 0,
+        }
+
+    def register(
+        self,
+        channel: str,
+        deliver: Callable[[str, str], Awaitable[bool]],
+        broadcast: Callable[[str, Optional[str]], Awaitable[Any]],
+    ) -> None:
+        """登记频道（一种 WebSocket 会话）的本地投递与本地广播回调"""
+        self._channels[channel] = (deliver, broadcast)
+
+    # ==================== 生命周期 ====================
+    async def start(self) -> None:
+        """绑定传输层并向已有 worker 索取其在线用户"""
+        await self.transport.open(self._receive)
+        for peer in self.transport.peers():
+            await self._send(peer, {"k": "hello"})
+        logger.info(f"消息路由总线已启动: worker {self.worker_id}")
+
+    async def stop(self) -> None:
+        """通知其他 worker 删除指向本进程的路由，并关闭传输层"""
+        for peer in self.transport.peers():
+            await self._send(peer, {"k": "bye"})
+        for future, _ in self._pending.values():
+            if not future.done():
+                future.set_result(False)
+        self._pending.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.transport.close()
+        if MessageBus.active is self:
+            MessageBus.active = None
+
+    # ==================== 在线状态 ====================
+    async def claim(self, channel: str, user_id: str) -> None:
+        """本进程接受了该用户的连接"""
+        self._local.setdefault(channel, set()).add(user_id)
+        self._routes.get(channel, {}).pop(user_id, None)
+        await self._announce({"k": "up", "c": channel, "u": user_id})
+
+    async def release(self, channel: str, user_id: str) -> None:
+        """该用户在本进程的连接已断开"""
+        local = self._local.get(channel)
+        if not local or user_id not in local:
+            return
+        local.discard(user_id)
+        await self._announce({"k": "down", "c": channel, "u": user_id})
+
+    def route_of(self, channel: str, user_id: str) -> Optional[str]:
+        """持有该用户连接的 worker（本进程返回自己的 ID，未知时返回 None）"""
+        if user_id in self._local.get(channel, ()):
+            return self.worker_id
+        return self._routes.get(channel, {}).get(user_id)
+
+    # ==================== 发送 ====================
+    async def send(self, channel: str, user_id: str, text: str) -> bool:
+        """把一帧转发给持有该用户连接的 worker，返回是否确认送达"""
+        route = self._routes.get(channel, {}).get(user_id)
+        targets = [route] if route is not None else self.transport.peers()
+        if not targets:
+            return False
+        frame_id = f"{self.worker_id}:{next(self._frame_ids)}"
+        future = asyncio.get_running_loop().create_future()
+        # 每个目标回送一次确认；发送失败的目标直接记为一次未送达
+        self._pending[frame_id] = (future, len(targets))
+        started = time.perf_counter()
+        frame = {"k": "frame", "id": frame_id, "c": channel, "u": user_id, "d": text}
+        sent = 0
+        for peer in targets:
+            if await self._send(peer, frame):
+                sent += 1
+            else:
+                self._acknowledge(frame_id, False)
+        if sent == 0:
+            self._pending.pop(frame_id, None)
+            self._forget_route(channel, user_id, route)
+            return self._result(channel, False, "unreachable")
+        try:
+            delivered = await asyncio.wait_for(asyncio.shield(future), self.ack_timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            delivered = None
+        finally:
+            self._pending.pop(frame_id, None)
+        if delivered is None:
+            return self._result(channel, False, "timeout")
+        Metrics.observe("message_bus_ack_seconds", time.perf_counter() - started, channel=channel)
+        if not delivered:
+            # 定向发送被拒说明路由已过期（用户已断开），下次发送时重新广播查找
+            self._forget_route(channel, user_id, route)
+        return self._result(channel, delivered, "delivered" if delivered else "undelivered")
+
+    async def broadcast(self, channel: str, text: str, exclude_id: Optional[str] = None) -> None:
+        """请其他 worker 各自向本地连接广播（不等待确认）"""
+        frame = {"k": "broadcast", "c": channel, "d": text, "x": exclude_id}
+        for peer in self.transport.peers():
+            await self._send(peer, frame)
+        self._stats["broadcasts"] += 1
+
+    def _result(self, channel: str, delivered: bool, result: str) -> bool:
+        self._stats["forwarded"] += 1
+        self._stats["delivered" if delivered else "undelivered"] += 1
+        Metrics.increment("message_bus_frames_total", channel=channel, result=result)
+        return delivered
+
+    def _forget_route(self, channel: str, user_id: str, worker_id: Optional[str]) -> None:
+        if worker_id is not None and self._routes.get(channel, {}).get(user_id) == worker_id:
+            del self._routes[channel][user_id]
+
+    async def _send(self, peer: str, message: dict) -> bool:
+        message["o"] = self.worker_id
+        return await self.transport.send(peer, json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+    async def _announce(self, message: dict) -> None:
+        for peer in self.transport.peers():
+            await self._send(peer, dict(message))
+
+    # ==================== 接收 ====================
+    def _receive(self, data: bytes) -> None:
+        """传输层回调：按消息类型分派（需要等待的处理放入后台任务）"""
+        try:
+            message = json.loads(data.decode("utf-8"))
+        except Exception:
+            logger.warning(f"跳过无法解析的总线消息: {data[:200]!r}")
+            return
+        kind, origin = message.get("k"), message.get("o")
+        if kind == "ack":
+            self._acknowledge(message["id"], message["ok"])
+        elif kind == "up":
+            self._routes.setdefault(message["c"], {})[message["u"]] = origin
+        elif kind == "down":
+            self._forget_route(message["c"], message["u"], origin)
+        elif kind == "bye":
+            for routes in self._routes.values():
+                for user_id in [user_id for user_id, worker_id in routes.items() if worker_id == origin]:
+                    del routes[user_id]
+        elif kind in ("frame", "broadcast", "hello"):
+            task = asyncio.get_running_loop().create_task(self._handle(kind, origin, message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            logger.warning(f"未知的总线消息类型: {kind}")
+
+    def _acknowledge(self, frame_id: str, ok: bool) -> None:
+        entry = self._pending.get(frame_id)
+        if entry is None:
+            return
+        future, waiting = entry
+        if future.done():
+            return
+        if ok:
+            future.set_result(True)
+        elif waiting <= 1:
+            future.set_result(False)
+        else:
+            self._pending[frame_id] = (future, waiting - 1)
+
+    async def _handle(self, kind: str, origin: str, message: dict) -> None:
+        try:
+            if kind == "hello":
+                for channel, users in self._local.items():
+                    for user_id in list(users):
+                        await self._send(origin, {"k": "up", "c": channel, "u": user_id})
+                return
+            entry = self._channels.get(message["c"])
+            if kind == "broadcast":
+                if entry is not None:
+                    await entry[1](message["d"], message.get("x"))
+                return
+            self._stats["received"] += 1
+            delivered = False
+            if entry is not None and message["u"] in self._local.get(message["c"], ()):
+                delivered = bool(await entry[0](message["u"], message["d"]))
+            await self._send(origin, {"k": "ack", "id": message["id"], "ok": delivered})
+        except Exception as e:
+            logger.error(f"处理来自 worker {origin} 的总线消息失败: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "peers": len(self.transport.peers()),
+            "local_users": {channel: len(users) for channel, users in self._local.items()},
+            "remote_users": {channel: len(routes) for channel, routes in self._routes.items()},
+            "pending": len(self._pending),
+            **self._stats,
+        }
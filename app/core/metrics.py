@@ -0,0 +1,175 @@
+"""
+进程内指标登记表
+- 计数器、仪表（当前值）与延迟直方图按指标名 + 标签（如 collection / operation）分组
+- render_prometheus 输出 Prometheus 文本格式，供 /metrics 抓取
+- 慢操作单独保留最近若干条（含查询形状），便于定位是哪个集合、哪类查询变慢
+"""
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """固定桶的延迟直方图（每个桶只计落入该桶的次数，输出时再累加）"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((repr(bound), total))
+        result.append(("+Inf", self.count))
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估算分位数（落在最后一个桶时返回 None）"""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        for bound, total in self.cumulative():
+            if total >= target:
+                return None if bound == "+Inf" else float(bound)
+        return None
+
+
+class Metrics:
+    """
+    全局指标登记表
+    属性：
+        _counters: dict{name, dict{labels, float}}
+        _gauges: dict{name, dict{labels, float}}，可增可减的当前值（如连接池占用数）
+        _histograms: dict{name, dict{labels, Histogram}}
+        _help: dict{name, 说明}
+        slow_operations: 最近的慢操作记录
+    """
+    _counters: Dict[str, Dict[Labels, float]] = {}
+    _gauges: Dict[str, Dict[Labels, float]] = {}
+    _histograms: Dict[str, Dict[Labels, Histogram]] = {}
+    _help: Dict[str, str] = {}
+    slow_operations = deque(maxlen=settings.DB_SLOW_OP_HISTORY)
+
+    @classmethod
+    def describe(cls, name: str, text: str) -> None:
+        cls._help[name] = text
+
+    @classmethod
+    def increment(cls, name: str, amount: float = 1, **labels) -> None:
+        series = cls._counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    @classmethod
+    def adjust_gauge(cls, name: str, amount: float, **labels) -> None:
+        series = cls._gauges.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + amount
+
+    @classmethod
+    def set_gauge(cls, name: str, value: float, **labels) -> None:
+        cls._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    @classmethod
+    def observe(cls, name: str, value: float, **labels) -> None:
+        series = cls._histograms.setdefault(name, {})
+        key = _labels(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @classmethod
+    def record_slow(cls, **details) -> None:
+        cls.slow_operations.append({"at": time.time(), **details})
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._counters.clear()
+        cls._gauges.clear()
+        cls._histograms.clear()
+        cls.slow_operations.clear()
+
+    @classmethod
+    def render_prometheus(cls) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for name, series in cls._counters.items():
+            if name in cls._help:
+                lines.append(f"# HELP {name} {cls._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in cls._gauges.items():
+            if name in cls._help:
+                lines.append(f"# HELP {name} {cls._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for name, series in cls._histograms.items():
+            if name in cls._help:
+                lines.append(f"# HELP {name} {cls._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                for bound, total in histogram.cumulative():
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {total}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        """JSON 形式的摘要：每个序列的次数、平均耗时与 p95 估计"""
+        histograms = {}
+        for name, series in cls._histograms.items():
+            histograms[name] = [
+                {
+                    **dict(labels),
+                    "count": histogram.count,
+                    "avg": round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                    "p95": histogram.quantile(0.95),
+                }
+                for labels, histogram in series.items()
+            ]
+        counters = {
+            name: [{**dict(labels), "value": value} for labels, value in series.items()]
+            for name, series in cls._counters.items()
+        }
+        gauges = {
+            name: [{**dict(labels), "value": value} for labels, value in series.items()]
+            for name, series in cls._gauges.items()
+        }
+        return {"counters": counters, "gauges": gauges, "histograms": histograms, "slow_operations": list(cls.slow_operations)}
@@ -0,0 +1,84 @@
+"""
+版本化的数据迁移
+- 每个迁移有唯一的整数版本号，按版本号顺序执行；已执行的版本记录在 schema_migrations 集合中
+- 启动时由 lifespan 在加载任何数据之前调用 MigrationRunner.run()
+- 迁移函数需要可重复执行（多个进程同时启动时可能都会执行一次）
+- 某个迁移失败即停止，后面的版本可能依赖它，留到下次启动重试
+"""
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List
+
+from app.core.database import Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("migrations")
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+
+class Migration:
+    def __init__(self, version: int, description: str, apply: Callable[[], Awaitable]):
+        self.version = version
+        self.description = description
+        self.apply = apply
+
+
+class MigrationRunner:
+    """
+    全局迁移登记表
+    属性：
+        _migrations: dict{version, Migration}
+    """
+    _migrations: Dict[int, Migration] = {}
+
+    @classmethod
+    def register(cls, version: int, description: str):
+        """装饰器：登记一个迁移函数"""
+        def decorator(func):
+            if version in cls._migrations:
+                raise ValueError(f"Duplicate migration version {version}")
+            cls._migrations[version] = Migration(version, description, func)
+            return func
+        return decorator
+
+    @classmethod
+    async def applied_versions(cls) -> set:
+        documents = await Database.find(MIGRATIONS_COLLECTION, {}, {"_id": 1})
+        return {document["_id"] for document in documents}
+
+    @classmethod
+    async def run(cls) -> List[int]:
+        """执行全部尚未执行的迁移，返回本次执行的版本号"""
+        applied = await cls.applied_versions()
+        executed = []
+        for version in sorted(set(cls._migrations) - applied):
+            migration = cls._migrations[version]
+            logger.info(f"Applying migration {version}: {migration.description}")
+            try:
+                result = await migration.apply()
+            except Exception as e:
+                logger.error(f"Migration {version} failed, later migrations postponed: {e}")
+                break
+            try:
+                await Database.insert_one(MIGRATIONS_COLLECTION, {
+                    "_id": version,
+                    "description": migration.description,
+                    "applied_at": datetime.now(timezone.utc),
+                })
+            except Exception as e:
+                # 另一个进程已经记录了同一版本
+                logger.warning(f"Migration {version} already recorded: {e}")
+            logger.info(f"Migration {version} applied: {result}")
+            executed.append(version)
+        return executed
+
+
+# ==================== 迁移 ====================
+@MigrationRunner.register(1, "users: rename telegram_user_name to user_name")
+async def _rename_user_name():
+    # User.to_document 写入的是 user_name，早期文档以 telegram_user_name 存储
+    return await Database.update_many(
+        "users",
+        {"telegram_user_name": {"$exists": True}, "user_name": {"$exists": False}},
+        {"$rename": {"telegram_user_name": "user_name"}},
+    )
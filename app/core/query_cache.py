@@ -0,0 +1,156 @@
+"""
+Database.find_one 的读穿透缓存
+- 只缓存按 _id 等值查询的单文档结果；每个集合单独配置 TTL，未配置的集合不缓存
+- 全局 LRU 限制条目数，超出时淘汰最久未使用的条目
+- 经 Database 门面的任何写入都会失效同一 _id 的条目；无法确定 _id 的写入（任意过滤条件）失效整个集合
+- 缓存按进程独立；多 worker 部署时其他进程的写入经 ChangeFeed 失效本进程的条目，否则最大陈旧时间由 TTL 约束
+- 命中/未命中/淘汰次数写入 Metrics，/flush_status 给出命中率
+"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.config import settings
+from app.core.metrics import Metrics
+
+Metrics.describe("db_cache_requests_total", "find_one cache lookups by collection and result (hit/miss)")
+Metrics.describe("db_cache_evictions_total", "find_one cache entries evicted by the LRU bound")
+
+_MISSING = object()
+
+
+def parse_ttls(value: str) -> Dict[str, float]:
+    """解析 "users:30,posts:10" 形式的 TTL 配置（秒）"""
+    ttls = {}
+    for item in value.split(","):
+        if ":" in item:
+            collection, ttl = item.split(":", 1)
+            ttls[collection.strip()] = float(ttl)
+    return ttls
+
+
+def cache_key(query: Optional[dict]) -> Any:
+    """可缓存的查询（仅 {"_id": 标量}）返回其 _id，否则返回 _MISSING"""
+    if not query or len(query) != 1 or "_id" not in query:
+        return _MISSING
+    value = query["_id"]
+    if isinstance(value, (dict, list)):
+        return _MISSING
+    return value
+
+
+def written_ids(query: Optional[dict], key: str = "_id") -> Optional[Iterable[Hashable]]:
+    """写入过滤条件涉及的主键（默认 _id）；无法确定时返回 None（需要失效整个集合）"""
+    if not query or set(query) != {key}:
+        return None
+    value = query[key]
+    if isinstance(value, dict):
+        if set(value) == {"$in"}:
+            return list(value["$in"])
+        return None
+    return [value]
+
+
+class QueryCache:
+    """
+    全局 find_one 缓存
+    属性：
+        _entries: OrderedDict{(collection, _id), (过期时间, 文档)}，按最近使用排序
+        _versions: dict{collection, int}，失效时递增；未命中期间版本变化则不回填，避免把写入前的旧文档放回缓存
+        _ttls: dict{collection, 秒}
+    """
+    _entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Optional[dict]]]" = OrderedDict()
+    _versions: Dict[str, int] = {}
+    _ttls: Dict[str, float] = parse_ttls(settings.DB_CACHE_TTLS)
+    max_entries: int = settings.DB_CACHE_MAX_ENTRIES
+    enabled: bool = settings.DB_CACHE_ENABLED
+
+    @classmethod
+    def configure(cls, collection: str, ttl: Optional[float]) -> None:
+        """设置集合的 TTL；ttl 为 None 或 0 时关闭该集合的缓存"""
+        if ttl:
+            cls._ttls[collection] = ttl
+        else:
+            cls.invalidate(collection)
+            cls._ttls.pop(collection, None)
+
+    @classmethod
+    def caches(cls, collection: str) -> bool:
+        return cls.enabled and collection in cls._ttls
+
+    @classmethod
+    def cacheable(cls, collection: str, query: Optional[dict]) -> bool:
+        return cls.enabled and collection in cls._ttls and cache_key(query) is not _MISSING
+
+    @classmethod
+    def version(cls, collection: str) -> int:
+        return cls._versions.get(collection, 0)
+
+    @classmethod
+    def get(cls, collection: str, query: dict) -> Tuple[bool, Optional[dict]]:
+        """返回 (是否命中, 文档副本)；命中时文档可能为 None，表示该 _id 不存在"""
+        key = (collection, cache_key(query))
+        entry = cls._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            cls._entries.move_to_end(key)
+            Metrics.increment("db_cache_requests_total", collection=collection, result="hit")
+            return True, copy.deepcopy(entry[1])
+        if entry is not None:
+            del cls._entries[key]
+        Metrics.increment("db_cache_requests_total", collection=collection, result="miss")
+        return False, None
+
+    @classmethod
+    def put(cls, collection: str, query: dict, document: Optional[dict], version: int) -> None:
+        """回填未命中的结果；查询期间集合发生过写入时放弃回填"""
+        if version != cls.version(collection):
+            return
+        key = (collection, cache_key(query))
+        cls._entries[key] = (time.monotonic() + cls._ttls[collection], copy.deepcopy(document))
+        cls._entries.move_to_end(key)
+        while len(cls._entries) > cls.max_entries:
+            (evicted_collection, _), _ = cls._entries.popitem(last=False)
+            Metrics.increment("db_cache_evictions_total", collection=evicted_collection)
+
+    @classmethod
+    def invalidate(cls, collection: str, query: Optional[dict] = None, ids: Optional[Iterable[Hashable]] = None) -> None:
+        """
+        写入后失效缓存：传入 ids 或可解析出 _id 的 query 时只失效这些条目，否则失效整个集合
+        """
+        if collection not in cls._ttls:
+            return
+        cls._versions[collection] = cls.version(collection) + 1
+        if ids is None and query is not None:
+            ids = written_ids(query)
+        if ids is None:
+            for key in [key for key in cls._entries if key[0] == collection]:
+                del cls._entries[key]
+            return
+        for _id in ids:
+            try:
+                cls._entries.pop((collection, _id), None)
+            except TypeError:
+                # 不可哈希的 _id 不会被缓存
+                continue
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._entries.clear()
+        cls._versions.clear()
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        requests = Metrics.get_status()["counters"].get("db_cache_requests_total", [])
+        collections: Dict[str, Dict[str, Any]] = {
+            collection: {"ttl": ttl, "entries": 0, "hit": 0, "miss": 0} for collection, ttl in cls._ttls.items()
+        }
+        for collection, _ in cls._entries:
+            collections.setdefault(collection, {"ttl": None, "entries": 0, "hit": 0, "miss": 0})["entries"] += 1
+        for item in requests:
+            stats = collections.setdefault(item["collection"], {"ttl": None, "entries": 0, "hit": 0, "miss": 0})
+            stats[item["result"]] += item["value"]
+        for stats in collections.values():
+            total = stats["hit"] + stats["miss"]
+            stats["hit_rate"] = round(stats["hit"] / total, 4) if total else None
+        return {"enabled": cls.enabled, "max_entries": cls.max_entries, "size": len(cls._entries), "collections": collections}
@@ -0,0 +1,195 @@
+"""
+内存状态快照（管理器缓存热启动）
+- 定期把各管理器内存中的文档写成一个带版本号的紧凑二进制文件
+- 启动时先读快照，再只从数据库拉取快照时间之后变更的文档（按 _modified_at 追平），
+  并用主键投影比对找出新增/已删除的文档，避免整表读取
+
+文件格式（小端）：
+    头部: magic(6s) | version(H) | created_at(d) | 集合数量(I)
+    每个集合: 名称长度(H) + 名称 | 主键字段长度(H) + 主键字段 | 文档数(I) | 压缩长度(I) + zlib(连续的 BSON 文档)
+"""
+import asyncio
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import bson
+
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("Snapshot")
+
+SNAPSHOT_MAGIC = b"LLSNAP"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<6sHdI")
+_SHORT = struct.Struct("<H")
+_UINT = struct.Struct("<I")
+
+# 编码时每处理这么多文档让出一次事件循环，避免长时间阻塞请求
+_YIELD_EVERY = 1000
+
+
+class Snapshot:
+    """
+    快照读写
+    属性：
+        _collections: dict{collection, (key_field, dump_all)}  # dump_all() 返回该集合内存中的全部文档
+        last_written_at / last_duration / last_size: 最近一次写快照的统计
+    """
+    _collections: Dict[str, Tuple[str, Callable[[], Iterable[dict]]]] = {}
+    last_written_at: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_size: Optional[int] = None
+
+    @classmethod
+    def register(cls, collection: str, key_field: str, dump_all: Callable[[], Iterable[dict]]) -> None:
+        """登记一个需要写入快照的集合"""
+        cls._collections[collection] = (key_field, dump_all)
+
+    # ==================== 写快照 ====================
+    @classmethod
+    async def write(cls, path: Optional[str] = None) -> bool:
+        """把已登记集合的内存文档写入快照文件（临时文件 + 原子替换）"""
+        snapshot_path = Path(path or settings.SNAPSHOT_PATH)
+        started = time.perf_counter()
+        # 先取时间戳再序列化：之后的修改都会带更晚的 _modified_at，启动时会被追平
+        created_at = time.time()
+
+        sections = []
+        for collection, (key_field, dump_all) in list(cls._collections.items()):
+            encoded = []
+            # 一次性取出文档（期间不让出事件循环，字典不会在迭代中被修改）
+            documents = list(dump_all())
+            for index, document in enumerate(documents):
+                try:
+                    encoded.append(bson.encode(document))
+                except Exception as e:
+                    logger.warning(f"快照跳过无法编码的文档 {collection}/{document.get(key_field)}: {e}")
+                if index % _YIELD_EVERY == _YIELD_EVERY - 1:
+                    await asyncio.sleep(0)
+            sections.append((collection, key_field, encoded))
+
+        size = await asyncio.to_thread(cls._write_file, snapshot_path, created_at, sections)
+
+        cls.last_written_at = created_at
+        cls.last_duration = round(time.perf_counter() - started, 4)
+        cls.last_size = size
+        total = sum(len(encoded) for _, _, encoded in sections)
+        logger.info(f"快照已写入: {total} 个文档，{size} 字节，耗时 {cls.last_duration:.3f}秒")
+        return True
+
+    @staticmethod
+    def _write_file(snapshot_path: Path, created_at: float, sections) -> int:
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+        with open(tmp_path, "wb") as snapshot_file:
+            snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, created_at, len(sections)))
+            for collection, key_field, encoded in sections:
+                for text in (collection, key_field):
+                    raw = text.encode("utf-8")
+                    snapshot_file.write(_SHORT.pack(len(raw)) + raw)
+                payload = zlib.compress(b"".join(encoded), 1)
+                snapshot_file.write(_UINT.pack(len(encoded)))
+                snapshot_file.write(_UINT.pack(len(payload)) + payload)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, snapshot_path)
+        return snapshot_path.stat().st_size
+
+    # ==================== 读快照 ====================
+    @staticmethod
+    def read(path: Optional[str] = None) -> Optional[Tuple[float, Dict[str, Tuple[str, List[dict]]]]]:
+        """
+        读取快照文件，返回 (created_at, {collection: (key_field, documents)})
+        文件不存在、版本不匹配或已损坏时返回 None（调用方回退到整表加载）
+        """
+        snapshot_path = Path(path or settings.SNAPSHOT_PATH)
+        if not snapshot_path.exists():
+            return None
+        try:
+            data = snapshot_path.read_bytes()
+            magic, version, created_at, count = _HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                logger.warning(f"快照格式不匹配（magic={magic!r}, version={version}），忽略快照")
+                return None
+
+            offset = _HEADER.size
+            collections = {}
+            for _ in range(count):
+                texts = []
+                for _ in range(2):
+                    (length,) = _SHORT.unpack_from(data, offset)
+                    offset += _SHORT.size
+                    texts.append(data[offset:offset + length].decode("utf-8"))
+                    offset += length
+                (document_count,) = _UINT.unpack_from(data, offset)
+                (payload_length,) = _UINT.unpack_from(data, offset + _UINT.size)
+                offset += 2 * _UINT.size
+                documents = bson.decode_all(zlib.decompress(data[offset:offset + payload_length]))
+                offset += payload_length
+                if len(documents) != document_count:
+                    raise ValueError(f"{texts[0]} 文档数量不一致")
+                collections[texts[0]] = (texts[1], documents)
+            return created_at, collections
+        except Exception as e:
+            logger.warning(f"快照文件损坏，忽略快照: {e}")
+            return None
+
+    # ==================== 热启动 ====================
+    @classmethod
+    async def warm_start(cls, path: Optional[str] = None) -> Dict[str, List[dict]]:
+        """
+        读取快照并与数据库追平，返回 {collection: documents}
+        没有可用快照时返回空字典，各管理器按原方式整表加载
+        """
+        from app.core.database import Database, MODIFIED_AT_FIELD
+
+        snapshot = await asyncio.to_thread(cls.read, path)
+        if snapshot is None:
+            return {}
+
+        created_at, collections = snapshot
+        since = datetime.fromtimestamp(created_at - settings.SNAPSHOT_CATCHUP_MARGIN, tz=timezone.utc)
+        result = {}
+        for collection, (key_field, documents) in collections.items():
+            started = time.perf_counter()
+            by_key = {document[key_field]: document for document in documents if key_field in document}
+
+            # 主键投影：找出快照之后新增与已删除的文档
+            database_keys = set()
+            async for batch in Database.iter(collection, {}, {key_field: 1}):
+                database_keys.update(document[key_field] for document in batch if key_field in document)
+            deleted_keys = by_key.keys() - database_keys
+            for key in deleted_keys:
+                del by_key[key]
+            new_keys = list(database_keys - by_key.keys())
+
+            # 拉取快照之后被修改过的文档，以及快照中没有的新文档
+            changed = await Database.find(collection, {MODIFIED_AT_FIELD: {"$gte": since}})
+            batch_size = settings.DB_BULK_BATCH_SIZE
+            for start in range(0, len(new_keys), batch_size):
+                changed.extend(await Database.find(collection, {key_field: {"$in": new_keys[start:start + batch_size]}}))
+            for document in changed:
+                # 缺少主键字段的历史文档（如早期没有 ai_message_id 的消息）与整表加载时一样跳过
+                if key_field in document:
+                    by_key[document[key_field]] = document
+
+            result[collection] = list(by_key.values())
+            logger.info(
+                f"{collection} 热启动: 快照 {len(documents)} 个，追平 {len(changed)} 个，删除 {len(deleted_keys)} 个，"
+                f"耗时 {time.perf_counter() - started:.3f}秒"
+            )
+        return result
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        return {
+            "last_written_at": cls.last_written_at,
+            "last_duration": cls.last_duration,
+            "last_size": cls.last_size,
+        }
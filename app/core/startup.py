@@ -0,0 +1,161 @@
+"""
+启动编排（按依赖并发初始化）
+- 每个初始化步骤注册为一个阶段，并声明它依赖的阶段；依赖全部完成后立即开始，互不依赖的阶段用 asyncio.gather 并发执行
+- 依赖只能指向已注册的阶段，因此不会出现环
+- 某个阶段失败时，依赖它的阶段跳过，其余阶段照常完成，最后抛出最先失败的阶段的异常
+- 记录每个阶段的开始/结束时间，启动结束后输出关键路径报告（决定总启动耗时的那条阶段链）
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.metrics import Metrics
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("Startup")
+
+Metrics.describe("startup_stage_seconds", "Duration of each startup stage in the last startup")
+
+
+class StartupStage:
+    """
+    单个启动阶段
+    属性：
+        name: 阶段名称
+        func: 无参异步函数，返回值存入 StartupPlan.results
+        after: 依赖的阶段名称
+        status: pending / running / done / failed / skipped
+        started / finished: 相对启动开始的秒数
+        error: 失败时的异常
+    """
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], after: Tuple[str, ...]):
+        self.name = name
+        self.func = func
+        self.after = after
+        self.status = "pending"
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "after": list(self.after),
+            "status": self.status,
+            "started": round(self.started, 4) if self.started is not None else None,
+            "finished": round(self.finished, 4) if self.finished is not None else None,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+        }
+
+
+class _DependencyFailed(Exception):
+    """依赖的阶段失败，本阶段跳过"""
+
+
+class StartupPlan:
+    """
+    启动计划
+    属性：
+        stages: dict{name, StartupStage}，按注册顺序
+        results: dict{name, 阶段返回值}
+        last_report: 最近一次启动的报告（类属性，供状态接口读取）
+    """
+    last_report: Optional[Dict[str, Any]] = None
+
+    def __init__(self):
+        self.stages: Dict[str, StartupStage] = {}
+        self.results: Dict[str, Any] = {}
+
+    def stage(self, name: str, func: Callable[[], Awaitable[Any]], after: Tuple[str, ...] = ()) -> None:
+        """注册一个阶段；after 中的阶段必须已经注册"""
+        if name in self.stages:
+            raise ValueError(f"Startup stage {name} is already registered")
+        missing = [dependency for dependency in after if dependency not in self.stages]
+        if missing:
+            raise ValueError(f"Startup stage {name} depends on unknown stages: {missing}")
+        self.stages[name] = StartupStage(name, func, tuple(after))
+
+    async def run(self) -> Dict[str, Any]:
+        """执行全部阶段，返回各阶段的返回值"""
+        origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: StartupStage):
+            try:
+                await asyncio.gather(*(tasks[name] for name in stage.after))
+            except Exception:
+                stage.status = "skipped"
+                raise _DependencyFailed(stage.name)
+            stage.status = "running"
+            stage.started = time.perf_counter() - origin
+            try:
+                self.results[stage.name] = await stage.func()
+                stage.status = "done"
+            except Exception as e:
+                stage.status = "failed"
+                stage.error = e
+                logger.error(f"启动阶段 {stage.name} 失败: {e}")
+                raise
+            finally:
+                stage.finished = time.perf_counter() - origin
+                Metrics.set_gauge("startup_stage_seconds", stage.duration, stage=stage.name)
+
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage), name=f"startup:{stage.name}")
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        StartupPlan.last_report = self.report()
+        self.log_report()
+        failed = sorted((stage for stage in self.stages.values() if stage.status == "failed"), key=lambda stage: stage.finished)
+        if failed:
+            raise failed[0].error
+        return self.results
+
+    def critical_path(self) -> List[str]:
+        """从最晚结束的阶段沿"最晚完成的依赖"回溯得到的阶段链（按执行先后排列）"""
+        finished = [stage for stage in self.stages.values() if stage.finished is not None]
+        if not finished:
+            return []
+        stage = max(finished, key=lambda item: item.finished)
+        path = [stage.name]
+        while stage.after:
+            stage = max((self.stages[name] for name in stage.after), key=lambda item: item.finished or 0)
+            path.append(stage.name)
+        return path[::-1]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        启动报告
+        total: 实际启动耗时；serial: 各阶段耗时之和（即依次执行所需的时间）
+        """
+        durations = [stage.duration for stage in self.stages.values() if stage.duration is not None]
+        total = max((stage.finished for stage in self.stages.values() if stage.finished is not None), default=0.0)
+        return {
+            "total": round(total, 4),
+            "serial": round(sum(durations), 4),
+            "critical_path": self.critical_path(),
+            "stages": {name: stage.get_status() for name, stage in self.stages.items()},
+        }
+
+    def log_report(self) -> None:
+        """输出各阶段时间线（* 标记关键路径上的阶段）"""
+        report = self.report()
+        critical = set(report["critical_path"])
+        logger.info(f"启动耗时 {report['total']:.3f}s（各阶段依次执行需 {report['serial']:.3f}s）")
+        logger.info(f"关键路径: {' → '.join(report['critical_path'])}")
+        for stage in sorted(self.stages.values(), key=lambda item: (item.started is None, item.started or 0)):
+            marker = "*" if stage.name in critical else " "
+            if stage.duration is None:
+                logger.info(f"{marker} {stage.name:<24} {stage.status}")
+            else:
+                logger.info(f"{marker} {stage.name:<24} {stage.started:>8.3f}s → {stage.finished:>8.3f}s  {stage.duration:>8.3f}s  {stage.status}")
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        return cls.last_report or {"total": None, "stages": {}}
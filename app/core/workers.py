@@ -0,0 +1,158 @@
+"""
+多 worker 部署的进程协调（文件锁，仅适用于同一台机器上的 uvicorn --workers）
+- bootstrap()：启动阶段的互斥区，迁移、索引、日志重放与基础数据初始化在各进程间依次执行
+- 领导者：第一个拿到 leader 锁的进程负责全量完备性检查与快照；领导者退出后锁被释放，其他进程在下一次检查时接替
+- 本地日志/溢写目录按进程划分（<base>/worker-<worker_id>），存活期间持有目录锁；
+  启动时重放已退出进程遗留的目录（锁可获得即说明其所有者已退出）
+WORKERS 为 1 时各方法退化为单进程行为：不加锁、始终是领导者、直接使用配置的目录
+"""
+import asyncio
+import fcntl
+import os
+import shutil
+import socket
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("WorkerCoordinator")
+
+
+class WorkerCoordinator:
+    """
+    进程协调
+    属性：
+        _locks: dict{锁文件路径, fd}  # 本进程持有的文件锁（进程退出时由操作系统释放）
+        _directories: dict{目录, 锁文件路径}  # 本进程占用的本地目录
+        _leader: 本进程是否已成为领导者
+    """
+    _locks: Dict[str, int] = {}
+    _directories: Dict[str, str] = {}
+    _leader: bool = False
+
+    @staticmethod
+    def multi_worker() -> bool:
+        return settings.WORKERS > 1
+
+    @staticmethod
+    def worker_id() -> str:
+        # 每次按当前 pid 计算：worker 进程由主进程派生，不能在导入时缓存
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    @classmethod
+    def _try_lock(cls, path: Path) -> Optional[int]:
+        """非阻塞地获取排他文件锁，成功返回 fd"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @classmethod
+    @asynccontextmanager
+    async def bootstrap(cls):
+        """启动互斥区：同一时刻只有一个进程执行其中的初始化步骤"""
+        if not cls.multi_worker():
+            yield
+            return
+        path = Path(settings.WORKER_STATE_DIR) / "bootstrap.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            logger.info(f"worker {cls.worker_id()} 进入启动互斥区")
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @classmethod
+    def is_leader(cls) -> bool:
+        """本进程是否负责全局任务（全量完备性检查、快照）；未持有时尝试接替"""
+        if not cls.multi_worker() or cls._leader:
+            return True
+        path = Path(settings.WORKER_STATE_DIR) / "leader.lock"
+        fd = cls._try_lock(path)
+        if fd is None:
+            return False
+        cls._locks[str(path)] = fd
+        cls._leader = True
+        logger.info(f"worker {cls.worker_id()} 成为领导者")
+        return True
+
+    @classmethod
+    def directory(cls, base: str) -> str:
+        """本进程使用的本地目录（日志/溢写）：多 worker 时为 base 下按进程划分并加锁的子目录"""
+        if not cls.multi_worker():
+            return base
+        directory = Path(base) / f"worker-{cls.worker_id()}"
+        lock_path = Path(f"{directory}.lock")
+        if str(lock_path) not in cls._locks:
+            fd = cls._try_lock(lock_path)
+            if fd is None:
+                raise RuntimeError(f"目录 {directory} 已被另一个进程占用")
+            cls._locks[str(lock_path)] = fd
+            cls._directories[str(directory)] = str(lock_path)
+        directory.mkdir(parents=True, exist_ok=True)
+        return str(directory)
+
+    @classmethod
+    def release(cls) -> None:
+        """停机时删除本进程已清空的本地目录并释放全部锁；仍有文件的目录留给下一个启动的进程重放"""
+        for directory, lock_path in cls._directories.items():
+            try:
+                Path(directory).rmdir()
+                Path(lock_path).unlink(missing_ok=True)
+            except OSError:
+                pass
+        for fd in cls._locks.values():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        cls._locks.clear()
+        cls._directories.clear()
+        cls._leader = False
+
+    @classmethod
+    async def adopt_orphans(cls, base: str, replay: Callable[[str], Awaitable[int]]) -> int:
+        """
+        重放已退出进程遗留在 base 下的目录（在启动互斥区内调用），成功后删除目录，返回重放的记录数
+        重放失败的目录保留，下次启动时再试
+        """
+        if not cls.multi_worker() or not Path(base).exists():
+            return 0
+        own = f"worker-{cls.worker_id()}"
+        replayed = 0
+        for directory in sorted(Path(base).glob("worker-*")):
+            if not directory.is_dir() or directory.name == own:
+                continue
+            lock_path = Path(f"{directory}.lock")
+            fd = cls._try_lock(lock_path)
+            if fd is None:
+                continue
+            try:
+                count = await replay(str(directory))
+                shutil.rmtree(directory, ignore_errors=True)
+                lock_path.unlink(missing_ok=True)
+                replayed += count
+                if count:
+                    logger.info(f"已重放退出进程遗留的 {directory}: {count} 条记录")
+            except Exception as e:
+                logger.error(f"重放 {directory} 失败，保留到下次启动: {e}")
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+        return replayed
+
+    @classmethod
+    def get_status(cls) -> Dict[str, Any]:
+        return {
+            "worker_id": cls.worker_id(),
+            "workers": settings.WORKERS,
+            "leader": cls.is_leader(),
+        }
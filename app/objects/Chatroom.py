@@ -1,53 +1,43 @@
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.change_tracker import ChangeTrackingMixin
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("Chatroom")
 
 
-class Chatroom:
+class Chatroom(ChangeTrackingMixin):
     """
     聊天室类，管理聊天室内容
     """
-    _chatroom_counter = 0
+    # 变更追踪：持久化字段变更（含 message_ids 的原地追加）会把聊天室登记为脏对象
+    _tracked_collection = "chatrooms"
+    _tracked_key = "chatroom_id"
+    _tracked_fields = frozenset({"chatroom_id", "user1_id", "user2_id", "message_ids", "match_id"})
+    # 紧凑存储：消息ID存为 array('q')，用户ID字符串驻留
+    _id_array_fields = frozenset({"message_ids"})
+    _interned_fields = frozenset({"user1_id", "user2_id"})
+    __slots__ = tuple(sorted(_tracked_fields)) + ("user1", "user2")
+
     _initialized = False
     
     @classmethod
     async def initialize_counter(cls):
         """
-        从数据库初始化聊天室计数器，确保不会产生重复ID
+        初始化聊天室ID序列：从 counters 集合租用ID段（下限为数据库中最大的_id），多进程下也不会产生重复ID
         """
         if cls._initialized:
             return
-            
-        try:
-            # 查找数据库中最大的_id（chatroom_id存储在_id字段中）
-            chatrooms = await Database.find("chatrooms", sort=[("_id", -1)], limit=1)
-            
-            if chatrooms:
-                max_id = chatrooms[0]["_id"]
-                cls._chatroom_counter = max_id
-                logger.info(f"Chatroom counter initialized from database: starting from {max_id}")
-            else:
-                cls._chatroom_counter = 0
-                logger.info("No existing chatrooms found, starting counter from 0")
-                
-            cls._initialized = True
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize chatroom counter: {e}")
-            # 如果初始化失败，使用时间戳作为起始点以避免冲突
-            import time
-            cls._chatroom_counter = int(time.time() * 1000)  # 毫秒时间戳
-            cls._initialized = True
-            logger.warning(f"Using timestamp as chatroom counter starting point: {cls._chatroom_counter}")
-    
+        await IdAllocator.initialize("chatrooms")
+        cls._initialized = True
+
     def __init__(self, user1, user2, match_id):
         # 确保计数器已初始化
         if not Chatroom._initialized:
             raise RuntimeError("Chatroom counter not initialized. Call Chatroom.initialize_counter() first.")
             
-        Chatroom._chatroom_counter += 1
-        self.chatroom_id = Chatroom._chatroom_counter
+        # 从本进程租到的ID段中分配（多进程下不会重复）
+        self.chatroom_id = IdAllocator.next_id("chatrooms")
         self.message_ids = []
         # 中文注释：聊天室中的用户ID改为字符串（openid）
         self.user1_id = user1.user_id
@@ -64,30 +54,50 @@ class Chatroom:
         保存聊天室到数据库，使用chatroom_id作为_id主键
         """
         try:
-            chatroom_dict = {
-                "_id": self.chatroom_id,  # 使用chatroom_id作为MongoDB的_id主键
-                "user1_id": self.user1_id,
-                "user2_id": self.user2_id,
-                "message_ids": self.message_ids,
-                "match_id": self.match_id  # 添加match_id到数据库字段
-            }
+            # 先取快照并清除脏标记；写库期间发生的新修改会重新标脏
+            chatroom_dict = self.to_document()
+            self.mark_clean()
             
-            # 检查聊天室是否已存在（基于_id查询，O(log n)复杂度）
-            existing_chatroom = await Database.find_one("chatrooms", {"_id": self.chatroom_id})
-            if existing_chatroom:
-                # 更新现有聊天室
-                await Database.update_one(
-                    "chatrooms",
-                    {"_id": self.chatroom_id},
-                    {"$set": {k: v for k, v in chatroom_dict.items() if k != "_id"}}  # 不更新_id字段
-                )
-            else:
-                # 插入新聊天室
-                await Database.insert_one("chatrooms", chatroom_dict)
+            # 单次 upsert 往返，不再先查询是否存在
+            result = await Database.bulk_upsert("chatrooms", [chatroom_dict])
+            if result["failed_keys"]:
+                self.mark_dirty()
+                return False
             
             logger.info(f"Saved chatroom {self.chatroom_id} to database")
             return True
             
         except Exception as e:
             logger.error(f"Error saving chatroom {self.chatroom_id} to database: {e}")
-            return False
\ No newline at end of file
+            self.mark_dirty()
+            return False
+
+    @classmethod
+    def from_document(cls, document: dict, user1=None, user2=None) -> "Chatroom":
+        """
+        由 `chatrooms` 集合中的文档直接重建聊天室（调用方传入内存中的双方用户实例）
+        不经过 __init__，因此不消耗ID序列，也不会登记脏对象
+        用户ID取自文档；lazy 模式下未加载的用户传入 None
+        """
+        match_id = document.get("match_id")
+        return cls._from_fields({
+            "chatroom_id": int(document["_id"]),
+            "message_ids": document.get("message_ids", []),
+            "user1_id": str(document["user1_id"]),
+            "user2_id": str(document["user2_id"]),
+            "match_id": int(match_id) if match_id is not None else None,
+            "user1": user1,
+            "user2": user2,
+        })
+
+    def to_document(self) -> dict:
+        """
+        转换为 `chatrooms` 集合中的文档格式（chatroom_id 作为 _id）
+        """
+        return {
+            "_id": self.chatroom_id,  # 使用chatroom_id作为MongoDB的_id主键
+            "user1_id": self.user1_id,
+            "user2_id": self.user2_id,
+            "message_ids": list(self.message_ids),
+            "match_id": self.match_id  # 添加match_id到数据库字段
+        }
\ No newline at end of file
@@ -2,48 +2,47 @@ from datetime import datetime, timezone
 from typing import List, Dict, Any
 
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.change_tracker import ChangeTrackingMixin
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("Comment")
 
 
-class Comment:
+class Comment(ChangeTrackingMixin):
     """评论对象（极简版，无回复层级）
     - 负责持久化自身到 `comments` 集合
-    - 使用 `_id` 为递增整型主键（由数据库中最大 `_id` 初始化）
+    - 使用 `_id` 为递增整型主键（由 IdAllocator 按段租用）
+    - 持久化字段变更时自动登记为脏对象，由 ForumManager 定期刷新
     """
 
-    _comment_counter: int = 0
+    _tracked_collection = "comments"
+    _tracked_key = "comment_id"
+    _tracked_fields = frozenset({
+        "comment_id", "post_id", "comment_content", "commenter_user_id", "commenter_user_name",
+        "like_count", "liked_user_ids", "comment_status", "created_at",
+    })
+    # 紧凑存储：用户ID字符串驻留
+    _interned_fields = frozenset({"commenter_user_id", "liked_user_ids"})
+    __slots__ = tuple(sorted(_tracked_fields))
+
     _initialized: bool = False
 
     @classmethod
     async def initialize_counter(cls) -> None:
-        """从数据库初始化评论计数器"""
+        """初始化评论ID序列（从 counters 集合租用ID段）"""
         if cls._initialized:
             return
-        try:
-            comments = await Database.find("comments", sort=[("_id", -1)], limit=1)
-            if comments:
-                max_id = comments[0]["_id"]
-                cls._comment_counter = int(max_id)
-                logger.info(f"Comment counter initialized from database: starting from {max_id}")
-            else:
-                cls._comment_counter = 0
-                logger.info("No existing comments found, starting counter from 0")
-            cls._initialized = True
-        except Exception as e:
-            logger.error(f"Failed to initialize comment counter: {e}")
-            import time
-            cls._comment_counter = int(time.time() * 1000)
-            cls._initialized = True
+        await IdAllocator.initialize("comments")
+        cls._initialized = True
 
     def __init__(self, commenter_user_id: str, commenter_user_name: str, post_id: int, comment_content: str) -> None:
         # 确保计数器已初始化
         if not Comment._initialized:
             raise RuntimeError("Comment counter not initialized. Call Comment.initialize_counter() first.")
 
-        Comment._comment_counter += 1
-        self.comment_id: int = Comment._comment_counter
+        # 从本进程租到的ID段中分配（多进程下不会重复）
+        self.comment_id: int = IdAllocator.next_id("comments")
 
         # 基础内容
         self.post_id: int = post_id
@@ -63,7 +62,27 @@ class Comment:
 
         logger.info(f"Created comment {self.comment_id} for post {self.post_id}")
 
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "Comment":
+        """由 `comments` 集合中的文档直接重建评论（不消耗ID序列、不标脏；时间字段原样保留）"""
+        return cls._from_fields({
+            "comment_id": int(document["_id"]),
+            "post_id": document.get("post_id"),
+            "comment_content": document.get("comment_content", ""),
+            "commenter_user_id": str(document.get("commenter_user_id")),
+            "commenter_user_name": document.get("commenter_user_name", ""),
+            "like_count": int(document.get("like_count", 0)),
+            # 中文注释：liked_user_ids 为字符串列表
+            "liked_user_ids": [str(uid) for uid in document.get("liked_user_ids", [])],
+            "comment_status": document.get("comment_status", "published"),
+            "created_at": document.get("created_at"),
+        })
+
     async def to_dict(self) -> Dict[str, Any]:
+        return self.to_document()
+
+    def to_document(self) -> Dict[str, Any]:
+        """转换为 `comments` 集合中的文档格式（comment_id 作为 _id）"""
         return {
             "_id": self.comment_id,
             "post_id": self.post_id,
@@ -71,7 +90,7 @@ class Comment:
             "commenter_user_id": self.commenter_user_id,
             "commenter_user_name": self.commenter_user_name,
             "like_count": self.like_count,
-            "liked_user_ids": self.liked_user_ids,
+            "liked_user_ids": list(self.liked_user_ids),
             "comment_status": self.comment_status,
             "created_at": self.created_at,
         }
@@ -80,19 +99,17 @@ class Comment:
         """保存评论到数据库（存在则更新，不存在则插入）"""
         try:
             comment_dict = await self.to_dict()
-            existing = await Database.find_one("comments", {"_id": self.comment_id})
-            if existing:
-                await Database.update_one(
-                    "comments",
-                    {"_id": self.comment_id},
-                    {"$set": {k: v for k, v in comment_dict.items() if k != "_id"}},
-                )
-            else:
-                await Database.insert_one("comments", comment_dict)
+            # 取快照后清除脏标记；写库期间的新修改会重新标脏
+            self.mark_clean()
+            result = await Database.bulk_upsert("comments", [comment_dict])
+            if result["failed_keys"]:
+                self.mark_dirty()
+                return False
             logger.info(f"Saved comment {self.comment_id} to database")
             return True
         except Exception as e:
             logger.error(f"Error saving comment {self.comment_id}: {e}")
+            self.mark_dirty()
             return False
 
     async def add_like(self, user_id: str) -> bool:
@@ -1,54 +1,46 @@
 import time
 from typing import Optional, Dict, Any
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.change_tracker import ChangeTrackingMixin
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("Match")
 
 
-class Match:
+class Match(ChangeTrackingMixin):
     """
     匹配类，管理一个Match
     """
-    _match_counter = 0
+    # 变更追踪：只有持久化字段参与脏标记，user_1/user_2/chatroom 等运行期引用不参与
+    _tracked_collection = "matches"
+    _tracked_key = "match_id"
+    _tracked_fields = frozenset({
+        "match_id", "user_id_1", "user_id_2", "description_to_user_1", "description_to_user_2",
+        "is_liked", "match_score", "mutual_game_scores", "chatroom_id", "match_time",
+    })
+    _interned_fields = frozenset({"user_id_1", "user_id_2"})
+    __slots__ = tuple(sorted(_tracked_fields)) + ("chatroom", "user_1", "user_2")
+
     _initialized = False
     
     @classmethod
     async def initialize_counter(cls):
         """
-        从数据库初始化匹配计数器，确保不会产生重复ID
+        初始化匹配ID序列：从 counters 集合租用ID段（下限为数据库中最大的_id），多进程下也不会产生重复ID
         """
         if cls._initialized:
             return
-            
-        try:
-            # 查找数据库中最大的_id（match_id存储在_id字段中）
-            matches = await Database.find("matches", sort=[("_id", -1)], limit=1)
-            
-            if matches:
-                max_id = matches[0]["_id"]
-                cls._match_counter = max_id
-                logger.info(f"Match counter initialized from database: starting from {max_id}")
-            else:
-                cls._match_counter = 0
-                logger.info("No existing matches found, starting counter from 0")
-                
-            cls._initialized = True
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize match counter: {e}")
-            # 如果初始化失败，使用时间戳作为起始点以避免冲突
-            cls._match_counter = int(time.time() * 1000000)  # 微秒时间戳
-            cls._initialized = True
-            logger.warning(f"Using timestamp as match counter starting point: {cls._match_counter}")
-    
+        await IdAllocator.initialize("matches", fallback_start=int(time.time() * 1000000))
+        cls._initialized = True
+
     def __init__(self, telegram_user_session_id_1: str, telegram_user_session_id_2: str, reason_to_id_1: str, reason_to_id_2: str, match_score: int, match_time: str):
         # 确保计数器已初始化
         if not Match._initialized:
             raise RuntimeError("Match counter not initialized. Call Match.initialize_counter() first.")
             
-        Match._match_counter += 1
-        self.match_id = Match._match_counter
+        # 从本进程租到的ID段中分配（多进程下不会重复）
+        self.match_id = IdAllocator.next_id("matches")
         # 中文注释：匹配的两个用户ID改为字符串（openid）
         self.user_id_1 = telegram_user_session_id_1
         self.user_id_2 = telegram_user_session_id_2
@@ -69,21 +61,46 @@ class Match:
         
         logger.info(f"Created new match with ID: {self.match_id} between users {self.user_id_1} and {self.user_id_2}")
 
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "Match":
+        """
+        由 `matches` 集合中的文档直接重建匹配
+        不经过 __init__，因此不消耗匹配计数器，也不会登记脏对象
+        """
+        match = cls._from_fields({
+            "match_id": document["_id"],
+            "user_id_1": str(document["user_id_1"]),
+            "user_id_2": str(document["user_id_2"]),
+            "description_to_user_1": document.get("description_to_user_1", ""),
+            "description_to_user_2": document.get("description_to_user_2", ""),
+            "is_liked": document.get("is_liked", False),
+            "match_score": document.get("match_score", 0),
+            "mutual_game_scores": document.get("mutual_game_scores", {}),
+            "chatroom_id": document.get("chatroom_id"),
+            "match_time": document.get("match_time", "Unknown"),
+            "chatroom": None,
+            "user_1": None,
+            "user_2": None,
+        })
+        match._populate_user_instances()
+        return match
+
     def _populate_user_instances(self):
         """
-        从UserManagement单例获取用户实例
+        从UserManagement单例获取用户实例（只取内存中已有的；lazy 模式下未加载的用户为 None）
         """
         try:
             from app.services.https.UserManagement import UserManagement
             user_manager = UserManagement()
             
-            self.user_1 = user_manager.get_user_instance(self.user_id_1)
-            self.user_2 = user_manager.get_user_instance(self.user_id_2)
+            self.user_1 = user_manager.peek_user_instance(self.user_id_1)
+            self.user_2 = user_manager.peek_user_instance(self.user_id_2)
             
-            if self.user_1 is None:
-                logger.warning(f"User {self.user_id_1} not found in UserManagement")
-            if self.user_2 is None:
-                logger.warning(f"User {self.user_id_2} not found in UserManagement")
+            if not user_manager.lazy():
+                if self.user_1 is None:
+                    logger.warning(f"User {self.user_id_1} not found in UserManagement")
+                if self.user_2 is None:
+                    logger.warning(f"User {self.user_id_2} not found in UserManagement")
                 
         except Exception as e:
             logger.error(f"Error populating user instances: {e}")
@@ -137,40 +154,39 @@ class Match:
         保存匹配到数据库，使用match_id作为_id主键
         """
         try:
-            match_data = {
-                "_id": self.match_id,  # 使用match_id作为MongoDB的_id主键
-                "user_id_1": self.user_id_1,
-                "user_id_2": self.user_id_2,
-                "description_to_user_1": self.description_to_user_1,
-                "description_to_user_2": self.description_to_user_2,
-                "is_liked": self.is_liked,
-                "match_score": self.match_score,
-                "mutual_game_scores": self.mutual_game_scores,
-                "chatroom_id": self.chatroom_id,
-                "match_time": self.match_time
-            }
-            
-            # 检查匹配是否已存在（基于_id查询，O(log n)复杂度）
-            existing_match = await Database.find_one("matches", {"_id": self.match_id})
+            # 先取快照并清除脏标记；写库期间发生的新修改会重新标脏，留给下一次刷新
+            match_data = self.to_document()
+            self.mark_clean()
             
-            if existing_match:
-                # 更新现有匹配
-                await Database.update_one(
-                    "matches",
-                    {"_id": self.match_id},
-                    {"$set": {k: v for k, v in match_data.items() if k != "_id"}}  # 不更新_id字段
-                )
-                # logger.info(f"Updated match {self.match_id} in database")
-            else:
-                # 插入新匹配
-                await Database.insert_one("matches", match_data)
-                # logger.info(f"Saved new match {self.match_id} to database")
+            # 单次 upsert 往返，不再先查询是否存在
+            result = await Database.bulk_upsert("matches", [match_data])
+            if result["failed_keys"]:
+                self.mark_dirty()
+                return False
             
             return True
         except Exception as e:
             logger.error(f"Error saving match {self.match_id} to database: {e}")
+            self.mark_dirty()
             return False
     
+    def to_document(self) -> Dict[str, Any]:
+        """
+        转换为 `matches` 集合中的文档格式（match_id 作为 _id）
+        """
+        return {
+            "_id": self.match_id,  # 使用match_id作为MongoDB的_id主键
+            "user_id_1": self.user_id_1,
+            "user_id_2": self.user_id_2,
+            "description_to_user_1": self.description_to_user_1,
+            "description_to_user_2": self.description_to_user_2,
+            "is_liked": self.is_liked,
+            "match_score": self.match_score,
+            "mutual_game_scores": dict(self.mutual_game_scores),
+            "chatroom_id": self.chatroom_id,
+            "match_time": self.match_time
+        }
+    
     def get_target_user_id(self, user_id: str) -> Optional[str]:
         """
         获取目标用户ID
@@ -1,5 +1,7 @@
+import sys
 from datetime import datetime, timezone
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("Message")
@@ -9,51 +11,35 @@ class Message:
     """
     消息类，管理单条消息内容
     """
-    _message_counter = 0
+    __slots__ = (
+        "message_id", "message_content", "message_send_time_in_utc", "message_sender_id",
+        "message_receiver_id", "chatroom_id", "message_sender", "message_receiver",
+    )
+
     _initialized = False
     
     @classmethod
     async def initialize_counter(cls):
         """
-        从数据库初始化消息计数器，确保不会产生重复ID
+        初始化消息ID序列：从 counters 集合租用ID段（下限为数据库中最大的_id），多进程下也不会产生重复ID
         """
         if cls._initialized:
             return
-            
-        try:
-            # 查找数据库中最大的_id（message_id存储在_id字段中）
-            messages = await Database.find("messages", sort=[("_id", -1)], limit=1)
-            
-            if messages:
-                max_id = messages[0]["_id"]
-                cls._message_counter = max_id
-                logger.info(f"Message counter initialized from database: starting from {max_id}")
-            else:
-                cls._message_counter = 0
-                logger.info("No existing messages found, starting counter from 0")
-                
-            cls._initialized = True
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize message counter: {e}")
-            # 如果初始化失败，使用时间戳作为起始点以避免冲突
-            import time
-            cls._message_counter = int(time.time() * 1000)  # 毫秒时间戳
-            cls._initialized = True
-            logger.warning(f"Using timestamp as message counter starting point: {cls._message_counter}")
-    
+        await IdAllocator.initialize("messages")
+        cls._initialized = True
+
     def __init__(self, sender_user, receiver_user, send_content, chatroom_id):
         # 确保计数器已初始化
         if not Message._initialized:
             raise RuntimeError("Message counter not initialized. Call Message.initialize_counter() first.")
             
-        Message._message_counter += 1
-        self.message_id = Message._message_counter
+        # 从本进程租到的ID段中分配（多进程下不会重复）
+        self.message_id = IdAllocator.next_id("messages")
         self.message_content = send_content
         self.message_send_time_in_utc = datetime.now(timezone.utc)
-        # 中文注释：消息发送者、接收者ID改为字符串（openid）
-        self.message_sender_id = sender_user.user_id
-        self.message_receiver_id = receiver_user.user_id
+        # 中文注释：消息发送者、接收者ID改为字符串（openid），驻留后与用户对象共享
+        self.message_sender_id = sys.intern(sender_user.user_id)
+        self.message_receiver_id = sys.intern(receiver_user.user_id)
         self.chatroom_id = chatroom_id  # 消息归属的聊天室ID
         
         self.message_sender = sender_user
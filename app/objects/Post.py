@@ -2,45 +2,44 @@ from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.change_tracker import ChangeTrackingMixin
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("Post")
 
 
-class Post:
+class Post(ChangeTrackingMixin):
     """帖子对象（最简版）
     - 负责持久化自身到 `posts` 集合
-    - 使用 `_id` 为递增整型主键（由数据库中最大 `_id` 初始化）
+    - 使用 `_id` 为递增整型主键（由 IdAllocator 按段租用）
+    - 持久化字段变更时自动登记为脏对象，由 ForumManager 定期刷新
     """
 
-    _post_counter: int = 0
+    _tracked_collection = "posts"
+    _tracked_key = "post_id"
+    _tracked_fields = frozenset({
+        "post_id", "post_content", "post_type", "creator_user_id", "creator_user_name",
+        "media_files", "like_count", "comment_count", "view_count", "liked_user_ids",
+        "comment_ids", "post_category", "tags", "post_status", "created_at", "updated_at",
+    })
+    # 紧凑存储：评论ID存为 array('q')，用户ID字符串驻留
+    _id_array_fields = frozenset({"comment_ids"})
+    _interned_fields = frozenset({"creator_user_id", "liked_user_ids"})
+    __slots__ = tuple(sorted(_tracked_fields))
+
     _initialized: bool = False
 
     @classmethod
     async def initialize_counter(cls) -> None:
-        """从数据库初始化帖子计数器
-        - 读取 `posts` 集合中最大的 `_id` 作为起始值
-        - 若集合为空，从 0 开始
-        - 若异常，回退为毫秒时间戳，避免冲突
+        """初始化帖子ID序列
+        - 从 `counters` 集合按段租用ID，下限为 `posts` 集合中最大的 `_id`
+        - 若异常，回退为从毫秒时间戳起算的进程内计数器
         """
         if cls._initialized:
             return
-
-        try:
-            posts = await Database.find("posts", sort=[("_id", -1)], limit=1)
-            if posts:
-                max_id = posts[0]["_id"]
-                cls._post_counter = int(max_id)
-                logger.info(f"Post counter initialized from database: starting from {max_id}")
-            else:
-                cls._post_counter = 0
-                logger.info("No existing posts found, starting counter from 0")
-            cls._initialized = True
-        except Exception as e:
-            logger.error(f"Failed to initialize post counter: {e}")
-            import time
-            cls._post_counter = int(time.time() * 1000)
-            cls._initialized = True
+        await IdAllocator.initialize("posts")
+        cls._initialized = True
 
     def __init__(
         self,
@@ -56,8 +55,8 @@ class Post:
         if not Post._initialized:
             raise RuntimeError("Post counter not initialized. Call Post.initialize_counter() first.")
 
-        Post._post_counter += 1
-        self.post_id: int = Post._post_counter
+        # 从本进程租到的ID段中分配（多进程下不会重复）
+        self.post_id: int = IdAllocator.next_id("posts")
 
         # 基础内容
         self.post_content: str = post_content
@@ -86,22 +85,49 @@ class Post:
 
         logger.info(f"Created post {self.post_id} by user {self.creator_user_id}")
 
+    @classmethod
+    def from_document(cls, document: Dict[str, Any]) -> "Post":
+        """由 `posts` 集合中的文档直接重建帖子（不消耗计数器、不标脏；时间字段原样保留）"""
+        return cls._from_fields({
+            "post_id": int(document["_id"]),
+            "post_content": document.get("post_content", ""),
+            "post_type": document.get("post_type", "text"),
+            "creator_user_id": str(document.get("creator_user_id")),
+            "creator_user_name": document.get("creator_user_name", ""),
+            "media_files": document.get("media_files") or [],
+            "post_category": document.get("post_category", ""),
+            "tags": (document.get("tags") or [])[:3],
+            "like_count": int(document.get("like_count", 0)),
+            "comment_count": int(document.get("comment_count", 0)),
+            "view_count": int(document.get("view_count", 0)),
+            # 中文注释：liked_user_ids 为字符串列表
+            "liked_user_ids": [str(uid) for uid in document.get("liked_user_ids", [])],
+            "comment_ids": list(document.get("comment_ids", [])),
+            "post_status": document.get("post_status", "published"),
+            "created_at": document.get("created_at"),
+            "updated_at": document.get("updated_at"),
+        })
+
     async def to_dict(self) -> Dict[str, Any]:
         """转换为可写入数据库的字典"""
+        return self.to_document()
+
+    def to_document(self) -> Dict[str, Any]:
+        """转换为 `posts` 集合中的文档格式（post_id 作为 _id）"""
         return {
             "_id": self.post_id,
             "post_content": self.post_content,
             "post_type": self.post_type,
             "creator_user_id": self.creator_user_id,
             "creator_user_name": self.creator_user_name,
-            "media_files": self.media_files,
+            "media_files": list(self.media_files),
             "like_count": self.like_count,
             "comment_count": self.comment_count,
             "view_count": self.view_count,
-            "liked_user_ids": self.liked_user_ids,
-            "comment_ids": self.comment_ids,
+            "liked_user_ids": list(self.liked_user_ids),
+            "comment_ids": list(self.comment_ids),
             "post_category": self.post_category,
-            "tags": self.tags,
+            "tags": list(self.tags),
             "post_status": self.post_status,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
@@ -111,19 +137,17 @@ class Post:
         """保存帖子到数据库（存在则更新，不存在则插入）"""
         try:
             post_dict = await self.to_dict()
-            existing = await Database.find_one("posts", {"_id": self.post_id})
-            if existing:
-                await Database.update_one(
-                    "posts",
-                    {"_id": self.post_id},
-                    {"$set": {k: v for k, v in post_dict.items() if k != "_id"}},
-                )
-            else:
-                await Database.insert_one("posts", post_dict)
+            # 取快照后清除脏标记；写库期间的新修改会重新标脏
+            self.mark_clean()
+            result = await Database.bulk_upsert("posts", [post_dict])
+            if result["failed_keys"]:
+                self.mark_dirty()
+                return False
             logger.info(f"Saved post {self.post_id} to database")
             return True
         except Exception as e:
             logger.error(f"Error saving post {self.post_id}: {e}")
+            self.mark_dirty()
             return False
 
     async def add_like(self, user_id: str) -> bool:
@@ -1,7 +1,23 @@
-class User:
+from app.core.change_tracker import ChangeTrackingMixin
+
+
+class User(ChangeTrackingMixin):
     """
     用户类，管理单一用户的数据
     """
+    # 变更追踪：对以下字段赋值或原地修改都会把用户登记为脏对象
+    _tracked_collection = "users"
+    _tracked_key = "user_id"
+    _tracked_fields = frozenset({
+        "user_id", "telegram_user_name", "gender", "age", "target_gender",
+        "user_personality_summary", "match_ids", "blocked_user_ids",
+        "post_ids", "liked_post_ids",
+    })
+    # 紧凑存储：匹配/帖子ID存为 array('q')，用户ID字符串驻留
+    _id_array_fields = frozenset({"match_ids", "post_ids", "liked_post_ids"})
+    _interned_fields = frozenset({"user_id", "blocked_user_ids"})
+    __slots__ = tuple(sorted(_tracked_fields))
+
     def __init__(self, telegram_user_name: str = None, gender: int = None, user_id: str = None):
         # 用户基本信息（中文注释：user_id 改为字符串，存储微信 openid 或其他平台的字符串主键）
         self.user_id = user_id
@@ -10,12 +26,29 @@ class User:
         self.age = None
         self.target_gender = None
         self.user_personality_summary = None
-        self.match_ids = []  # type: list[int] 匹配ID仍为数字
+        self.match_ids = []  # type: TrackedIdArray 匹配ID仍为数字
         self.blocked_user_ids = []  # type: list[str] 被屏蔽的用户ID（字符串）
         
         # 论坛相关字段（新增）
-        self.post_ids = []           # type: list[int] - 用户发布的帖子ID列表
-        self.liked_post_ids = []     # type: list[int] - 用户点赞的帖子ID列表（帖子ID为数字）
+        self.post_ids = []           # type: TrackedIdArray - 用户发布的帖子ID列表
+        self.liked_post_ids = []     # type: TrackedIdArray - 用户点赞的帖子ID列表（帖子ID为数字）
+
+    @classmethod
+    def from_document(cls, document: dict) -> "User":
+        """由 `users` 集合中的文档直接重建用户（不标脏）"""
+        return cls._from_fields({
+            "user_id": document["_id"],
+            # 文档中写入的是 user_name，兼容早期以 telegram_user_name 存储的文档
+            "telegram_user_name": document.get("user_name", document.get("telegram_user_name")),
+            "gender": document.get("gender"),
+            "age": document.get("age"),
+            "target_gender": document.get("target_gender"),
+            "user_personality_summary": document.get("user_personality_summary"),
+            "match_ids": document.get("match_ids", []),
+            "blocked_user_ids": document.get("blocked_user_ids", []),
+            "post_ids": document.get("post_ids", []),
+            "liked_post_ids": document.get("liked_post_ids", []),
+        })
 
     def edit_data(self, telegram_user_name=None, gender=None, age=None, target_gender=None, user_personality_summary=None):
         """编辑用户数据"""
@@ -30,6 +63,22 @@ class User:
         if user_personality_summary is not None:
             self.user_personality_summary = user_personality_summary
 
+    def to_document(self) -> dict:
+        """转换为 `users` 集合中的文档格式（user_id 作为 _id）"""
+        return {
+            "_id": self.user_id,
+            "user_name": self.telegram_user_name,
+            "gender": self.gender,
+            "age": self.age,
+            "target_gender": self.target_gender,
+            "user_personality_summary": self.user_personality_summary,
+            "match_ids": list(self.match_ids),
+            "blocked_user_ids": list(self.blocked_user_ids),
+            # 论坛相关字段（新增）
+            "post_ids": list(self.post_ids),           # 用户发布的帖子ID列表
+            "liked_post_ids": list(self.liked_post_ids), # 用户点赞的帖子ID列表
+        }
+
     def get_user_id(self):
         return self.user_id
 
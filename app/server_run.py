@@ -2,7 +2,8 @@
 
 import uvicorn
 from fastapi import FastAPI, Request, WebSocket
-from contextlib import asynccontextmanager
+from fastapi.responses import PlainTextResponse
+from contextlib import AsyncExitStack, asynccontextmanager
 import sys
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware # 导入 CORS 中间件
@@ -17,7 +18,23 @@ sys.path.append(str(ROOT_PATH))
 from app.api.v1.api import api_router
 from app.ws import all_ws_routers
 from app.config import settings
-from app.core.database import Database
+from app.core.database import Database, FaultInjector
+from app.core.change_feed import ChangeFeed, FileFeedTransport
+from app.core.change_tracker import ChangeTracker
+from app.core.change_log import ChangeLog
+from app.core.flush_scheduler import FlushScheduler
+from app.core.journal import Journal
+from app.core.message_bus import MessageBus, UnixSocketBusTransport
+from app.core.snapshot import Snapshot
+from app.core.startup import StartupPlan
+from app.core.id_allocator import IdAllocator
+from app.core.indexes import IndexRegistry
+from app.core.metrics import Metrics
+from app.core.query_cache import QueryCache
+from app.core.migrations import MigrationRunner
+from app.core.workers import WorkerCoordinator
+from app.WebSocketsService.ConnectionHandler import ConnectionHandler
+from app.WebSocketsService.MatchSessionHandler import MatchSessionHandler
 from app.utils.my_logger import MyLogger
 from app.utils.singleton_status import SingletonStatusReporter
 from app.services.https.UserManagement import UserManagement
@@ -25,6 +42,7 @@ from app.services.https.MatchManager import MatchManager
 from app.services.https.ChatroomManager import ChatroomManager
 from app.services.https.N8nWebhookManager import N8nWebhookManager
 from app.services.https.DataIntegrity import DataIntegrity
+from app.services.https.ReferenceIndex import ReferenceIndex
 from app.services.https.AIResponseProcessor import AIResponseProcessor
 
 logger = MyLogger("server")
@@ -394,191 +412,252 @@ async def init_personality_data():
         return False
 # ===== 性格测试数据初始化相关结束 =====
 
-# 全局变量用于控制自动保存任务
-auto_save_task = None
+async def run_integrity_check():
+    """执行全量数据完备性检查（清理无效数据），作为夜间任务注册到刷新调度器，也可通过 /integrity_check 按需触发"""
+    data_integrity = DataIntegrity()
+    integrity_result = await data_integrity.run_integrity_check()
+    
+    if integrity_result["success"]:
+        logger.info(f"✅ 数据完备性检查完成: {integrity_result['checks_completed']}/{integrity_result['total_checks']} 项检查通过")
+    else:
+        logger.warning(f"⚠️ 数据完备性检查部分失败: {integrity_result['checks_completed']}/{integrity_result['total_checks']} 项检查通过")
+        for error in integrity_result["errors"]:
+            logger.warning(f"⚠️ 完备性检查错误: {error}")
+    return integrity_result["success"]
+
+
+def leader_only(flush_func):
+    """多 worker 部署时只在领导者进程执行的全局任务（全量检查、快照）；其他进程直接视为成功"""
+    async def run():
+        if not WorkerCoordinator.is_leader():
+            return True
+        return await flush_func()
+    return run
 
-async def auto_save_to_database():
+
+async def run_incremental_integrity_check():
+    """只验证自上次检查以来被触及的主键（见 ChangeLog），作为刷新调度器中的高频任务"""
+    integrity_result = await DataIntegrity().run_incremental_check()
+    return integrity_result["success"]
+
+
+def register_flush_jobs():
     """
-    每10秒自动保存所有单例实例到数据库的后台任务
+    把每个单例管理器的脏数据刷新注册到刷新调度器
+    每个管理器按自己的间隔独立刷新，慢集合不会拖慢其他集合
     """
-    global auto_save_task
-    logger.info("启动自动保存任务，每10秒保存一次所有单例数据到数据库")
+    from app.services.https.PersonalityTestManager import PersonalityTestManager
+    from app.services.https.ForumManager import ForumManager
     
-    while True:
-        try:
-            await asyncio.sleep(10)  # 等待10秒
-            
-            logger.info("🔄 开始执行自动保存...")
-            start_time = time.time()
-            
-            # 执行数据完备性检查（在保存前清理无效数据）
-            try:
-                logger.info("🔍 开始数据完备性检查...")
-                data_integrity = DataIntegrity()
-                integrity_result = await data_integrity.run_integrity_check()
-                
-                if integrity_result["success"]:
-                    logger.info(f"✅ 数据完备性检查完成: {integrity_result['checks_completed']}/{integrity_result['total_checks']} 项检查通过")
-                else:
-                    logger.warning(f"⚠️ 数据完备性检查部分失败: {integrity_result['checks_completed']}/{integrity_result['total_checks']} 项检查通过")
-                    if integrity_result["errors"]:
-                        for error in integrity_result["errors"]:
-                            logger.warning(f"⚠️ 完备性检查错误: {error}")
-            except Exception as e:
-                logger.error(f"❌ 数据完备性检查失败: {e}")
-            
-            # 保存UserManagement数据
-            try:
-                user_manager = UserManagement()
-                user_save_success = await user_manager.save_to_database()  # 保存所有用户
-                if user_save_success:
-                    logger.info("✅ UserManagement数据保存成功")
-                else:
-                    logger.warning("⚠️ UserManagement数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ UserManagement数据保存失败: {e}")
-            
-            # 保存MatchManager数据
-            try:
-                match_manager = MatchManager()
-                match_save_success = await match_manager.save_to_database()  # 保存所有匹配
-                if match_save_success:
-                    logger.info("✅ MatchManager数据保存成功")
-                else:
-                    logger.warning("⚠️ MatchManager数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ MatchManager数据保存失败: {e}")
-            
-            # 保存ChatroomManager数据
-            try:
-                chatroom_manager = ChatroomManager()
-                chatroom_save_success = await chatroom_manager.save_chatroom_history()  # 保存所有聊天室历史
-                if chatroom_save_success:
-                    logger.info("✅ ChatroomManager数据保存成功")
-                else:
-                    logger.warning("⚠️ ChatroomManager数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ ChatroomManager数据保存失败: {e}")
-            
-            # 保存AIResponseProcessor数据
-            try:
-                ai_processor = AIResponseProcessor()
-                ai_save_success = await ai_processor.save_to_database()  # 保存AI聊天数据到数据库
-                if ai_save_success:
-                    logger.info("✅ AIResponseProcessor数据保存成功")
-                else:
-                    logger.warning("⚠️ AIResponseProcessor数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ AIResponseProcessor数据保存失败: {e}")
-            
-            # 保存PersonalityTestManager数据
-            try:
-                from app.services.https.PersonalityTestManager import PersonalityTestManager
-                personality_manager = PersonalityTestManager()
-                personality_save_success = await personality_manager.save_to_database()  # 保存性格测试数据到数据库
-                if personality_save_success:
-                    logger.info("✅ PersonalityTestManager数据保存成功")
-                else:
-                    logger.warning("⚠️ PersonalityTestManager数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ PersonalityTestManager数据保存失败: {e}")
-            
-            # 保存ForumManager数据（新增论坛功能）
-            try:
-                from app.services.https.ForumManager import ForumManager
-                forum_manager = ForumManager()
-                forum_save_success = await forum_manager.save_to_database()  # 保存论坛数据到数据库
-                if forum_save_success:
-                    logger.info("✅ ForumManager数据保存成功")
-                else:
-                    logger.warning("⚠️ ForumManager数据保存部分失败")
-            except Exception as e:
-                logger.error(f"❌ ForumManager数据保存失败: {e}")
-            
-            elapsed_time = time.time() - start_time
-            logger.info(f"🔄 自动保存完成，耗时: {elapsed_time:.3f}秒")
-            
-        except asyncio.CancelledError:
-            logger.info("自动保存任务被取消")
-            break
-        except Exception as e:
-            logger.error(f"自动保存任务发生错误: {e}")
-            # 发生错误时等待一段时间再继续
-            await asyncio.sleep(5)
+    flush_scheduler = FlushScheduler()
+    flush_scheduler.register("DataIntegrity", leader_only(run_integrity_check), settings.INTEGRITY_CHECK_INTERVAL)
+    flush_scheduler.register("IncrementalIntegrity", run_incremental_integrity_check, settings.INTEGRITY_INCREMENTAL_INTERVAL)
+    flush_scheduler.register("UserManagement", UserManagement().save_to_database, settings.FLUSH_INTERVAL_USERS, ("users",))
+    flush_scheduler.register("MatchManager", MatchManager().save_to_database, settings.FLUSH_INTERVAL_MATCHES, ("matches",))
+    flush_scheduler.register("ChatroomManager", ChatroomManager().save_chatroom_history, settings.FLUSH_INTERVAL_CHATROOMS, ("chatrooms",))
+    flush_scheduler.register("AIResponseProcessor", AIResponseProcessor().save_to_database, settings.FLUSH_INTERVAL_AI, ("AI_chatroom", "AI_message"))
+    flush_scheduler.register("PersonalityTestManager", PersonalityTestManager().save_to_database, settings.FLUSH_INTERVAL_PERSONALITY, ("personality_test_records",))
+    flush_scheduler.register("ForumManager", ForumManager().save_to_database, settings.FLUSH_INTERVAL_FORUM, ("posts", "comments"))
+    if settings.SNAPSHOT_ENABLED:
+        flush_scheduler.register("Snapshot", leader_only(Snapshot.write), settings.SNAPSHOT_INTERVAL)
+    return flush_scheduler
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    global auto_save_task
-    
-    # 启动时连接数据库
-    logger.info("正在连接数据库...")
+async def graceful_shutdown_flush(flush_scheduler: FlushScheduler) -> bool:
+    """
+    停机刷新：
+    1. 先把全部脏对象溢写到本地恢复目录（不改变脏标记，本地写入很快）
+    2. 各管理器并发写回脏数据，整体受 SHUTDOWN_FLUSH_DEADLINE 限制，超时的刷新被取消
+    3. 按时写回成功的集合删除溢写文件；其余保留，下次启动时重放
+    返回是否全部按时写回
+    """
+    started = time.perf_counter()
+    recovery_dir = WorkerCoordinator.directory(settings.RECOVERY_DIR)
     try:
-        await Database.connect()  # 恢复数据库连接
-        logger.info("数据库连接成功")
-        
-        # 初始化性格测试数据（抽卡游戏基础数据） - 新增功能
+        spilled = Journal.spill(recovery_dir)
+    except Exception as e:
+        # 溢写失败不影响写回本身
+        logger.error(f"停机溢写失败: {e}")
+        spilled = {}
+    results = await flush_scheduler.flush_all(
+        exclude=("DataIntegrity", "IncrementalIntegrity", "Snapshot"),
+        timeout=settings.SHUTDOWN_FLUSH_DEADLINE,
+    )
+    
+    saved_collections = {
+        collection
+        for name, success in results.items() if success
+        for collection in flush_scheduler.jobs[name].collections
+        if ChangeTracker.dirty_count(collection) == 0
+    }
+    Journal.discard_spill([collection for collection in spilled if collection in saved_collections], recovery_dir)
+    unsaved = {collection: count for collection, count in spilled.items() if collection not in saved_collections}
+    
+    for name, success in results.items():
+        if success:
+            logger.info(f"最终 {name} 数据保存完成")
+        elif success is None:
+            logger.error(f"最终 {name} 数据保存超时（{settings.SHUTDOWN_FLUSH_DEADLINE}秒）")
+        else:
+            logger.error(f"最终 {name} 数据保存失败")
+    if unsaved:
+        logger.warning(f"未能按时写回的脏数据已溢写到 {recovery_dir}，下次启动时重放: {unsaved}")
+    logger.info(f"停机刷新结束，耗时 {time.perf_counter() - started:.3f}秒")
+    return not unsaved and all(results.values())
+
+def build_startup_plan(bootstrap_lock: AsyncExitStack) -> StartupPlan:
+    """
+    声明启动阶段及其依赖
+    - 迁移、索引、日志重放与基础数据初始化在多个 worker 之间依次执行：持有启动互斥区（bootstrap_lock）期间完成
+    - 各管理器在互斥区释放后加载；只有匹配、聊天室与论坛依赖内存中的用户，其余管理器与用户并发加载
+    """
+    from app.services.https.PersonalityTestManager import PersonalityTestManager
+    from app.services.https.ForumManager import ForumManager
+    
+    plan = StartupPlan()
+    
+    def warm_documents():
+        return plan.results["snapshot"]
+    
+    async def enter_bootstrap():
+        await bootstrap_lock.enter_async_context(WorkerCoordinator.bootstrap())
+    
+    async def run_migrations():
+        # 数据迁移与索引必须先于日志重放和各管理器加载
+        executed_migrations = await MigrationRunner.run()
+        if executed_migrations:
+            logger.info(f"数据迁移完成: {executed_migrations}")
+    
+    async def check_query_plans():
+        # explain() 只对 MongoDB 有意义，内存后端跳过
+        if settings.QUERY_PLAN_CHECK_ENABLED and settings.DB_BACKEND == "mongo":
+            await IndexRegistry.check_hot_queries()
+    
+    async def replay_journal():
+        # 重放上次运行残留的本地日志（必须在各管理器从数据库加载之前）
+        if not settings.JOURNAL_ENABLED:
+            return 0
+        logger.info("正在重放本地日志...")
+        replayed_count = await Journal.recover()
+        # 多 worker 部署时还要重放已退出进程遗留的日志目录
+        replayed_count += await WorkerCoordinator.adopt_orphans(settings.JOURNAL_DIR, Journal.recover)
+        logger.info(f"本地日志重放完成，共 {replayed_count} 条记录")
+        return replayed_count
+    
+    async def replay_recovery():
+        # 重放上次停机时未能按时写回的溢写文件（比日志更新，放在日志之后）
+        recovered_count = await Journal.recover(settings.RECOVERY_DIR)
+        recovered_count += await WorkerCoordinator.adopt_orphans(settings.RECOVERY_DIR, Journal.recover)
+        if recovered_count:
+            logger.info(f"停机溢写文件重放完成，共 {recovered_count} 条记录")
+        return recovered_count
+    
+    async def read_snapshot():
+        # 读取内存快照并与数据库追平；没有快照时各管理器整表加载
+        if not settings.SNAPSHOT_ENABLED:
+            return {}
+        logger.info("正在读取内存快照...")
+        return await Snapshot.warm_start()
+    
+    async def seed_personality_data():
+        # 初始化性格测试数据（抽卡游戏基础数据），与日志重放互不影响
         logger.info("🎮 正在初始化抽卡游戏基础数据...")
-        personality_data_success = await init_personality_data()
-        if personality_data_success:
+        if await init_personality_data():
             logger.info("✅ 抽卡游戏基础数据初始化成功")
         else:
             logger.warning("⚠️ 抽卡游戏基础数据初始化失败，但不影响其他功能")
-        
-        # 初始化UserManagement缓存
-        logger.info("正在初始化UserManagement缓存...")
-        user_manager = UserManagement()
-        await user_manager.initialize_from_database()
+    
+    async def load_users():
+        await UserManagement().initialize_from_database(warm_documents().get("users"))
         logger.info("UserManagement缓存初始化完成")
-        
-        # 初始化MatchManager缓存
-        logger.info("正在初始化MatchManager缓存...")
-        match_manager = MatchManager()
-        await match_manager.construct()
+    
+    async def load_matches():
+        await MatchManager().construct(warm_documents().get("matches"))
         logger.info("MatchManager缓存初始化完成")
-        
-        # 初始化ChatroomManager缓存
-        logger.info("正在初始化ChatroomManager缓存...")
+    
+    async def load_chatrooms():
         chatroom_manager = ChatroomManager()
-        construct_success = await chatroom_manager.construct()  # 从数据库加载聊天室数据
-        
-        # 检查初始化状态
-        if construct_success:
+        # 从数据库（或快照）加载聊天室数据
+        if await chatroom_manager.construct(warm_documents().get("chatrooms")):
             logger.info(f"ChatroomManager缓存初始化完成 - 加载了 {len(chatroom_manager.chatrooms)} 个聊天室")
-            logger.info(f"ChatroomManager可用的聊天室ID: {list(chatroom_manager.chatrooms.keys())}")
         else:
             logger.error("ChatroomManager缓存初始化失败")
-            
-        logger.info("ChatroomManager缓存初始化完成")
-        
-        # 初始化N8nWebhookManager
-        logger.info("正在初始化N8nWebhookManager...")
-        n8n_webhook_manager = N8nWebhookManager()
-        logger.info("N8nWebhookManager初始化完成")
-        
-        # 初始化AIResponseProcessor
-        logger.info("正在初始化AIResponseProcessor...")
-        ai_processor = AIResponseProcessor()
-        await ai_processor.initialize_from_database()  # 从数据库加载数据到内存
+    
+    async def load_n8n_webhooks():
+        N8nWebhookManager()
+    
+    async def load_ai_chatrooms():
+        await AIResponseProcessor().initialize_from_database(
+            warm_documents().get("AI_chatroom"), warm_documents().get("AI_message")
+        )  # 从数据库（或快照）加载数据到内存
         logger.info("AIResponseProcessor初始化完成")
-        
-        # 初始化PersonalityTestManager
-        logger.info("正在初始化PersonalityTestManager...")
-        from app.services.https.PersonalityTestManager import PersonalityTestManager
-        personality_manager = PersonalityTestManager()
-        await personality_manager.initialize_from_database()  # 从数据库加载数据到内存
+    
+    async def load_personality_tests():
+        await PersonalityTestManager().initialize_from_database(warm_documents().get("personality_test_records"))
         logger.info("PersonalityTestManager初始化完成")
-
-        # 初始化ForumManager
-        logger.info("正在初始化ForumManager...")
-        from app.services.https.ForumManager import ForumManager
-        forum_manager = ForumManager()
-        await forum_manager.initialize()  # 从数据库加载数据到内存
+    
+    async def load_forum():
+        # 加载后按帖子对齐内存中用户的 post_ids，因此在用户之后
+        await ForumManager().initialize(warm_documents().get("posts"), warm_documents().get("comments"))
         logger.info("ForumManager初始化完成")
+    
+    plan.stage("bootstrap_lock", enter_bootstrap)
+    plan.stage("migrations", run_migrations, after=("bootstrap_lock",))
+    plan.stage("indexes", IndexRegistry.ensure_indexes, after=("migrations",))
+    plan.stage("query_plans", check_query_plans, after=("indexes",))
+    plan.stage("journal_replay", replay_journal, after=("indexes",))
+    plan.stage("recovery_replay", replay_recovery, after=("journal_replay",))
+    plan.stage("snapshot", read_snapshot, after=("recovery_replay",))
+    plan.stage("personality_data", seed_personality_data, after=("indexes",))
+    plan.stage("bootstrap_release", bootstrap_lock.aclose, after=("query_plans", "snapshot", "personality_data"))
+    plan.stage("users", load_users, after=("bootstrap_release",))
+    plan.stage("matches", load_matches, after=("users",))
+    plan.stage("chatrooms", load_chatrooms, after=("users",))
+    plan.stage("n8n_webhooks", load_n8n_webhooks)
+    plan.stage("ai_chatrooms", load_ai_chatrooms, after=("bootstrap_release",))
+    plan.stage("personality_tests", load_personality_tests, after=("bootstrap_release",))
+    plan.stage("forum", load_forum, after=("users",))
+    return plan
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时连接数据库
+    logger.info("正在连接数据库...")
+    try:
+        await Database.connect()  # 恢复数据库连接
+        logger.info("数据库连接成功")
+        
+        # 多 worker 部署：先订阅变更（此后本进程的写入会发布给其他进程，加载期间到达的事件在加载完成后应用）
+        if WorkerCoordinator.multi_worker():
+            ChangeFeed.subscribe(FileFeedTransport(settings.CHANGE_FEED_DIR, WorkerCoordinator.worker_id()))
+        
+        # 按依赖并发执行迁移、日志重放与各管理器加载，结束后输出关键路径报告
+        bootstrap_lock = AsyncExitStack()
+        try:
+            await build_startup_plan(bootstrap_lock).run()
+        finally:
+            await bootstrap_lock.aclose()
         
-        # 启动自动保存任务
-        logger.info("正在启动自动保存后台任务...")
-        auto_save_task = asyncio.create_task(auto_save_to_database())
-        logger.info("自动保存后台任务已启动")
+        # 启用本地日志：此后每次内存修改都会批量落盘，两次刷新之间崩溃也不会丢失
+        if settings.JOURNAL_ENABLED:
+            Journal.open(WorkerCoordinator.directory(settings.JOURNAL_DIR))
+        
+        # 开始应用其他 worker 的变更
+        ChangeFeed.start()
+        
+        # 多 worker 部署：WebSocket 接收方不在本进程时经消息路由总线转发
+        if WorkerCoordinator.multi_worker():
+            bus = MessageBus(UnixSocketBusTransport(settings.MESSAGE_BUS_DIR, WorkerCoordinator.worker_id()))
+            for handler in (ConnectionHandler, MatchSessionHandler):
+                bus.register(handler.bus_channel, handler.deliver_local, handler.broadcast_local)
+            await bus.start()
+            MessageBus.active = bus
+        
+        # 启动刷新调度器（各管理器独立节奏、并发写回脏数据）
+        logger.info("正在启动刷新调度器...")
+        flush_scheduler = register_flush_jobs()
+        flush_scheduler.start()
+        logger.info("刷新调度器已启动")
         
     except Exception as e:
         logger.error(f"数据库连接或初始化失败: {str(e)}")
@@ -589,49 +668,43 @@ async def lifespan(app: FastAPI):
     # 关闭时的清理工作
     logger.info("正在关闭服务...")
     
-    # 取消自动保存任务
-    if auto_save_task and not auto_save_task.done():
-        logger.info("正在停止自动保存任务...")
-        auto_save_task.cancel()
-        try:
-            await auto_save_task
-        except asyncio.CancelledError:
-            logger.info("自动保存任务已停止")
+    # 先停止消息路由：其他 worker 不再把帧转发到本进程
+    if MessageBus.active is not None:
+        await MessageBus.active.stop()
     
-    # 执行最后一次保存
+    # 停止刷新调度器（等待进行中的刷新结束）
+    logger.info("正在停止刷新调度器...")
+    flush_scheduler = FlushScheduler()
+    await flush_scheduler.stop()
+    
+    # 执行最后一次保存：只写脏数据、各管理器并发、受时限约束
     logger.info("执行最后一次数据保存...")
     try:
-        user_manager = UserManagement()
-        await user_manager.save_to_database()
-        logger.info("最终用户数据保存完成")
-        
-        match_manager = MatchManager()
-        await match_manager.save_to_database()
-        logger.info("最终匹配数据保存完成")
-        
-        chatroom_manager = ChatroomManager()
-        await chatroom_manager.save_chatroom_history()
-        logger.info("最终聊天室数据保存完成")
-        
-        ai_processor = AIResponseProcessor()
-        await ai_processor.save_to_database()
-        logger.info("最终AI聊天数据保存完成")
-        
-        # 保存ForumManager数据
-        try:
-            from app.services.https.ForumManager import ForumManager
-            forum_manager = ForumManager()
-            await forum_manager.save_to_database()
-            logger.info("最终论坛数据保存完成")
-        except Exception as e:
-            logger.error(f"最终论坛数据保存失败: {e}")
+        all_flushed = await graceful_shutdown_flush(flush_scheduler)
     except Exception as e:
         logger.error(f"最终数据保存失败: {e}")
+        all_flushed = False
+    
+    # 停机刷新的写入发布给仍在运行的 worker 后停止订阅
+    await ChangeFeed.stop()
+    
+    # 关闭本地日志；全部写回成功时截断日志，否则保留到下次启动重放
+    await Journal.close(truncate=all_flushed and ChangeTracker.dirty_count() == 0)
+    
+    # 写最后一次快照，下次启动只需追平之后的变更
+    if settings.SNAPSHOT_ENABLED and WorkerCoordinator.is_leader():
+        try:
+            await Snapshot.write()
+        except Exception as e:
+            logger.error(f"写入内存快照失败: {e}")
     
     # 断开数据库连接
     logger.info("正在关闭数据库连接...")
     await Database.close()  # 恢复数据库关闭
     logger.info("数据库连接已关闭")
+    
+    # 释放多 worker 协调的文件锁（领导者锁由其他进程接替）
+    WorkerCoordinator.release()
 
 
 app = FastAPI(
@@ -785,6 +858,14 @@ async def log_requests_and_responses(request: Request, call_next):
         logger.error(f"🔴 [{request_id}] ====== 请求失败 ======")
         raise
 
+# 多 worker 部署时在响应头中标明处理请求的进程，便于排查跨进程一致性问题
+@app.middleware("http")
+async def tag_worker(request: Request, call_next):
+    response = await call_next(request)
+    if WorkerCoordinator.multi_worker():
+        response.headers["X-Worker-Id"] = WorkerCoordinator.worker_id()
+    return response
+
 # 注册HTTP API路由
 app.include_router(api_router, prefix="/api/v1")
 logger.info(f"HTTP API路由已注册")
@@ -819,6 +900,50 @@ async def root():
     logger.debug("访问根路径")
     return {"message": "Welcome to New LoveLush User Service API"}
 
+@app.get("/flush_status")
+async def flush_status():
+    """各管理器最近一次刷新的时间戳、耗时与脏对象数量"""
+    return {
+        "scheduler": FlushScheduler().get_status(),
+        "change_tracker": ChangeTracker.get_status(),
+        "journal": Journal.get_status(),
+        "snapshot": Snapshot.get_status(),
+        "reference_index": ReferenceIndex().get_status(),
+        "integrity_change_log": ChangeLog.get_status(),
+        "id_allocator": IdAllocator.get_status(),
+        "slow_db_operations": list(Metrics.slow_operations),
+        "query_cache": QueryCache.get_status(),
+        "fault_injection": FaultInjector.get_status(),
+        "worker": WorkerCoordinator.get_status(),
+        "change_feed": ChangeFeed.get_status(),
+        "message_bus": MessageBus.active.get_status() if MessageBus.active is not None else {"enabled": False},
+        "startup": StartupPlan.get_status(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """进程内指标（Prometheus 文本格式）：数据库各集合/操作的延迟直方图与失败次数"""
+    return PlainTextResponse(Metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.post("/integrity_check")
+async def integrity_check(mode: str = "full"):
+    """
+    按需触发一次数据完备性检查（与定时任务共用同一把锁，不会重叠执行）
+    mode=full 全量检查；mode=incremental 只检查变更日志中的主键
+    """
+    job_name = "IncrementalIntegrity" if mode == "incremental" else "DataIntegrity"
+    # 全量检查只在领导者进程执行；请求落在其他 worker 时如实返回未执行，而不是报告成功
+    if job_name == "DataIntegrity" and not WorkerCoordinator.is_leader():
+        return {
+            "success": False,
+            "mode": mode,
+            "ran": False,
+            "worker": WorkerCoordinator.worker_id(),
+            "detail": "full integrity check runs on the leader worker only; this worker did not run it",
+        }
+    success = await FlushScheduler().flush(job_name)
+    return {"success": success, "mode": mode, "ran": True}
+
 if __name__ == "__main__":
     logger.info(f"启动服务器: {settings.PROJECT_NAME} v{settings.VERSION}")
     
@@ -827,8 +952,8 @@ if __name__ == "__main__":
         "app": "app.server_run:app",
         "host": "127.0.0.1",  # 本地地址
         "port": 8000,          # 本地端口
-        "reload": True,        # 开发模式自动重载
-        "workers": 1
+        "reload": settings.WORKERS == 1,  # 开发模式自动重载（与多 worker 不兼容）
+        "workers": settings.WORKERS       # 大于 1 时各进程通过变更订阅保持缓存一致
     }
 
     # 生产环境配置 - 服务器环境（注释掉）
@@ -837,7 +962,7 @@ if __name__ == "__main__":
     #     "host": "0.0.0.0",
     #     "port": 8000,
     #     "reload": False,
-    #     "workers": 1
+    #     "workers": settings.WORKERS
     # }
     
     try:
@@ -1,7 +1,13 @@
 from typing import List, Tuple, Optional, Dict
 from datetime import datetime
 import logging
+import time
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.journal import Journal
+from app.core.snapshot import Snapshot
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("AIResponseProcessor")
@@ -18,40 +24,38 @@ class AIResponseProcessor:
             cls._instance.ai_chatrooms = {}  # user_id -> ai_message_id列表
             cls._instance.ai_messages = {}  # ai_message_id -> 消息详情
             cls._instance.ai_user_id = 999  # AI固定用户ID
-            cls._instance.message_counter = 0  # 消息ID计数器
+            Journal.register("AI_chatroom", "user_id", cls._instance._journal_chatroom_document)
+            Journal.register("AI_message", "ai_message_id", lambda message_id, _: cls._instance.ai_messages.get(message_id))
+            Snapshot.register("AI_chatroom", "user_id", lambda: (
+                cls._instance._journal_chatroom_document(user_id) for user_id in cls._instance.ai_chatrooms
+            ))
+            Snapshot.register("AI_message", "ai_message_id", lambda: cls._instance.ai_messages.values())
+            ChangeFeed.register(
+                "AI_chatroom", cls._instance._apply_remote_chatroom,
+                lambda user_id: cls._instance.ai_chatrooms.pop(user_id, None), key_field="user_id",
+                dump=cls._instance._journal_chatroom_document,
+            )
+            ChangeFeed.register(
+                "AI_message", cls._instance._apply_remote_message,
+                lambda message_id: cls._instance.ai_messages.pop(message_id, None), key_field="ai_message_id",
+                dump=cls._instance.ai_messages.get,
+            )
         return cls._instance
     
     async def initialize_counter(self):
         """
-        从数据库初始化AI消息计数器，确保不会产生重复ID
+        初始化AI消息ID序列：从 counters 集合租用ID段（下限为数据库中最大的 ai_message_id），多进程下也不会产生重复ID
+        早先按业务字段写入的文档 _id 为 ObjectId，因此以 ai_message_id 计算下限
         """
         if AIResponseProcessor._initialized:
             return
-            
-        try:
-            # 查找数据库中最大的_id（ai_message_id存储在_id字段中）
-            messages = await Database.find("AI_message", sort=[("_id", -1)], limit=1)
-            
-            if messages:
-                max_id = messages[0]["_id"]
-                self.message_counter = max_id
-                logger.info(f"AI消息计数器从数据库初始化: 从 {max_id} 开始")
-            else:
-                self.message_counter = 0
-                logger.info("未找到现有AI消息，从0开始计数")
-                
-            AIResponseProcessor._initialized = True
-            
-        except Exception as e:
-            logger.error(f"初始化AI消息计数器失败: {e}")
-            # 如果初始化失败，使用时间戳作为起始点以避免冲突
-            import time
-            self.message_counter = int(time.time() * 1000)  # 毫秒时间戳
-            AIResponseProcessor._initialized = True
-            logger.warning(f"使用时间戳作为AI消息计数器起始点: {self.message_counter}")
-    
-    async def initialize_from_database(self):
-        """从数据库初始化AI聊天缓存 [内部方法，非API调用]"""
+        await IdAllocator.initialize("AI_message", id_field="ai_message_id")
+
+    async def initialize_from_database(self, chatrooms=None, messages=None):
+        """
+        从数据库初始化AI聊天缓存 [内部方法，非API调用]
+        chatrooms/messages: 快照热启动时传入已追平的文档，为 None 时从数据库读取
+        """
         if AIResponseProcessor._initialized:
             return
         
@@ -62,25 +66,27 @@ class AIResponseProcessor:
             logger.info("AIResponseProcessor: 开始从数据库加载AI聊天数据到内存")
             
             # 加载AI_chatroom数据
-            chatrooms_data = await Database.find("AI_chatroom", {})
             loaded_chatrooms = 0
             
-            for chatroom_data in chatrooms_data:
-                user_id = chatroom_data.get("user_id")
-                ai_message_ids = chatroom_data.get("ai_message_ids", [])
-                if user_id:
-                    self.ai_chatrooms[user_id] = ai_message_ids
-                    loaded_chatrooms += 1
+            async for batch in Database.iter_documents("AI_chatroom", chatrooms):
+                for chatroom_data in batch:
+                    user_id = chatroom_data.get("user_id")
+                    ai_message_ids = chatroom_data.get("ai_message_ids", [])
+                    if user_id:
+                        self.ai_chatrooms[user_id] = ai_message_ids
+                        loaded_chatrooms += 1
             
             # 加载AI_message数据
-            messages_data = await Database.find("AI_message", {})
             loaded_messages = 0
             
-            for message_data in messages_data:
-                message_id = message_data.get("ai_message_id")
-                if message_id:
-                    self.ai_messages[message_id] = message_data
-                    loaded_messages += 1
+            async for batch in Database.iter_documents("AI_message", messages):
+                for message_data in batch:
+                    message_id = message_data.get("ai_message_id")
+                    if message_id:
+                        # 写入时间戳只用于快照追平，不进入内存
+                        message_data.pop("_modified_at", None)
+                        self.ai_messages[message_id] = message_data
+                        loaded_messages += 1
             
             AIResponseProcessor._initialized = True
             
@@ -154,7 +160,7 @@ class AIResponseProcessor:
     
     async def save_conversation_history(self, user_id: str, message: str, response: str) -> bool:
         """
-        保存用户和AI的对话历史 - 先写内存，后异步写数据库
+        保存用户和AI的对话历史 - 只写内存，由自动保存批量写回数据库
         
         Args:
             user_id: 用户ID
@@ -165,12 +171,12 @@ class AIResponseProcessor:
             bool: 是否成功
         """
         try:
-            logger.info(f"[{user_id}] 开始保存对话历史到内存和数据库")
+            logger.info(f"[{user_id}] 开始保存对话历史到内存")
             now_utc = datetime.utcnow()
             
-            # 1. 保存用户消息
-            self.message_counter += 1
-            user_message_id = self.message_counter
+            # 1. 保存用户消息（用户消息与AI响应各占一个ID）
+            await IdAllocator.ensure("AI_message", count=2)
+            user_message_id = IdAllocator.next_id("AI_message")
             user_message_data = {
                 "_id": user_message_id,
                 "ai_message_id": user_message_id,
@@ -181,8 +187,7 @@ class AIResponseProcessor:
             logger.debug(f"[{user_id}] 创建用户消息, ID: {user_message_id}")
             
             # 2. 保存AI响应
-            self.message_counter += 1
-            ai_message_id = self.message_counter
+            ai_message_id = IdAllocator.next_id("AI_message")
             ai_message_data = {
                 "_id": ai_message_id,
                 "ai_message_id": ai_message_id,
@@ -192,28 +197,11 @@ class AIResponseProcessor:
             }
             logger.debug(f"[{user_id}] 创建AI消息, ID: {ai_message_id}")
 
-            # 3. 更新内存缓存
-            # 使用 self.add_message_to_memory 方法来原子性地更新内存
+            # 3. 更新内存缓存并登记脏数据
+            # 数据库写入由下一次刷新批量完成，在此之前由本地日志保证不丢失
             self.add_message_to_memory(user_id, user_message_id, user_message_data)
             self.add_message_to_memory(user_id, ai_message_id, ai_message_data)
             logger.info(f"[{user_id}] 成功更新内存缓存，新增消息IDs: {user_message_id}, {ai_message_id}")
-
-            # 4. 异步写入数据库 (不阻塞主流程)
-            try:
-                logger.info(f"[{user_id}] 开始异步写入数据库...")
-                await Database.insert_one("AI_message", user_message_data)
-                await Database.insert_one("AI_message", ai_message_data)
-                
-                # 更新AI_chatroom表
-                await Database.update_one(
-                    "AI_chatroom",
-                    {"user_id": user_id},
-                    {"$push": {"ai_message_ids": {"$each": [user_message_id, ai_message_id]}}},
-                    upsert=True
-                )
-                logger.info(f"[{user_id}] 异步写入数据库成功")
-            except Exception as db_e:
-                logger.error(f"[{user_id}] 异步写入数据库失败: {db_e}", exc_info=True)
             
             return True
             
@@ -316,72 +304,33 @@ class AIResponseProcessor:
     async def save_to_database(self, user_id: Optional[str] = None):
         """
         保存AI聊天数据到数据库
-        如果指定了user_id，则保存该用户的聊天数据；如果没有指定，则保存所有内存中的聊天数据。
+        如果指定了user_id，则保存该用户的聊天数据；如果没有指定，则只保存被标记为脏的聊天数据。
         [API调用]
         """
         try:
             if user_id is None:
-                # 保存所有内存中的聊天数据
-                success_count = 0
-                total_chatrooms = len(self.ai_chatrooms)
+                # 只保存变更追踪层登记为脏的聊天室与消息
+                started = time.perf_counter()
+                dirty_chatroom_ids = await ChangeTracker.pop_dirty("AI_chatroom")
+                dirty_message_ids = await ChangeTracker.pop_dirty("AI_message")
+                failed_chatrooms, failed_messages = await self._bulk_save(dirty_chatroom_ids, dirty_message_ids)
                 
-                for user_id, message_ids in self.ai_chatrooms.items():
-                    try:
-                        # 保存聊天室数据
-                        chatroom_data = {
-                            "user_id": user_id,
-                            "ai_message_ids": message_ids
-                        }
-                        
-                        # 检查聊天室是否已在数据库中
-                        existing_chatroom = await Database.find_one("AI_chatroom", {"user_id": user_id})
-                        
-                        if existing_chatroom:
-                            # 如果存在，则更新
-                            await Database.update_one(
-                                "AI_chatroom",
-                                {"user_id": user_id},
-                                {"$set": {"ai_message_ids": message_ids}}
-                            )
-                        else:
-                            # 如果不存在，则插入
-                            await Database.insert_one("AI_chatroom", chatroom_data)
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"保存用户 {user_id} 的AI聊天室失败: {e}")
-                        continue
+                # 写入失败的聊天室与消息重新标脏，留待下次刷新
+                for failed_user_id in failed_chatrooms:
+                    ChangeTracker.mark_dirty("AI_chatroom", failed_user_id)
+                for failed_message_id in failed_messages:
+                    ChangeTracker.mark_dirty("AI_message", failed_message_id)
                 
-                # 保存所有消息数据
-                message_success_count = 0
-                total_messages = len(self.ai_messages)
+                success_count = sum(1 for uid in dirty_chatroom_ids if uid in self.ai_chatrooms) - len(failed_chatrooms)
+                message_success_count = sum(1 for mid in dirty_message_ids if mid in self.ai_messages) - len(failed_messages)
+                failed_count = len(failed_chatrooms) + len(failed_messages)
                 
-                for message_id, message_data in self.ai_messages.items():
-                    try:
-                        # 检查消息是否已在数据库中
-                        existing_message = await Database.find_one("AI_message", {"ai_message_id": message_id})
-                        
-                        if existing_message:
-                            # 如果存在，则更新
-                            update_data = message_data.copy()
-                            await Database.update_one(
-                                "AI_message",
-                                {"ai_message_id": message_id},
-                                {"$set": update_data}
-                            )
-                        else:
-                            # 如果不存在，则插入
-                            await Database.insert_one("AI_message", message_data)
-                        
-                        message_success_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"保存消息 {message_id} 失败: {e}")
-                        continue
-                
-                logger.info(f"AI聊天数据保存完成: {success_count}/{total_chatrooms} 个聊天室, {message_success_count}/{total_messages} 条消息")
-                return success_count == total_chatrooms and message_success_count == total_messages
+                report = ChangeTracker.record_flush(
+                    "AIResponseProcessor", success_count + message_success_count, failed_count,
+                    time.perf_counter() - started, collections=("AI_chatroom", "AI_message")
+                )
+                logger.info(f"AI聊天数据刷新完成: {success_count} 个聊天室, {message_success_count} 条消息, 失败 {report['failed']} 个, 耗时 {report['elapsed']:.3f}秒")
+                return failed_count == 0
                 
             else:
                 # 保存指定用户的聊天数据
@@ -390,38 +339,15 @@ class AIResponseProcessor:
                     return False
                 
                 message_ids = self.ai_chatrooms[user_id]
+                ChangeTracker.discard("AI_chatroom", user_id)
                 
-                # 保存聊天室数据
-                chatroom_data = {
-                    "user_id": user_id,
-                    "ai_message_ids": message_ids
-                }
-                
-                existing_chatroom = await Database.find_one("AI_chatroom", {"user_id": user_id})
-                
-                if existing_chatroom:
-                    await Database.update_one(
-                        "AI_chatroom",
-                        {"user_id": user_id},
-                        {"$set": {"ai_message_ids": message_ids}}
-                    )
-                else:
-                    await Database.insert_one("AI_chatroom", chatroom_data)
-                
-                # 保存该用户的所有消息
-                for message_id in message_ids:
-                    if message_id in self.ai_messages:
-                        message_data = self.ai_messages[message_id]
-                        existing_message = await Database.find_one("AI_message", {"ai_message_id": message_id})
-                        
-                        if existing_message:
-                            await Database.update_one(
-                                "AI_message",
-                                {"ai_message_id": message_id},
-                                {"$set": message_data}
-                            )
-                        else:
-                            await Database.insert_one("AI_message", message_data)
+                # 聊天室与该用户的所有消息各一次批量 upsert
+                failed_chatrooms, failed_messages = await self._bulk_save([user_id], message_ids)
+                if failed_chatrooms or failed_messages:
+                    ChangeTracker.mark_dirty("AI_chatroom", user_id)
+                    for failed_message_id in failed_messages:
+                        ChangeTracker.mark_dirty("AI_message", failed_message_id)
+                    return False
                 
                 logger.info(f"用户 {user_id} 的AI聊天数据保存完成")
                 return True
@@ -430,6 +356,52 @@ class AIResponseProcessor:
             logger.error(f"保存AI聊天数据到数据库失败: {str(e)}")
             return False
     
+    def _apply_remote_chatroom(self, user_id, document):
+        """应用其他进程写入的AI聊天室文档 [变更订阅回调]"""
+        self.ai_chatrooms[user_id] = list(document.get("ai_message_ids", []))
+
+    def _apply_remote_message(self, message_id, document):
+        """应用其他进程写入的AI消息 [变更订阅回调]"""
+        self.ai_messages[message_id] = {key: value for key, value in document.items() if key != "_modified_at"}
+
+    def _journal_chatroom_document(self, user_id, _=None):
+        """生成写入本地日志的AI聊天室文档 [内部方法]"""
+        message_ids = self.ai_chatrooms.get(user_id)
+        if message_ids is None:
+            return None
+        return {"user_id": user_id, "ai_message_ids": list(message_ids)}
+    
+    async def _bulk_save(self, chatroom_user_ids, message_ids):
+        """
+        批量写回指定的AI聊天室与消息 [内部方法]
+        
+        Returns:
+            (写入失败的用户ID列表, 写入失败的消息ID列表)
+        """
+        chatroom_docs = [
+            {"user_id": uid, "ai_message_ids": list(self.ai_chatrooms[uid])}
+            for uid in chatroom_user_ids if uid in self.ai_chatrooms
+        ]
+        message_docs = [
+            self.ai_messages[mid] for mid in message_ids if mid in self.ai_messages
+        ]
+        
+        try:
+            chatroom_result = await Database.bulk_upsert("AI_chatroom", chatroom_docs, key="user_id")
+            failed_chatrooms = chatroom_result["failed_keys"]
+        except Exception as e:
+            logger.error(f"批量保存AI聊天室失败: {e}")
+            failed_chatrooms = [doc["user_id"] for doc in chatroom_docs]
+        
+        try:
+            message_result = await Database.bulk_upsert("AI_message", message_docs, key="ai_message_id")
+            failed_messages = message_result["failed_keys"]
+        except Exception as e:
+            logger.error(f"批量保存AI消息失败: {e}")
+            failed_messages = [doc["ai_message_id"] for doc in message_docs]
+        
+        return failed_chatrooms, failed_messages
+    
     async def load_from_database(self):
         """
         从数据库加载数据到内存 [已废弃，使用initialize_from_database]
@@ -456,4 +428,8 @@ class AIResponseProcessor:
         # 添加消息详情到内存
         self.ai_messages[message_id] = message_data
         
+        # 登记脏数据，等待下一次刷新写回
+        ChangeTracker.mark_dirty("AI_chatroom", user_id)
+        ChangeTracker.mark_dirty("AI_message", message_id)
+        
         logger.info(f"消息 {message_id} 已添加到用户 {user_id} 的内存中") 
\ No newline at end of file
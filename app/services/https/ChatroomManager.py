@@ -1,9 +1,17 @@
+import time
 from app.config import settings
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.change_log import ChangeLog
+from app.core.journal import Journal
+from app.core.snapshot import Snapshot
 from app.objects.Chatroom import Chatroom
 from app.objects.Message import Message
 from app.services.https.MatchManager import MatchManager
 from app.services.https.UserManagement import UserManagement
+from app.services.https.ReferenceIndex import ReferenceIndex
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
 from app.utils.my_logger import MyLogger
 from typing import Optional, List, Tuple
 
@@ -21,12 +29,16 @@ class ChatroomManager:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.chatrooms = {}  # {chatroom_id: Chatroom}
+            Journal.register("chatrooms")
+            Snapshot.register("chatrooms", "_id", lambda: (chatroom.to_document() for chatroom in cls._instance.chatrooms.values()))
+            ChangeFeed.register("chatrooms", cls._instance._apply_remote_chatroom, cls._instance._remove_remote_chatroom)
             logger.info("ChatroomManager singleton instance created")
         return cls._instance
 
-    async def construct(self) -> bool:
+    async def construct(self, documents=None) -> bool:
         """
         Initialize ChatroomManager by loading data from database
+        documents: 快照热启动时传入已追平的聊天室文档，为 None 时从数据库读取
         """
         try:
             # Initialize counters from database first
@@ -38,53 +50,72 @@ class ChatroomManager:
             
             # Load existing chatrooms from database
             logger.info("ChatroomManager construct: Querying chatrooms from database...")
-            chatrooms_data = await Database.find("chatrooms")
-            logger.info(f"ChatroomManager construct: Found {len(chatrooms_data)} chatrooms in database")
             loaded_count = 0
             
-            for chatroom_data in chatrooms_data:
-                try:
-                    chatroom_id = chatroom_data["_id"]  # chatroom_id现在存储在_id字段中
-                    user1_id = chatroom_data["user1_id"]
-                    user2_id = chatroom_data["user2_id"]
-                    match_id = chatroom_data.get("match_id")  # 获取match_id，如果不存在则为None
-                    
-                    logger.info(f"ChatroomManager construct: Processing chatroom {chatroom_id} (users: {user1_id}, {user2_id}, match_id: {match_id})")
+            async for batch in Database.iter_documents("chatrooms", documents):
+                for chatroom_data in batch:
+                    try:
+                        chatroom_id = chatroom_data["_id"]  # chatroom_id现在存储在_id字段中
+                        user1_id = chatroom_data["user1_id"]
+                        user2_id = chatroom_data["user2_id"]
+                        match_id = chatroom_data.get("match_id")  # 获取match_id，如果不存在则为None
                     
-                    # 中文注释：仅 chatroom_id、match_id 为数字，用户ID保持为字符串
-                    chatroom_id = int(chatroom_id)
-                    if match_id is not None:
-                        match_id = int(match_id)
+                        logger.debug(f"ChatroomManager construct: Processing chatroom {chatroom_id} (users: {user1_id}, {user2_id}, match_id: {match_id})")
                     
-                    # Get user instances
-                    user_manager = UserManagement()
-                    user1 = user_manager.get_user_instance(str(user1_id))
-                    user2 = user_manager.get_user_instance(str(user2_id))
+                        # Get user instances
+                        user_manager = UserManagement()
+                        user1 = user_manager.peek_user_instance(str(user1_id))
+                        user2 = user_manager.peek_user_instance(str(user2_id))
                     
-                    if user1 and user2:
-                        # Create chatroom instance with existing ID
-                        chatroom = Chatroom(user1, user2, match_id)
-                        chatroom.chatroom_id = chatroom_id
-                        chatroom.message_ids = chatroom_data.get("message_ids", [])
+                        # lazy 模式下用户按需加载，聊天室不要求双方用户已在内存中（未加载的用户引用为 None）
+                        if user_manager.has_user(str(user1_id)) and user_manager.has_user(str(user2_id)):
+                            # 按文档直接重建（保留原有ID，不消耗ID序列、不标脏）
+                            chatroom = Chatroom.from_document(chatroom_data, user1, user2)
+                            chatroom_id = chatroom.chatroom_id
                         
-                        self.chatrooms[chatroom_id] = chatroom
-                        loaded_count += 1
-                        logger.info(f"ChatroomManager construct: Successfully loaded chatroom {chatroom_id} with {len(chatroom.message_ids)} message_ids and match_id {match_id}")
-                    else:
-                        logger.warning(f"ChatroomManager construct: Cannot load chatroom {chatroom_id}: users {user1_id} (found: {user1 is not None}) or {user2_id} (found: {user2 is not None}) not found")
+                            self.chatrooms[chatroom_id] = chatroom
+                            ReferenceIndex().add_chatroom(chatroom)
+                            loaded_count += 1
+                            logger.debug(f"ChatroomManager construct: Successfully loaded chatroom {chatroom_id} with {len(chatroom.message_ids)} message_ids and match_id {match_id}")
+                        else:
+                            logger.warning(f"ChatroomManager construct: Cannot load chatroom {chatroom_id}: users {user1_id} (found: {user1 is not None}) or {user2_id} (found: {user2 is not None}) not found")
                         
-                except Exception as e:
-                    logger.error(f"ChatroomManager construct: Error loading chatroom from database: {e}")
-                    continue
+                    except Exception as e:
+                        logger.error(f"ChatroomManager construct: Error loading chatroom from database: {e}")
+                        continue
             
             logger.info(f"ChatroomManager construct: Loaded {loaded_count} chatrooms from database")
-            logger.info(f"ChatroomManager construct: Final chatrooms in memory: {list(self.chatrooms.keys())}")
             return True
             
         except Exception as e:
             logger.error(f"ChatroomManager construct: Error constructing ChatroomManager: {e}")
             return False
 
+    def _apply_remote_chatroom(self, chatroom_id, document):
+        """
+        应用其他进程写入的聊天室文档 [变更订阅回调]
+        已有聊天室的双方用户不会改变，只原地更新消息列表等字段；新聊天室的用户尚未到达时返回 False，稍后重试
+        """
+        chatroom = self.chatrooms.get(chatroom_id)
+        if chatroom is not None:
+            chatroom.refresh_from(Chatroom.from_document(document, chatroom.user1, chatroom.user2))
+        else:
+            user_manager = UserManagement()
+            if not user_manager.has_user(str(document["user1_id"])) or not user_manager.has_user(str(document["user2_id"])):
+                return False
+            # lazy 模式下未加载的用户为 None，用户ID取自文档
+            user1 = user_manager.peek_user_instance(str(document["user1_id"]))
+            user2 = user_manager.peek_user_instance(str(document["user2_id"]))
+            chatroom = self.chatrooms[chatroom_id] = Chatroom.from_document(document, user1, user2)
+        ReferenceIndex().add_chatroom(chatroom)
+        return True
+
+    def _remove_remote_chatroom(self, chatroom_id):
+        """其他进程删除了聊天室：从缓存与反向索引移除 [变更订阅回调]"""
+        chatroom = self.chatrooms.pop(chatroom_id, None)
+        if chatroom is not None:
+            ReferenceIndex().forget_chatroom(chatroom)
+
     async def get_or_create_chatroom(self, user_id_1, user_id_2, match_id) -> int:
         """
         Get existing chatroom or create new one for the match
@@ -118,8 +149,8 @@ class ChatroomManager:
             # Get user instances
             user_manager = UserManagement()
             
-            user1 = user_manager.get_user_instance(str(user_id_1))
-            user2 = user_manager.get_user_instance(str(user_id_2))
+            user1 = await user_manager.get_user_instance(str(user_id_1))
+            user2 = await user_manager.get_user_instance(str(user_id_2))
             
             logger.info(f"STEP 1.3.2: user1 result: {user1 is not None}, user2 result: {user2 is not None}")
             if user1:
@@ -135,12 +166,14 @@ class ChatroomManager:
                 return None
             
             logger.info(f"STEP 1.4: Creating new chatroom for users {user_id_1} and {user_id_2}")
-            # Create new chatroom
+            # Create new chatroom（ID段用尽时先租下一段）
+            await IdAllocator.ensure("chatrooms")
             chatroom = Chatroom(user1, user2, match_id)
             
             logger.info(f"STEP 1.5: Storing chatroom {chatroom.chatroom_id} in memory")
             # Store in memory
             self.chatrooms[chatroom.chatroom_id] = chatroom
+            ReferenceIndex().add_chatroom(chatroom)
             
             logger.info(f"STEP 1.6: Updating match {match_id} with chatroom_id {chatroom.chatroom_id}")
             # Update match with chatroom_id
@@ -153,7 +186,10 @@ class ChatroomManager:
                 logger.error(f"STEP 1.7 FAILED: Could not save chatroom {chatroom.chatroom_id} to database")
                 # 从内存中移除失败的chatroom
                 self.chatrooms.pop(chatroom.chatroom_id, None)
+                ReferenceIndex().forget_chatroom(chatroom)
+                match.chatroom_id = None
                 return None
+            ChangeLog.chatroom_created(chatroom.chatroom_id)
             
             logger.info(f"STEP 1.8: Saving updated match {match_id} to database")
             # Save match to database with updated chatroom_id
@@ -215,7 +251,7 @@ class ChatroomManager:
                     if message_data:
                         # Get sender user instance for sender name
                         user_manager = UserManagement()
-                        sender_user = user_manager.get_user_instance(str(message_data["message_sender_id"]))
+                        sender_user = await user_manager.get_user_instance(str(message_data["message_sender_id"]))
                         sender_name = sender_user.telegram_user_name if sender_user else f"User{message_data['message_sender_id']}"
                         
                         # Create message tuple: (message_content, datetime_utc, sender_id, sender_name)
@@ -281,21 +317,21 @@ class ChatroomManager:
             
             # Get sender user instance
             user_manager = UserManagement()
-            sender_user = user_manager.get_user_instance(str(sender_user_id))
+            sender_user = await user_manager.get_user_instance(str(sender_user_id))
             if not sender_user:
                 logger.error(f"SEND MSG STEP 2 FAILED: Sender user {sender_user_id} not found")
                 return {"success": False, "match_id": None}
             
             # Determine receiver user (the other user in the chatroom)
             if str(sender_user_id) == str(chatroom.user1_id):
-                receiver_user = chatroom.user2
                 receiver_user_id = chatroom.user2_id
             elif str(sender_user_id) == str(chatroom.user2_id):
-                receiver_user = chatroom.user1
                 receiver_user_id = chatroom.user1_id
             else:
                 logger.error(f"SEND MSG STEP 2 FAILED: User {sender_user_id} not authorized for chatroom {chatroom_id}")
                 return {"success": False, "match_id": None}
+            # 按ID取得接收方（lazy 模式下聊天室不持有未加载的用户）
+            receiver_user = await user_manager.get_user_instance(str(receiver_user_id))
             
             if not receiver_user:
                 logger.error(f"SEND MSG STEP 2 FAILED: Receiver user {receiver_user_id} not found")
@@ -303,7 +339,8 @@ class ChatroomManager:
             
             logger.info(f"SEND MSG STEP 3: Creating message from {sender_user_id} to {receiver_user_id}")
             
-            # Create Message instance
+            # Create Message instance（ID段用尽时先租下一段）
+            await IdAllocator.ensure("messages")
             message = Message(sender_user, receiver_user, message_content, chatroom_id)
             
             logger.info(f"SEND MSG STEP 4: Saving message {message.message_id} to database")
@@ -318,6 +355,7 @@ class ChatroomManager:
             
             # Add message ID to chatroom (don't store message instance in memory)
             chatroom.message_ids.append(message.message_id)
+            ChangeLog.message_inserted(message.message_id, chatroom_id)
             
             logger.info(f"SEND MSG STEP 6: Updating chatroom {chatroom_id} in database")
             
@@ -336,7 +374,7 @@ class ChatroomManager:
     async def save_chatroom_history(self, chatroom_id: Optional[int] = None) -> bool:
         """
         Save chatroom and its messages to database
-        If chatroom_id is None, save all chatrooms
+        If chatroom_id is None, save all dirty chatrooms
         """
         try:
             if chatroom_id is not None:
@@ -353,18 +391,40 @@ class ChatroomManager:
                     logger.error(f"Chatroom {chatroom_id} not found")
                     return False
             else:
-                # Save all chatrooms
-                success_count = 0
-                total_chatrooms = len(self.chatrooms)
+                # Save dirty chatrooms only
+                started = time.perf_counter()
+                dirty_chatrooms = await ChangeTracker.pop_dirty("chatrooms")
+                
+                chatroom_docs = []
+                for dirty_id, chatroom in dirty_chatrooms.items():
+                    # 已被删除的聊天室不再写回
+                    if chatroom is None or self.chatrooms.get(dirty_id) is not chatroom:
+                        continue
+                    chatroom_docs.append(chatroom.to_document())
+                
+                try:
+                    result = await Database.bulk_upsert("chatrooms", chatroom_docs)
+                    failed_ids = result["failed_keys"]
+                except Exception as e:
+                    logger.error(f"Error bulk saving chatrooms: {e}")
+                    failed_ids = [doc["_id"] for doc in chatroom_docs]
                 
-                for chatroom in self.chatrooms.values():
-                    if await chatroom.save_to_database():
-                        success_count += 1
+                # 写入失败的聊天室重新标脏，留待下次刷新
+                for failed_id in failed_ids:
+                    chatroom = self.chatrooms.get(failed_id)
+                    if chatroom:
+                        chatroom.mark_dirty()
+                failed_count = len(failed_ids)
+                success_count = len(chatroom_docs) - failed_count
                 
                 # Messages are already saved to database when sent via send_message()
                 # No need to save them again here since chatroom.messages is empty
-                logger.info(f"Saved {success_count}/{total_chatrooms} chatrooms structure to database")
-                return success_count == total_chatrooms
+                report = ChangeTracker.record_flush(
+                    "ChatroomManager", success_count, failed_count, time.perf_counter() - started,
+                    collections=("chatrooms",)
+                )
+                logger.info(f"Flushed {report['written']} dirty chatrooms structure to database ({report['failed']} failed) in {report['elapsed']:.3f}s")
+                return failed_count == 0
                 
         except Exception as e:
             logger.error(f"Error saving chatroom history: {e}")
@@ -1,9 +1,12 @@
 from typing import List, Set
+from app.core.change_log import ChangeLog
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
 from app.services.https.MatchManager import MatchManager
 from app.services.https.UserManagement import UserManagement
 from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.ReferenceIndex import ReferenceIndex
+from app.services.https.DatabaseAudit import DatabaseAudit
 
 logger = MyLogger("DataIntegrity")
 
@@ -64,12 +67,14 @@ class DataIntegrity:
             
             invalid_match_ids = []
             valid_matches = []  # 存储有效的match，用于反向检查
+            # lazy 模式下内存中只有部分用户，按数据库核对用户是否存在
+            existing_user_ids = await self.user_manager.known_user_ids()
             
             # 第一步：轮询MatchManager里的每一个Match实例，检查用户是否存在
             for match_id, match in self.match_manager.match_list.items():
                 # 中文注释：用户ID统一为字符串
-                user_1_exists = self.user_manager.get_user_instance(str(match.user_id_1)) is not None
-                user_2_exists = self.user_manager.get_user_instance(str(match.user_id_2)) is not None
+                user_1_exists = str(match.user_id_1) in existing_user_ids
+                user_2_exists = str(match.user_id_2) in existing_user_ids
                 
                 # 检查两个用户是否都存在
                 if not user_1_exists or not user_2_exists:
@@ -79,26 +84,23 @@ class DataIntegrity:
                     # 记录有效的match用于反向检查
                     valid_matches.append(match)
             
-            # 删除非法的Match实例
+            # 删除非法的Match实例（内存+数据库，并级联清理其聊天室与用户引用）
             for match_id in invalid_match_ids:
-                # 从内存中删除
-                if match_id in self.match_manager.match_list:
-                    del self.match_manager.match_list[match_id]
-                    logger.info(f"从内存中删除非法Match {match_id}")
-                
-                # 从数据库中删除
-                await Database.delete_one("matches", {"_id": match_id})
-                logger.info(f"从数据库中删除非法Match {match_id}")
+                await ReferenceIndex().remove_match(match_id)
+                logger.info(f"删除非法Match {match_id}")
             
             # 第二步：反向检查 - 确保用户的match_ids包含相应的match
             updated_users_count = 0
+            users = await self.user_manager.load_users(
+                str(user_id) for match in valid_matches for user_id in (match.user_id_1, match.user_id_2)
+            )
             for match in valid_matches:
                 match_id = match.match_id
                 user_id_1 = match.user_id_1
                 user_id_2 = match.user_id_2
                 
                 # 检查user1的match_ids
-                user_1 = self.user_manager.get_user_instance(str(user_id_1))
+                user_1 = users.get(str(user_id_1))
                 if user_1 and match_id not in user_1.match_ids:
                     user_1.match_ids.append(match_id)
                     await self.user_manager.save_to_database(user_id_1)
@@ -106,7 +108,7 @@ class DataIntegrity:
                     logger.info(f"为用户 {user_id_1} 添加缺失的match_id: {match_id}")
                 
                 # 检查user2的match_ids
-                user_2 = self.user_manager.get_user_instance(str(user_id_2))
+                user_2 = users.get(str(user_id_2))
                 if user_2 and match_id not in user_2.match_ids:
                     user_2.match_ids.append(match_id)
                     await self.user_manager.save_to_database(user_id_2)
@@ -131,8 +133,9 @@ class DataIntegrity:
             # 获取所有存在的match_ids
             existing_match_ids = set(self.match_manager.match_list.keys())
             
-            # 轮询UserManagement里的user实例
-            for user_id, user in self.user_manager.user_list.items():
+            # 轮询UserManagement里的user实例（lazy 模式下从数据库遍历）
+            async for user in self.user_manager.iter_users():
+                user_id = user.user_id
                 if hasattr(user, 'match_ids') and user.match_ids:
                     invalid_match_ids = []
                     
@@ -172,7 +175,7 @@ class DataIntegrity:
             invalid_chatroom_ids = []
             
             # 获取所有存在的user_ids和match_ids
-            existing_user_ids = set(str(uid) for uid in self.user_manager.user_list.keys())
+            existing_user_ids = await self.user_manager.known_user_ids()
             existing_match_ids = set(self.match_manager.match_list.keys())
             
             # 轮询ChatroomManager内存中的所有chatroom
@@ -196,16 +199,10 @@ class DataIntegrity:
                 if is_invalid:
                     invalid_chatroom_ids.append(chatroom_id)
             
-            # 删除无效的chatroom
+            # 删除无效的chatroom（内存+数据库，并级联删除其消息）
             for chatroom_id in invalid_chatroom_ids:
-                # 从内存中删除
-                if chatroom_id in self.chatroom_manager.chatrooms:
-                    del self.chatroom_manager.chatrooms[chatroom_id]
-                    logger.info(f"从内存中删除无效Chatroom {chatroom_id}")
-                
-                # 从数据库中删除
-                await Database.delete_one("chatrooms", {"_id": chatroom_id})
-                logger.info(f"从数据库中删除无效Chatroom {chatroom_id}")
+                await ReferenceIndex().remove_chatroom(chatroom_id)
+                logger.info(f"删除无效Chatroom {chatroom_id}")
             
             logger.info(f"Chatroom数据检查完成，删除了 {len(invalid_chatroom_ids)} 个无效Chatroom")
             return True
@@ -310,7 +307,7 @@ class DataIntegrity:
             logger.info("开始最终数据库Message完备性检查...")
             
             # 获取所有存在的user_ids和chatroom_ids
-            existing_user_ids = set(str(uid) for uid in self.user_manager.user_list.keys())
+            existing_user_ids = await self.user_manager.known_user_ids()
             existing_chatroom_ids = set(self.chatroom_manager.chatrooms.keys())
             
             # 获取数据库中所有message数据
@@ -355,12 +352,96 @@ class DataIntegrity:
             logger.error(f"最终数据库Message检查时发生错误: {e}")
             return False
     
+    async def run_incremental_check(self) -> dict:
+        """
+        增量完备性检查：只验证变更日志（ChangeLog）中自上次检查以来被触及的主键及其相邻对象
+        - 已删除用户：反向索引中残留的匹配与聊天室
+        - 创建/删除的匹配：双方用户是否存在、双方 match_ids 是否一致、已删除匹配是否残留聊天室
+        - 新建的聊天室：双方用户与对应匹配是否存在
+        - 新写入的消息：所属聊天室是否存在（不存在则按批删除）、聊天室 message_ids 是否包含该消息
+        """
+        changes = ChangeLog.drain()
+        reference_index = ReferenceIndex()
+        checked = {name: len(entries) for name, entries in changes.items()}
+        repaired = {"matches": 0, "users": 0, "chatrooms": 0, "messages": 0}
+        try:
+            # 1. 已删除用户
+            for user_id in changes["deleted_users"]:
+                if await self.user_manager.get_user_instance(user_id) is not None:
+                    continue
+                for match_id in reference_index.matches_of(user_id):
+                    await reference_index.remove_match(match_id)
+                    repaired["matches"] += 1
+                for chatroom_id in reference_index.chatrooms_of(user_id):
+                    await reference_index.remove_chatroom(chatroom_id)
+                    repaired["chatrooms"] += 1
+            
+            # 2. 创建/删除的匹配
+            for match_id, user_ids in changes["matches"].items():
+                match = self.match_manager.match_list.get(match_id)
+                users = [await self.user_manager.get_user_instance(user_id) for user_id in user_ids]
+                if match is None:
+                    for user in users:
+                        if user is not None and match_id in user.match_ids:
+                            user.match_ids.remove(match_id)
+                            repaired["users"] += 1
+                    for chatroom_id in list(reference_index.match_chatrooms.get(match_id, ())):
+                        await reference_index.remove_chatroom(chatroom_id)
+                        repaired["chatrooms"] += 1
+                    continue
+                if any(user is None for user in users):
+                    logger.warning(f"发现非法Match {match_id}: 用户 {user_ids} 不完整")
+                    await reference_index.remove_match(match_id)
+                    repaired["matches"] += 1
+                    continue
+                for user in users:
+                    if match_id not in user.match_ids:
+                        user.match_ids.append(match_id)
+                        repaired["users"] += 1
+            
+            # 3. 新建的聊天室
+            for chatroom_id in changes["chatrooms"]:
+                chatroom = self.chatroom_manager.chatrooms.get(chatroom_id)
+                if chatroom is None:
+                    continue
+                if (
+                    await self.user_manager.get_user_instance(str(chatroom.user1_id)) is None
+                    or await self.user_manager.get_user_instance(str(chatroom.user2_id)) is None
+                    or (chatroom.match_id is not None and chatroom.match_id not in self.match_manager.match_list)
+                ):
+                    logger.warning(f"发现无效Chatroom {chatroom_id}")
+                    await reference_index.remove_chatroom(chatroom_id)
+                    repaired["chatrooms"] += 1
+            
+            # 4. 新写入的消息
+            orphan_message_ids = []
+            for message_id, chatroom_id in changes["messages"].items():
+                chatroom = self.chatroom_manager.chatrooms.get(chatroom_id)
+                if chatroom is None:
+                    orphan_message_ids.append(message_id)
+                elif message_id not in chatroom.message_ids:
+                    chatroom.message_ids.append(message_id)
+                    repaired["chatrooms"] += 1
+            if orphan_message_ids:
+                repaired["messages"] += await Database.delete_many("messages", {"_id": {"$in": orphan_message_ids}}) or 0
+            
+            logger.info(f"增量完备性检查完成: 检查 {checked}，修复 {repaired}")
+            return {"success": True, "checked": checked, "repaired": repaired}
+            
+        except Exception as e:
+            # 放回尚未确认的记录，下一次增量检查重试
+            ChangeLog.restore(changes)
+            logger.error(f"增量完备性检查发生错误: {e}")
+            return {"success": False, "checked": checked, "repaired": repaired, "errors": [str(e)]}
+    
     async def run_integrity_check(self) -> dict:
         """
         运行完整的数据完备性检查，返回检查结果统计
+        全量检查覆盖全部数据，开始时清空变更日志
         """
         try:
             logger.info("启动数据完备性检查...")
+            ChangeLog.drain()
             
             result = {
                 "success": True,
@@ -394,6 +475,9 @@ class DataIntegrity:
             if result["checks_completed"] != result["total_checks"]:
                 result["success"] = False
             
+            # 全量检查之后按内存内容校准反向索引
+            ReferenceIndex().rebuild()
+            
             logger.info(f"数据完备性检查完成: {result['checks_completed']}/{result['total_checks']} 项检查成功")
             return result
             
@@ -409,12 +493,11 @@ class DataIntegrity:
     async def run_database_only_integrity_check(self) -> dict:
         """
         仅对数据库进行完备性检查，不涉及内存管理器
-        这是一个高复杂度操作，仅用于手动脚本执行
+        以流式、仅投影主键的方式扫描（见 DatabaseAudit），孤儿文档按批 $in 删除，
+        无效引用按批 $pull 清理；仅用于手动脚本执行
         """
-        try:
-            logger.info("启动数据库级别完备性检查...")
-            
-            result = {
+        def empty_result():
+            return {
                 "success": True,
                 "checks_completed": 0,
                 "total_checks": 5,
@@ -428,34 +511,37 @@ class DataIntegrity:
                 "updated_records": {
                     "users": 0,
                     "chatrooms": 0
-                }
+                },
+                "throughput": {}
             }
+
+        try:
+            logger.info("启动数据库级别完备性检查...")
             
-            # 执行各项数据库检查
+            result = empty_result()
+            audit = DatabaseAudit()
+            
+            # 执行各项数据库检查（顺序有依赖：后一项复用前一项得到的有效主键集合）
             checks = [
-                ("database_matches", self._check_database_matches),
-                ("database_user_match_ids", self._check_database_user_match_ids),
-                ("database_chatrooms", self._check_database_chatrooms),
-                ("database_messages", self._check_database_messages),
-                ("database_chatroom_message_ids", self._check_database_chatroom_message_ids)
+                ("database_matches", audit.check_matches),
+                ("database_user_match_ids", audit.check_user_match_ids),
+                ("database_chatrooms", audit.check_chatrooms),
+                ("database_messages", audit.check_messages),
+                ("database_chatroom_message_ids", audit.check_chatroom_message_ids)
             ]
             
             for check_name, check_func in checks:
                 try:
                     check_result = await check_func()
-                    if check_result["success"]:
-                        result["checks_completed"] += 1
-                        # 累加删除的记录数
-                        for key, count in check_result.get("deleted", {}).items():
-                            if key in result["deleted_records"]:
-                                result["deleted_records"][key] += count
-                        # 累加更新的记录数
-                        if "updated_users" in check_result:
-                            result["updated_records"]["users"] += check_result["updated_users"]
-                        logger.info(f"{check_name} 数据库检查完成")
-                    else:
-                        result["errors"].append(f"{check_name} 数据库检查失败")
-                        logger.error(f"{check_name} 数据库检查失败")
+                    result["checks_completed"] += 1
+                    # 累加删除的记录数
+                    for key, count in check_result.get("deleted", {}).items():
+                        result["deleted_records"][key] += count
+                    # 累加更新的记录数
+                    for key, count in check_result.get("updated", {}).items():
+                        result["updated_records"][key] += count
+                    result["updated_records"]["users"] += check_result.get("updated_users", 0)
+                    logger.info(f"{check_name} 数据库检查完成")
                 except Exception as e:
                     result["errors"].append(f"{check_name} 数据库检查异常: {str(e)}")
                     logger.error(f"{check_name} 数据库检查异常: {e}")
@@ -463,309 +549,16 @@ class DataIntegrity:
             if result["checks_completed"] != result["total_checks"]:
                 result["success"] = False
             
+            result["throughput"] = audit.throughput
             logger.info(f"数据库级别完备性检查完成: {result['checks_completed']}/{result['total_checks']} 项检查成功")
             logger.info(f"删除记录统计: {result['deleted_records']}")
             logger.info(f"更新记录统计: {result['updated_records']}")
+            logger.info(f"扫描吞吐量: {result['throughput']}")
             return result
             
         except Exception as e:
             logger.error(f"数据库级别完备性检查发生严重错误: {e}")
-            return {
-                "success": False,
-                "checks_completed": 0,
-                "total_checks": 5,
-                "errors": [f"严重错误: {str(e)}"],
-                "deleted_records": {
-                    "matches": 0,
-                    "users": 0,
-                    "chatrooms": 0,
-                    "messages": 0
-                },
-                "updated_records": {
-                    "users": 0,
-                    "chatrooms": 0
-                }
-            }
-    
-    async def _check_database_matches(self) -> dict:
-        """检查数据库中matches表的数据完备性"""
-        try:
-            logger.info("开始检查数据库matches表...")
-            
-            # 获取所有用户数据
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            users_dict = {user["_id"]: user for user in users_data}  # 用于快速查找用户数据
-            
-            # 获取所有matches
-            matches_data = await Database.find("matches")
-            invalid_match_ids = []
-            valid_matches = []  # 存储有效的match，用于反向检查
-            
-            # 第一步：检查match中的用户是否存在
-            for match_data in matches_data:
-                match_id = match_data.get("_id")
-                user_id_1 = match_data.get("user_id_1")
-                user_id_2 = match_data.get("user_id_2")
-                
-                # 检查两个用户是否都存在
-                if user_id_1 not in existing_user_ids or user_id_2 not in existing_user_ids:
-                    logger.warning(f"数据库中发现无效Match {match_id}: user1({user_id_1})存在={user_id_1 in existing_user_ids}, user2({user_id_2})存在={user_id_2 in existing_user_ids}")
-                    invalid_match_ids.append(match_id)
-                else:
-                    # 记录有效的match用于反向检查
-                    valid_matches.append({
-                        "match_id": match_id,
-                        "user_id_1": user_id_1,
-                        "user_id_2": user_id_2
-                    })
-            
-            # 删除无效matches
-            deleted_count = 0
-            for match_id in invalid_match_ids:
-                await Database.delete_one("matches", {"_id": match_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Match {match_id}")
-            
-            # 第二步：反向检查 - 确保用户的match_ids包含相应的match
-            updated_users_count = 0
-            for match in valid_matches:
-                match_id = match["match_id"]
-                user_id_1 = match["user_id_1"]
-                user_id_2 = match["user_id_2"]
-                
-                # 检查user1的match_ids
-                user1_data = users_dict.get(user_id_1)
-                if user1_data:
-                    user1_match_ids = user1_data.get("match_ids", [])
-                    if match_id not in user1_match_ids:
-                        # 添加match_id到用户的match_ids列表
-                        user1_match_ids.append(match_id)
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id_1},
-                            {"$set": {"match_ids": user1_match_ids}}
-                        )
-                        updated_users_count += 1
-                        logger.info(f"为用户 {user_id_1} 添加缺失的match_id: {match_id}")
-                
-                # 检查user2的match_ids
-                user2_data = users_dict.get(user_id_2)
-                if user2_data:
-                    user2_match_ids = user2_data.get("match_ids", [])
-                    if match_id not in user2_match_ids:
-                        # 添加match_id到用户的match_ids列表
-                        user2_match_ids.append(match_id)
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id_2},
-                            {"$set": {"match_ids": user2_match_ids}}
-                        )
-                        updated_users_count += 1
-                        logger.info(f"为用户 {user_id_2} 添加缺失的match_id: {match_id}")
-            
-            logger.info(f"数据库matches检查完成，删除了 {deleted_count} 个无效Match，为 {updated_users_count} 个用户补充了缺失的match_id")
-            return {"success": True, "deleted": {"matches": deleted_count}, "updated_users": updated_users_count}
-            
-        except Exception as e:
-            logger.error(f"检查数据库matches时发生错误: {e}")
-            return {"success": False, "deleted": {"matches": 0}, "updated_users": 0}
-    
-    async def _check_database_user_match_ids(self) -> dict:
-        """检查数据库中users表的match_ids完备性"""
-        try:
-            logger.info("开始检查数据库users表的match_ids...")
-            
-            # 获取所有match_ids
-            matches_data = await Database.find("matches")
-            existing_match_ids = set(match["_id"] for match in matches_data)
-            
-            # 获取所有用户
-            users_data = await Database.find("users")
-            updated_count = 0
-            
-            for user_data in users_data:
-                user_id = user_data.get("_id")
-                match_ids = user_data.get("match_ids", [])
-                
-                if match_ids:
-                    invalid_match_ids = []
-                    
-                    # 检查每个match_id是否存在
-                    for match_id in match_ids:
-                        if match_id not in existing_match_ids:
-                            logger.warning(f"数据库用户 {user_id} 的match_ids中发现不存在的match_id: {match_id}")
-                            invalid_match_ids.append(match_id)
-                    
-                    # 更新用户的match_ids
-                    if invalid_match_ids:
-                        new_match_ids = [mid for mid in match_ids if mid not in invalid_match_ids]
-                        await Database.update_one(
-                            "users",
-                            {"_id": user_id},
-                            {"$set": {"match_ids": new_match_ids}}
-                        )
-                        updated_count += 1
-                        logger.info(f"更新数据库用户 {user_id} 的match_ids，删除了 {len(invalid_match_ids)} 个无效match_id")
-            
-            logger.info(f"数据库用户match_ids检查完成，更新了 {updated_count} 个用户")
-            return {"success": True, "deleted": {"users": updated_count}}
-            
-        except Exception as e:
-            logger.error(f"检查数据库用户match_ids时发生错误: {e}")
-            return {"success": False, "deleted": {"users": 0}}
-    
-    async def _check_database_chatrooms(self) -> dict:
-        """检查数据库中chatrooms表的数据完备性"""
-        try:
-            logger.info("开始检查数据库chatrooms表...")
-            
-            # 获取所有用户ID和match_ids
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            
-            matches_data = await Database.find("matches")
-            existing_match_ids = set(match["_id"] for match in matches_data)
-            
-            # 获取所有chatrooms
-            chatrooms_data = await Database.find("chatrooms")
-            invalid_chatroom_ids = []
-            
-            for chatroom_data in chatrooms_data:
-                chatroom_id = chatroom_data.get("_id")
-                user1_id = chatroom_data.get("user1_id")
-                user2_id = chatroom_data.get("user2_id")
-                match_id = chatroom_data.get("match_id")
-                
-                is_invalid = False
-                
-                # 检查用户是否存在
-                if user1_id not in existing_user_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 包含不存在的user1_id: {user1_id}")
-                    is_invalid = True
-                
-                if user2_id not in existing_user_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 包含不存在的user2_id: {user2_id}")
-                    is_invalid = True
-                
-                # 检查match_id是否存在
-                if match_id is not None and match_id not in existing_match_ids:
-                    logger.warning(f"数据库Chatroom {chatroom_id} 对应不存在的match_id: {match_id}")
-                    is_invalid = True
-                
-                if is_invalid:
-                    invalid_chatroom_ids.append(chatroom_id)
-            
-            # 删除无效chatrooms
-            deleted_count = 0
-            for chatroom_id in invalid_chatroom_ids:
-                await Database.delete_one("chatrooms", {"_id": chatroom_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Chatroom {chatroom_id}")
-            
-            logger.info(f"数据库chatrooms检查完成，删除了 {deleted_count} 个无效Chatroom")
-            return {"success": True, "deleted": {"chatrooms": deleted_count}}
-            
-        except Exception as e:
-            logger.error(f"检查数据库chatrooms时发生错误: {e}")
-            return {"success": False, "deleted": {"chatrooms": 0}}
-    
-    async def _check_database_messages(self) -> dict:
-        """检查数据库中messages表的数据完备性"""
-        try:
-            logger.info("开始检查数据库messages表...")
-            
-            # 获取所有用户ID和chatroom_ids
-            users_data = await Database.find("users")
-            existing_user_ids = set(user["_id"] for user in users_data)
-            
-            chatrooms_data = await Database.find("chatrooms")
-            existing_chatroom_ids = set(chatroom["_id"] for chatroom in chatrooms_data)
-            
-            # 获取所有messages
-            messages_data = await Database.find("messages")
-            invalid_message_ids = []
-            
-            for message_data in messages_data:
-                message_id = message_data.get("_id")
-                sender_id = message_data.get("message_sender_id")
-                receiver_id = message_data.get("message_receiver_id")
-                chatroom_id = message_data.get("chatroom_id")
-                
-                is_invalid = False
-                
-                # 检查发送者是否存在
-                if sender_id and sender_id not in existing_user_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的message_sender_id: {sender_id}")
-                    is_invalid = True
-                
-                # 检查接收者是否存在
-                if receiver_id and receiver_id not in existing_user_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的message_receiver_id: {receiver_id}")
-                    is_invalid = True
-                
-                # 检查chatroom_id是否存在
-                if chatroom_id and chatroom_id not in existing_chatroom_ids:
-                    logger.warning(f"数据库Message {message_id} 包含不存在的chatroom_id: {chatroom_id}")
-                    is_invalid = True
-                
-                if is_invalid:
-                    invalid_message_ids.append(message_id)
-            
-            # 删除无效messages
-            deleted_count = 0
-            for message_id in invalid_message_ids:
-                await Database.delete_one("messages", {"_id": message_id})
-                deleted_count += 1
-                logger.info(f"从数据库删除无效Message {message_id}")
-            
-            logger.info(f"数据库messages检查完成，删除了 {deleted_count} 个无效Message")
-            return {"success": True, "deleted": {"messages": deleted_count}}
-            
-        except Exception as e:
-            logger.error(f"检查数据库messages时发生错误: {e}")
-            return {"success": False, "deleted": {"messages": 0}}
-    
-    async def _check_database_chatroom_message_ids(self) -> dict:
-        """检查数据库中chatrooms表的message_ids完备性"""
-        try:
-            logger.info("开始检查数据库chatrooms表的message_ids...")
-            
-            # 获取所有message_ids
-            messages_data = await Database.find("messages")
-            existing_message_ids = set(message["_id"] for message in messages_data)
-            
-            # 获取所有chatrooms
-            chatrooms_data = await Database.find("chatrooms")
-            updated_count = 0
-            
-            for chatroom_data in chatrooms_data:
-                chatroom_id = chatroom_data.get("_id")
-                message_ids = chatroom_data.get("message_ids", [])
-                
-                if message_ids:
-                    invalid_message_ids = []
-                    
-                    # 检查每个message_id是否存在
-                    for message_id in message_ids:
-                        if message_id not in existing_message_ids:
-                            logger.warning(f"数据库Chatroom {chatroom_id} 的message_ids中发现不存在的message_id: {message_id}")
-                            invalid_message_ids.append(message_id)
-                    
-                    # 更新chatroom的message_ids
-                    if invalid_message_ids:
-                        new_message_ids = [mid for mid in message_ids if mid not in invalid_message_ids]
-                        await Database.update_one(
-                            "chatrooms",
-                            {"_id": chatroom_id},
-                            {"$set": {"message_ids": new_message_ids}}
-                        )
-                        updated_count += 1
-                        logger.info(f"更新数据库Chatroom {chatroom_id} 的message_ids，删除了 {len(invalid_message_ids)} 个无效message_id")
-            
-            logger.info(f"数据库chatroom message_ids检查完成，更新了 {updated_count} 个chatroom")
-            return {"success": True, "deleted": {"chatrooms": updated_count}}
-            
-        except Exception as e:
-            logger.error(f"检查数据库chatroom message_ids时发生错误: {e}")
-            return {"success": False, "deleted": {"chatrooms": 0}}
\ No newline at end of file
+            result = empty_result()
+            result["success"] = False
+            result["errors"].append(f"严重错误: {str(e)}")
+            return result
@@ -0,0 +1,308 @@
+"""
+数据库完备性审计（流式、仅投影主键）
+- 游标按批流式读取，只投影检查需要的字段，不把整张表读入列表
+- 已存在的主键收集到紧凑集合中（整数主键存入 array('q')，约 8 字节/个）
+- 孤儿文档按批用 $in 删除，无效引用按批用 $pull 清理
+- 按固定文档数输出进度与吞吐量，适合在千万级消息库上运行
+"""
+import time
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from app.config import settings
+from app.core.database import Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("DatabaseAudit")
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+class CompactIdSet:
+    """
+    紧凑主键集合
+    - 整数主键存入有序 array('q')，用二分查找判断是否存在
+    - 其他类型（如字符串 openid）退回普通 set
+    按 _id 升序流式追加时无需额外排序
+    """
+
+    def __init__(self, values: Iterable[Hashable] = ()):
+        self._ints = array("q")
+        self._others = set()
+        self._sorted = True
+        for value in values:
+            self.add(value)
+
+    def add(self, value: Hashable) -> None:
+        if type(value) is int and _INT64_MIN <= value <= _INT64_MAX:
+            if self._ints and value <= self._ints[-1]:
+                if value == self._ints[-1]:
+                    return
+                self._sorted = False
+            self._ints.append(value)
+        else:
+            self._others.add(value)
+
+    def _ensure_sorted(self) -> None:
+        if not self._sorted:
+            self._ints = array("q", sorted(set(self._ints)))
+            self._sorted = True
+
+    def __contains__(self, value: Hashable) -> bool:
+        if type(value) is int:
+            self._ensure_sorted()
+            index = bisect_left(self._ints, value)
+            return index < len(self._ints) and self._ints[index] == value
+        return value in self._others
+
+    def __len__(self) -> int:
+        self._ensure_sorted()
+        return len(self._ints) + len(self._others)
+
+
+class _Progress:
+    """按固定文档数输出扫描进度与吞吐量"""
+
+    def __init__(self, name: str, report_every: int):
+        self.name = name
+        self.report_every = report_every
+        self.scanned = 0
+        self.started = time.perf_counter()
+
+    def tick(self) -> None:
+        self.scanned += 1
+        if self.report_every and self.scanned % self.report_every == 0:
+            logger.info(f"{self.name}: 已扫描 {self.scanned} 个文档，{self.rate():.0f} 个/秒")
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.scanned / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {"scanned": self.scanned, "elapsed": round(self.elapsed(), 3), "docs_per_second": round(self.rate(), 1)}
+
+
+class DatabaseAudit:
+    """
+    一次数据库审计运行
+    各项检查按顺序执行，并复用前一项检查得到的有效主键集合，每个集合只需扫描一遍：
+        users(_id) → matches → user.match_ids → chatrooms → messages → chatroom.message_ids
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, report_every: Optional[int] = None):
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.report_every = settings.AUDIT_PROGRESS_EVERY if report_every is None else report_every
+        self.user_ids: Optional[CompactIdSet] = None
+        self.match_ids: Optional[CompactIdSet] = None
+        self.chatroom_ids: Optional[CompactIdSet] = None
+        self.message_ids: Optional[CompactIdSet] = None
+        self.throughput: Dict[str, Dict[str, Any]] = {}
+
+    # ==================== 通用工具 ====================
+    async def _stream(self, collection: str, projection: dict, query: Optional[dict] = None):
+        """按 _id 升序流式读取（走 _id 索引，服务端无需内存排序）"""
+        async for batch in Database.iter(collection, query, projection, self.batch_size, sort=[("_id", 1)]):
+            for document in batch:
+                yield document
+
+    async def _collect_ids(self, collection: str) -> CompactIdSet:
+        """只投影 _id，收集一个集合的全部主键"""
+        progress = _Progress(f"{collection} 主键", self.report_every)
+        ids = CompactIdSet()
+        async for document in self._stream(collection, {"_id": 1}):
+            ids.add(document["_id"])
+            progress.tick()
+        self.throughput[f"{collection}_ids"] = progress.summary()
+        return ids
+
+    async def _delete_batch(self, collection: str, ids: List[Hashable]) -> int:
+        if not ids:
+            return 0
+        # 传入副本：删除语句会被本地日志保留，之后清空批次不能影响它
+        deleted = await Database.delete_many(collection, {"_id": {"$in": list(ids)}})
+        ids.clear()
+        return deleted or 0
+
+    async def _pull_batch(self, collection: str, field: str, owner_ids: List[Hashable], invalid: set) -> int:
+        """从一批文档的数组字段中一次性移除所有无效引用"""
+        if not owner_ids:
+            return 0
+        updated = await Database.update_many(
+            collection,
+            {"_id": {"$in": list(owner_ids)}},
+            {"$pull": {field: {"$in": list(invalid)}}},
+        )
+        owner_ids.clear()
+        invalid.clear()
+        return updated or 0
+
+    # ==================== 各项检查 ====================
+    async def check_matches(self) -> dict:
+        """删除引用了不存在用户的匹配；为缺失 match_id 的用户补齐（按批 $addToSet）"""
+        if self.user_ids is None:
+            self.user_ids = await self._collect_ids("users")
+
+        progress = _Progress("matches", self.report_every)
+        self.match_ids = CompactIdSet()
+        invalid: List[Hashable] = []
+        valid_batch: List[dict] = []
+        deleted = 0
+        updated_users = 0
+
+        async for match in self._stream("matches", {"user_id_1": 1, "user_id_2": 1}):
+            progress.tick()
+            user_id_1, user_id_2 = match.get("user_id_1"), match.get("user_id_2")
+            if user_id_1 not in self.user_ids or user_id_2 not in self.user_ids:
+                logger.warning(f"数据库中发现无效Match {match['_id']}: user1={user_id_1}, user2={user_id_2}")
+                invalid.append(match["_id"])
+                if len(invalid) >= self.batch_size:
+                    deleted += await self._delete_batch("matches", invalid)
+                continue
+            self.match_ids.add(match["_id"])
+            valid_batch.append(match)
+            if len(valid_batch) >= self.batch_size:
+                updated_users += await self._backfill_user_match_ids(valid_batch)
+
+        deleted += await self._delete_batch("matches", invalid)
+        updated_users += await self._backfill_user_match_ids(valid_batch)
+        self.throughput["matches"] = progress.summary()
+        logger.info(f"数据库matches检查完成，删除了 {deleted} 个无效Match，为 {updated_users} 个用户补充了缺失的match_id")
+        return {"success": True, "deleted": {"matches": deleted}, "updated_users": updated_users}
+
+    async def _backfill_user_match_ids(self, matches: List[dict]) -> int:
+        """对一批有效匹配，只读取相关用户的 match_ids，补齐缺失的引用"""
+        if not matches:
+            return 0
+        user_ids = list({match[field] for match in matches for field in ("user_id_1", "user_id_2")})
+        users = await Database.find("users", {"_id": {"$in": user_ids}}, {"match_ids": 1})
+        existing = {user["_id"]: set(user.get("match_ids") or ()) for user in users}
+
+        missing: Dict[Hashable, List[Hashable]] = {}
+        for match in matches:
+            for field in ("user_id_1", "user_id_2"):
+                user_id = match[field]
+                if user_id in existing and match["_id"] not in existing[user_id]:
+                    missing.setdefault(user_id, []).append(match["_id"])
+        matches.clear()
+
+        for user_id, match_ids in missing.items():
+            await Database.update_one("users", {"_id": user_id}, {"$addToSet": {"match_ids": {"$each": match_ids}}})
+            logger.info(f"为用户 {user_id} 添加缺失的match_id: {match_ids}")
+        return len(missing)
+
+    async def check_user_match_ids(self) -> dict:
+        """从用户的 match_ids 中移除不存在的匹配（按批 $pull）"""
+        if self.match_ids is None:
+            self.match_ids = await self._collect_ids("matches")
+
+        progress = _Progress("users.match_ids", self.report_every)
+        owners: List[Hashable] = []
+        invalid: set = set()
+        updated = 0
+        async for user in self._stream("users", {"match_ids": 1}, {"match_ids.0": {"$exists": True}}):
+            progress.tick()
+            stale = [match_id for match_id in user.get("match_ids") or () if match_id not in self.match_ids]
+            if stale:
+                logger.warning(f"数据库用户 {user['_id']} 的match_ids中发现不存在的match_id: {stale}")
+                owners.append(user["_id"])
+                invalid.update(stale)
+                if len(owners) >= self.batch_size:
+                    updated += await self._pull_batch("users", "match_ids", owners, invalid)
+        updated += await self._pull_batch("users", "match_ids", owners, invalid)
+
+        self.throughput["users.match_ids"] = progress.summary()
+        logger.info(f"数据库用户match_ids检查完成，更新了 {updated} 个用户")
+        return {"success": True, "updated": {"users": updated}}
+
+    async def check_chatrooms(self) -> dict:
+        """删除引用了不存在用户或匹配的聊天室"""
+        if self.user_ids is None:
+            self.user_ids = await self._collect_ids("users")
+        if self.match_ids is None:
+            self.match_ids = await self._collect_ids("matches")
+
+        progress = _Progress("chatrooms", self.report_every)
+        self.chatroom_ids = CompactIdSet()
+        invalid: List[Hashable] = []
+        deleted = 0
+        async for chatroom in self._stream("chatrooms", {"user1_id": 1, "user2_id": 1, "match_id": 1}):
+            progress.tick()
+            match_id = chatroom.get("match_id")
+            if (
+                chatroom.get("user1_id") not in self.user_ids
+                or chatroom.get("user2_id") not in self.user_ids
+                or (match_id is not None and match_id not in self.match_ids)
+            ):
+                logger.warning(f"数据库中发现无效Chatroom {chatroom['_id']}")
+                invalid.append(chatroom["_id"])
+                if len(invalid) >= self.batch_size:
+                    deleted += await self._delete_batch("chatrooms", invalid)
+                continue
+            self.chatroom_ids.add(chatroom["_id"])
+        deleted += await self._delete_batch("chatrooms", invalid)
+
+        self.throughput["chatrooms"] = progress.summary()
+        logger.info(f"数据库chatrooms检查完成，删除了 {deleted} 个无效Chatroom")
+        return {"success": True, "deleted": {"chatrooms": deleted}}
+
+    async def check_messages(self) -> dict:
+        """删除发送者/接收者或聊天室不存在的消息"""
+        if self.user_ids is None:
+            self.user_ids = await self._collect_ids("users")
+        if self.chatroom_ids is None:
+            self.chatroom_ids = await self._collect_ids("chatrooms")
+
+        progress = _Progress("messages", self.report_every)
+        self.message_ids = CompactIdSet()
+        invalid: List[Hashable] = []
+        deleted = 0
+        projection = {"message_sender_id": 1, "message_receiver_id": 1, "chatroom_id": 1}
+        async for message in self._stream("messages", projection):
+            progress.tick()
+            sender_id = message.get("message_sender_id")
+            receiver_id = message.get("message_receiver_id")
+            chatroom_id = message.get("chatroom_id")
+            if (
+                (sender_id and sender_id not in self.user_ids)
+                or (receiver_id and receiver_id not in self.user_ids)
+                or (chatroom_id and chatroom_id not in self.chatroom_ids)
+            ):
+                invalid.append(message["_id"])
+                if len(invalid) >= self.batch_size:
+                    deleted += await self._delete_batch("messages", invalid)
+                continue
+            self.message_ids.add(message["_id"])
+        deleted += await self._delete_batch("messages", invalid)
+
+        self.throughput["messages"] = progress.summary()
+        logger.info(f"数据库messages检查完成，删除了 {deleted} 个无效Message")
+        return {"success": True, "deleted": {"messages": deleted}}
+
+    async def check_chatroom_message_ids(self) -> dict:
+        """从聊天室的 message_ids 中移除不存在的消息（按批 $pull）"""
+        if self.message_ids is None:
+            self.message_ids = await self._collect_ids("messages")
+
+        progress = _Progress("chatrooms.message_ids", self.report_every)
+        owners: List[Hashable] = []
+        invalid: set = set()
+        updated = 0
+        async for chatroom in self._stream("chatrooms", {"message_ids": 1}, {"message_ids.0": {"$exists": True}}):
+            progress.tick()
+            stale = [message_id for message_id in chatroom.get("message_ids") or () if message_id not in self.message_ids]
+            if stale:
+                logger.warning(f"数据库Chatroom {chatroom['_id']} 的message_ids中发现 {len(stale)} 个不存在的message_id")
+                owners.append(chatroom["_id"])
+                invalid.update(stale)
+                if len(owners) >= self.batch_size or len(invalid) >= self.batch_size:
+                    updated += await self._pull_batch("chatrooms", "message_ids", owners, invalid)
+        updated += await self._pull_batch("chatrooms", "message_ids", owners, invalid)
+
+        self.throughput["chatrooms.message_ids"] = progress.summary()
+        logger.info(f"数据库chatroom message_ids检查完成，更新了 {updated} 个chatroom")
+        return {"success": True, "updated": {"chatrooms": updated}}
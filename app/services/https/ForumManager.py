@@ -1,7 +1,13 @@
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Iterable, Optional
 from datetime import datetime, timezone
 
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.journal import Journal
+from app.core.snapshot import Snapshot
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
 from app.objects.Post import Post
 from app.objects.Comment import Comment
 from app.services.https.UserManagement import UserManagement
@@ -28,10 +34,19 @@ class ForumManager:
             cls._instance.posts_dict = {}      # post_id -> Post 实例
             cls._instance.comments_dict = {}   # comment_id -> Comment 实例
             cls._instance._initialized = False
+            Journal.register("posts")
+            Journal.register("comments")
+            Snapshot.register("posts", "_id", lambda: (post.to_document() for post in cls._instance.posts_dict.values()))
+            Snapshot.register("comments", "_id", lambda: (comment.to_document() for comment in cls._instance.comments_dict.values()))
+            ChangeFeed.register("posts", cls._instance._apply_remote_post, lambda post_id: cls._instance.posts_dict.pop(post_id, None))
+            ChangeFeed.register("comments", cls._instance._apply_remote_comment, lambda comment_id: cls._instance.comments_dict.pop(comment_id, None))
         return cls._instance
 
-    async def initialize(self) -> bool:
-        """从数据库初始化内存缓存（应用启动时调用一次）"""
+    async def initialize(self, posts=None, comments=None) -> bool:
+        """
+        从数据库初始化内存缓存（应用启动时调用一次）
+        posts/comments: 快照热启动时传入已追平的文档，为 None 时从数据库读取
+        """
         try:
             if ForumManager._initialized:
                 return True
@@ -47,8 +62,8 @@ class ForumManager:
             self.comments_dict.clear()
             
             # 从数据库加载现有数据到内存
-            posts_loaded = await self._load_posts_from_database()
-            comments_loaded = await self._load_comments_from_database()
+            posts_loaded = await self._load_posts_from_database(posts)
+            comments_loaded = await self._load_comments_from_database(comments)
             
             # 在完成加载后，基于帖子内存对 UserManagement 中用户的 post_ids 进行对齐
             try:
@@ -66,49 +81,24 @@ class ForumManager:
             ForumManager._initialized = False
             return False
 
-    async def _load_posts_from_database(self):
-        """从数据库加载帖子到内存缓存"""
+    async def _load_posts_from_database(self, documents=None):
+        """从数据库（或快照文档）加载帖子到内存缓存"""
         try:
             logger.info("开始从数据库加载帖子到内存...")
-            posts_data = await Database.find("posts", {})
             loaded_count = 0
             
-            logger.info(f"数据库中找到 {len(posts_data)} 个帖子")
-            
-            for post_data in posts_data:
-                try:
-                    post_id = post_data.get("_id")
-                    if post_id:
-                        # 重建Post实例
-                        post = Post(
-                            creator_user_id=str(post_data.get("creator_user_id")),
-                            creator_user_name=post_data.get("creator_user_name", ""),
-                            post_content=post_data.get("post_content", ""),
-                            post_type=post_data.get("post_type", "text"),
-                            post_category=post_data.get("post_category", ""),
-                            tags=post_data.get("tags", []),
-                            media_files=post_data.get("media_files", []),
-                        )
-                        # 恢复原有ID和状态
-                        Post._post_counter = max(Post._post_counter, int(post_id))
-                        post.post_id = int(post_id)
-                        post.like_count = int(post_data.get("like_count", 0))
-                        # 中文注释：liked_user_ids 改为字符串列表
-                        post.liked_user_ids = [str(uid) for uid in list(post_data.get("liked_user_ids", []))]
-                        post.comment_count = int(post_data.get("comment_count", 0))
-                        post.view_count = int(post_data.get("view_count", 0))
-                        post.comment_ids = list(post_data.get("comment_ids", []))
-                        post.post_status = post_data.get("post_status", "published")
-                        post.created_at = self._ensure_aware_datetime(post_data.get("created_at"))
-                        post.updated_at = self._ensure_aware_datetime(post_data.get("updated_at"))
-                        
-                        self.posts_dict[post.post_id] = post
-                        loaded_count += 1
-                        
-                        logger.debug(f"成功加载帖子 {post_id}: {post.post_content[:30]}...")
-                except Exception as post_error:
-                    logger.error(f"加载帖子 {post_data.get('_id', 'unknown')} 时出错: {post_error}")
-                    continue
+            # 按集合编解码器直接解码为 Post 对象（不经 __init__，不消耗ID序列）
+            async for batch in Database.iter_documents("posts", documents, as_objects=True):
+                for post in batch:
+                    # 时间字段统一为 aware datetime；规范化产生的脏标记随后撤销
+                    post.created_at = self._ensure_aware_datetime(post.created_at)
+                    post.updated_at = self._ensure_aware_datetime(post.updated_at)
+                    post.mark_clean()
+                    
+                    self.posts_dict[post.post_id] = post
+                    loaded_count += 1
+                    
+                    logger.debug(f"成功加载帖子 {post.post_id}: {post.post_content[:30]}...")
             
             logger.info(f"成功从数据库加载 {loaded_count} 个帖子到内存")
             return loaded_count
@@ -116,42 +106,22 @@ class ForumManager:
             logger.error(f"从数据库加载帖子失败: {e}")
             raise  # 重新抛出异常，确保初始化失败时能被捕获
 
-    async def _load_comments_from_database(self):
-        """从数据库加载评论到内存缓存"""
+    async def _load_comments_from_database(self, documents=None):
+        """从数据库（或快照文档）加载评论到内存缓存"""
         try:
             logger.info("开始从数据库加载评论到内存...")
-            comments_data = await Database.find("comments", {})
             loaded_count = 0
             
-            logger.info(f"数据库中找到 {len(comments_data)} 个评论")
-            
-            for comment_data in comments_data:
-                try:
-                    comment_id = comment_data.get("_id")
-                    if comment_id:
-                        # 重建Comment实例
-                        comment = Comment(
-                            commenter_user_id=str(comment_data.get("commenter_user_id")),
-                            commenter_user_name=comment_data.get("commenter_user_name", ""),
-                            post_id=comment_data.get("post_id"),
-                            comment_content=comment_data.get("comment_content", ""),
-                        )
-                        # 恢复原有ID和状态
-                        Comment._comment_counter = max(Comment._comment_counter, int(comment_id))
-                        comment.comment_id = int(comment_id)
-                        comment.like_count = int(comment_data.get("like_count", 0))
-                        # 中文注释：liked_user_ids 改为字符串列表
-                        comment.liked_user_ids = [str(uid) for uid in list(comment_data.get("liked_user_ids", []))]
-                        comment.comment_status = comment_data.get("comment_status", "published")
-                        comment.created_at = self._ensure_aware_datetime(comment_data.get("created_at"))
-                        
-                        self.comments_dict[comment.comment_id] = comment
-                        loaded_count += 1
-                        
-                        logger.debug(f"成功加载评论 {comment_id}: {comment.comment_content[:30]}...")
-                except Exception as comment_error:
-                    logger.error(f"加载评论 {comment_data.get('_id', 'unknown')} 时出错: {comment_error}")
-                    continue
+            # 按集合编解码器直接解码为 Comment 对象（不经 __init__，不消耗ID序列）
+            async for batch in Database.iter_documents("comments", documents, as_objects=True):
+                for comment in batch:
+                    comment.created_at = self._ensure_aware_datetime(comment.created_at)
+                    comment.mark_clean()
+                    
+                    self.comments_dict[comment.comment_id] = comment
+                    loaded_count += 1
+                    
+                    logger.debug(f"成功加载评论 {comment.comment_id}: {comment.comment_content[:30]}...")
             
             logger.info(f"成功从数据库加载 {loaded_count} 个评论到内存")
             return loaded_count
@@ -159,6 +129,28 @@ class ForumManager:
             logger.error(f"从数据库加载评论失败: {e}")
             raise  # 重新抛出异常，确保初始化失败时能被捕获
 
+    def _apply_remote_post(self, post_id, document):
+        """应用其他进程写入的帖子文档：已有帖子原地更新，新帖子加入缓存 [变更订阅回调]"""
+        incoming = Post.from_document(document)
+        # 直接写属性：incoming 只是数据来源，不应登记为脏对象
+        object.__setattr__(incoming, "created_at", self._ensure_aware_datetime(incoming.created_at))
+        object.__setattr__(incoming, "updated_at", self._ensure_aware_datetime(incoming.updated_at))
+        post = self.posts_dict.get(post_id)
+        if post is None:
+            self.posts_dict[post_id] = incoming
+        else:
+            post.refresh_from(incoming)
+
+    def _apply_remote_comment(self, comment_id, document):
+        """应用其他进程写入的评论文档 [变更订阅回调]"""
+        incoming = Comment.from_document(document)
+        object.__setattr__(incoming, "created_at", self._ensure_aware_datetime(incoming.created_at))
+        comment = self.comments_dict.get(comment_id)
+        if comment is None:
+            self.comments_dict[comment_id] = incoming
+        else:
+            comment.refresh_from(incoming)
+
     # ==================== 帖子相关 ====================
     async def create_post(
         self,
@@ -176,11 +168,12 @@ class ForumManager:
                 await self.initialize()
                 
             user_manager = UserManagement()
-            user = user_manager.get_user_instance(str(creator_user_id))
+            user = await user_manager.get_user_instance(str(creator_user_id))
             if not user:
                 logger.error(f"User {creator_user_id} not found when creating post")
                 return None
 
+            await IdAllocator.ensure("posts")
             post = Post(
                 creator_user_id=user.user_id,
                 creator_user_name=user.telegram_user_name or str(user.user_id),
@@ -330,7 +323,8 @@ class ForumManager:
                 if modified_count > 0:
                     # 同步更新内存中的用户对象
                     user_manager = UserManagement()
-                    user = user_manager.get_user_instance(str(user_id))
+                    # 数据库已更新；只同步内存中已有的用户对象
+                    user = user_manager.peek_user_instance(str(user_id))
                     if user:
                         user.add_liked_post(post_id)
                         logger.info(f"用户 {user_id} 的 liked_post_ids 已更新，添加帖子 {post_id}")
@@ -352,7 +346,8 @@ class ForumManager:
                 if modified_count > 0:
                     # 同步更新内存中的用户对象
                     user_manager = UserManagement()
-                    user = user_manager.get_user_instance(str(user_id))
+                    # 数据库已更新；只同步内存中已有的用户对象
+                    user = user_manager.peek_user_instance(str(user_id))
                     if user:
                         user.remove_liked_post(post_id)
                         logger.info(f"用户 {user_id} 的 liked_post_ids 已更新，移除帖子 {post_id}")
@@ -474,7 +469,7 @@ class ForumManager:
                 await self.initialize()
                 
             user_manager = UserManagement()
-            user = user_manager.get_user_instance(str(user_id))
+            user = await user_manager.get_user_instance(str(user_id))
             if not user:
                 return {"success": False, "message": "user not found"}
 
@@ -483,6 +478,7 @@ class ForumManager:
             if not post:
                 return {"success": False, "message": "post not found"}
 
+            await IdAllocator.ensure("comments")
             comment = Comment(
                 commenter_user_id=user.user_id,
                 commenter_user_name=user.telegram_user_name or str(user.user_id),
@@ -592,55 +588,56 @@ class ForumManager:
     
     # ==================== 数据库同步方法 ====================
     async def save_to_database(self) -> bool:
-        """将内存数据同步到数据库（供自动保存任务调用）"""
+        """将内存中的脏帖子/脏评论同步到数据库（供自动保存任务调用）"""
         try:
-            # 保存前再次对齐一次用户与帖子关系，确保落库一致
+            started = time.perf_counter()
+            dirty_posts = await ChangeTracker.pop_dirty("posts")
+            dirty_comments = await ChangeTracker.pop_dirty("comments")
+
+            # 已被移出内存的对象不再写回
+            posts_to_save = [
+                post for post_id, post in dirty_posts.items()
+                if post is not None and self.posts_dict.get(post_id) is post
+            ]
+            comments_to_save = [
+                comment for comment_id, comment in dirty_comments.items()
+                if comment is not None and self.comments_dict.get(comment_id) is comment
+            ]
+
+            # 保存前只对本次变更的帖子对齐用户与帖子关系，确保落库一致
             try:
-                self._reconcile_user_post_relationships()
+                self._reconcile_user_post_relationships(posts_to_save)
             except Exception as reconcile_error:
                 logger.warning(f"保存前对齐用户 post_ids 失败: {reconcile_error}")
 
             success_count = 0
-            total_count = len(self.posts_dict) + len(self.comments_dict)
+            failed_count = 0
             
-            # 保存所有帖子
-            for post in self.posts_dict.values():
+            # 脏帖子、脏评论各一次批量 upsert；失败的对象重新标脏，留待下次刷新
+            for collection_name, items, id_attr in (
+                ("posts", posts_to_save, "post_id"),
+                ("comments", comments_to_save, "comment_id"),
+            ):
+                docs = [await item.to_dict() for item in items]
                 try:
-                    post_dict = await post.to_dict()
-                    existing = await Database.find_one("posts", {"_id": post.post_id})
-                    if existing:
-                        await Database.update_one(
-                            "posts",
-                            {"_id": post.post_id},
-                            {"$set": {k: v for k, v in post_dict.items() if k != "_id"}}
-                        )
-                    else:
-                        await Database.insert_one("posts", post_dict)
-                    success_count += 1
+                    result = await Database.bulk_upsert(collection_name, docs)
+                    failed_ids = set(result["failed_keys"])
                 except Exception as e:
-                    logger.error(f"Failed to save post {post.post_id}: {e}")
-                    continue
-            
-            # 保存所有评论
-            for comment in self.comments_dict.values():
-                try:
-                    comment_dict = await comment.to_dict()
-                    existing = await Database.find_one("comments", {"_id": comment.comment_id})
-                    if existing:
-                        await Database.update_one(
-                            "comments",
-                            {"_id": comment.comment_id},
-                            {"$set": {k: v for k, v in comment_dict.items() if k != "_id"}}
-                        )
-                    else:
-                        await Database.insert_one("comments", comment_dict)
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"Failed to save comment {comment.comment_id}: {e}")
-                    continue
+                    logger.error(f"Failed to bulk save {collection_name}: {e}")
+                    failed_ids = {doc["_id"] for doc in docs}
+                
+                for item in items:
+                    if getattr(item, id_attr) in failed_ids:
+                        item.mark_dirty()
+                failed_count += len(failed_ids)
+                success_count += len(docs) - len(failed_ids)
             
-            logger.info(f"Saved {success_count}/{total_count} forum items to database")
-            return success_count == total_count
+            report = ChangeTracker.record_flush(
+                "ForumManager", success_count, failed_count, time.perf_counter() - started,
+                collections=("posts", "comments")
+            )
+            logger.info(f"Flushed {report['written']} dirty forum items to database ({report['failed']} failed) in {report['elapsed']:.3f}s")
+            return failed_count == 0
         except Exception as e:
             logger.error(f"Failed to save forum data to database: {e}")
             return False
@@ -677,14 +674,15 @@ class ForumManager:
             return None
 
     # ==================== 内部对齐方法 ====================
-    def _reconcile_user_post_relationships(self) -> None:
+    def _reconcile_user_post_relationships(self, posts: Optional[Iterable[Post]] = None) -> None:
         """
         基于内存中的帖子，确保 UserManagement 内存里的用户 post_ids 一致。
         - 内存优先：只改内存，不直接写库；持久化交给定时保存任务
+        - posts 为空时对齐全部帖子（启动时），否则只对齐给定帖子（刷新时只传脏帖子）
         """
         user_manager = UserManagement()
-        for post in self.posts_dict.values():
-            user = user_manager.get_user_instance(post.creator_user_id)
+        for post in (self.posts_dict.values() if posts is None else posts):
+            user = user_manager.peek_user_instance(post.creator_user_id)
             if user is None:
                 # 如果用户不在内存，这里跳过（上层启动流程应先初始化 UserManagement）
                 continue
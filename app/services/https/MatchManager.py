@@ -1,7 +1,15 @@
+import time
 from typing import Optional, Dict, Any
 from app.config import settings
 from app.objects.Match import Match
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.change_log import ChangeLog
+from app.core.journal import Journal
+from app.core.snapshot import Snapshot
+from app.services.https.ReferenceIndex import ReferenceIndex
 from app.core.database import Database
+from app.core.id_allocator import IdAllocator
 from app.utils.my_logger import MyLogger
 from datetime import datetime, timezone
 
@@ -19,12 +27,16 @@ class MatchManager:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance.match_list = {}  # Dictionary to store matches by match_id
+            Journal.register("matches")
+            Snapshot.register("matches", "_id", lambda: (match.to_document() for match in cls._instance.match_list.values()))
+            ChangeFeed.register("matches", cls._instance._apply_remote_match, cls._instance._remove_remote_match)
             logger.info("MatchManager singleton instance created")
         return cls._instance
 
-    async def construct(self) -> bool:
+    async def construct(self, documents=None) -> bool:
         """
         Initialize MatchManager by initializing match counter and loading matches from database
+        documents: 快照热启动时传入已追平的匹配文档，为 None 时从数据库读取
         """
         try:
             # Initialize Match counter from database
@@ -33,51 +45,14 @@ class MatchManager:
             
             # Load existing matches from database
             logger.info("MatchManager construct: Loading matches from database...")
-            matches_data = await Database.find("matches")
-            logger.info(f"MatchManager construct: Found {len(matches_data)} matches in database")
             
             loaded_count = 0
-            for match_data in matches_data:
-                try:
-                    match_id = match_data["_id"]  # match_id现在存储在_id字段中
-                    user_id_1 = match_data["user_id_1"]
-                    user_id_2 = match_data["user_id_2"]
-                    
-                    logger.info(f"MatchManager construct: Processing match {match_id} (users: {user_id_1}, {user_id_2})")
-                    
-                    # 创建Match实例但使用现有ID
-                    # 先临时禁用初始化检查
-                    Match._initialized = True
-                    original_counter = Match._match_counter
-                    
-                    # 创建Match实例
-                    match = Match(
-                        telegram_user_session_id_1=str(user_id_1),
-                        telegram_user_session_id_2=str(user_id_2),
-                        reason_to_id_1=match_data.get("description_to_user_1", ""),
-                        reason_to_id_2=match_data.get("description_to_user_2", ""),
-                        match_score=match_data.get("match_score", 0),
-                        match_time=match_data.get("match_time", "Unknown")
-                    )
-                    
-                    # 恢复原始计数器并设置正确的match_id
-                    Match._match_counter = original_counter
-                    match.match_id = match_id
-                    
-                    # 设置其他属性
-                    match.is_liked = match_data.get("is_liked", False)
-                    match.mutual_game_scores = match_data.get("mutual_game_scores", {})
-                    match.chatroom_id = match_data.get("chatroom_id")
-                    
-                    # 存储到内存
-                    self.match_list[match_id] = match
+            # 按集合编解码器直接解码为 Match 对象：不经 __init__，不消耗计数器也不标脏
+            async for batch in Database.iter_documents("matches", documents, as_objects=True):
+                for match in batch:
+                    self.match_list[match.match_id] = match
+                    ReferenceIndex().add_match(match)
                     loaded_count += 1
-                    
-                    logger.info(f"MatchManager construct: Successfully loaded match {match_id}")
-                    
-                except Exception as e:
-                    logger.error(f"MatchManager construct: Error loading match from database: {e}")
-                    continue
             
             logger.info(f"MatchManager construct: Loaded {loaded_count} matches from database")
             logger.info(f"MatchManager construct completed successfully")
@@ -87,12 +62,37 @@ class MatchManager:
             logger.error(f"MatchManager construct: Error constructing MatchManager: {e}")
             return False
 
+    def _apply_remote_match(self, match_id, document):
+        """
+        应用其他进程写入的匹配文档 [变更订阅回调]
+        新匹配的双方用户尚未到达本进程时返回 False，稍后重试
+        """
+        match = self.match_list.get(match_id)
+        if match is None:
+            from app.services.https.UserManagement import UserManagement
+            user_manager = UserManagement()
+            if (not user_manager.has_user(str(document["user_id_1"]))
+                    or not user_manager.has_user(str(document["user_id_2"]))):
+                return False
+            match = self.match_list[match_id] = Match.from_document(document)
+        else:
+            match.refresh_from(Match.from_document(document))
+        ReferenceIndex().add_match(match)
+        return True
+
+    def _remove_remote_match(self, match_id):
+        """其他进程删除了匹配：从缓存与反向索引移除 [变更订阅回调]"""
+        match = self.match_list.pop(match_id, None)
+        if match is not None:
+            ReferenceIndex().forget_match(match)
+
     async def create_match(self, user_id_1: str, user_id_2: str, reason_1: str, reason_2: str, match_score: int) -> Match:
         """
         创建新的匹配
         """
         try:
-            # Create new match instance
+            # Create new match instance（ID段用尽时先租下一段）
+            await IdAllocator.ensure("matches")
             new_match = Match(
                 telegram_user_session_id_1=str(user_id_1),
                 telegram_user_session_id_2=str(user_id_2),
@@ -104,13 +104,15 @@ class MatchManager:
             
             # Store in memory
             self.match_list[new_match.match_id] = new_match
+            ReferenceIndex().add_match(new_match)
+            ChangeLog.match_touched(new_match.match_id, new_match.user_id_1, new_match.user_id_2)
             
             # Add match_id to corresponding user instances
             from app.services.https.UserManagement import UserManagement
             user_manager = UserManagement()
             
-            user_1 = user_manager.get_user_instance(str(user_id_1))
-            user_2 = user_manager.get_user_instance(str(user_id_2))
+            user_1 = await user_manager.get_user_instance(str(user_id_1))
+            user_2 = await user_manager.get_user_instance(str(user_id_2))
             
             if user_1:
                 if new_match.match_id not in user_1.match_ids:
@@ -173,7 +175,7 @@ class MatchManager:
     async def save_to_database(self, match_id: Optional[int] = None) -> bool:
         """
         保存匹配到数据库
-        如果没有指定match_id，则保存所有匹配
+        如果没有指定match_id，则保存所有被标记为脏的匹配
         """
         try:
             if match_id is not None:
@@ -188,16 +190,37 @@ class MatchManager:
                     logger.error(f"Cannot save: Match {match_id} not found")
                     return False
             else:
-                # Save all matches
-                success_count = 0
-                total_matches = len(self.match_list)
+                # Save dirty matches only
+                started = time.perf_counter()
+                dirty_matches = await ChangeTracker.pop_dirty("matches")
+                
+                match_docs = []
+                for dirty_id, match in dirty_matches.items():
+                    # 已被删除的匹配不再写回
+                    if match is None or self.match_list.get(dirty_id) is not match:
+                        continue
+                    match_docs.append(match.to_document())
+                
+                try:
+                    result = await Database.bulk_upsert("matches", match_docs)
+                    failed_ids = result["failed_keys"]
+                except Exception as e:
+                    logger.error(f"Error bulk saving matches: {e}")
+                    failed_ids = [doc["_id"] for doc in match_docs]
                 
-                for match in self.match_list.values():
-                    if await match.save_to_database():
-                        success_count += 1
+                # 写入失败的匹配重新标脏，留待下次刷新
+                for failed_id in failed_ids:
+                    match = self.match_list.get(failed_id)
+                    if match:
+                        match.mark_dirty()
+                failed_count = len(failed_ids)
                 
-                logger.info(f"Saved {success_count}/{total_matches} matches to database")
-                return success_count == total_matches
+                report = ChangeTracker.record_flush(
+                    "MatchManager", len(match_docs) - failed_count, failed_count, time.perf_counter() - started,
+                    collections=("matches",)
+                )
+                logger.info(f"Flushed {report['written']} dirty matches to database ({report['failed']} failed) in {report['elapsed']:.3f}s")
+                return failed_count == 0
                 
         except Exception as e:
             logger.error(f"Error saving matches to database: {e}")
@@ -243,10 +266,12 @@ class MatchManager:
         获取用户的所有匹配
         """
         try:
-            user_matches = []
-            for match in self.match_list.values():
-                if match.user_id_1 == user_id or match.user_id_2 == user_id:
-                    user_matches.append(match)
+            # 通过反向索引定位，无需遍历全部匹配
+            user_matches = [
+                self.match_list[match_id]
+                for match_id in sorted(ReferenceIndex().matches_of(user_id))
+                if match_id in self.match_list
+            ]
             
             logger.info(f"Found {len(user_matches)} matches for user {user_id}")
             return user_matches
@@ -260,36 +285,14 @@ class MatchManager:
         从数据库加载所有匹配
         """
         try:
-            matches_data = await Database.find("matches")
             loaded_count = 0
             
-            for match_data in matches_data:
-                try:
-                    # Reconstruct Match object from database data
-                    match = Match(
-                        telegram_user_session_id_1=match_data["user_id_1"],
-                        telegram_user_session_id_2=match_data["user_id_2"],
-                        reason_to_id_1=match_data["description_to_user_1"],
-                        reason_to_id_2=match_data["description_to_user_2"],
-                        match_score=match_data["match_score"],
-                        match_time=match_data.get("match_time", "Unknown")
-                    )
-                    
-                    # Restore additional properties
-                    match.match_id = match_data["match_id"]
-                    match.is_liked = match_data.get("is_liked", False)
-                    match.mutual_game_scores = match_data.get("mutual_game_scores", {})
-                    match.chatroom_id = match_data.get("chatroom_id")
-                    
-                    # User instances are automatically populated in Match.__init__()
-                    
-                    # Store in memory
+            async for batch in Database.iter("matches", as_objects=True):
+                for match in batch:
+                    # User instances are populated in Match.from_document()
                     self.match_list[match.match_id] = match
+                    ReferenceIndex().add_match(match)
                     loaded_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error reconstructing match from database data: {e}")
-                    continue
             
             logger.info(f"Loaded {loaded_count} matches from database")
             return True
@@ -320,7 +323,7 @@ class MatchManager:
             # 第一步：参数验证和确定目标女性用户列表
             if user_id is not None:
                 # 检查指定用户是否存在
-                target_user = user_manager.get_user_instance(user_id)
+                target_user = await user_manager.get_user_instance(user_id)
                 if not target_user:
                     return {"success": False, "message": "错误：指定的用户不存在"}
                 
@@ -331,9 +334,8 @@ class MatchManager:
                 female_users_to_match = [target_user]
                 logger.info(f"开始为指定女性用户 {user_id} 创建匹配")
             else:
-                # 获取所有女性用户（gender == 1）
-                female_user_dict = user_manager.get_female_user_list()
-                female_users_to_match = list(female_user_dict.values())
+                # 获取所有女性用户（gender == 1；lazy 模式下从数据库读取）
+                female_users_to_match = [user async for user in user_manager.iter_users(gender=1)]
                 logger.info(f"开始为所有 {len(female_users_to_match)} 个女性用户创建匹配")
             
             # 第二步：遍历女性用户进行匹配
@@ -361,7 +363,7 @@ class MatchManager:
                         match_score = match_data.get("match_score", match_data.get("score", 0))
                         
                         # 验证男性用户是否存在
-                        male_user = user_manager.get_user_instance(male_user_id)
+                        male_user = await user_manager.get_user_instance(male_user_id)
                         if not male_user:
                             failed_matches.append({
                                 "user_id": female_user.user_id,
@@ -421,8 +423,8 @@ class MatchManager:
                 
                 for i, match in enumerate(successful_matches, 1):
                     # 获取用户信息
-                    female_user = user_manager.get_user_instance(match.user_id_1)
-                    male_user = user_manager.get_user_instance(match.user_id_2)
+                    female_user = await user_manager.get_user_instance(match.user_id_1)
+                    male_user = await user_manager.get_user_instance(match.user_id_2)
                     
                     # 构建详细信息
                     match_detail = f"""
@@ -443,7 +445,7 @@ class MatchManager:
             if print_message and failed_matches:
                 message_parts.append(f"\n\n失败的匹配 ({failed_count} 个)：")
                 for i, failed in enumerate(failed_matches, 1):
-                    user = user_manager.get_user_instance(failed["user_id"])
+                    user = await user_manager.get_user_instance(failed["user_id"])
                     user_name = user.telegram_user_name if user else "未知用户"
                     message_parts.append(f"{i}. {user_name} (ID: {failed['user_id']}): {failed['error']}")
             
@@ -9,6 +9,10 @@ from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import uuid
 import time
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.journal import Journal
+from app.core.snapshot import Snapshot
 from app.core.database import Database
 from app.utils.my_logger import MyLogger
 logger = MyLogger("PersonalityTestManager")
@@ -31,10 +35,20 @@ class PersonalityTestManager:
             cls._instance.test_sessions = {}     # session_id -> 测试会话详情
             cls._instance.user_histories = {}   # user_id -> 历史记录列表
             cls._instance.session_counter = 0   # 会话计数器
+            Journal.register("personality_test_records", "session_id", lambda session_id, _: cls._instance.test_sessions.get(session_id))
+            Snapshot.register("personality_test_records", "session_id", lambda: cls._instance.test_sessions.values())
+            ChangeFeed.register(
+                "personality_test_records", lambda _, record: cls._instance._load_record(dict(record)),
+                lambda session_id: cls._instance.test_sessions.pop(session_id, None), key_field="session_id",
+                dump=cls._instance.test_sessions.get,
+            )
         return cls._instance
     
-    async def initialize_from_database(self):
-        """从数据库初始化内存数据"""
+    async def initialize_from_database(self, records=None):
+        """
+        从数据库初始化内存数据
+        records: 快照热启动时传入已追平的测试记录，为 None 时从数据库读取
+        """
         if PersonalityTestManager._initialized:
             return
             
@@ -60,29 +74,9 @@ class PersonalityTestManager:
                     self.cards[card_id] = card_data
             
             # 加载测试记录
-            records_data = await Database.find("personality_test_records", {})
-            for record_data in records_data:
-                session_id = record_data.get("session_id")
-                user_id = record_data.get("user_id")
-                
-                if session_id:
-                    # 移除MongoDB的_id字段
-                    record_data.pop("_id", None)
-                    self.test_sessions[session_id] = record_data
-                    
-                    # 如果测试已完成，添加到用户历史记录
-                    if record_data.get("completed", False) and user_id:
-                        if user_id not in self.user_histories:
-                            self.user_histories[user_id] = []
-                        
-                        # 避免重复添加
-                        existing_sessions = [h.get("session_id") for h in self.user_histories[user_id]]
-                        if session_id not in existing_sessions:
-                            self.user_histories[user_id].append({
-                                "session_id": session_id,
-                                "result_card": record_data.get("result_card"),
-                                "completed_at": record_data.get("completed_at")
-                            })
+            async for batch in Database.iter_documents("personality_test_records", records):
+                for record_data in batch:
+                    self._load_record(record_data)
             
             # 初始化会话计数器 - 使用时间戳避免冲突
             self.session_counter = int(time.time() * 1000)
@@ -96,46 +90,71 @@ class PersonalityTestManager:
             logger.error(f"PersonalityTestManager: 从数据库加载数据失败: {str(e)}")
             PersonalityTestManager._initialized = True  # 即使失败也标记为已初始化，避免重复尝试
     
+    def _load_record(self, record_data: Dict) -> None:
+        """把一条测试记录放入内存（启动加载与应用其他进程的写入共用）"""
+        session_id = record_data.get("session_id")
+        user_id = record_data.get("user_id")
+        if not session_id:
+            return
+        
+        # 移除MongoDB的_id字段与写入时间戳
+        record_data.pop("_id", None)
+        record_data.pop("_modified_at", None)
+        self.test_sessions[session_id] = record_data
+        
+        # 如果测试已完成，添加到用户历史记录
+        if record_data.get("completed", False) and user_id:
+            if user_id not in self.user_histories:
+                self.user_histories[user_id] = []
+            
+            # 避免重复添加
+            existing_sessions = [h.get("session_id") for h in self.user_histories[user_id]]
+            if session_id not in existing_sessions:
+                self.user_histories[user_id].append({
+                    "session_id": session_id,
+                    "result_card": record_data.get("result_card"),
+                    "completed_at": record_data.get("completed_at")
+                })
+    
     async def save_to_database(self, session_id: Optional[str] = None) -> bool:
         """
         保存内存数据到数据库
         
         Args:
-            session_id: 指定保存的会话ID，None表示保存所有数据
+            session_id: 指定保存的会话ID，None表示保存所有被标记为脏的会话
             
         Returns:
             是否保存成功
         """
         try:
             if session_id is None:
-                # 保存所有测试会话
-                success_count = 0
-                total_sessions = len(self.test_sessions)
+                # 只保存被标记为脏的测试会话
+                started = time.perf_counter()
+                dirty_session_ids = await ChangeTracker.pop_dirty("personality_test_records")
+                # 已被清理的会话不再写回
+                session_docs = [
+                    self.test_sessions[sid] for sid in dirty_session_ids
+                    if sid in self.test_sessions
+                ]
                 
-                for sid, session_data in self.test_sessions.items():
-                    try:
-                        # 检查数据库中是否存在
-                        existing_session = await Database.find_one("personality_test_records", {"session_id": sid})
-                        
-                        if existing_session:
-                            # 更新现有记录
-                            await Database.update_one(
-                                "personality_test_records",
-                                {"session_id": sid},
-                                {"$set": session_data}
-                            )
-                        else:
-                            # 插入新记录
-                            await Database.insert_one("personality_test_records", session_data)
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        logger.error(f"保存测试会话 {sid} 失败: {e}")
-                        continue
+                try:
+                    result = await Database.bulk_upsert("personality_test_records", session_docs, key="session_id")
+                    failed_ids = result["failed_keys"]
+                except Exception as e:
+                    logger.error(f"批量保存测试会话失败: {e}")
+                    failed_ids = [doc["session_id"] for doc in session_docs]
+                
+                for sid in failed_ids:
+                    ChangeTracker.mark_dirty("personality_test_records", sid)
+                failed_count = len(failed_ids)
+                success_count = len(session_docs) - failed_count
                 
-                logger.info(f"性格测试数据保存完成: {success_count}/{total_sessions} 个测试会话")
-                return success_count == total_sessions
+                report = ChangeTracker.record_flush(
+                    "PersonalityTestManager", success_count, failed_count, time.perf_counter() - started,
+                    collections=("personality_test_records",)
+                )
+                logger.info(f"性格测试数据刷新完成: 写入 {report['written']} 个脏测试会话，失败 {report['failed']} 个，耗时 {report['elapsed']:.3f}秒")
+                return failed_count == 0
                 
             else:
                 # 保存指定会话
@@ -144,20 +163,12 @@ class PersonalityTestManager:
                     return False
                 
                 session_data = self.test_sessions[session_id]
+                ChangeTracker.discard("personality_test_records", session_id)
                 
-                # 检查数据库中是否存在
-                existing_session = await Database.find_one("personality_test_records", {"session_id": session_id})
-                
-                if existing_session:
-                    # 更新现有记录
-                    await Database.update_one(
-                        "personality_test_records",
-                        {"session_id": session_id},
-                        {"$set": session_data}
-                    )
-                else:
-                    # 插入新记录
-                    await Database.insert_one("personality_test_records", session_data)
+                result = await Database.bulk_upsert("personality_test_records", [session_data], key="session_id")
+                if result["failed_keys"]:
+                    ChangeTracker.mark_dirty("personality_test_records", session_id)
+                    return False
                 
                 logger.info(f"测试会话 {session_id} 保存完成")
                 return True
@@ -197,8 +208,9 @@ class PersonalityTestManager:
                 "completed_at": None
             }
             
-            # 保存到内存
+            # 保存到内存，并登记为脏会话
             self.test_sessions[session_id] = session_data
+            ChangeTracker.mark_dirty("personality_test_records", session_id)
             
             # 获取第一道题目
             first_question = self.questions.get("Q1")
@@ -280,6 +292,7 @@ class PersonalityTestManager:
             }
             
             session["answers"].append(answer_record)
+            ChangeTracker.mark_dirty("personality_test_records", session_id)
             
             current_question_num = len(session["answers"])
             
@@ -361,6 +374,7 @@ class PersonalityTestManager:
             session["result_card"] = result_card_id
             session["completed"] = True
             session["completed_at"] = completed_at
+            ChangeTracker.mark_dirty("personality_test_records", session_id)
             
             # 添加到用户历史记录
             user_id = session.get("user_id")
@@ -561,6 +575,7 @@ class PersonalityTestManager:
             # 从内存中移除过期会话
             for session_id in sessions_to_remove:
                 del self.test_sessions[session_id]
+                ChangeTracker.discard("personality_test_records", session_id)
             
             cleaned_count = len(sessions_to_remove)
             if cleaned_count > 0:
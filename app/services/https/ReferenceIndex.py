@@ -0,0 +1,203 @@
+"""
+引用关系反向索引（事件驱动的引用完整性）
+- 在创建/加载匹配与聊天室时同步维护反向索引：用户 → 匹配、用户 → 聊天室、匹配 → 聊天室
+- 聊天室 → 消息 直接使用 Chatroom.message_ids（发送消息时已维护）
+- 删除实体时按索引级联清理关联数据，不再需要周期性全量扫描；
+  DataIntegrity 的全量检查只作为按需/夜间任务保留
+"""
+from typing import Any, Dict, Hashable, Set
+
+from app.core.change_log import ChangeLog
+from app.core.database import Database
+from app.utils.my_logger import MyLogger
+
+logger = MyLogger("ReferenceIndex")
+
+
+class ReferenceIndex:
+    """
+    引用关系反向索引单例
+    属性：
+        user_matches: dict{user_id, set(match_id)}
+        user_chatrooms: dict{user_id, set(chatroom_id)}
+        match_chatrooms: dict{match_id, set(chatroom_id)}
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.user_matches = {}
+            cls._instance.user_chatrooms = {}
+            cls._instance.match_chatrooms = {}
+            logger.info("ReferenceIndex singleton instance created")
+        return cls._instance
+
+    @staticmethod
+    def _link(index: Dict[Hashable, Set], key: Hashable, value: Hashable) -> None:
+        index.setdefault(key, set()).add(value)
+
+    @staticmethod
+    def _unlink(index: Dict[Hashable, Set], key: Hashable, value: Hashable) -> None:
+        values = index.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del index[key]
+
+    # ==================== 索引维护 ====================
+    def add_match(self, match) -> None:
+        """登记一个匹配（创建或从数据库加载时调用）"""
+        self._link(self.user_matches, str(match.user_id_1), match.match_id)
+        self._link(self.user_matches, str(match.user_id_2), match.match_id)
+
+    def forget_match(self, match) -> None:
+        """从索引中移除一个匹配（不触及数据库）"""
+        self._unlink(self.user_matches, str(match.user_id_1), match.match_id)
+        self._unlink(self.user_matches, str(match.user_id_2), match.match_id)
+
+    def add_chatroom(self, chatroom) -> None:
+        """登记一个聊天室（创建或从数据库加载时调用）"""
+        self._link(self.user_chatrooms, str(chatroom.user1_id), chatroom.chatroom_id)
+        self._link(self.user_chatrooms, str(chatroom.user2_id), chatroom.chatroom_id)
+        if chatroom.match_id is not None:
+            self._link(self.match_chatrooms, chatroom.match_id, chatroom.chatroom_id)
+
+    def forget_chatroom(self, chatroom) -> None:
+        """从索引中移除一个聊天室（不触及数据库）"""
+        self._unlink(self.user_chatrooms, str(chatroom.user1_id), chatroom.chatroom_id)
+        self._unlink(self.user_chatrooms, str(chatroom.user2_id), chatroom.chatroom_id)
+        if chatroom.match_id is not None:
+            self._unlink(self.match_chatrooms, chatroom.match_id, chatroom.chatroom_id)
+
+    def matches_of(self, user_id) -> Set:
+        return set(self.user_matches.get(str(user_id), ()))
+
+    def chatrooms_of(self, user_id) -> Set:
+        return set(self.user_chatrooms.get(str(user_id), ()))
+
+    def rebuild(self) -> None:
+        """按管理器当前内存内容重建索引（供全量检查之后校准使用）"""
+        from app.services.https.MatchManager import MatchManager
+        from app.services.https.ChatroomManager import ChatroomManager
+
+        self.user_matches.clear()
+        self.user_chatrooms.clear()
+        self.match_chatrooms.clear()
+        for match in MatchManager().match_list.values():
+            self.add_match(match)
+        for chatroom in ChatroomManager().chatrooms.values():
+            self.add_chatroom(chatroom)
+
+    # ==================== 级联删除 ====================
+    async def remove_chatroom(self, chatroom_id) -> int:
+        """
+        删除聊天室及其全部消息（内存+数据库），返回删除的消息数
+        先删除数据库中的文档，成功后才从内存移除；删除失败时异常向上抛出，内存保持不变
+        """
+        from app.services.https.ChatroomManager import ChatroomManager
+        from app.services.https.MatchManager import MatchManager
+
+        chatroom_manager = ChatroomManager()
+        chatroom = chatroom_manager.chatrooms.get(chatroom_id)
+        message_ids = list(chatroom.message_ids) if chatroom is not None else []
+
+        if message_ids:
+            await Database.delete_many("messages", {"_id": {"$in": message_ids}})
+        await Database.delete_one("chatrooms", {"_id": chatroom_id})
+
+        chatroom = chatroom_manager.chatrooms.pop(chatroom_id, None)
+        if chatroom is not None:
+            self.forget_chatroom(chatroom)
+            # 撤销脏标记，避免刷新时重新写回
+            chatroom.mark_clean()
+            match = MatchManager().match_list.get(chatroom.match_id)
+            if match is not None and match.chatroom_id == chatroom_id:
+                match.chatroom_id = None
+        logger.info(f"级联删除聊天室 {chatroom_id}，清理了 {len(message_ids)} 条消息")
+        return len(message_ids)
+
+    async def remove_match(self, match_id) -> Dict[str, int]:
+        """
+        删除匹配（内存+数据库），并级联：
+        1. 从双方用户的 match_ids 中移除该匹配
+        2. 删除该匹配的聊天室及消息
+        数据库写入成功后才修改内存
+        """
+        from app.services.https.MatchManager import MatchManager
+        from app.services.https.UserManagement import UserManagement
+
+        match_manager = MatchManager()
+        chatroom_ids = set(self.match_chatrooms.get(match_id, ()))
+        match = match_manager.match_list.get(match_id)
+        user_ids = []
+        if match is not None:
+            if match.chatroom_id is not None:
+                chatroom_ids.add(match.chatroom_id)
+            user_ids = [str(match.user_id_1), str(match.user_id_2)]
+            await Database.update_many("users", {"_id": {"$in": user_ids}}, {"$pull": {"match_ids": match_id}})
+
+        await Database.delete_one("matches", {"_id": match_id})
+
+        self.match_chatrooms.pop(match_id, None)
+        match = match_manager.match_list.pop(match_id, None)
+        if match is not None:
+            self.forget_match(match)
+            match.mark_clean()
+            ChangeLog.match_touched(match_id, match.user_id_1, match.user_id_2)
+            user_manager = UserManagement()
+            for user_id in user_ids:
+                # 只修改内存中已有的用户；未加载的用户已由上面的数据库更新覆盖
+                user = user_manager.peek_user_instance(user_id)
+                if user is not None and match_id in user.match_ids:
+                    user.match_ids.remove(match_id)
+
+        messages = 0
+        for chatroom_id in chatroom_ids:
+            messages += await self.remove_chatroom(chatroom_id)
+        logger.info(f"级联删除匹配 {match_id}，清理了 {len(chatroom_ids)} 个聊天室")
+        return {"chatrooms": len(chatroom_ids), "messages": messages}
+
+    async def remove_user(self, user_id) -> Dict[str, Any]:
+        """
+        删除用户（内存+数据库），并级联删除其全部匹配、聊天室与消息
+        数据库删除成功后才从内存移除；删除失败时异常向上抛出，用户仍留在内存中
+        返回清理统计
+        """
+        from app.services.https.UserManagement import UserManagement
+
+        user_id = str(user_id)
+        user_manager = UserManagement()
+        stats = {"matches": 0, "chatrooms": 0, "messages": 0}
+
+        match_ids = self.matches_of(user_id)
+        user = user_manager.peek_user_instance(user_id)
+        if user is not None:
+            match_ids.update(user.match_ids)
+
+        await Database.delete_one("users", {"_id": user_id})
+        # 从内存移除并撤销脏标记，避免刷新时重新插入
+        user_manager.forget_user(user_id)
+        ChangeLog.user_deleted(user_id)
+
+        for match_id in match_ids:
+            result = await self.remove_match(match_id)
+            stats["matches"] += 1
+            stats["chatrooms"] += result["chatrooms"]
+            stats["messages"] += result["messages"]
+
+        # 不属于任何匹配的聊天室
+        for chatroom_id in self.chatrooms_of(user_id):
+            stats["messages"] += await self.remove_chatroom(chatroom_id)
+            stats["chatrooms"] += 1
+
+        self.user_matches.pop(user_id, None)
+        self.user_chatrooms.pop(user_id, None)
+        return stats
+
+    def get_status(self) -> Dict[str, int]:
+        return {
+            "users_with_matches": len(self.user_matches),
+            "users_with_chatrooms": len(self.user_chatrooms),
+            "matches_with_chatrooms": len(self.match_chatrooms),
+        }
@@ -1,19 +1,36 @@
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
 from fastapi import HTTPException, status
 from app.config import settings
+from app.core.change_feed import ChangeFeed
+from app.core.change_tracker import ChangeTracker
+from app.core.journal import Journal
+from app.core.metrics import Metrics
+from app.core.snapshot import Snapshot
 from app.core.database import Database
 from app.objects.User import User
 from app.utils.my_logger import MyLogger
 
 logger = MyLogger("UserManagement")
 
+Metrics.describe("user_cache_lookups_total", "User lookups in lazy mode by result (hit/miss/absent)")
+Metrics.describe("user_cache_evictions_total", "Users evicted from the hot set in lazy mode by reason")
+
 class UserManagement:
     """
     用户管理单例，负责管理所有用户
     属性：
-        user_list: dict{user_id, User}  # 所有用户
+        user_list: dict{user_id, User}  # 所有用户（lazy 模式下为常驻的热点用户）
         male_user_list: dict{user_id, User}
         female_user_list: dict{user_id, User}
         database_address: str
+    lazy 模式（USER_CACHE_MODE=lazy）：
+        - 启动时不加载用户，get_user_instance 未命中时从数据库读取（同一用户的并发读取合并为一次）
+        - 常驻用户按最近访问排序，超过 USER_CACHE_CAPACITY 或空闲超过 USER_CACHE_IDLE_SECONDS 的干净用户被淘汰
+        - _resident 以弱引用记录本进程中仍存活的全部用户对象（含已淘汰但仍被匹配等结构持有的），
+          再次访问时复用同一个对象，保证每个用户在进程内只有一个实例
     """
     _instance = None
     _initialized = False
@@ -26,45 +43,44 @@ class UserManagement:
             cls._instance.male_user_list = {}
             cls._instance.female_user_list = {}
             cls._instance.user_counter = 0  # 用户计数器
+            cls._instance._resident = weakref.WeakValueDictionary()  # lazy 模式：user_id -> 存活的 User
+            cls._instance._last_access = OrderedDict()  # lazy 模式：user_id -> 最近访问时间，按访问先后排序
+            cls._instance._loading = {}  # lazy 模式：user_id -> 进行中的数据库读取
+            Journal.register("users")
+            if not cls.lazy():
+                # lazy 模式内存中只有部分用户，不能写入快照（热启动会把快照当作全量）
+                Snapshot.register("users", "_id", lambda: (user.to_document() for user in cls._instance.user_list.values()))
+            ChangeFeed.register("users", cls._instance._apply_remote_user, cls._instance._remove_remote_user)
         return cls._instance
 
-    async def initialize_from_database(self):
-        """从数据库初始化用户缓存 [内部方法，非API调用]"""
+    @staticmethod
+    def lazy() -> bool:
+        return settings.USER_CACHE_MODE == "lazy"
+
+    async def initialize_from_database(self, documents=None):
+        """
+        从数据库初始化用户缓存 [内部方法，非API调用]
+        documents: 快照热启动时传入已追平的用户文档，为 None 时从数据库读取
+        lazy 模式下只统计用户总数，用户在首次访问时加载
+        """
         if UserManagement._initialized:
             return
         
+        if self.lazy():
+            self.user_counter = await Database.count_documents("users")
+            UserManagement._initialized = True
+            print(f"UserManagement: 按需加载模式，数据库中共 {self.user_counter} 个用户，常驻上限 {settings.USER_CACHE_CAPACITY}")
+            return
+        
         # 从数据库获取所有用户
-        users_from_db = await Database.find("users", {})
         loaded_count = 0
         
-        for user_data in users_from_db:
-            # 创建User对象
-            user = User(
-                telegram_user_name=user_data.get("telegram_user_name"),
-                gender=user_data.get("gender"),
-                user_id=user_data.get("_id")
-            )
-            user.age = user_data.get("age")
-            user.target_gender = user_data.get("target_gender")
-            user.user_personality_summary = user_data.get("user_personality_summary")
-            user.match_ids = user_data.get("match_ids", [])
-            user.blocked_user_ids = user_data.get("blocked_user_ids", [])
-            
-            # 论坛相关字段（新增）
-            user.post_ids = user_data.get("post_ids", [])           # 用户发布的帖子ID列表
-            user.liked_post_ids = user_data.get("liked_post_ids", []) # 用户点赞的帖子ID列表
-            
-            # 添加到缓存列表
-            user_id = user.user_id
-            self.user_list[user_id] = user
-            
-            # 🔧 MODIFIED: 修复性别分类 - 根据性别分类
-            if user.gender == 1:  # 1=女性
-                self.female_user_list[user_id] = user
-            elif user.gender == 2:  # 2=男性
-                self.male_user_list[user_id] = user
-            
-            loaded_count += 1
+        # 按集合编解码器直接解码为 User 对象（不经 __init__，加载后无需撤销脏标记）
+        async for batch in Database.iter_documents("users", documents, as_objects=True):
+            for user in batch:
+                # 添加到缓存列表（按性别分类）
+                self._file(user)
+                loaded_count += 1
         
         # 更新用户计数器
         self.user_counter = len(self.user_list)
@@ -74,40 +90,201 @@ class UserManagement:
         print(f"UserManagement: 成功从数据库加载 {loaded_count} 个用户到内存")
         print(f"UserManagement: 男性用户: {len(self.male_user_list)}, 女性用户: {len(self.female_user_list)}")
 
+    def _file(self, user):
+        """放入用户列表并按性别分类（1=女性，2=男性）"""
+        user_id = user.user_id
+        self.user_list[user_id] = user
+        self.female_user_list.pop(user_id, None)
+        self.male_user_list.pop(user_id, None)
+        if user.gender == 1:
+            self.female_user_list[user_id] = user
+        elif user.gender == 2:
+            self.male_user_list[user_id] = user
+        if self.lazy():
+            self._resident[user_id] = user
+
+    def _unfile(self, user_id):
+        """从用户列表与性别分类中移除，返回移除的用户"""
+        self.female_user_list.pop(user_id, None)
+        self.male_user_list.pop(user_id, None)
+        self._last_access.pop(user_id, None)
+        return self.user_list.pop(user_id, None)
+
+    def _apply_remote_user(self, user_id, document):
+        """
+        应用其他进程写入的用户文档：已有用户原地更新（聊天室等持有的引用不变），新用户加入缓存 [变更订阅回调]
+        lazy 模式下本进程没有的用户不加入，下次访问时从数据库读取
+        """
+        user = self.peek_user_instance(user_id)
+        if user is None:
+            if self.lazy():
+                return
+            user = User.from_document(document)
+            self.user_counter += 1
+        else:
+            user.refresh_from(User.from_document(document))
+        if user_id in self.user_list or not self.lazy():
+            self._file(user)
+
+    def _remove_remote_user(self, user_id):
+        """其他进程注销了用户：从缓存移除（匹配与聊天室各有自己的删除事件） [变更订阅回调]"""
+        self.forget_user(user_id)
+
+    def forget_user(self, user_id):
+        """从内存移除用户并撤销其脏标记（注销时调用），返回被移除的用户"""
+        user = self._unfile(user_id)
+        if self.lazy():
+            user = self._resident.pop(user_id, None) or user
+        if user is None:
+            return None
+        user.mark_clean()
+        self.user_counter = max(0, self.user_counter - 1)
+        return user
+
+    # ==================== 按需加载（lazy 模式） ====================
+    def peek_user_instance(self, user_id):
+        """只查内存、不触发加载，也不计入访问（同步上下文与变更订阅回调使用） [内部方法，非API调用]"""
+        user = self.user_list.get(user_id)
+        if user is None and self.lazy():
+            user = self._resident.get(user_id)
+        return user
+
+    def _touch(self, user):
+        """记录一次访问：放回常驻集合、移到最近端，超出容量时淘汰最久未访问的干净用户"""
+        user_id = user.user_id
+        if user_id not in self.user_list:
+            self._file(user)
+        self._last_access[user_id] = time.monotonic()
+        self._last_access.move_to_end(user_id)
+        overflow = len(self.user_list) - settings.USER_CACHE_CAPACITY
+        if overflow > 0:
+            self._evict(overflow, reason="capacity")
+
+    def _evict(self, count=None, idle_before=None, reason="capacity"):
+        """
+        从最久未访问的一端淘汰干净用户：淘汰 count 个，或淘汰最近访问早于 idle_before 的全部用户
+        有未写回修改的用户跳过；被淘汰的对象仍被其他结构引用时留在 _resident 中
+        """
+        evicted = 0
+        for user_id, accessed_at in list(self._last_access.items()):
+            if count is not None and evicted >= count:
+                break
+            if idle_before is not None and accessed_at >= idle_before:
+                break
+            if ChangeTracker.is_dirty("users", user_id):
+                continue
+            self._unfile(user_id)
+            evicted += 1
+        if evicted:
+            Metrics.increment("user_cache_evictions_total", evicted, reason=reason)
+        return evicted
+
+    def evict_idle(self):
+        """淘汰空闲超过 USER_CACHE_IDLE_SECONDS 的干净用户（每次刷新后调用），返回淘汰数量"""
+        if not self.lazy():
+            return 0
+        return self._evict(idle_before=time.monotonic() - settings.USER_CACHE_IDLE_SECONDS, reason="idle")
+
+    def _adopt(self, document):
+        """由数据库文档得到用户对象：内存中已有同一用户时复用已有对象（可能有更新的修改）"""
+        user = self.peek_user_instance(document["_id"])
+        if user is None:
+            user = User.from_document(document)
+            self._resident[user.user_id] = user
+        return user
+
+    async def _load(self, user_id):
+        document = await Database.find_one("users", {"_id": user_id})
+        return self._adopt(document) if document is not None else None
+
+    async def load_users(self, user_ids):
+        """
+        批量取得用户（不计入访问，不挤占常驻集合），返回 {user_id: User}，不存在的用户不在结果中
+        lazy 模式下内存中没有的用户按批从数据库读取 [内部方法，非API调用]
+        """
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user = self.peek_user_instance(user_id)
+            if user is not None:
+                users[user_id] = user
+            elif self.lazy():
+                missing.append(user_id)
+        batch_size = settings.DB_BULK_BATCH_SIZE
+        for start in range(0, len(missing), batch_size):
+            for document in await Database.find("users", {"_id": {"$in": missing[start:start + batch_size]}}):
+                users[document["_id"]] = self._adopt(document)
+        return users
+
+    async def iter_users(self, gender=None):
+        """
+        遍历全部用户（可按性别筛选）；lazy 模式下从数据库流式读取，不挤占常驻集合 [内部方法，非API调用]
+        """
+        source = {1: self.female_user_list, 2: self.male_user_list}.get(gender, self.user_list)
+        if not self.lazy():
+            for user in list(source.values()):
+                yield user
+            return
+        seen = set()
+        async for batch in Database.iter("users", {"gender": gender} if gender is not None else {}):
+            for document in batch:
+                seen.add(document["_id"])
+                yield self._adopt(document)
+        # 新建后尚未写回数据库的用户
+        for user_id, user in list(source.items()):
+            if user_id not in seen:
+                yield user
+
+    async def known_user_ids(self):
+        """全部用户ID（lazy 模式下从数据库按主键投影读取，并包含尚未写回的新用户） [内部方法，非API调用]"""
+        if not self.lazy():
+            return set(str(user_id) for user_id in self.user_list.keys())
+        user_ids = set(str(user_id) for user_id in self.user_list.keys())
+        async for batch in Database.iter("users", {}, {"_id": 1}):
+            user_ids.update(str(document["_id"]) for document in batch)
+        return user_ids
+
+    def has_user(self, user_id):
+        """
+        同步检查用户是否存在（加载匹配/聊天室时使用）
+        lazy 模式下无法在不访问数据库的情况下判断，一律视为存在，由数据完备性检查按数据库核对
+        """
+        return self.lazy() or user_id in self.user_list
+
     # 创建新用户 [API调用]
     def create_new_user(self, telegram_user_name, telegram_user_id, gender):
         # 中文注释：将用户ID改为字符串（例如微信 openid），不再转换为整数
         user_id = str(telegram_user_id)
         user = User(telegram_user_name=telegram_user_name, gender=gender, user_id=user_id)
-        self.user_list[user_id] = user
-        if gender == 1:
-            self.female_user_list[user_id] = user
-        elif gender == 2:
-            self.male_user_list[user_id] = user
+        replaced = self.peek_user_instance(user_id) is not None
+        self._file(user)
+        if self.lazy():
+            self._touch(user)
         
         # 更新用户计数器
-        self.user_counter = len(self.user_list)
+        if not replaced:
+            self.user_counter += 1
         return user_id
 
     # 编辑用户年龄 [API调用]
-    def edit_user_age(self, user_id, age):
-        user = self.user_list.get(user_id)
+    async def edit_user_age(self, user_id, age):
+        user = await self.get_user_instance(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(age=age)
         return True
 
     # 编辑用户目标性别 [API调用]
-    def edit_target_gender(self, user_id, target_gender):
-        user = self.user_list.get(user_id)
+    async def edit_target_gender(self, user_id, target_gender):
+        user = await self.get_user_instance(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(target_gender=target_gender)
         return True
 
     # 编辑用户总结 [API调用]
-    def edit_summary(self, user_id, summary):
-        user = self.user_list.get(user_id)
+    async def edit_summary(self, user_id, summary):
+        user = await self.get_user_instance(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         user.edit_data(user_personality_summary=summary)
@@ -117,101 +294,68 @@ class UserManagement:
     async def save_to_database(self, user_id=None):
         """
         保存用户到MongoDB，并使用user_id作为文档的_id。
-        如果指定了user_id，则保存该用户；如果没有指定，则保存所有内存中的用户。
+        如果指定了user_id，则保存该用户；如果没有指定，则只保存内存中被标记为脏的用户。
         如果用户在数据库中已存在，则更新；否则，创建新记录。
         [API调用]
         """
         if user_id is None:
-            # 保存所有内存中的用户
-            success_count = 0
-            total_users = len(self.user_list)
+            # 只刷新脏用户（变更追踪层登记的集合），一次批量 upsert 写回
+            started = time.perf_counter()
+            dirty_users = await ChangeTracker.pop_dirty("users")
             
-            for user in self.user_list.values():
-                try:
-                    # 使用 user_id 作为 MongoDB 的 _id
-                    user_dict = {
-                        "_id": user.user_id,
-                        "user_name": user.telegram_user_name,
-                        "gender": user.gender,
-                        "age": user.age,
-                        "target_gender": user.target_gender,
-                        "user_personality_summary": user.user_personality_summary,
-                        "match_ids": user.match_ids,
-                        "blocked_user_ids": user.blocked_user_ids,
-                        # 论坛相关字段（新增）
-                        "post_ids": user.post_ids,           # 用户发布的帖子ID列表
-                        "liked_post_ids": user.liked_post_ids, # 用户点赞的帖子ID列表
-                    }
-
-                    # 检查用户是否已在数据库中
-                    existing_user_in_db = await Database.find_one("users", {"_id": user.user_id})
-
-                    if existing_user_in_db:
-                        # 如果存在，则更新。$set 的内容不能包含 _id
-                        update_payload = user_dict.copy()
-                        del update_payload["_id"]
-                        await Database.update_one(
-                            "users",
-                            {"_id": user.user_id},
-                            {"$set": update_payload}
-                        )
-                    else:
-                        # 如果不存在，则插入 (包含 _id)
-                        await Database.insert_one("users", user_dict)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    # 记录单个用户保存失败，但继续保存其他用户
-                    print(f"保存用户 {user.user_id} 失败: {e}")
+            user_docs = []
+            for dirty_id, user in dirty_users.items():
+                # 已被删除/替换的用户不再写回，避免把注销用户重新插入
+                if user is None or self.peek_user_instance(dirty_id) is not user:
                     continue
+                user_docs.append(user.to_document())
             
-            return success_count == total_users
+            try:
+                result = await Database.bulk_upsert("users", user_docs)
+                failed_ids = result["failed_keys"]
+            except Exception as e:
+                print(f"批量保存用户失败: {e}")
+                failed_ids = [doc["_id"] for doc in user_docs]
+            
+            # 写入失败的用户重新标脏，留待下次刷新
+            for failed_id in failed_ids:
+                user = self.peek_user_instance(failed_id)
+                if user:
+                    user.mark_dirty()
+            
+            report = ChangeTracker.record_flush(
+                "UserManagement", len(user_docs) - len(failed_ids), len(failed_ids), time.perf_counter() - started,
+                collections=("users",)
+            )
+            logger.info(f"UserManagement刷新完成: 写入 {report['written']} 个脏用户，失败 {report['failed']} 个，耗时 {report['elapsed']:.3f}秒")
+            # 刚写回的用户已变干净，可以淘汰空闲的用户
+            self.evict_idle()
+            return not failed_ids
         else:
             # 保存指定的用户
-            user = self.user_list.get(user_id)
+            user = self.peek_user_instance(user_id)
             if not user:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="要保存的用户在内存中不存在")
 
-            # 使用 user_id 作为 MongoDB 的 _id
-            user_dict = {
-                "_id": user.user_id,
-                "user_name": user.telegram_user_name,
-                "gender": user.gender,
-                "age": user.age,
-                "target_gender": user.target_gender,
-                "user_personality_summary": user.user_personality_summary,
-                "match_ids": user.match_ids,
-                "blocked_user_ids": user.blocked_user_ids,
-                # 论坛相关字段（新增）
-                "post_ids": user.post_ids,           # 用户发布的帖子ID列表
-                "liked_post_ids": user.liked_post_ids, # 用户点赞的帖子ID列表
-            }
-
-            # 检查用户是否已在数据库中
-            existing_user_in_db = await Database.find_one("users", {"_id": user.user_id})
-
-            if existing_user_in_db:
-                # 如果存在，则更新。$set 的内容不能包含 _id
-                update_payload = user_dict.copy()
-                del update_payload["_id"]
-                await Database.update_one(
-                    "users",
-                    {"_id": user.user_id},
-                    {"$set": update_payload}
-                )
-            else:
-                # 如果不存在，则插入 (包含 _id)
-                await Database.insert_one("users", user_dict)
-
+            # 先取快照并清除脏标记；写库期间发生的新修改会重新标脏
+            user_dict = user.to_document()
+            user.mark_clean()
+            try:
+                result = await Database.bulk_upsert("users", [user_dict])
+            except Exception:
+                user.mark_dirty()
+                raise
+            if result["failed_keys"]:
+                user.mark_dirty()
+                return False
             return True
 
     # 根据id获取用户信息 [API调用]
-    def get_user_info_with_user_id(self, user_id):
+    async def get_user_info_with_user_id(self, user_id):
         # 中文注释：统一按字符串 user_id 处理，不进行数值转换
         user_id = str(user_id)
         
-        user = self.user_list.get(user_id)
+        user = await self.get_user_instance(user_id)
         if not user:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在")
         return {
@@ -221,7 +365,7 @@ class UserManagement:
             "age": user.age,
             "target_gender": user.target_gender,
             "user_personality_trait": user.user_personality_summary,
-            "match_ids": user.match_ids
+            "match_ids": list(user.match_ids)
         }
 
     # 获取用户统计信息 [内部方法，非API调用]
@@ -231,7 +375,9 @@ class UserManagement:
             "total_users": self.user_counter,
             "male_users": len(self.male_user_list),
             "female_users": len(self.female_user_list),
-            "user_list_size": len(self.user_list)
+            "user_list_size": len(self.user_list),
+            "resident_users": len(self._resident) if self.lazy() else len(self.user_list),
+            "cache_mode": settings.USER_CACHE_MODE,
         }
 
     # 获得用户列表 [内部方法，非API调用]
@@ -247,8 +393,28 @@ class UserManagement:
         return self.female_user_list
 
     # 获得用户实例 [内部方法，非API调用]
-    def get_user_instance(self, user_id):
-        return self.user_list.get(user_id)
+    async def get_user_instance(self, user_id):
+        """
+        取得用户实例，不存在时返回 None
+        lazy 模式下未命中时从数据库读取并放入常驻集合，同一用户的并发读取只访问一次数据库
+        """
+        user = self.user_list.get(user_id)
+        if not self.lazy():
+            return user
+        if user is None:
+            user = self._resident.get(user_id)
+        if user is None:
+            loading = self._loading.get(user_id)
+            if loading is None:
+                loading = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+                loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+            user = await asyncio.shield(loading)
+            Metrics.increment("user_cache_lookups_total", result="miss" if user is not None else "absent")
+        else:
+            Metrics.increment("user_cache_lookups_total", result="hit")
+        if user is not None:
+            self._touch(user)
+        return user
 
     # 用户注销 [API调用]
     async def deactivate_user(self, user_id):
@@ -256,15 +422,10 @@ class UserManagement:
         用户注销功能，删除用户及其相关的匹配数据、聊天室和消息
         数据流程：
         1. 检查用户是否存在
-        2. 获取用户的所有match_ids
-        3. 从MatchManager获取相关Match实例
-        4. 获取Match中涉及的其他用户
-        5. 收集需要删除的Chatroom和Message数据
-        6. 删除用户（内存+数据库）
-        7. 从其他用户的match_ids中移除相关match_id
-        8. 删除相关Match实例（内存+数据库）
-        9. 删除相关Chatroom实例（内存+数据库）
-        10. 删除相关Message实例（数据库）
+        2. 通过反向索引级联删除（ReferenceIndex.remove_user）：
+           - 删除用户（内存+数据库）
+           - 删除用户的全部Match，并从对方用户的match_ids中移除
+           - 删除相关Chatroom及其Message
         [API调用]
         """
         try:
@@ -272,100 +433,17 @@ class UserManagement:
             user_id = str(user_id)
             
             # Step 1: 检查用户是否存在
-            target_user = self.user_list.get(user_id)
-            if not target_user:
+            if await self.get_user_instance(user_id) is None:
                 logger.info("用户不存在")
                 return False
             
-            # Step 2: 获取用户的所有match_ids
-            user_match_ids = target_user.match_ids.copy()  # 创建副本，避免修改时的问题
-            
-            # Step 3: 从MatchManager获取相关Match实例
-            from app.services.https.MatchManager import MatchManager
-            match_manager = MatchManager()
-            
-            matches_to_delete = []
-            other_users_to_update = set()  # 使用set避免重复
-            chatrooms_to_delete = []  # 需要删除的聊天室
-            messages_to_delete = []   # 需要删除的消息
-            
-            for match_id in user_match_ids:
-                match_instance = match_manager.get_match(match_id)
-                if match_instance:
-                    matches_to_delete.append(match_instance)
-                    
-                    # Step 4: 获取Match中涉及的其他用户
-                    other_user_id = match_instance.get_target_user_id(user_id)
-                    if other_user_id:
-                        other_user = self.get_user_instance(other_user_id)
-                        if other_user:
-                            other_users_to_update.add((other_user, match_id))
-                    
-                    # Step 5: 收集需要删除的Chatroom和Message数据
-                    if match_instance.chatroom_id:
-                        from app.services.https.ChatroomManager import ChatroomManager
-                        chatroom_manager = ChatroomManager()
-                        
-                        chatroom = chatroom_manager.chatrooms.get(match_instance.chatroom_id)
-                        if chatroom:
-                            chatrooms_to_delete.append(chatroom)
-                            # 收集该聊天室中的所有消息ID
-                            messages_to_delete.extend(chatroom.message_ids)
-            
-            # Step 6: 删除本人用户实例（内存+数据库）
-            # 从内存中删除
-            del self.user_list[user_id]
-            
-            # 从性别分类列表中删除
-            if target_user.gender == 1:
-                self.female_user_list.pop(user_id, None)
-            elif target_user.gender == 2:
-                self.male_user_list.pop(user_id, None)
-                
-            # 从数据库中删除
-            await Database.delete_one("users", {"_id": user_id})
-            
-            # Step 7: 从其他用户的match_ids中移除相关match_id
-            for other_user, match_id in other_users_to_update:
-                if match_id in other_user.match_ids:
-                    other_user.match_ids.remove(match_id)
-                    # 更新数据库中的用户数据
-                    await Database.update_one(
-                        "users",
-                        {"_id": other_user.user_id},
-                        {"$pull": {"match_ids": match_id}}
-                    )
-            
-            # Step 8: 删除相关Match实例（内存+数据库）
-            for match_instance in matches_to_delete:
-                # 从MatchManager内存中删除
-                match_manager.match_list.pop(match_instance.match_id, None)
-                
-                # 从数据库中删除
-                await Database.delete_one("matches", {"_id": match_instance.match_id})
-            
-            # Step 9: 删除相关Chatroom实例（内存+数据库）
-            from app.services.https.ChatroomManager import ChatroomManager
-            chatroom_manager = ChatroomManager()
-            
-            for chatroom in chatrooms_to_delete:
-                # 从ChatroomManager内存中删除
-                chatroom_manager.chatrooms.pop(chatroom.chatroom_id, None)
-                
-                # 从数据库中删除
-                await Database.delete_one("chatrooms", {"_id": chatroom.chatroom_id})
-            
-            # Step 10: 删除相关Message实例（数据库）
-            # 使用批量删除操作提高效率
-            if messages_to_delete:
-                await Database.delete_many("messages", {"_id": {"$in": messages_to_delete}})
-            
-            # 更新用户计数器
-            self.user_counter = len(self.user_list)
+            # Step 2: 级联删除
+            from app.services.https.ReferenceIndex import ReferenceIndex
+            stats = await ReferenceIndex().remove_user(user_id)
             
-            print(f"用户注销成功: 删除用户 {user_id}，清理了 {len(matches_to_delete)} 个匹配，"
-                  f"{len(chatrooms_to_delete)} 个聊天室，{len(messages_to_delete)} 条消息，"
-                  f"更新了 {len(other_users_to_update)} 个其他用户")
+            print(f"用户注销成功: 删除用户 {user_id}，清理了 {stats['matches']} 个匹配，"
+                  f"{stats['chatrooms']} 个聊天室，{stats['messages']} 条消息，"
+                  f"更新了 {stats['matches']} 个其他用户")
             return True
             
         except Exception as e:
@@ -67,6 +67,17 @@ class SingletonStatusReporter:
         except Exception as e:
             status["ChatroomManager"] = {"error": str(e)}
         
+        # 变更追踪层状态：各集合的脏对象数量
+        try:
+            from app.core.change_tracker import ChangeTracker
+            tracker_status = ChangeTracker.get_status()
+            status["ChangeTracker"] = {
+                f"dirty_{collection}": {"size": count}
+                for collection, count in tracker_status["dirty"].items()
+            }
+        except Exception as e:
+            status["ChangeTracker"] = {"error": str(e)}
+        
         # ForumManager 状态（新增，可选）
         try:
             from app.services.https.ForumManager import ForumManager
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+领域对象内存基准：按数据库加载路径（from_document）批量重建 User / Match / Chatroom / Post，
+用 tracemalloc 统计每类对象常驻的字节数（含其持有的字符串、整数与ID集合），默认各 100k 个
+
+用法：
+    python tests/benchmark_object_memory.py [--count 100000]
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.objects.Post import Post
+from app.objects.User import User
+from app.services.https.UserManagement import UserManagement
+
+# 接近线上的ID形态：匹配/消息ID取自时间戳起算的序列，远超小整数缓存
+ID_BASE = 1_700_000_000_000_000
+MATCHES_PER_USER = 5
+MESSAGES_PER_CHATROOM = 20
+LIKES_PER_POST = 8
+
+
+def user_document(index, count):
+    return {
+        "_id": f"openid_{index}",
+        "user_name": f"user{index}",
+        "gender": 1 + index % 2,
+        "age": 20 + index % 30,
+        "target_gender": 2 - index % 2,
+        "user_personality_summary": f"summary of user {index}",
+        "match_ids": [ID_BASE + (index + offset) % count for offset in range(MATCHES_PER_USER)],
+        "blocked_user_ids": [f"openid_{(index + 7) % count}"],
+        "post_ids": [ID_BASE + index],
+        "liked_post_ids": [ID_BASE + (index + offset) % count for offset in range(1, 4)],
+    }
+
+
+def match_document(index, count):
+    return {
+        "_id": ID_BASE + index,
+        "user_id_1": f"openid_{index}",
+        "user_id_2": f"openid_{(index + 1) % count}",
+        "description_to_user_1": f"reason {index} for user 1",
+        "description_to_user_2": f"reason {index} for user 2",
+        "is_liked": False,
+        "match_score": index % 100,
+        "mutual_game_scores": {},
+        "chatroom_id": ID_BASE + index,
+        "match_time": "2025-01-01T00:00:00",
+    }
+
+
+def chatroom_document(index, count):
+    return {
+        "_id": ID_BASE + index,
+        "user1_id": f"openid_{index}",
+        "user2_id": f"openid_{(index + 1) % count}",
+        "message_ids": [ID_BASE + index * MESSAGES_PER_CHATROOM + offset for offset in range(MESSAGES_PER_CHATROOM)],
+        "match_id": ID_BASE + index,
+    }
+
+
+def post_document(index, count):
+    return {
+        "_id": ID_BASE + index,
+        "post_content": f"post {index}",
+        "post_type": "text",
+        "creator_user_id": f"openid_{index}",
+        "creator_user_name": f"user{index}",
+        "media_files": [],
+        "post_category": "",
+        "tags": ["tag"],
+        "like_count": LIKES_PER_POST,
+        "comment_count": 2,
+        "view_count": 0,
+        "liked_user_ids": [f"openid_{(index + offset) % count}" for offset in range(1, LIKES_PER_POST + 1)],
+        "comment_ids": [ID_BASE + index * 2, ID_BASE + index * 2 + 1],
+        "post_status": "published",
+        "created_at": None,
+        "updated_at": None,
+    }
+
+
+def measure(build, count):
+    """返回 build 产出的对象在其输入文档释放后仍常驻的字节数；对象本身保留到下一阶段结束"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build(count)
+    gc.collect()
+    return objects, tracemalloc.get_traced_memory()[0] - before
+
+
+def run(count):
+    manager = UserManagement()
+    for container in (manager.user_list, manager.female_user_list, manager.male_user_list):
+        container.clear()
+
+    tracemalloc.start()
+    users, user_bytes = measure(lambda n: [User.from_document(user_document(i, n)) for i in range(n)], count)
+    # 匹配与聊天室引用内存中的用户（与线上加载顺序一致）；登记用户列表不计入任何一类
+    for user in users:
+        manager.user_list[user.user_id] = user
+    users_by_id = manager.user_list
+    matches, match_bytes = measure(lambda n: [Match.from_document(match_document(i, n)) for i in range(n)], count)
+
+    def build_chatrooms(n):
+        chatrooms = []
+        for i in range(n):
+            document = chatroom_document(i, n)
+            chatrooms.append(Chatroom.from_document(document, users_by_id[document["user1_id"]], users_by_id[document["user2_id"]]))
+        return chatrooms
+    chatrooms, chatroom_bytes = measure(build_chatrooms, count)
+    posts, post_bytes = measure(lambda n: [Post.from_document(post_document(i, n)) for i in range(n)], count)
+    tracemalloc.stop()
+
+    manager.user_list.clear()
+    ChangeTracker.clear()
+    return {
+        "user": user_bytes / count,
+        "match": match_bytes / count,
+        "chatroom": chatroom_bytes / count,
+        "post": post_bytes / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000, help="每类对象的数量")
+    args = parser.parse_args()
+
+    report = run(args.count)
+    print(f"{'object':<10}{'bytes/object':>14}{'total MiB':>12}")
+    for name, per_object in report.items():
+        print(f"{name:<10}{per_object:>14.1f}{per_object * args.count / 2 ** 20:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -38,14 +38,14 @@ async def check_user_cache():
         
         # 特别检查1000000这个ID
         print(f"\n🔍 检查用户ID 1000000:")
-        user_1000000 = user_manager.get_user_instance(1000000)
+        user_1000000 = await user_manager.get_user_instance(1000000)
         if user_1000000:
             print(f"✅ 用户1000000存在: {user_1000000.telegram_user_name}, 性别: {user_1000000.gender}")
         else:
             print("❌ 用户1000000不存在")
             
         # 检查字符串版本
-        user_1000000_str = user_manager.get_user_instance("1000000")
+        user_1000000_str = await user_manager.get_user_instance("1000000")
         if user_1000000_str:
             print(f"✅ 用户'1000000'(字符串)存在: {user_1000000_str.telegram_user_name}")
         else:
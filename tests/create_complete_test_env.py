@@ -106,9 +106,9 @@ async def create_complete_test_environment():
                 user_data["id"], 
                 user_data["gender"]
             )
-            user_manager.edit_user_age(user_id, user_data["age"])
-            user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 设置为异性
-            user_manager.edit_summary(user_id, f"这是测试用户 {user_data['name']}")
+            await user_manager.edit_user_age(user_id, user_data["age"])
+            await user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 设置为异性
+            await user_manager.edit_summary(user_id, f"这是测试用户 {user_data['name']}")
             test_users.append(user_id)
             print(f"   ✅ 创建用户: {user_data['name']} (ID: {user_id}, 性别: {'男' if user_data['gender'] == 1 else '女'})")
         
@@ -148,7 +148,7 @@ async def create_complete_test_environment():
         # 验证match_ids是否正确保存
         print("   🔍 验证用户match_ids:")
         for user_id in test_users:
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 print(f"     用户 {user_id}: match_ids = {user.match_ids}")
         
@@ -64,7 +64,7 @@ async def fix_user_match_ids():
         # 更新用户的match_ids (内存和数据库)
         print("\n🔄 更新用户match_ids:")
         for user_id, match_ids in user_match_mapping.items():
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 # 更新内存
                 user.match_ids = list(set(match_ids))  # 去重
@@ -74,7 +74,7 @@ async def fix_user_match_ids():
                 await Database.update_one(
                     "users",
                     {"_id": user_id},
-                    {"$set": {"match_ids": user.match_ids}}
+                    {"$set": {"match_ids": list(user.match_ids)}}
                 )
                 print(f"   ✅ 用户 {user_id} 数据库已更新")
         
@@ -83,7 +83,7 @@ async def fix_user_match_ids():
         # 验证修复结果
         print("\n🔍 验证修复结果:")
         for user_id in test_user_ids:
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 db_user = await Database.find_one("users", {"_id": user_id})
                 memory_match_ids = set(user.match_ids)
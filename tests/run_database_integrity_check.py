@@ -90,6 +90,12 @@ async def main():
         print(f"    • 补充match_id的 Users: {result['updated_records']['users']}")
         print(f"    • 更新message_ids的 Chatrooms: {result['updated_records']['chatrooms']}")
         
+        # 扫描吞吐量
+        if result.get("throughput"):
+            print("  🚀 扫描吞吐量:")
+            for name, stats in result["throughput"].items():
+                print(f"    • {name}: {stats['scanned']} 个文档，{stats['elapsed']} 秒，{stats['docs_per_second']} 个/秒")
+        
         total_deleted = sum(result['deleted_records'].values())
         total_updated = sum(result['updated_records'].values())
         total_operations = total_deleted + total_updated
@@ -0,0 +1,50 @@
+"""
+AI对话历史测试：对话只写内存并登记脏数据，由自动保存一次性批量写回数据库
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.memory_backend import MemoryDatabase
+from app.services.https.AIResponseProcessor import AIResponseProcessor
+
+
+def test_conversation_is_written_once_by_the_flush():
+    processor = AIResponseProcessor()
+    processor.ai_chatrooms.clear()
+    processor.ai_messages.clear()
+    ChangeTracker.clear()
+    IdAllocator._sequences.pop("AI_message", None)
+
+    async def main():
+        await IdAllocator.initialize("AI_message", id_field="ai_message_id")
+        assert await processor.save_conversation_history("openid_a", "你好", "你好呀")
+
+        # 请求路径不直接写数据库
+        assert await Database.count_documents("AI_message") == 0
+        assert await Database.find_one("AI_chatroom", {"user_id": "openid_a"}) is None
+        assert (ChangeTracker.dirty_count("AI_message"), ChangeTracker.dirty_count("AI_chatroom")) == (2, 1)
+
+        await processor.save_to_database()
+        messages = await Database.find("AI_message", {})
+        chatroom = await Database.find_one("AI_chatroom", {"user_id": "openid_a"})
+        return messages, chatroom
+
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        messages, chatroom = asyncio.run(main())
+    finally:
+        Database.db = original_db
+        IdAllocator._sequences.pop("AI_message", None)
+
+    message_ids = processor.ai_chatrooms["openid_a"]
+    assert sorted(message["ai_message_id"] for message in messages) == sorted(message_ids)
+    assert chatroom["ai_message_ids"] == message_ids
+    assert ChangeTracker.dirty_count() == 0
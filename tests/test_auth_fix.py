@@ -30,7 +30,7 @@ async def test_authentication_fix():
             try:
                 # 这是修复后的逻辑
                 user_id_int = int(user_id_input)
-                user_instance = user_manager.get_user_instance(user_id_int)
+                user_instance = await user_manager.get_user_instance(user_id_int)
                 
                 if user_instance:
                     print(f"✅ 认证成功: {user_instance.telegram_user_name}")
@@ -40,7 +40,7 @@ async def test_authentication_fix():
             except (ValueError, TypeError) as e:
                 # 如果无法转换为整数，尝试直接使用原值
                 print(f"⚠️ 无法转换为整数: {e}")
-                user_instance = user_manager.get_user_instance(user_id_input)
+                user_instance = await user_manager.get_user_instance(user_id_input)
                 if user_instance:
                     print(f"✅ 认证成功(原值): {user_instance.telegram_user_name}")
                 else:
@@ -0,0 +1,96 @@
+"""
+Database.bulk_upsert 测试：验证分批、操作类型、失败主键的收集，以及按业务字段 upsert 时保留整数 _id
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.database import Database
+from app.core.memory_backend import MemoryDatabase
+
+
+class _Result:
+    def __init__(self, count):
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = count
+
+
+class _RecordingCollection:
+    """记录每次 bulk_write 调用的集合替身"""
+
+    def __init__(self, fail_index=None):
+        self.calls = []
+        self.fail_index = fail_index
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append((operations, ordered))
+        if self.fail_index is not None and self.fail_index < len(operations):
+            raise BulkWriteError({
+                "nUpserted": len(operations) - 1,
+                "writeErrors": [{"index": self.fail_index, "errmsg": "boom"}],
+            })
+        return _Result(len(operations))
+
+
+def _run(collection, *args, **kwargs):
+    original_db = Database.db
+    Database.db = {"things": collection}
+    try:
+        return asyncio.run(Database.bulk_upsert("things", *args, **kwargs))
+    finally:
+        Database.db = original_db
+
+
+def test_batches_are_unordered_updates_by_default():
+    collection = _RecordingCollection()
+    docs = [{"_id": i, "value": i} for i in range(5)]
+
+    result = _run(collection, docs, batch_size=2)
+
+    assert [len(ops) for ops, _ in collection.calls] == [2, 2, 1]
+    assert all(ordered is False for _, ordered in collection.calls)
+    assert all(isinstance(op, UpdateOne) for ops, _ in collection.calls for op in ops)
+    assert result["upserted"] == 5
+    assert result["failed_keys"] == []
+
+
+def test_replace_uses_replace_one():
+    collection = _RecordingCollection()
+
+    _run(collection, [{"_id": 1, "value": 1}], replace=True)
+
+    assert isinstance(collection.calls[0][0][0], ReplaceOne)
+
+
+def test_write_errors_report_failed_keys():
+    collection = _RecordingCollection(fail_index=1)
+    docs = [{"session_id": f"s{i}", "value": i} for i in range(3)]
+
+    result = _run(collection, docs, key="session_id")
+
+    assert result["failed_keys"] == ["s1"]
+    assert result["upserted"] == 2
+
+
+def test_business_key_upsert_keeps_integer_id():
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+
+    async def main():
+        await Database.bulk_upsert("AI_message", [{"_id": 7, "ai_message_id": 7, "content": "hi"}], key="ai_message_id")
+        await Database.bulk_upsert("AI_message", [{"_id": 7, "ai_message_id": 7, "content": "edited"}], key="ai_message_id")
+        return await Database.find("AI_message", {})
+
+    try:
+        documents = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert [(document["_id"], document["content"]) for document in documents] == [(7, "edited")]
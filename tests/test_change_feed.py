@@ -0,0 +1,263 @@
+"""
+跨进程变更订阅测试：远端写入在本进程原地应用、与本地脏实体三方合并、依赖未就绪时重试，
+多个 uvicorn worker 之间的写入可见性（有界延迟），以及非领导者 worker 不会谎报全量检查已执行
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+import httpx
+import pytest
+
+from app.core.change_feed import ChangeFeed, FileFeedTransport
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.core.memory_backend import MemoryDatabase
+from app.core.workers import WorkerCoordinator
+from app.objects.Chatroom import Chatroom
+from app.objects.User import User
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.ReferenceIndex import ReferenceIndex
+from app.services.https.UserManagement import UserManagement
+
+# 多 worker 测试：写入后所有 worker 可见的时限（秒）
+MAX_VISIBILITY_LAG = 3.0
+
+
+def _setup_users(*user_ids):
+    ChangeTracker.clear()
+    manager = UserManagement()
+    for container in (manager.user_list, manager.female_user_list, manager.male_user_list):
+        container.clear()
+    for user_id in user_ids:
+        user = User(telegram_user_name=user_id, gender=1, user_id=user_id)
+        manager.user_list[user_id] = user
+        manager.female_user_list[user_id] = user
+    ChangeTracker.clear()
+    return manager
+
+
+def _run_as_workers(remote_writes, directory):
+    """remote_writes 以 "remote" 进程的身份写入并发布，随后以 "local" 进程的身份拉取并应用"""
+    local = FileFeedTransport(directory, "local")
+    remote = FileFeedTransport(directory, "remote")
+
+    async def main():
+        ChangeFeed.subscribe(remote)
+        await remote_writes()
+        await ChangeFeed.pump()
+        ChangeFeed.subscribe(local)
+        return await ChangeFeed.pump()
+
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        return asyncio.run(main())
+    finally:
+        ChangeFeed._transport = None
+        ChangeTracker.capture_bases = False
+        Database.db = original_db
+
+
+def test_remote_user_writes_apply_in_place(tmp_path):
+    manager = _setup_users("openid_0", "openid_1", "openid_2")
+    alice = manager.user_list["openid_0"]
+    # 本进程尚未写回的修改与远端写入合并；没有共同祖先时两边都有的字段保留本地的值
+    manager.user_list["openid_2"].age = 20
+
+    async def remote_writes():
+        await Database.bulk_upsert("users", [
+            {"_id": "openid_0", "user_name": "alice", "gender": 1, "match_ids": [7]},
+            {"_id": "openid_2", "user_name": "carol", "gender": 1},
+            {"_id": "openid_9", "user_name": "bob", "gender": 2},
+        ])
+        await Database.update_one("users", {"_id": "openid_0"}, {"$set": {"age": 30}})
+        await Database.delete_one("users", {"_id": "openid_1"})
+
+    _run_as_workers(remote_writes, tmp_path)
+
+    assert manager.user_list["openid_0"] is alice
+    assert (alice.telegram_user_name, alice.age, alice.match_ids) == ("alice", 30, [7])
+    assert not alice.is_dirty
+    # 原地更新后的容器仍然追踪修改
+    alice.match_ids.append(8)
+    assert alice.is_dirty
+    assert manager.male_user_list["openid_9"].telegram_user_name == "bob"
+    assert "openid_1" not in manager.user_list and "openid_1" not in manager.female_user_list
+    carol = manager.user_list["openid_2"]
+    assert (carol.telegram_user_name, carol.age) == ("openid_2", 20)
+    assert carol.is_dirty
+    assert (ChangeFeed._stats["merged"], ChangeFeed._stats["skipped_dirty"]) == (1, 0)
+
+
+def test_concurrent_edits_on_a_dirty_user_are_merged(tmp_path):
+    manager = _setup_users("openid_0")
+    alice = manager.user_list["openid_0"]
+    alice.match_ids.extend([1, 2])
+    ChangeTracker.clear()
+    local = FileFeedTransport(tmp_path, "local")
+    remote = FileFeedTransport(tmp_path, "remote")
+
+    async def main():
+        await Database.bulk_upsert("users", [alice.to_document()])
+        ChangeFeed.subscribe(remote)
+        # 本进程：追加匹配 3、移除匹配 1，尚未写回
+        alice.match_ids.append(3)
+        alice.match_ids.remove(1)
+        # 另一个进程：同时追加匹配 4 并修改年龄
+        await Database.update_one("users", {"_id": "openid_0"}, {"$push": {"match_ids": 4}, "$set": {"age": 30}})
+        await ChangeFeed.pump()
+        ChangeFeed.subscribe(local)
+        await ChangeFeed.pump()
+
+        assert list(alice.match_ids) == [2, 3, 4] and alice.age == 30
+        assert alice.is_dirty
+        # 本进程的刷新写回合并结果，两边的修改都不丢失
+        await manager.save_to_database()
+        return await Database.find_one("users", {"_id": "openid_0"})
+
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        document = asyncio.run(main())
+    finally:
+        ChangeFeed._transport = None
+        ChangeTracker.capture_bases = False
+        Database.db = original_db
+
+    assert (document["match_ids"], document["age"]) == ([2, 3, 4], 30)
+    assert ChangeFeed._stats["merged"] == 1
+
+
+def test_chatroom_waits_for_its_users(tmp_path):
+    manager = _setup_users("openid_0")
+    chatroom_manager = ChatroomManager()
+    chatroom_manager.chatrooms.clear()
+    index = ReferenceIndex()
+    index.user_chatrooms.clear()
+    index.match_chatrooms.clear()
+    Chatroom._initialized = True
+    transport = FileFeedTransport(tmp_path, "local")
+    remote = FileFeedTransport(tmp_path, "remote")
+
+    async def main():
+        ChangeFeed.subscribe(remote)
+        # 聊天室先于其中一个用户写回数据库
+        await Database.bulk_upsert("chatrooms", [{"_id": 5, "user1_id": "openid_0", "user2_id": "openid_3", "message_ids": [], "match_id": None}])
+        await ChangeFeed.pump()
+        ChangeFeed.subscribe(transport)
+        await ChangeFeed.pump()
+        assert 5 not in chatroom_manager.chatrooms
+        assert ChangeFeed.get_status()["deferred"] == 1
+
+        # 切换身份但保留本进程等待重试的事件
+        ChangeFeed._transport = remote
+        await Database.bulk_upsert("users", [{"_id": "openid_3", "user_name": "dave", "gender": 2}])
+        await ChangeFeed.pump()
+        ChangeFeed._transport = transport
+        await ChangeFeed.pump()
+
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        asyncio.run(main())
+    finally:
+        ChangeFeed._transport = None
+        ChangeTracker.capture_bases = False
+        Database.db = original_db
+
+    chatroom = chatroom_manager.chatrooms[5]
+    assert chatroom.user2 is manager.user_list["openid_3"]
+    assert index.chatrooms_of("openid_3") == {5}
+    assert ChangeFeed._deferred == {}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_write_in_one_worker_is_visible_in_the_others():
+    workers = 3
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "DB_BACKEND": "memory",
+            "WORKERS": str(workers),
+            "WORKER_STATE_DIR": f"{directory}/workers",
+            "CHANGE_FEED_DIR": f"{directory}/feed",
+            "JOURNAL_DIR": f"{directory}/journal",
+            "RECOVERY_DIR": f"{directory}/recovery",
+            "SNAPSHOT_ENABLED": "false",
+            "FLUSH_INTERVAL_USERS": "0.2",
+            "FLUSH_POLL_INTERVAL": "0.1",
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.server_run:app", "--port", str(port), "--workers", str(workers)],
+            cwd=ROOT_PATH, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}"
+            # 等到每个 worker 都完成启动（按响应头中的进程标识区分）
+            ready = set()
+            deadline = time.time() + 60
+            while len(ready) < workers and time.time() < deadline:
+                try:
+                    # 每次新建连接，让请求分散到不同的 worker
+                    ready.add(httpx.get(f"{url}/").headers["x-worker-id"])
+                except httpx.HTTPError:
+                    time.sleep(0.2)
+            if len(ready) < workers:
+                pytest.skip("uvicorn workers did not start")
+
+            response = httpx.post(f"{url}/api/v1/UserManagement/create_new_user", json={
+                "user_name": "alice", "user_id": "openid_feed", "gender": 1,
+            })
+            assert response.status_code == 200
+            written_at = time.time()
+            writer = response.headers["x-worker-id"]
+
+            visible_after = {}
+            while len(visible_after) < workers and time.time() - written_at < MAX_VISIBILITY_LAG * 2:
+                response = httpx.post(f"{url}/api/v1/UserManagement/get_user_info_with_user_id", json={"user_id": "openid_feed"})
+                worker = response.headers["x-worker-id"]
+                if response.status_code == 200 and worker not in visible_after:
+                    assert response.json()["user_name"] == "alice"
+                    visible_after[worker] = time.time() - written_at
+                time.sleep(0.01)
+
+            assert set(visible_after) == ready
+            assert writer in visible_after
+            assert max(visible_after.values()) < MAX_VISIBILITY_LAG
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def test_full_integrity_check_on_non_leader_reports_not_run(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.core.flush_scheduler import FlushScheduler
+    from app.server_run import app
+
+    monkeypatch.setattr(WorkerCoordinator, "is_leader", classmethod(lambda cls: False))
+
+    async def must_not_run(self, name):
+        raise AssertionError(f"{name} should not run on a non-leader worker")
+
+    monkeypatch.setattr(FlushScheduler, "flush", must_not_run)
+
+    # 不进入 lifespan：只验证接口本身
+    response = TestClient(app).post("/integrity_check", params={"mode": "full"})
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+    assert response.json()["ran"] is False
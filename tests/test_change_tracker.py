@@ -0,0 +1,89 @@
+"""
+变更追踪层测试：验证领域对象在字段变更时会登记为脏对象
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker, TrackedIdArray, TrackedList
+from app.objects.Match import Match
+from app.objects.User import User
+
+
+def setup_function():
+    ChangeTracker.clear()
+
+
+def test_new_user_is_dirty_until_marked_clean():
+    user = User(telegram_user_name="alice", gender=1, user_id="openid_a")
+    assert ChangeTracker.is_dirty("users", "openid_a")
+
+    user.mark_clean()
+    assert not user.is_dirty
+    assert ChangeTracker.dirty_count("users") == 0
+
+
+def test_attribute_assignment_marks_dirty():
+    user = User(telegram_user_name="bob", gender=2, user_id="openid_b")
+    user.mark_clean()
+
+    user.edit_data(age=21)
+    assert user.is_dirty
+
+
+def test_in_place_list_mutation_marks_dirty():
+    user = User(telegram_user_name="carol", gender=1, user_id="openid_c")
+    user.mark_clean()
+
+    user.match_ids.append(42)
+    assert user.is_dirty
+    assert user.to_document()["match_ids"] == [42]
+
+
+def test_pop_dirty_drains_collection():
+    first = User(user_id="u1")
+    second = User(user_id="u2")
+
+    drained = asyncio.run(ChangeTracker.pop_dirty("users"))
+    assert drained == {"u1": first, "u2": second}
+    assert ChangeTracker.dirty_count("users") == 0
+
+
+def test_reassigning_key_moves_registration():
+    user = User(user_id="temp")
+    user.user_id = "final"
+
+    assert not ChangeTracker.is_dirty("users", "temp")
+    assert ChangeTracker.is_dirty("users", "final")
+
+
+def test_discard_ignores_other_instances():
+    stale = User(user_id="same")
+    fresh = User(user_id="same")
+
+    stale.mark_clean()
+    assert ChangeTracker.is_dirty("users", "same")
+    assert fresh.is_dirty
+
+
+def test_objects_are_slotted_with_compact_id_collections():
+    user = User.from_document({"_id": "".join(["openid_", "d"]), "match_ids": [2 ** 60, 7], "blocked_user_ids": ["".join(["openid_", "e"])]})
+    match = Match.from_document({"_id": 2 ** 60, "user_id_1": "".join(["openid_", "d"]), "user_id_2": "openid_e"})
+    assert not hasattr(user, "__dict__") and not hasattr(match, "__dict__")
+
+    # 同一用户ID在各对象间共享一个字符串
+    assert match.user_id_1 is user.user_id
+    assert user.blocked_user_ids[0] is match.user_id_2
+
+    assert type(user.match_ids) is TrackedIdArray
+    assert user.match_ids == [2 ** 60, 7] and not user.is_dirty
+    user.match_ids.remove(7)
+    assert user.is_dirty
+    assert user.to_document()["match_ids"] == [2 ** 60]
+
+    # 历史数据中的非整数ID仍按列表保存
+    legacy = User.from_document({"_id": "openid_f", "match_ids": ["7"]})
+    assert type(legacy.match_ids) is TrackedList
@@ -0,0 +1,98 @@
+"""
+文档编解码层测试：验证快速路径、声明字段转换、递归回退以及直接解码为领域对象
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+from bson import ObjectId
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker
+from app.core.codec import CodecRegistry
+from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.objects.User import User
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection=None):
+        return _Cursor(self.documents)
+
+
+def test_codec_paths():
+    document = {"_id": "openid_a", "match_ids": [1, 2]}
+    assert CodecRegistry.get("users").decode(document) is document
+
+    oid = ObjectId()
+    nested = ObjectId()
+    decoded = CodecRegistry.get("AI_message").decode({"_id": oid, "ai_message_id": 3})
+    assert decoded == {"_id": str(oid), "ai_message_id": 3}
+
+    # 未声明的集合回退到递归转换
+    fallback = CodecRegistry.get("some_unknown_collection").decode({"_id": oid, "inner": [{"ref": nested}]})
+    assert fallback == {"_id": str(oid), "inner": [{"ref": str(nested)}]}
+
+
+def test_iter_decodes_straight_into_domain_objects():
+    ChangeTracker.clear()
+    next_match_id = IdAllocator.next_id("matches")
+    original_db = Database.db
+    Database.db = {
+        "users": _FakeCollection([
+            {"_id": "openid_a", "user_name": "alice", "gender": 1, "match_ids": [7]},
+            {"_id": "openid_b", "telegram_user_name": "bob", "gender": 2},
+        ]),
+        "matches": _FakeCollection([
+            {"_id": 7, "user_id_1": "openid_a", "user_id_2": "openid_b", "match_score": 80},
+            {"user_id_1": "broken"},  # 缺少 _id 的文档被跳过
+        ]),
+    }
+
+    async def main():
+        users = [user async for batch in Database.iter("users", as_objects=True) for user in batch]
+        matches = [match async for batch in Database.iter("matches", as_objects=True) for match in batch]
+        return users, matches
+
+    try:
+        users, matches = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert [type(user) for user in users] == [User, User]
+    assert [user.telegram_user_name for user in users] == ["alice", "bob"]
+    assert users[1].match_ids == []
+    assert [match.match_id for match in matches] == [7]
+    assert matches[0].is_liked is False and matches[0].chatroom is None
+    # 解码不消耗ID序列、不登记脏对象，但容器仍可追踪
+    assert IdAllocator.next_id("matches") == next_match_id + 1
+    assert ChangeTracker.dirty_count("users") == 0 and ChangeTracker.dirty_count("matches") == 0
+    users[0].match_ids.append(8)
+    assert users[0].is_dirty
+    ChangeTracker.clear()
@@ -0,0 +1,151 @@
+"""
+数据库审计测试：验证紧凑主键集合、流式投影扫描以及按批 $in 删除 / $pull
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.database import Database
+from app.services.https.DatabaseAudit import CompactIdSet, DatabaseAudit
+
+
+class _Result:
+    def __init__(self, count):
+        self.deleted_count = count
+        self.modified_count = count
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+
+class _FakeCollection:
+    """只支持审计用到的查询形式：{}、{"_id": {"$in": ...}}、{"<数组>.0": {"$exists": True}}"""
+
+    def __init__(self, documents):
+        self.documents = {document["_id"]: dict(document) for document in documents}
+        self.calls = []
+
+    def _match(self, query):
+        for document in self.documents.values():
+            if "_id" in query and document["_id"] not in query["_id"]["$in"]:
+                continue
+            array_fields = [key[:-2] for key in query if key.endswith(".0")]
+            if any(not document.get(field) for field in array_fields):
+                continue
+            yield document
+
+    def find(self, query, projection=None):
+        fields = set(projection or {}) | {"_id"}
+        return _Cursor([
+            {key: value for key, value in document.items() if not projection or key in fields}
+            for document in self._match(query)
+        ])
+
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        ids = [document["_id"] for document in self._match(query)]
+        for _id in ids:
+            del self.documents[_id]
+        return _Result(len(ids))
+
+    async def update_many(self, query, update):
+        self.calls.append(("update_many", query))
+        targets = list(self._match(query))
+        for document in targets:
+            for field, condition in update.get("$pull", {}).items():
+                document[field] = [value for value in document.get(field, []) if value not in condition["$in"]]
+        return _Result(len(targets))
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query))
+        document = self.documents[query["_id"]]
+        for field, values in update.get("$addToSet", {}).items():
+            document.setdefault(field, []).extend(v for v in values["$each"] if v not in document[field])
+        return _Result(1)
+
+
+def test_compact_id_set_handles_ints_and_strings():
+    ids = CompactIdSet([1, 2, 5, "openid_a"])
+    ids.add(3)  # 乱序追加
+    ids.add(5)
+
+    assert len(ids) == 5
+    assert 3 in ids and 5 in ids and 4 not in ids
+    assert "openid_a" in ids and "openid_b" not in ids
+
+
+def test_audit_streams_and_batches_cleanup():
+    collections = {
+        "users": _FakeCollection([
+            {"_id": "a", "match_ids": [1, 99]},
+            {"_id": "b", "match_ids": []},
+        ]),
+        "matches": _FakeCollection([
+            {"_id": 1, "user_id_1": "a", "user_id_2": "b"},
+            {"_id": 2, "user_id_1": "a", "user_id_2": "gone"},
+        ]),
+        "chatrooms": _FakeCollection([
+            {"_id": 10, "user1_id": "a", "user2_id": "b", "match_id": 1, "message_ids": [100, 101, 102]},
+            {"_id": 11, "user1_id": "a", "user2_id": "b", "match_id": 2, "message_ids": []},
+        ]),
+        "messages": _FakeCollection([
+            {"_id": 100, "message_sender_id": "a", "message_receiver_id": "b", "chatroom_id": 10},
+            {"_id": 101, "message_sender_id": "gone", "message_receiver_id": "b", "chatroom_id": 10},
+            {"_id": 103, "message_sender_id": "a", "message_receiver_id": "b", "chatroom_id": 11},
+        ]),
+    }
+    original_db = Database.db
+    Database.db = collections
+
+    async def main():
+        audit = DatabaseAudit(batch_size=2, report_every=0)
+        results = [
+            await audit.check_matches(),
+            await audit.check_user_match_ids(),
+            await audit.check_chatrooms(),
+            await audit.check_messages(),
+            await audit.check_chatroom_message_ids(),
+        ]
+        return audit, results
+
+    try:
+        audit, results = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert results[0] == {"success": True, "deleted": {"matches": 1}, "updated_users": 1}
+    assert set(collections["matches"].documents) == {1}
+    assert collections["users"].documents["b"]["match_ids"] == [1]
+    assert collections["users"].documents["a"]["match_ids"] == [1]
+    assert set(collections["chatrooms"].documents) == {10}
+    assert set(collections["messages"].documents) == {100}
+    assert collections["chatrooms"].documents[10]["message_ids"] == [100]
+    # 孤儿消息通过一次 $in 批量删除，而不是逐条 delete_one
+    assert [call for call in collections["messages"].calls if call[0] == "delete_many"] == [
+        ("delete_many", {"_id": {"$in": [101, 103]}})
+    ]
+    assert audit.throughput["messages"]["scanned"] == 3
@@ -0,0 +1,78 @@
+"""
+Database.iter 测试：验证按批产出、游标参数以及预取文档的单批路径
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from bson import ObjectId
+
+from app.core.database import Database
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.sorted_by = None
+        self.cursor_batch_size = None
+
+    def sort(self, sort):
+        self.sorted_by = sort
+        return self
+
+    def batch_size(self, size):
+        self.cursor_batch_size = size
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Collection:
+    def __init__(self, documents):
+        self.documents = documents
+        self.cursor = None
+
+    def find(self, query, projection=None):
+        self.cursor = _Cursor(self.documents)
+        return self.cursor
+
+
+def _collect(generator):
+    async def main():
+        return [batch async for batch in generator]
+
+    return asyncio.run(main())
+
+
+def test_iter_yields_batches_and_converts_object_ids():
+    oid = ObjectId()
+    collection = _Collection([{"_id": oid}] + [{"_id": index} for index in range(4)])
+    original_db = Database.db
+    Database.db = {"things": collection}
+    try:
+        batches = _collect(Database.iter("things", batch_size=2, sort=[("_id", 1)]))
+    finally:
+        Database.db = original_db
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[0][0]["_id"] == str(oid)
+    assert collection.cursor.cursor_batch_size == 2
+    assert collection.cursor.sorted_by == [("_id", 1)]
+
+
+def test_iter_documents_uses_prefetched_documents_as_one_batch():
+    documents = [{"_id": 1}, {"_id": 2}]
+
+    assert _collect(Database.iter_documents("things", documents)) == [documents]
+    assert _collect(Database.iter_documents("things", [])) == []
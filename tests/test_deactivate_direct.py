@@ -60,9 +60,9 @@ async def test_deactivate_user():
         
         # 验证初始状态
         print("\n6. 验证初始状态...")
-        user1 = user_manager.get_user_instance(user1_id)
-        user2 = user_manager.get_user_instance(user2_id)
-        user3 = user_manager.get_user_instance(user3_id)
+        user1 = await user_manager.get_user_instance(user1_id)
+        user2 = await user_manager.get_user_instance(user2_id)
+        user3 = await user_manager.get_user_instance(user3_id)
         
         print(f"用户1 match_ids: {user1.match_ids}")
         print(f"用户2 match_ids: {user2.match_ids}")
@@ -83,15 +83,15 @@ async def test_deactivate_user():
         print("\n8. 验证注销后的状态...")
         
         # 检查用户1是否被删除
-        user1_after = user_manager.get_user_instance(user1_id)
+        user1_after = await user_manager.get_user_instance(user1_id)
         if user1_after is None:
             print("✓ 用户1已成功删除")
         else:
             print("✗ 用户1仍然存在")
         
         # 检查用户2和用户3的match_ids是否已清理
-        user2_after = user_manager.get_user_instance(user2_id)
-        user3_after = user_manager.get_user_instance(user3_id)
+        user2_after = await user_manager.get_user_instance(user2_id)
+        user3_after = await user_manager.get_user_instance(user3_id)
         
         print(f"注销后 - 用户2 match_ids: {user2_after.match_ids}")
         print(f"注销后 - 用户3 match_ids: {user3_after.match_ids}")
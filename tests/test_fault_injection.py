@@ -0,0 +1,250 @@
+"""
+数据库故障注入测试：规则匹配，以及自动保存、WebSocket 私聊处理与注销用户在高延迟/写失败/超时下的请求耗时与事件循环健康度
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from pymongo.errors import AutoReconnect, NetworkTimeout
+
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database, FaultInjector, FaultRule
+from app.core.flush_scheduler import FlushScheduler
+from app.core.memory_backend import MemoryDatabase
+from app.core.metrics import Metrics
+from app.objects.Chatroom import Chatroom
+from app.objects.Message import Message
+from app.objects.User import User
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.ReferenceIndex import ReferenceIndex
+from app.services.https.UserManagement import UserManagement
+from app.WebSocketsService.MessageConnectionHandler import MessageConnectionHandler
+
+# 事件循环健康度：心跳任务相对计划唤醒时间的最大滞后
+MAX_LOOP_LAG = 0.05
+
+
+class _LoopMonitor:
+    """每 interval 秒醒来一次，记录实际唤醒相对预期的最大滞后"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - started - self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+class _FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+def _run(main, rules, seed=7):
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    FaultInjector.configure(rules, seed=seed)
+    Metrics.clear()
+    try:
+        return asyncio.run(main())
+    finally:
+        FaultInjector.clear()
+        Database.db = original_db
+
+
+def _setup_users(count):
+    ChangeTracker.clear()
+    manager = UserManagement()
+    for container in (manager.user_list, manager.female_user_list, manager.male_user_list):
+        container.clear()
+    for index in range(count):
+        user = User(telegram_user_name=f"user{index}", gender=1 + index % 2, user_id=f"openid_{index}")
+        manager.user_list[user.user_id] = user
+    return manager
+
+
+def _setup_chatroom():
+    manager = _setup_users(2)
+    alice, bob = manager.user_list["openid_0"], manager.user_list["openid_1"]
+    chatroom_manager = ChatroomManager()
+    chatroom_manager.chatrooms.clear()
+    Chatroom._initialized = True
+    Message._initialized = True
+    chatroom = Chatroom(alice, bob, 1)
+    chatroom_manager.chatrooms[chatroom.chatroom_id] = chatroom
+    return chatroom
+
+
+def test_most_specific_rule_applies():
+    FaultInjector.configure([
+        {"latency": 0.001},
+        {"operation": "bulk_write", "error_rate": 1.0},
+        {"collection": "users", "operation": "bulk_write", "timeout_rate": 1.0, "timeout": 0.01},
+    ])
+    try:
+        assert FaultInjector.rule_for("posts", "find_one").latency == 0.001
+        assert FaultInjector.rule_for("posts", "bulk_write").error_rate == 1.0
+        assert FaultInjector.rule_for("users", "bulk_write").timeout_rate == 1.0
+    finally:
+        FaultInjector.clear()
+    assert FaultInjector.rule_for("users", "bulk_write") is None
+
+    try:
+        FaultRule(operation="bulk_upsert")
+        assert False, "facade operation names are not driver operations"
+    except ValueError:
+        pass
+
+
+def test_injected_errors_and_timeouts_surface_as_driver_errors():
+    async def main():
+        try:
+            await Database.find("posts", {})
+            assert False
+        except NetworkTimeout:
+            pass
+        try:
+            await Database.update_one("users", {"_id": "a"}, {"$set": {"x": 1}})
+            assert False
+        except AutoReconnect:
+            pass
+        # 无序批量写入的失败由门面转成 failed_keys
+        result = await Database.bulk_upsert("users", [{"_id": "a"}])
+        assert result["failed_keys"] == ["a"]
+
+    _run(main, [
+        {"collection": "posts", "operation": "find", "timeout_rate": 1.0, "timeout": 0.01},
+        {"collection": "users", "error_rate": 1.0},
+    ])
+    faults = Metrics.get_status()["counters"]["db_injected_faults_total"]
+    assert {item["fault"] for item in faults} == {"timeout", "error"}
+    errors = {item["operation"] for item in Metrics.get_status()["counters"]["db_operation_errors_total"]}
+    assert errors == {"find", "update_one"}
+
+
+def test_autosave_keeps_dirty_users_when_writes_fail():
+    manager = _setup_users(50)
+    FlushScheduler._instance = None
+    scheduler = FlushScheduler()
+    scheduler.register("UserManagement", manager.save_to_database, 10, ("users",))
+
+    async def main():
+        request_latencies = []
+        with _LoopMonitor() as monitor:
+            flush = asyncio.ensure_future(scheduler.flush("UserManagement"))
+            # 自动保存等待数据库期间，读内存的请求不应被拖慢
+            while not flush.done():
+                started = time.perf_counter()
+                await asyncio.sleep(0)
+                await manager.get_user_info_with_user_id("openid_0")
+                request_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.005)
+            flushed = await flush
+        assert flushed is False
+        assert ChangeTracker.dirty_count("users") == 50
+        assert max(request_latencies) < MAX_LOOP_LAG
+        assert monitor.max_lag < MAX_LOOP_LAG
+
+        # 故障解除后的下一次刷新写回全部用户
+        FaultInjector.clear()
+        assert await scheduler.flush("UserManagement") is True
+        assert ChangeTracker.dirty_count("users") == 0
+        assert await Database.count_documents("users") == 50
+
+    _run(main, [{"collection": "users", "operation": "bulk_write", "latency": 0.1, "error_rate": 1.0}])
+
+
+def test_private_messages_under_p99_latency():
+    chatroom = _setup_chatroom()
+
+    async def send(index):
+        websocket = _FakeWebSocket()
+        handler = MessageConnectionHandler(websocket)
+        handler.user_id = "openid_0" if index % 2 == 0 else "openid_1"
+        started = time.perf_counter()
+        await handler.handle_private_message({
+            "target_user_id": "openid_1" if index % 2 == 0 else "openid_0",
+            "chatroom_id": chatroom.chatroom_id,
+            "content": f"hello {index}",
+        })
+        return time.perf_counter() - started, websocket.sent
+
+    async def main():
+        with _LoopMonitor() as monitor:
+            results = await asyncio.gather(*(send(index) for index in range(40)))
+        return results, monitor.max_lag
+
+    # 每次调用约 2ms，5% 的调用额外 500ms（p99 抬升到 500ms 量级）
+    results, max_lag = _run(main, [{"latency": 0.002, "tail_rate": 0.05, "tail_latency": 0.5}])
+    latencies = [latency for latency, _ in results]
+    assert any(item["fault"] == "tail_latency" for item in Metrics.get_status()["counters"]["db_injected_faults_total"])
+    assert max(latencies) >= 0.5
+    assert all(sent[-1]["type"] == "message_status" and sent[-1]["saved_to_database"] for _, sent in results)
+    assert len(chatroom.message_ids) == 40
+    # 每条消息 3 次数据库调用（查重、插入、更新聊天室），最坏情况各命中一次长尾
+    assert max(latencies) < 3 * 0.55
+    assert statistics.median(latencies) < 0.1
+    assert max_lag < MAX_LOOP_LAG
+
+
+def test_private_message_times_out_without_partial_state():
+    chatroom = _setup_chatroom()
+    websocket = _FakeWebSocket()
+    handler = MessageConnectionHandler(websocket)
+    handler.user_id = "openid_0"
+
+    async def main():
+        started = time.perf_counter()
+        with _LoopMonitor() as monitor:
+            await handler.handle_private_message({
+                "target_user_id": "openid_1", "chatroom_id": chatroom.chatroom_id, "content": "hi",
+            })
+        return time.perf_counter() - started, monitor.max_lag
+
+    elapsed, max_lag = _run(main, [{"collection": "messages", "operation": "insert_one", "timeout_rate": 1.0, "timeout": 0.2}])
+    assert websocket.sent[-1]["saved_to_database"] is False
+    assert chatroom.message_ids == []
+    assert elapsed < 0.2 + 0.1
+    assert max_lag < MAX_LOOP_LAG
+
+
+def test_deactivate_user_reports_failure_within_timeout():
+    manager = _setup_users(2)
+    index = ReferenceIndex()
+    index.user_matches.clear()
+    index.user_chatrooms.clear()
+    index.match_chatrooms.clear()
+
+    async def main():
+        started = time.perf_counter()
+        with _LoopMonitor() as monitor:
+            success = await manager.deactivate_user("openid_0")
+        return success, time.perf_counter() - started, monitor.max_lag
+
+    user = manager.user_list["openid_0"]
+    success, elapsed, max_lag = _run(main, [{"collection": "users", "operation": "delete_one", "timeout_rate": 1.0, "timeout": 0.2}])
+    assert success is False
+    assert elapsed < 0.2 + 0.1
+    assert max_lag < MAX_LOOP_LAG
+    # 数据库删除超时，用户仍留在内存中，与数据库保持一致
+    assert manager.peek_user_instance("openid_0") is user
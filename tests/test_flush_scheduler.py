@@ -0,0 +1,182 @@
+"""
+刷新调度器测试：验证并发上限、同一管理器不重叠以及刷新统计，
+以及停机刷新只保留未按时写回的集合的溢写文件
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.config import settings
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.core.flush_scheduler import FlushScheduler
+from app.core.memory_backend import MemoryDatabase
+from app.objects.Match import Match
+from app.objects.User import User
+from app.services.https.MatchManager import MatchManager
+from app.services.https.UserManagement import UserManagement
+
+
+def _new_scheduler(max_concurrency):
+    FlushScheduler._instance = None
+    scheduler = FlushScheduler()
+    scheduler.max_concurrency = max_concurrency
+    return scheduler
+
+
+def test_global_concurrency_cap():
+    scheduler = _new_scheduler(2)
+    active = {"now": 0, "peak": 0}
+
+    async def slow_flush():
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return True
+
+    for index in range(5):
+        scheduler.register(f"manager_{index}", slow_flush, 10)
+
+    results = asyncio.run(scheduler.flush_all())
+
+    assert all(results.values())
+    assert active["peak"] == 2
+
+
+def test_same_manager_never_overlaps():
+    scheduler = _new_scheduler(4)
+    state = {"running": False, "overlapped": False}
+
+    async def flush():
+        if state["running"]:
+            state["overlapped"] = True
+        state["running"] = True
+        await asyncio.sleep(0.01)
+        state["running"] = False
+        return True
+
+    scheduler.register("users", flush, 10)
+
+    async def main():
+        await asyncio.gather(*(scheduler.flush("users") for _ in range(3)))
+
+    asyncio.run(main())
+
+    assert not state["overlapped"]
+    assert scheduler.get_status()["jobs"]["users"]["runs"] == 3
+
+
+def test_failures_are_recorded():
+    scheduler = _new_scheduler(1)
+
+    async def broken_flush():
+        raise RuntimeError("mongo down")
+
+    scheduler.register("forum", broken_flush, 10)
+    assert asyncio.run(scheduler.flush("forum")) is False
+
+    job_status = scheduler.get_status()["jobs"]["forum"]
+    assert job_status["failures"] == 1
+    assert job_status["last_success"] is False
+    assert job_status["last_duration"] is not None
+    assert job_status["last_finished_at"] is not None
+
+
+def test_flush_all_deadline_marks_unfinished_jobs():
+    scheduler = _new_scheduler(4)
+
+    async def fast_flush():
+        return True
+
+    async def stuck_flush():
+        await asyncio.sleep(10)
+        return True
+
+    scheduler.register("fast", fast_flush, 10)
+    scheduler.register("stuck", stuck_flush, 10)
+
+    results = asyncio.run(scheduler.flush_all(timeout=0.05))
+
+    assert results == {"fast": True, "stuck": None}
+    assert not scheduler.jobs["stuck"].lock.locked()
+
+
+def test_adaptive_decision_threshold_age_and_backoff():
+    from app.core.change_tracker import ChangeTracker
+
+    ChangeTracker.clear()
+    scheduler = _new_scheduler(2)
+    job = scheduler.register("things", lambda: None, 10, ("things",))
+    job.dirty_threshold = 3
+
+    # 没有脏对象时不刷新
+    assert job.decide() is None
+
+    ChangeTracker.mark_dirty("things", 1)
+    assert job.decide() is None
+
+    # 最早的脏对象超过最长等待时间
+    ChangeTracker._dirty_since["things"] -= 11
+    assert job.decide() == "max_age"
+
+    # 退避后等待时间与阈值同比放大
+    job.update_backoff(success=False, duration=0.1)
+    assert job.backoff == 2
+    assert job.decide() is None
+    for key in range(2, 7):
+        ChangeTracker.mark_dirty("things", key)
+    assert job.decide() == "threshold"
+
+    # 刷新恢复正常后逐步回落
+    job.update_backoff(success=True, duration=0.1)
+    assert job.backoff == 1
+    assert [decision["reason"] for decision in scheduler.get_status()["jobs"]["things"]["recent_decisions"]] == [
+        "max_age", "threshold"
+    ]
+    ChangeTracker.clear()
+
+
+def test_graceful_shutdown_keeps_spill_only_for_unsaved_collections(tmp_path, monkeypatch):
+    from app.server_run import graceful_shutdown_flush
+
+    monkeypatch.setattr(settings, "RECOVERY_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "SHUTDOWN_FLUSH_DEADLINE", 0.2)
+    ChangeTracker.clear()
+    user_manager = UserManagement()
+    for container in (user_manager.user_list, user_manager.female_user_list, user_manager.male_user_list):
+        container.clear()
+    MatchManager()
+    user = User(telegram_user_name="alice", gender=1, user_id="openid_a")
+    user_manager.user_list[user.user_id] = user
+    match = Match.from_document({"_id": 7, "user_id_1": "openid_a", "user_id_2": "openid_b", "match_score": 50})
+    match.is_liked = True
+
+    scheduler = _new_scheduler(4)
+
+    async def stuck_flush():
+        await asyncio.sleep(10)
+        return True
+
+    scheduler.register("UserManagement", user_manager.save_to_database, 10, ("users",))
+    scheduler.register("MatchManager", stuck_flush, 10, ("matches",))
+
+    async def main():
+        completed = await graceful_shutdown_flush(scheduler)
+        return completed, await Database.find_one("users", {"_id": "openid_a"})
+
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        completed, document = asyncio.run(main())
+    finally:
+        Database.db = original_db
+        ChangeTracker.clear()
+
+    assert completed is False
+    assert document["user_name"] == "alice"
+    # 用户已写回，溢写文件被删除；匹配的刷新超时，溢写文件保留到下次启动重放
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["matches.active.jsonl"]
@@ -288,8 +288,8 @@ class TestGetNewMatchesForEveryone:
                 self.log("SUCCESS", f"发现 {len(latest_matches)} 个新匹配")
                 for i, match in enumerate(latest_matches[:3]):  # 只显示前3个
                     user_manager = UserManagement()
-                    female_user = user_manager.get_user_instance(match.user_id_1)
-                    male_user = user_manager.get_user_instance(match.user_id_2)
+                    female_user = await user_manager.get_user_instance(match.user_id_1)
+                    male_user = await user_manager.get_user_instance(match.user_id_2)
                     
                     self.log("INFO", f"匹配 {i+1}: {female_user.telegram_user_name if female_user else match.user_id_1} ↔ {male_user.telegram_user_name if male_user else match.user_id_2}")
                     self.log("INFO", f"  分数: {match.match_score}, 时间: {match.match_time}")
@@ -0,0 +1,170 @@
+"""
+ID分配测试：验证按段租用、后台预取、多个进程（分配器实例）之间不会分配重复ID，
+以及集合中含 ObjectId _id 时仍能租用ID段、预取未完成时请求路径同步租段
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from bson import ObjectId
+
+from app.config import settings
+from app.core.database import Database
+from app.core.id_allocator import IdAllocator, IdSequence
+from app.core.memory_backend import MemoryDatabase
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+
+class _Result:
+    modified_count = 1
+
+
+class _Counters:
+    """只支持分配器用到的 $max / $inc upsert"""
+
+    def __init__(self):
+        self.values = {}
+        self.leases = 0
+
+    async def update_one(self, query, update, upsert=False):
+        name = query["_id"]
+        self.values[name] = max(self.values.get(name, 0), update["$max"]["value"])
+        return _Result()
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        await asyncio.sleep(0)  # 模拟一次数据库往返
+        name = query["_id"]
+        self.leases += 1
+        self.values[name] = self.values.get(name, 0) + update["$inc"]["value"]
+        return {"_id": name, "value": self.values[name]}
+
+
+class _Collection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection=None):
+        return _Cursor(self.documents)
+
+
+def test_leased_blocks_are_disjoint_across_processes():
+    counters = _Counters()
+    original_db = Database.db
+    original_block, original_remaining = settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING
+    Database.db = {"counters": counters, "messages": _Collection([{"_id": 41}])}
+    settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING = 10, 5
+
+    async def worker():
+        # 每个"进程"有独立的本地序列状态，只共享 counters 集合
+        IdAllocator._sequences["messages"] = IdSequence("messages")
+        await IdAllocator.initialize("messages")
+        ids = []
+        for _ in range(25):
+            ids.append(IdAllocator.next_id("messages"))
+            await asyncio.sleep(0)  # 让后台预取有机会完成
+        return ids, IdAllocator._sequences.pop("messages")
+
+    async def main():
+        first_ids, first = await worker()
+        second_ids, second = await worker()
+        return first_ids, second_ids, first, second
+
+    try:
+        first_ids, second_ids, first, second = asyncio.run(main())
+    finally:
+        Database.db = original_db
+        settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING = original_block, original_remaining
+
+    # 从现有最大 _id 之后开始，两个进程的ID互不重复
+    assert first_ids[0] == 42
+    assert len(set(first_ids) | set(second_ids)) == 50
+    assert first.leased and first.blocks_leased >= 3
+    # 热路径只是本地自增：25 个ID只需要少量租约往返
+    assert counters.leases <= 8
+
+
+def test_falls_back_to_local_counter_without_database():
+    original_db = Database.db
+    Database.db = {}  # 访问任何集合都会失败
+    IdAllocator._sequences.pop("comments", None)
+    try:
+        asyncio.run(IdAllocator.initialize("comments", fallback_start=1000))
+    finally:
+        Database.db = original_db
+
+    assert IdAllocator.next_id("comments") == 1001
+    assert IdAllocator.get_status()["comments"]["mode"] == "local"
+    IdAllocator._sequences.pop("comments")
+
+
+def _with_memory_database(main):
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+    try:
+        return asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+
+def test_initializes_from_collection_with_object_ids():
+    IdAllocator._sequences.pop("AI_message", None)
+    IdAllocator._sequences.pop("AI_chatroom", None)
+
+    async def main():
+        await Database.insert_many("AI_message", [
+            {"_id": ObjectId(), "ai_message_id": 50},
+            {"_id": 40, "ai_message_id": 40},
+        ])
+        await Database.insert_many("AI_chatroom", [{"_id": ObjectId(), "user_id": "openid_0"}])
+        await IdAllocator.initialize("AI_message", id_field="ai_message_id")
+        await IdAllocator.initialize("AI_chatroom")
+        return IdAllocator.next_id("AI_message"), IdAllocator.get_status()
+
+    try:
+        first_id, status = _with_memory_database(main)
+    finally:
+        IdAllocator._sequences.pop("AI_message", None)
+        IdAllocator._sequences.pop("AI_chatroom", None)
+
+    assert first_id == 51
+    assert status["AI_message"]["mode"] == "leased"
+    assert status["AI_chatroom"]["mode"] == "leased"
+
+
+def test_burst_larger_than_prefetch_window_leases_on_request_path():
+    original_block, original_remaining = settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING
+    settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING = 10, 5
+    IdAllocator._sequences.pop("messages", None)
+
+    async def main():
+        await IdAllocator.initialize("messages")
+        ids = []
+        for _ in range(35):
+            # 两次分配之间不让出事件循环，后台预取来不及完成
+            await IdAllocator.ensure("messages")
+            ids.append(IdAllocator.next_id("messages"))
+        return ids
+
+    try:
+        ids = _with_memory_database(main)
+    finally:
+        settings.ID_BLOCK_SIZE, settings.ID_REFILL_REMAINING = original_block, original_remaining
+        IdAllocator._sequences.pop("messages", None)
+
+    assert len(set(ids)) == 35
@@ -0,0 +1,115 @@
+"""
+索引引导与迁移测试：验证声明的索引被创建、COLLSCAN 计划被识别，以及迁移只执行一次
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.database import Database
+from app.core.indexes import IndexRegistry, plan_stages
+from app.core.migrations import MIGRATIONS_COLLECTION, MigrationRunner
+
+
+class _Result:
+    modified_count = 1
+    inserted_id = None
+
+
+class _Cursor:
+    def __init__(self, documents, plan):
+        self.documents = documents
+        self.plan = plan
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+    async def explain(self):
+        return {"queryPlanner": {"winningPlan": self.plan}}
+
+
+class _FakeCollection:
+    def __init__(self, indexed=True):
+        self.documents = []
+        self.index_calls = []
+        self.indexed = indexed
+
+    async def create_indexes(self, models):
+        self.index_calls.append([model.document["key"] for model in models])
+        return [model.document["name"] for model in models]
+
+    def find(self, query, projection=None):
+        if self.indexed:
+            plan = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+        else:
+            plan = {"stage": "COLLSCAN"}
+        return _Cursor(self.documents, plan)
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+        result = _Result()
+        result.inserted_id = document["_id"]
+        return result
+
+    async def update_many(self, query, update):
+        return _Result()
+
+
+class _FakeDb(dict):
+    def __missing__(self, name):
+        collection = self[name] = _FakeCollection()
+        return collection
+
+
+def test_plan_stages_handles_nested_and_sbe_plans():
+    classic = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+    sbe = {"queryPlanner": {"winningPlan": {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}}
+    assert plan_stages(classic) == ["SORT", "COLLSCAN"]
+    assert plan_stages(sbe) == ["FETCH", "IXSCAN"]
+
+
+def test_ensure_indexes_and_collscan_check():
+    fake_db = _FakeDb()
+    fake_db["comments"] = _FakeCollection(indexed=False)
+    original_db = Database.db
+    Database.db = fake_db
+
+    async def main():
+        await IndexRegistry.ensure_indexes()
+        return await IndexRegistry.check_hot_queries()
+
+    try:
+        plans = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert {"ai_message_id": 1} in [key for call in fake_db["AI_message"].index_calls for key in call]
+    assert set(IndexRegistry.indexes()) <= set(fake_db)
+    assert plans["comments_by_post"] == ["COLLSCAN"]
+    assert "COLLSCAN" not in plans["ai_chatroom_by_user"]
+
+
+def test_migrations_run_once():
+    fake_db = _FakeDb()
+    original_db = Database.db
+    Database.db = fake_db
+
+    async def main():
+        return await MigrationRunner.run(), await MigrationRunner.run()
+
+    try:
+        first, second = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert first == sorted(MigrationRunner._migrations)
+    assert second == []
+    assert [document["_id"] for document in fake_db[MIGRATIONS_COLLECTION].documents] == first
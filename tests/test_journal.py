@@ -0,0 +1,172 @@
+"""
+本地预写日志测试：验证修改落盘、刷新后截断以及启动重放
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.core.journal import Journal
+from app.objects.User import User
+
+
+class _RecordingCollection:
+    """记录重放写入的集合替身"""
+
+    def __init__(self):
+        self.operations = []
+        self.deleted = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+        class _Result:
+            matched_count = 0
+            modified_count = 0
+            upserted_count = len(operations)
+
+        return _Result()
+
+    async def delete_many(self, query):
+        self.deleted.append(query)
+
+        class _Result:
+            deleted_count = 1
+
+        return _Result()
+
+
+def setup_function():
+    ChangeTracker.clear()
+    Journal.register("users")
+
+
+def _journal_lines(directory):
+    return [
+        line
+        for path in sorted(Path(directory).glob("users.*"))
+        for line in path.read_text(encoding="utf-8").splitlines()
+    ]
+
+
+def test_mutations_are_journaled_and_released_after_flush(tmp_path):
+    async def main():
+        Journal.open(str(tmp_path))
+        try:
+            user = User(telegram_user_name="alice", gender=1, user_id="openid_a")
+            user.edit_data(age=20)
+
+            # 刷新开始：封存活动日志，未落盘的修改同步写入
+            await ChangeTracker.pop_dirty("users")
+            assert len(_journal_lines(tmp_path)) == 1
+            assert list(tmp_path.glob("users.*.sealed.jsonl"))
+
+            # 刷新成功后封存文件被删除
+            ChangeTracker.record_flush("UserManagement", 1, 0, 0.0, collections=("users",))
+            assert not list(tmp_path.glob("users.*"))
+        finally:
+            await Journal.close()
+
+    asyncio.run(main())
+
+
+def test_seal_keeps_event_loop_responsive_during_slow_fsync(tmp_path, monkeypatch):
+    """封存时的 fsync 在线程池中执行，事件循环在此期间仍按时调度其他任务"""
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(0.3)
+        real_fsync(fd)
+
+    async def main():
+        Journal.open(str(tmp_path))
+        try:
+            user = User(telegram_user_name="dave", gender=1, user_id="openid_d")
+            user.edit_data(age=40)
+            monkeypatch.setattr(os, "fsync", slow_fsync)
+
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(time.perf_counter())
+                    await asyncio.sleep(0.01)
+
+            ticker_task = asyncio.create_task(ticker())
+            await asyncio.sleep(0.02)
+            started = time.perf_counter()
+            drained = await ChangeTracker.pop_dirty("users")
+            sealed_in = time.perf_counter() - started
+            ticker_task.cancel()
+            await asyncio.gather(ticker_task, return_exceptions=True)
+            monkeypatch.setattr(os, "fsync", real_fsync)
+
+            lag = max(later - earlier for earlier, later in zip(ticks, ticks[1:]))
+            assert "openid_d" in drained
+            assert sealed_in >= 0.3
+            assert lag < 0.15
+            assert len(_journal_lines(tmp_path)) == 1
+        finally:
+            await Journal.close(truncate=True)
+
+    asyncio.run(main())
+
+
+def test_recover_replays_upserts_and_deletes_in_order(tmp_path):
+    collection = _RecordingCollection()
+    original_db = Database.db
+    Database.db = {"users": collection}
+
+    async def main():
+        Journal.open(str(tmp_path))
+        user = User(telegram_user_name="bob", gender=2, user_id="openid_b")
+        user.edit_data(age=30)
+        Journal.record_delete("users", {"_id": "openid_gone"})
+        # 模拟崩溃：只写出日志，不截断
+        await Journal.close()
+
+        replayed = await Journal.recover(str(tmp_path))
+        return replayed
+
+    try:
+        replayed = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    assert replayed == 2
+    assert collection.operations[0]._filter == {"_id": "openid_b"}
+    assert collection.operations[0]._doc["$set"]["age"] == 30
+    assert collection.deleted == [{"_id": "openid_gone"}]
+    assert not list(tmp_path.glob("users.*"))
+
+
+def test_spill_keeps_dirty_state_and_is_replayed(tmp_path):
+    collection = _RecordingCollection()
+    original_db = Database.db
+    Database.db = {"users": collection}
+
+    user = User(telegram_user_name="carol", gender=1, user_id="openid_c")
+    user.edit_data(age=25)
+
+    spilled = Journal.spill(str(tmp_path))
+    # 溢写不改变脏标记，随后的停机刷新仍会写回
+    assert spilled == {"users": 1}
+    assert ChangeTracker.is_dirty("users", "openid_c")
+
+    try:
+        replayed = asyncio.run(Journal.recover(str(tmp_path)))
+    finally:
+        Database.db = original_db
+
+    assert replayed == 1
+    assert collection.operations[0]._doc["$set"]["age"] == 25
+
+    Journal.spill(str(tmp_path))
+    Journal.discard_spill(["users"], str(tmp_path))
+    assert not list(tmp_path.glob("users.*"))
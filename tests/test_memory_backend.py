@@ -0,0 +1,119 @@
+"""
+内存存储后端测试：验证 Database 门面在 MemoryDatabase 上的查询、更新操作符、批量写入与延迟注入
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.database import Database
+from app.core.id_allocator import IdAllocator
+from app.core.memory_backend import MemoryDatabase
+from app.objects.Post import Post
+
+
+def _run_with_backend(backend, main):
+    original_db = Database.db
+    Database.use_backend(backend)
+    try:
+        return asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+
+def test_find_sort_limit_projection():
+    async def main():
+        await Database.insert_many("messages", [
+            {"_id": i, "chatroom_id": i % 2, "message_send_time_in_utc": 100 - i, "message_content": f"m{i}"}
+            for i in range(6)
+        ])
+        latest = await Database.find(
+            "messages", {"chatroom_id": 0}, {"message_content": 1}, limit=2, sort=[("message_send_time_in_utc", 1)]
+        )
+        assert latest == [{"_id": 4, "message_content": "m4"}, {"_id": 2, "message_content": "m2"}]
+        assert await Database.find_one("messages", {"_id": 3}) is not None
+        assert await Database.count_documents("messages", {"_id": {"$gte": 2, "$lt": 5}}) == 3
+        assert await Database.count_documents("messages", {"$or": [{"_id": 0}, {"chatroom_id": 1}]}) == 4
+
+    _run_with_backend(MemoryDatabase(), main)
+
+
+def test_update_operators_and_upsert():
+    async def main():
+        await Database.insert_one("posts", {"_id": 1, "liked_user_ids": ["a"], "like_count": 1})
+        await Database.update_one("posts", {"_id": 1}, {"$push": {"liked_user_ids": {"$each": ["b", "c"]}}, "$inc": {"like_count": 2}})
+        await Database.update_one("posts", {"_id": 1}, {"$pull": {"liked_user_ids": "a"}, "$addToSet": {"liked_user_ids": "b"}})
+        post = await Database.find_one("posts", {"liked_user_ids": "c"})
+        assert post["liked_user_ids"] == ["b", "c"]
+        assert post["like_count"] == 3
+        assert "_modified_at" in post
+
+        assert await Database.update_many("posts", {"_id": 99}, {"$set": {"x": 1}}) == 0
+        counter = await Database.find_one_and_update("counters", {"_id": "posts"}, {"$inc": {"value": 1000}}, upsert=True)
+        assert counter["value"] == 1000
+
+        assert await Database.delete_many("posts", {"_id": {"$in": [1, 2]}}) == 1
+        assert await Database.count_documents("posts") == 0
+
+    _run_with_backend(MemoryDatabase(), main)
+
+
+def test_bulk_write_reports_partial_failures():
+    backend = MemoryDatabase()
+
+    async def main():
+        await Database.bulk_upsert("users", [{"_id": "a", "user_name": "A"}, {"_id": "b", "user_name": "B"}])
+        result = await Database.bulk_upsert("users", [{"_id": "a", "user_name": "A2"}, {"_id": "c", "user_name": "C"}])
+        assert result == {"matched": 1, "modified": 1, "upserted": 1, "failed_keys": []}
+
+        try:
+            await backend["users"].bulk_write([InsertOne({"_id": "a"}), UpdateOne({"_id": "b"}, {"$set": {"x": 1}})], ordered=False)
+            assert False, "duplicate insert should fail"
+        except BulkWriteError as e:
+            assert [error["index"] for error in e.details["writeErrors"]] == [0]
+            assert e.details["nModified"] == 1
+
+    _run_with_backend(backend, main)
+
+
+def test_posts_round_trip_through_loader_path():
+    async def main():
+        IdAllocator._sequences.pop("posts", None)
+        Post._initialized = False
+        await Post.initialize_counter()
+        post = Post("openid_a", "A", "hello", tags=["x"])
+        assert await post.save_to_database()
+
+        loaded = []
+        async for batch in Database.iter("posts", as_objects=True):
+            loaded.extend(batch)
+        assert [(item.post_id, item.post_content, item.tags) for item in loaded] == [(post.post_id, "hello", ["x"])]
+
+    try:
+        _run_with_backend(MemoryDatabase(), main)
+    finally:
+        IdAllocator._sequences.pop("posts", None)
+        Post._initialized = False
+
+
+def test_latency_injection():
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(Database.find_one("messages", {"_id": i}) for i in range(10)))
+        concurrent = time.perf_counter() - started
+        started = time.perf_counter()
+        for i in range(3):
+            await Database.find_one("messages", {"_id": i})
+        sequential = time.perf_counter() - started
+        return concurrent, sequential
+
+    concurrent, sequential = _run_with_backend(MemoryDatabase(latency=0.02), main)
+    # 并发请求的延迟相互重叠，顺序请求逐个累加
+    assert sequential >= 0.06
+    assert concurrent < sequential
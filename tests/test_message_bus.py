@@ -0,0 +1,162 @@
+"""
+WebSocket 跨进程路由测试：路由表随上线/下线/启停更新、定向转发与送达确认、
+确认超时，以及 ConnectionHandler 在本地找不到接收方时经总线转发
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+import pytest
+
+from app.core.message_bus import MemoryBusTransport, MessageBus, UnixSocketBusTransport
+from app.WebSocketsService.ConnectionHandler import ConnectionHandler
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+class FakeWorker:
+    """一个 worker 的本地连接表与总线"""
+
+    def __init__(self, transport, ack_timeout=1.0):
+        self.sessions = {}
+        self.bus = MessageBus(transport, ack_timeout=ack_timeout)
+        self.bus.register("chat", self.deliver, self.broadcast)
+
+    async def deliver(self, user_id, text):
+        websocket = self.sessions.get(user_id)
+        if websocket is None:
+            return False
+        await websocket.send_text(text)
+        return True
+
+    async def broadcast(self, text, exclude_id):
+        for user_id, websocket in self.sessions.items():
+            if user_id != exclude_id:
+                await websocket.send_text(text)
+
+    async def connect(self, user_id):
+        websocket = self.sessions[user_id] = FakeWebSocket()
+        await self.bus.claim("chat", user_id)
+        return websocket
+
+    async def disconnect(self, user_id):
+        del self.sessions[user_id]
+        await self.bus.release("chat", user_id)
+
+
+def _transports(kind, tmp_path):
+    network = {}
+
+    def make(worker_id):
+        if kind == "memory":
+            return MemoryBusTransport(worker_id, network)
+        return UnixSocketBusTransport(str(tmp_path), worker_id)
+    return make
+
+
+async def _settle():
+    await asyncio.sleep(0.05)
+
+
+@pytest.mark.parametrize("kind", ["memory", "unix"])
+def test_frames_reach_the_worker_holding_the_socket(kind, tmp_path):
+    make = _transports(kind, tmp_path)
+
+    async def main():
+        a, b = FakeWorker(make("a")), FakeWorker(make("b"))
+        await a.bus.start()
+        await b.bus.start()
+        bob = await b.connect("bob")
+        await _settle()
+        assert a.bus.route_of("chat", "bob") == "b"
+
+        assert await a.bus.send("chat", "bob", "hi") is True
+        assert bob.sent == ["hi"]
+        # 不在线的用户：全部 worker 回送否定确认，不必等到超时
+        assert await a.bus.send("chat", "ghost", "hi") is False
+        assert a.bus.get_status()["timeouts"] == 0
+
+        await a.bus.broadcast("chat", "hello all", exclude_id=None)
+        await _settle()
+        assert bob.sent == ["hi", "hello all"]
+
+        # 后启动的 worker 从已有 worker 获得在线用户
+        c = FakeWorker(make("c"))
+        await c.bus.start()
+        await _settle()
+        assert c.bus.route_of("chat", "bob") == "b"
+
+        await b.disconnect("bob")
+        await _settle()
+        assert a.bus.route_of("chat", "bob") is None
+        assert await a.bus.send("chat", "bob", "again") is False
+
+        carol = await b.connect("carol")
+        await _settle()
+        await b.bus.stop()
+        await _settle()
+        assert a.bus.route_of("chat", "carol") is None
+        assert await a.bus.send("chat", "carol", "hi") is False
+        assert carol.sent == []
+
+        await a.bus.stop()
+        await c.bus.stop()
+
+    asyncio.run(main())
+
+
+def test_unacknowledged_frame_times_out():
+    async def main():
+        network = {}
+        a = FakeWorker(MemoryBusTransport("a", network), ack_timeout=0.1)
+        await a.bus.start()
+        # 收到帧却不回送确认的对端
+        await MemoryBusTransport("mute", network).open(lambda data: None)
+        assert await a.bus.send("chat", "bob", "hi") is False
+        assert a.bus.get_status()["timeouts"] == 1
+        assert a.bus.get_status()["pending"] == 0
+        await a.bus.stop()
+
+    asyncio.run(main())
+
+
+def test_connection_handler_forwards_to_other_worker():
+    async def main():
+        network = {}
+        local = MessageBus(MemoryBusTransport("local", network))
+        local.register(ConnectionHandler.bus_channel, ConnectionHandler.deliver_local, ConnectionHandler.broadcast_local)
+        remote = FakeWorker(MemoryBusTransport("remote", network))
+        remote.bus.register(ConnectionHandler.bus_channel, remote.deliver, remote.broadcast)
+        await local.start()
+        await remote.bus.start()
+        MessageBus.active = local
+        ConnectionHandler.sessions.clear()
+        try:
+            alice = ConnectionHandler.sessions["alice"] = FakeWebSocket()
+            remote.sessions["bob"] = bob = FakeWebSocket()
+            await remote.bus.claim(ConnectionHandler.bus_channel, "bob")
+            await _settle()
+
+            assert await ConnectionHandler.send_to_user("bob", "from alice") is True
+            assert await ConnectionHandler.send_to_user("alice", "local") is True
+            assert await ConnectionHandler.send_to_user("nobody", "lost") is False
+            await ConnectionHandler.broadcast("everyone", exclude_id="alice")
+            await _settle()
+            assert bob.sent == ["from alice", "everyone"]
+            assert alice.sent == ["local"]
+        finally:
+            ConnectionHandler.sessions.clear()
+            await local.stop()
+            await remote.bus.stop()
+        assert MessageBus.active is None
+
+    asyncio.run(main())
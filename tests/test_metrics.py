@@ -0,0 +1,68 @@
+"""
+数据库指标测试：验证按集合/操作记录的延迟直方图、失败计数、慢操作形状以及 Prometheus 输出
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.config import settings
+from app.core.database import Database, query_shape
+from app.core.metrics import Metrics
+
+
+class _Result:
+    deleted_count = 2
+
+
+class _Collection:
+    async def find_one(self, query):
+        return {"_id": query["_id"]}
+
+    async def delete_many(self, query):
+        return _Result()
+
+    async def update_one(self, query, update, upsert=False):
+        raise RuntimeError("write failed")
+
+
+def test_query_shape_hides_values():
+    assert query_shape({"_id": {"$in": [1, 2, 3]}, "user_id": "openid_a"}) == {"_id": {"$in": ["?"]}, "user_id": "?"}
+
+
+def test_facade_records_latency_errors_and_slow_operations():
+    Metrics.clear()
+    original_db = Database.db
+    original_threshold = settings.DB_SLOW_OP_THRESHOLD
+    Database.db = {"messages": _Collection()}
+    settings.DB_SLOW_OP_THRESHOLD = 0  # 每个操作都记为慢操作
+
+    async def main():
+        await Database.find_one("messages", {"_id": 7})
+        await Database.find_one("messages", {"_id": 8})
+        await Database.delete_many("messages", {"_id": {"$in": [7, 8]}})
+        try:
+            await Database.update_one("messages", {"_id": 7}, {"$set": {"x": 1}})
+        except RuntimeError:
+            pass
+
+    try:
+        asyncio.run(main())
+    finally:
+        Database.db = original_db
+        settings.DB_SLOW_OP_THRESHOLD = original_threshold
+
+    histograms = {(item["collection"], item["operation"]): item for item in Metrics.get_status()["histograms"]["db_operation_seconds"]}
+    assert histograms[("messages", "find_one")]["count"] == 2
+    assert histograms[("messages", "update_one")]["count"] == 1
+    assert Metrics.get_status()["counters"]["db_operation_errors_total"] == [
+        {"collection": "messages", "operation": "update_one", "value": 1}
+    ]
+    assert Metrics.slow_operations[2]["shape"] == {"_id": {"$in": ["?"]}}
+
+    text = Metrics.render_prometheus()
+    assert 'db_operation_seconds_count{collection="messages",operation="find_one"} 2' in text
+    assert 'db_operation_seconds_bucket{collection="messages",operation="find_one",le="+Inf"} 2' in text
+    Metrics.clear()
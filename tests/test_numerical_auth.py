@@ -44,7 +44,7 @@ async def test_numerical_auth():
                 user_id_for_lookup = user_id_input
                 print(f"   📝 不是全数字，保持原样: {user_id_for_lookup} (类型: {type(user_id_for_lookup)})")
             
-            user_instance = user_manager.get_user_instance(user_id_for_lookup)
+            user_instance = await user_manager.get_user_instance(user_id_for_lookup)
             
             if user_instance:
                 print(f"   ✅ 认证成功: {user_instance.telegram_user_name}")
@@ -0,0 +1,76 @@
+"""
+连接池配置与指标测试：验证客户端参数来自 settings，以及连接池事件写入的检出次数、等待时间与占用连接数
+"""
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+from app.config import settings
+from app.core.database import PoolMetricsListener, client_options
+from app.core.metrics import Metrics
+
+ADDRESS = ("db.local", 27017)
+
+
+def _gauge(name):
+    return {item["address"]: item["value"] for item in Metrics.get_status()["gauges"][name]}
+
+
+def test_client_options_follow_settings():
+    original = (
+        settings.MONGODB_MAX_POOL_SIZE, settings.MONGODB_MAX_IDLE_TIME_MS,
+        settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS, settings.MONGODB_COMPRESSORS,
+    )
+    settings.MONGODB_MAX_POOL_SIZE = 7
+    settings.MONGODB_MAX_IDLE_TIME_MS = 0  # 0 表示不限制，不传给驱动
+    settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS = 250
+    settings.MONGODB_COMPRESSORS = "zlib, "
+    try:
+        options = client_options()
+        assert options["maxPoolSize"] == 7
+        assert options["waitQueueTimeoutMS"] == 250
+        assert options["compressors"] == ["zlib"]
+        assert "maxIdleTimeMS" not in options
+
+        # 驱动能接受这些参数（构造客户端不会立即连接）
+        client = AsyncIOMotorClient("mongodb://db.local:27017", **options)
+        assert client.options.pool_options.max_pool_size == 7
+        client.close()
+    finally:
+        (
+            settings.MONGODB_MAX_POOL_SIZE, settings.MONGODB_MAX_IDLE_TIME_MS,
+            settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS, settings.MONGODB_COMPRESSORS,
+        ) = original
+
+
+def test_pool_events_feed_metrics():
+    Metrics.clear()
+    listener = PoolMetricsListener()
+    listener.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 1))
+    listener.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 2))
+    listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1, 0.002))
+    listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 2, 0.3))
+    listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+    listener.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(ADDRESS, "timeout", 1.0))
+
+    assert _gauge("db_pool_connections_in_use") == {"db.local:27017": 1}
+    assert _gauge("db_pool_connections_open") == {"db.local:27017": 2}
+    status = Metrics.get_status()
+    assert status["counters"]["db_pool_checkouts_total"] == [{"address": "db.local:27017", "value": 2}]
+    assert status["counters"]["db_pool_checkout_failures_total"] == [
+        {"address": "db.local:27017", "reason": "timeout", "value": 1}
+    ]
+    assert status["histograms"]["db_pool_checkout_wait_seconds"][0]["count"] == 3
+
+    text = Metrics.render_prometheus()
+    assert "# TYPE db_pool_connections_in_use gauge" in text
+    assert 'db_pool_connections_in_use{address="db.local:27017"} 1' in text
+
+    listener.pool_closed(monitoring.PoolClosedEvent(ADDRESS))
+    assert _gauge("db_pool_connections_in_use") == {"db.local:27017": 0}
+    Metrics.clear()
@@ -0,0 +1,127 @@
+"""
+find_one 读穿透缓存测试：验证命中/未命中统计、写入失效、TTL 过期、LRU 淘汰以及并发写入时不回填旧文档
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.database import Database
+from app.core.memory_backend import MemoryDatabase
+from app.core.metrics import Metrics
+from app.core.query_cache import QueryCache
+
+
+class _CountingDatabase(MemoryDatabase):
+    """统计实际到达存储后端的 find_one 次数；read_delay 模拟读到文档后响应迟迟未返回"""
+
+    def __init__(self, read_delay: float = 0.0):
+        super().__init__()
+        self.reads = 0
+        self.read_delay = read_delay
+
+    def __getitem__(self, name):
+        collection = super().__getitem__(name)
+        if not getattr(collection, "_counting", False):
+            find_one = collection.find_one
+
+            async def counted_find_one(*args, **kwargs):
+                self.reads += 1
+                document = await find_one(*args, **kwargs)
+                await asyncio.sleep(self.read_delay)
+                return document
+
+            collection.find_one = counted_find_one
+            collection._counting = True
+        return collection
+
+
+def _run(backend, main, **ttls):
+    original_db = Database.db
+    original_ttls = dict(QueryCache._ttls)
+    original_max_entries = QueryCache.max_entries
+    original_enabled = QueryCache.enabled
+    Metrics.clear()
+    Database.use_backend(backend)
+    QueryCache.enabled = True
+    for collection, ttl in ttls.items():
+        QueryCache.configure(collection, ttl)
+    try:
+        return asyncio.run(main())
+    finally:
+        Database.db = original_db
+        QueryCache._ttls = original_ttls
+        QueryCache.max_entries = original_max_entries
+        QueryCache.enabled = original_enabled
+        QueryCache.clear()
+
+
+def test_hits_and_write_invalidation():
+    backend = _CountingDatabase()
+
+    async def main():
+        await Database.insert_one("users", {"_id": "a", "liked_post_ids": [1]})
+        for _ in range(3):
+            user = await Database.find_one("users", {"_id": "a"})
+            user["liked_post_ids"].append(99)  # 调用方修改返回值不影响缓存
+        assert backend.reads == 1
+
+        await Database.update_one("users", {"_id": "a"}, {"$addToSet": {"liked_post_ids": 2}})
+        assert (await Database.find_one("users", {"_id": "a"}))["liked_post_ids"] == [1, 2]
+        assert backend.reads == 2
+
+        await Database.bulk_upsert("users", [{"_id": "a", "liked_post_ids": []}])
+        assert (await Database.find_one("users", {"_id": "a"}))["liked_post_ids"] == []
+
+        # 非 _id 条件的写入失效整个集合；非 _id 查询不经缓存
+        await Database.update_many("users", {"gender": "f"}, {"$set": {"x": 1}})
+        await Database.find_one("users", {"_id": "a"})
+        await Database.find_one("users", {"liked_post_ids": []})
+        assert backend.reads == 5
+
+    _run(backend, main, users=30)
+    status = QueryCache.get_status()["collections"]["users"]
+    assert (status["hit"], status["miss"]) == (2, 4)
+    assert status["hit_rate"] == 0.3333
+
+
+def test_uncached_collections_ttl_and_lru():
+    backend = _CountingDatabase()
+
+    async def main():
+        await Database.insert_many("posts", [{"_id": i} for i in range(3)])
+        await Database.find_one("posts", {"_id": 0})
+        await Database.find_one("posts", {"_id": 0})
+        assert backend.reads == 2  # posts 未配置 TTL
+
+        for _id in ("a", "b", "c"):
+            await Database.find_one("users", {"_id": _id})  # 不存在的文档同样缓存
+        await Database.find_one("users", {"_id": "a"})
+        assert backend.reads == 6  # "a" 已被 LRU 淘汰
+
+        QueryCache.configure("users", 0.01)
+        await Database.find_one("users", {"_id": "d"})
+        await asyncio.sleep(0.02)
+        await Database.find_one("users", {"_id": "d"})
+        assert backend.reads == 8
+
+    QueryCache.max_entries = 2
+    _run(backend, main, users=30)
+    assert Metrics.get_status()["counters"]["db_cache_evictions_total"][0]["value"] >= 1
+
+
+def test_concurrent_write_prevents_stale_fill():
+    backend = _CountingDatabase(read_delay=0.02)
+
+    async def main():
+        await Database.insert_one("users", {"_id": "a", "user_name": "old"})
+        # 读到旧文档后、回填缓存前，另一请求完成了写入
+        read = asyncio.ensure_future(Database.find_one("users", {"_id": "a"}))
+        await asyncio.sleep(0.005)
+        await Database.update_one("users", {"_id": "a"}, {"$set": {"user_name": "new"}})
+        assert (await read)["user_name"] == "old"
+        assert (await Database.find_one("users", {"_id": "a"}))["user_name"] == "new"
+
+    _run(backend, main, users=30)
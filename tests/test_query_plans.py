@@ -0,0 +1,131 @@
+"""
+热点查询的查询计划回归测试
+- 连接本地 mongod，在独立的临时数据库中写入仿真数据集，按 IndexRegistry 创建索引
+- 对每条登记的热点查询执行 explain()，断言走索引且检查的文档数不超过上限
+- 本地没有 mongod 时跳过（QUERY_PLAN_TEST_MONGODB_URL 可指定其他实例）
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.database import MODIFIED_AT_FIELD
+from app.core.indexes import IndexRegistry, plan_stages
+
+MONGODB_URL = os.getenv("QUERY_PLAN_TEST_MONGODB_URL", "mongodb://localhost:27017")
+TEST_DB_NAME = f"query_plan_test_{os.getpid()}"
+INDEX_STAGES = {"IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "CLUSTERED_IXSCAN", "COUNT_SCAN", "DISTINCT_SCAN"}
+
+USERS = 500
+CHATROOMS = 200
+MESSAGES_PER_CHATROOM = 25
+POSTS = 2000
+COMMENTS_PER_POST = 10
+SESSIONS_PER_USER = 2
+
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SNAPSHOT_TIME = NOW - timedelta(minutes=5)
+
+# 热点查询名 -> (查询条件, 检查文档数上限)；排序与 limit 取自登记的热点查询
+CASES = {
+    "ai_chatroom_by_user": ({"user_id": "openid_7"}, 1),
+    "ai_message_by_id": ({"ai_message_id": 42}, 1),
+    "personality_record_by_session": ({"session_id": "session_7_1"}, 1),
+    "personality_records_by_user": ({"user_id": "openid_7"}, SESSIONS_PER_USER),
+    "message_by_id": ({"_id": 1234}, 1),
+    "chatroom_history": ({"chatroom_id": 7}, MESSAGES_PER_CHATROOM),
+    "latest_posts": ({"post_status": "published"}, 20),
+    "comments_by_post": ({"post_id": 7}, COMMENTS_PER_POST),
+    # 快照之后只有少量用户发生变更
+    "snapshot_catchup_users": ({MODIFIED_AT_FIELD: {"$gte": SNAPSHOT_TIME}}, 10),
+}
+
+
+def _build_dataset():
+    users = [
+        {"_id": f"openid_{i}", "user_name": f"user_{i}", "gender": 1 + i % 2, "match_ids": [],
+         MODIFIED_AT_FIELD: NOW if i < 10 else NOW - timedelta(days=1 + i % 30)}
+        for i in range(USERS)
+    ]
+    messages = [
+        {"_id": room * MESSAGES_PER_CHATROOM + n, "chatroom_id": room, "message_content": f"hello {n}",
+         "message_sender_id": f"openid_{room % USERS}", "message_receiver_id": f"openid_{(room + 1) % USERS}",
+         "message_send_time_in_utc": NOW - timedelta(minutes=MESSAGES_PER_CHATROOM - n)}
+        for room in range(CHATROOMS) for n in range(MESSAGES_PER_CHATROOM)
+    ]
+    posts = [
+        {"_id": i, "creator_user_id": f"openid_{i % USERS}", "post_content": f"post {i}",
+         "post_status": "deleted" if i % 10 == 0 else "published", "created_at": NOW - timedelta(minutes=i)}
+        for i in range(POSTS)
+    ]
+    comments = [
+        {"_id": post * COMMENTS_PER_POST + n, "post_id": post, "commenter_user_id": f"openid_{n}"}
+        for post in range(POSTS // 10) for n in range(COMMENTS_PER_POST)
+    ]
+    ai_chatrooms = [{"user_id": f"openid_{i}", "ai_message_ids": [2 * i, 2 * i + 1]} for i in range(USERS)]
+    ai_messages = [{"ai_message_id": i, "user_id": f"openid_{i // 2}", "message": f"ai {i}"} for i in range(USERS * 2)]
+    records = [
+        {"session_id": f"session_{i}_{n}", "user_id": f"openid_{i}", "status": "completed"}
+        for i in range(USERS) for n in range(SESSIONS_PER_USER)
+    ]
+    return {
+        "users": users,
+        "messages": messages,
+        "posts": posts,
+        "comments": comments,
+        "AI_chatroom": ai_chatrooms,
+        "AI_message": ai_messages,
+        "personality_test_records": records,
+    }
+
+
+@pytest.fixture(scope="module")
+def mongo_db():
+    client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=1000)
+    try:
+        client.server_info()
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod reachable at {MONGODB_URL}")
+
+    db = client[TEST_DB_NAME]
+    for collection, documents in _build_dataset().items():
+        db[collection].insert_many(documents)
+    for collection, models in IndexRegistry.indexes().items():
+        db[collection].create_indexes(models)
+    try:
+        yield db
+    finally:
+        client.drop_database(TEST_DB_NAME)
+        client.close()
+
+
+def test_every_hot_query_has_a_plan_case():
+    assert {hot_query.name for hot_query in IndexRegistry.hot_queries()} == set(CASES)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_hot_query_uses_index(mongo_db, name):
+    hot_query = next(hot_query for hot_query in IndexRegistry.hot_queries() if hot_query.name == name)
+    query, max_examined = CASES[name]
+    cursor = mongo_db[hot_query.collection].find(query, hot_query.projection)
+    if hot_query.sort:
+        cursor = cursor.sort(hot_query.sort)
+    if hot_query.limit:
+        cursor = cursor.limit(hot_query.limit)
+    explain = cursor.explain()
+
+    stages = plan_stages(explain)
+    assert "COLLSCAN" not in stages, f"{name}: {stages}"
+    assert INDEX_STAGES & set(stages), f"{name}: {stages}"
+    # 排序应由索引提供，而不是内存排序
+    assert "SORT" not in stages, f"{name}: {stages}"
+    examined = explain["executionStats"]["totalDocsExamined"]
+    assert examined <= max_examined, f"{name} examined {examined} documents (cap {max_examined})"
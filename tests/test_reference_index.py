@@ -0,0 +1,146 @@
+"""
+反向索引测试：验证索引维护以及注销用户时的级联删除
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.objects.Chatroom import Chatroom
+from app.objects.Match import Match
+from app.objects.User import User
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ReferenceIndex import ReferenceIndex
+from app.services.https.UserManagement import UserManagement
+
+
+class _Result:
+    deleted_count = 1
+    matched_count = 1
+    modified_count = 1
+
+
+class _RecordingCollection:
+    """记录删除与更新调用的集合替身"""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def delete_one(self, query):
+        self.calls.append(("delete_one", query))
+        return _Result()
+
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        return _Result()
+
+    async def update_many(self, query, update):
+        self.calls.append(("update_many", query, update))
+        return _Result()
+
+
+def _setup_graph():
+    ChangeTracker.clear()
+    user_manager = UserManagement()
+    match_manager = MatchManager()
+    chatroom_manager = ChatroomManager()
+    index = ReferenceIndex()
+    for container in (user_manager.user_list, user_manager.female_user_list, user_manager.male_user_list,
+                      match_manager.match_list, chatroom_manager.chatrooms):
+        container.clear()
+    index.user_matches.clear()
+    index.user_chatrooms.clear()
+    index.match_chatrooms.clear()
+
+    alice = User(telegram_user_name="alice", gender=1, user_id="openid_a")
+    bob = User(telegram_user_name="bob", gender=2, user_id="openid_b")
+    carol = User(telegram_user_name="carol", gender=2, user_id="openid_c")
+    for user in (alice, bob, carol):
+        user_manager.user_list[user.user_id] = user
+
+    Match._initialized = True
+    Chatroom._initialized = True
+    matches = []
+    for other in (bob, carol):
+        match = Match(alice.user_id, other.user_id, "r1", "r2", 80, "now")
+        match_manager.match_list[match.match_id] = match
+        index.add_match(match)
+        alice.match_ids.append(match.match_id)
+        other.match_ids.append(match.match_id)
+        matches.append(match)
+
+    chatroom = Chatroom(alice, bob, matches[0].match_id)
+    chatroom.message_ids = [11, 12]
+    chatroom_manager.chatrooms[chatroom.chatroom_id] = chatroom
+    matches[0].chatroom_id = chatroom.chatroom_id
+    index.add_chatroom(chatroom)
+    return alice, bob, carol, matches, chatroom
+
+
+def test_get_user_matches_uses_index():
+    alice, bob, carol, matches, _ = _setup_graph()
+
+    assert MatchManager().get_user_matches(alice.user_id) == sorted(matches, key=lambda m: m.match_id)
+    assert MatchManager().get_user_matches(bob.user_id) == [matches[0]]
+    assert ReferenceIndex().chatrooms_of(carol.user_id) == set()
+
+
+def test_remove_user_cascades_to_matches_chatrooms_and_messages():
+    alice, bob, carol, matches, chatroom = _setup_graph()
+    calls = []
+    collection = _RecordingCollection(calls)
+    original_db = Database.db
+    Database.db = {name: collection for name in ("users", "matches", "chatrooms", "messages")}
+    try:
+        stats = asyncio.run(ReferenceIndex().remove_user(alice.user_id))
+    finally:
+        Database.db = original_db
+
+    assert stats == {"matches": 2, "chatrooms": 1, "messages": 2}
+    assert alice.user_id not in UserManagement().user_list
+    assert MatchManager().match_list == {}
+    assert ChatroomManager().chatrooms == {}
+    assert bob.match_ids == [] and carol.match_ids == []
+    assert ("delete_many", {"_id": {"$in": [11, 12]}}) in calls
+    assert ReferenceIndex().user_matches == {}
+    assert ReferenceIndex().user_chatrooms == {}
+    # 被删除的对象不应在下一次刷新中被写回
+    assert ChangeTracker.dirty_count("matches") == 0
+    assert ChangeTracker.dirty_count("chatrooms") == 0
+
+
+def test_incremental_check_only_validates_logged_ids():
+    from app.core.change_log import ChangeLog
+    from app.services.https.DataIntegrity import DataIntegrity
+
+    alice, bob, carol, matches, chatroom = _setup_graph()
+    ChangeLog.drain()
+    # 绕过级联直接移除用户，只留下变更日志记录
+    del UserManagement().user_list[carol.user_id]
+    ChangeLog.user_deleted(carol.user_id)
+    # 记录一条所属聊天室不存在的消息
+    ChangeLog.message_inserted(500, 999)
+
+    calls = []
+    collection = _RecordingCollection(calls)
+    original_db = Database.db
+    Database.db = {name: collection for name in ("users", "matches", "chatrooms", "messages")}
+    try:
+        result = asyncio.run(DataIntegrity().run_incremental_check())
+    finally:
+        Database.db = original_db
+
+    assert result["success"] is True
+    assert result["checked"] == {"deleted_users": 1, "matches": 0, "chatrooms": 0, "messages": 1}
+    # 只有与已删除用户相关的匹配被清理，其余匹配与聊天室保持不变
+    assert set(MatchManager().match_list) == {matches[0].match_id}
+    assert chatroom.chatroom_id in ChatroomManager().chatrooms
+    assert alice.match_ids == [matches[0].match_id]
+    assert ("delete_many", {"_id": {"$in": [500]}}) in calls
+    # 级联删除产生的记录留给下一次增量检查
+    assert ChangeLog.matches == {matches[1].match_id: (alice.user_id, carol.user_id)}
@@ -0,0 +1,95 @@
+"""
+内存快照测试：验证二进制快照的写入、读取与版本校验，以及热启动按 _modified_at 追平数据库
+"""
+import asyncio
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.config import settings
+from app.core.database import Database
+from app.core.memory_backend import MemoryDatabase
+from app.core.snapshot import Snapshot, SNAPSHOT_MAGIC
+
+
+def setup_function():
+    Snapshot._collections.clear()
+
+
+def test_snapshot_round_trip(tmp_path):
+    users = {
+        "openid_a": {"_id": "openid_a", "gender": 1, "match_ids": [1, 2]},
+        "openid_b": {"_id": "openid_b", "gender": 2, "match_ids": []},
+    }
+    messages = [{"ai_message_id": 7, "content": "你好", "sent_at": datetime(2024, 1, 1, 8, 0)}]
+    Snapshot.register("users", "_id", lambda: users.values())
+    Snapshot.register("AI_message", "ai_message_id", lambda: messages)
+
+    path = tmp_path / "snapshot.bin"
+    asyncio.run(Snapshot.write(str(path)))
+    created_at, collections = Snapshot.read(str(path))
+
+    assert created_at == Snapshot.last_written_at
+    assert collections["users"] == ("_id", list(users.values()))
+    assert collections["AI_message"][0] == "ai_message_id"
+    assert collections["AI_message"][1][0]["content"] == "你好"
+    assert Snapshot.get_status()["last_size"] == path.stat().st_size
+
+
+def test_unknown_version_is_ignored(tmp_path):
+    path = tmp_path / "snapshot.bin"
+    path.write_bytes(struct.pack("<6sHdI", SNAPSHOT_MAGIC, 999, 0.0, 0))
+
+    assert Snapshot.read(str(path)) is None
+
+
+def test_missing_or_truncated_snapshot_falls_back(tmp_path):
+    assert Snapshot.read(str(tmp_path / "missing.bin")) is None
+
+    Snapshot.register("users", "_id", lambda: [{"_id": "openid_a"}])
+    path = tmp_path / "snapshot.bin"
+    asyncio.run(Snapshot.write(str(path)))
+    path.write_bytes(path.read_bytes()[:-3])
+
+    assert Snapshot.read(str(path)) is None
+
+
+def test_warm_start_catches_up_modified_deleted_and_new_documents(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SNAPSHOT_CATCHUP_MARGIN", 0.0)
+    path = tmp_path / "snapshot.bin"
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+
+    async def main():
+        await Database.bulk_upsert("users", [
+            {"_id": "openid_a", "age": 20},
+            {"_id": "openid_b", "age": 21},
+            {"_id": "openid_c", "age": 22},
+        ])
+        await Database.insert_one("AI_message", {"ai_message_id": 1, "content": "hi"})
+        users = [{"_id": "openid_a", "age": 20}, {"_id": "openid_b", "age": 21}, {"_id": "openid_c", "age": 22}]
+        Snapshot.register("users", "_id", lambda: users)
+        Snapshot.register("AI_message", "ai_message_id", lambda: [{"ai_message_id": 1, "content": "hi"}])
+        await asyncio.sleep(0.01)
+        await Snapshot.write(str(path))
+        await asyncio.sleep(0.01)
+
+        # 快照之后：修改 a、删除 b、新增 d，另写入一条缺少主键字段的历史消息
+        await Database.update_one("users", {"_id": "openid_a"}, {"$set": {"age": 30}})
+        await Database.delete_one("users", {"_id": "openid_b"})
+        await Database.insert_one("users", {"_id": "openid_d", "age": 23})
+        await Database.insert_one("AI_message", {"content": "legacy"})
+        return await Snapshot.warm_start(str(path))
+
+    try:
+        result = asyncio.run(main())
+    finally:
+        Database.db = original_db
+
+    users = {document["_id"]: document["age"] for document in result["users"]}
+    assert users == {"openid_a": 30, "openid_c": 22, "openid_d": 23}
+    assert [document["ai_message_id"] for document in result["AI_message"]] == [1]
@@ -0,0 +1,68 @@
+"""
+启动编排测试：互不依赖的阶段并发执行、依赖完成后才开始、关键路径沿最晚完成的依赖回溯，
+以及阶段失败时跳过依赖它的阶段并抛出原异常
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+import pytest
+
+from app.core.startup import StartupPlan
+
+
+def _sleeper(seconds, log, name, result=None):
+    async def run():
+        log.append(f"start {name}")
+        await asyncio.sleep(seconds)
+        log.append(f"end {name}")
+        return result
+    return run
+
+
+def test_independent_stages_overlap_and_report_critical_path():
+    log = []
+    plan = StartupPlan()
+    plan.stage("bootstrap", _sleeper(0.05, log, "bootstrap", result={"users": []}))
+    plan.stage("users", _sleeper(0.05, log, "users"), after=("bootstrap",))
+    plan.stage("ai", _sleeper(0.02, log, "ai"), after=("bootstrap",))
+    plan.stage("matches", _sleeper(0.1, log, "matches"), after=("users",))
+    plan.stage("forum", _sleeper(0.02, log, "forum"), after=("users",))
+
+    results = asyncio.run(plan.run())
+
+    assert results["bootstrap"] == {"users": []}
+    # 依赖完成后才开始；users 与 ai、matches 与 forum 并发
+    assert log.index("start users") > log.index("end bootstrap")
+    assert log.index("start ai") < log.index("end users")
+    assert log.index("start forum") < log.index("end matches")
+
+    report = StartupPlan.get_status()
+    assert report["critical_path"] == ["bootstrap", "users", "matches"]
+    assert report["total"] < report["serial"]
+    assert all(stage["status"] == "done" for stage in report["stages"].values())
+
+
+def test_failed_stage_skips_dependents_and_raises():
+    log = []
+    plan = StartupPlan()
+
+    async def broken():
+        raise RuntimeError("migration failed")
+
+    plan.stage("migrations", broken)
+    plan.stage("users", _sleeper(0, log, "users"), after=("migrations",))
+    plan.stage("n8n", _sleeper(0, log, "n8n"))
+
+    with pytest.raises(RuntimeError, match="migration failed"):
+        asyncio.run(plan.run())
+
+    stages = StartupPlan.get_status()["stages"]
+    assert (stages["migrations"]["status"], stages["users"]["status"], stages["n8n"]["status"]) == ("failed", "skipped", "done")
+    assert log == ["start n8n", "end n8n"]
+
+    with pytest.raises(ValueError):
+        plan.stage("chatrooms", broken, after=("unknown",))
@@ -66,9 +66,9 @@ async def setup_test_environment():
                 user_data["id"], 
                 user_data["gender"]
             )
-            user_manager.edit_user_age(user_id, user_data["age"])
-            user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 设置为异性
-            user_manager.edit_summary(user_id, f"这是测试用户 {user_data['name']}")
+            await user_manager.edit_user_age(user_id, user_data["age"])
+            await user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 设置为异性
+            await user_manager.edit_summary(user_id, f"这是测试用户 {user_data['name']}")
             test_users.append(user_id)
             print(f"   ✅ 创建用户: {user_data['name']} (ID: {user_id}, 性别: {'男' if user_data['gender'] == 1 else '女'})")
         
@@ -0,0 +1,156 @@
+"""
+用户按需加载（USER_CACHE_MODE=lazy）测试：未命中时读取数据库且并发读取合并、常驻集合按最近访问淘汰干净用户、
+被淘汰但仍被引用的用户复用同一对象，以及数据完备性检查不会把未加载的用户（及其聊天室、消息）当作不存在
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT_PATH))
+
+from app.config import settings
+from app.core.change_tracker import ChangeTracker
+from app.core.database import Database
+from app.core.memory_backend import MemoryDatabase
+from app.objects.Match import Match
+from app.services.https.ChatroomManager import ChatroomManager
+from app.services.https.DataIntegrity import DataIntegrity
+from app.services.https.MatchManager import MatchManager
+from app.services.https.ReferenceIndex import ReferenceIndex
+from app.services.https.UserManagement import UserManagement
+
+
+def _lazy_manager(monkeypatch, capacity):
+    monkeypatch.setattr(settings, "USER_CACHE_MODE", "lazy")
+    monkeypatch.setattr(settings, "USER_CACHE_CAPACITY", capacity)
+    ChangeTracker.clear()
+    manager = UserManagement()
+    for container in (manager.user_list, manager.female_user_list, manager.male_user_list, manager._last_access):
+        container.clear()
+    manager._resident.clear()
+    UserManagement._initialized = False
+    return manager
+
+
+def _run(main, users):
+    original_db = Database.db
+    Database.use_backend(MemoryDatabase())
+
+    async def seeded():
+        await Database.insert_many("users", [
+            {"_id": f"openid_{index}", "user_name": f"user{index}", "gender": 1 + index % 2, "match_ids": []}
+            for index in range(users)
+        ])
+        return await main()
+
+    try:
+        return asyncio.run(seeded())
+    finally:
+        Database.db = original_db
+        UserManagement._initialized = False
+
+
+def test_lazy_users_load_on_miss_and_evict_least_recent(monkeypatch):
+    manager = _lazy_manager(monkeypatch, capacity=3)
+    reads = []
+    original_find_one = Database.find_one.__func__
+
+    async def counting_find_one(cls, collection_name, query, *args, **kwargs):
+        reads.append(query["_id"])
+        return await original_find_one(cls, collection_name, query, *args, **kwargs)
+
+    monkeypatch.setattr(Database, "find_one", classmethod(counting_find_one))
+
+    async def main():
+        await manager.initialize_from_database()
+        assert manager.user_counter == 6
+        assert manager.user_list == {}
+
+        # 同一用户的并发未命中只读取一次数据库
+        first = await asyncio.gather(*(manager.get_user_instance("openid_0") for _ in range(5)))
+        assert all(user is first[0] for user in first)
+        assert reads == ["openid_0"]
+        assert await manager.get_user_instance("openid_9") is None
+
+        # 有未写回修改的用户不会被淘汰
+        dirty = await manager.get_user_instance("openid_1")
+        await manager.edit_user_age("openid_1", 30)
+        for index in (2, 3, 4):
+            await manager.get_user_instance(f"openid_{index}")
+        assert len(manager.user_list) == 3
+        assert set(manager.user_list) == {"openid_1", "openid_3", "openid_4"}
+        assert "openid_0" not in manager.female_user_list and "openid_1" in manager.male_user_list
+
+        # 被淘汰但仍被持有的用户再次访问时复用同一对象，不读数据库
+        reads.clear()
+        assert await manager.get_user_instance("openid_0") is first[0]
+        assert reads == []
+
+        # 刷新写回后，空闲用户被淘汰
+        monkeypatch.setattr(settings, "USER_CACHE_IDLE_SECONDS", 0)
+        assert await manager.save_to_database() is True
+        assert manager.user_list == {}
+        assert (await Database.find_one("users", {"_id": "openid_1"}))["age"] == 30
+        assert dirty.age == 30
+
+    _run(main, users=6)
+
+
+def test_integrity_check_keeps_matches_of_unloaded_users(monkeypatch):
+    manager = _lazy_manager(monkeypatch, capacity=2)
+    match_manager = MatchManager()
+    match_manager.match_list.clear()
+    index = ReferenceIndex()
+    index.user_matches.clear()
+    index.match_chatrooms.clear()
+
+    async def main():
+        await manager.initialize_from_database()
+        for match_id, other in ((1, "openid_1"), (2, "openid_missing")):
+            match = Match.from_document({"_id": match_id, "user_id_1": "openid_0", "user_id_2": other})
+            match_manager.match_list[match_id] = match
+            index.add_match(match)
+        # 加载匹配不会把用户读入内存
+        assert manager.user_list == {}
+
+        assert await DataIntegrity().check_and_clean_matches() is True
+        assert set(match_manager.match_list) == {1}
+        # 反向检查补充的 match_id 已写回数据库
+        assert (await Database.find_one("users", {"_id": "openid_0"}))["match_ids"] == [1]
+        assert (await Database.find_one("users", {"_id": "openid_1"}))["match_ids"] == [1]
+
+    _run(main, users=4)
+
+
+def test_chatrooms_of_unloaded_users_load_and_keep_their_messages(monkeypatch):
+    manager = _lazy_manager(monkeypatch, capacity=2)
+    match_manager = MatchManager()
+    match_manager.match_list.clear()
+    chatroom_manager = ChatroomManager()
+    chatroom_manager.chatrooms.clear()
+    index = ReferenceIndex()
+    for container in (index.user_matches, index.user_chatrooms, index.match_chatrooms):
+        container.clear()
+
+    async def main():
+        await Database.insert_many("matches", [{"_id": 1, "user_id_1": "openid_0", "user_id_2": "openid_1"}])
+        await Database.insert_many("chatrooms", [{"_id": 10, "user1_id": "openid_0", "user2_id": "openid_1", "message_ids": [100], "match_id": 1}])
+        await Database.insert_many("messages", [
+            {"_id": 100, "chatroom_id": 10, "message_sender_id": "openid_0", "message_receiver_id": "openid_1", "message_content": "hi"},
+            {"_id": 101, "chatroom_id": 11, "message_sender_id": "openid_2", "message_receiver_id": "openid_3", "message_content": "hey"},
+        ])
+        await manager.initialize_from_database()
+        await match_manager.construct()
+        assert await chatroom_manager.construct() is True
+        # 其他进程写入的聊天室同样不要求双方用户已在内存中
+        assert chatroom_manager._apply_remote_chatroom(11, {"_id": 11, "user1_id": "openid_2", "user2_id": "openid_3", "message_ids": [101], "match_id": None})
+        assert manager.user_list == {}
+        assert chatroom_manager.chatrooms[10].user1 is None
+        assert chatroom_manager.chatrooms[11].user1_id == "openid_2"
+
+        assert await DataIntegrity().check_and_clean_all_data() is True
+        assert set(chatroom_manager.chatrooms) == {10, 11}
+        assert await Database.count_documents("messages") == 2
+
+    _run(main, users=4)
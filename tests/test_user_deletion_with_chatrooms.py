@@ -64,9 +64,9 @@ class UserDeletionChatroomTest:
                 user_data["id"], 
                 user_data["gender"]
             )
-            user_manager.edit_user_age(user_id, user_data["age"])
-            user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 异性
-            user_manager.edit_summary(user_id, f"测试用户 {user_data['name']}")
+            await user_manager.edit_user_age(user_id, user_data["age"])
+            await user_manager.edit_target_gender(user_id, 3 - user_data["gender"])  # 异性
+            await user_manager.edit_summary(user_id, f"测试用户 {user_data['name']}")
             self.test_users.append(user_id)
             print(f"创建用户: {user_data['name']} (ID: {user_id})")
         
@@ -188,7 +188,7 @@ class UserDeletionChatroomTest:
         
         # 获取该用户的匹配和聊天室信息
         user_manager = UserManagement()
-        user = user_manager.get_user_instance(user_id)
+        user = await user_manager.get_user_instance(user_id)
         if not user:
             print(f"用户 {user_id} 不存在")
             return False
@@ -217,7 +217,7 @@ class UserDeletionChatroomTest:
         print(f"\n=== 验证用户 {user_id} 删除结果 ===")
         
         # 1. 验证用户被删除（内存和数据库）
-        user_in_memory = user_manager.get_user_instance(user_id)
+        user_in_memory = await user_manager.get_user_instance(user_id)
         user_in_db = await Database.find_one("users", {"_id": user_id})
         
         print(f"用户在内存中: {'存在' if user_in_memory else '不存在'}")
@@ -275,7 +275,7 @@ class UserDeletionChatroomTest:
         remaining_users = [10002, 10003, 10004]
         
         for user_id in remaining_users:
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 print(f"用户 {user_id}: 存在，匹配数量: {len(user.match_ids)}")
                 # 检查用户的匹配是否仍然有效
@@ -32,7 +32,7 @@ async def verify_user_match_ids():
         
         print("📋 内存中的用户match_ids:")
         for user_id in test_user_ids:
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 print(f"   用户 {user_id} ({user.telegram_user_name}): match_ids = {user.match_ids}")
             else:
@@ -58,7 +58,7 @@ async def verify_user_match_ids():
         # 分析不一致的情况
         print("\n🔍 分析结果:")
         for user_id in test_user_ids:
-            user = user_manager.get_user_instance(user_id)
+            user = await user_manager.get_user_instance(user_id)
             if user:
                 memory_match_ids = set(user.match_ids)
                 